@@ -795,17 +795,44 @@ struct Block {
             throw runtime_error("Do not ask to FP32 code to read grid file with binary data.");
 # endif
             // Raw, binary data in the grid file.
-            auto f = ifstream(fileName);
+            auto f = ifstream(fileName, ios::binary);
             if (!f) {
                 throw runtime_error("Did not open binary grid file successfully: "+fileName);
             }
-            number item;
-            f.read(reinterpret_cast<char*>(&item), sizeof(number)); // dimensions
-            f.read(reinterpret_cast<char*>(&item), sizeof(number)); // 0.0
-            f.read(reinterpret_cast<char*>(&item), sizeof(number)); // 0.0
-            f.read(reinterpret_cast<char*>(&item), sizeof(number)); int niv = int(item);
-            f.read(reinterpret_cast<char*>(&item), sizeof(number)); int njv = int(item);
-            f.read(reinterpret_cast<char*>(&item), sizeof(number)); int nkv = int(item);
+            int niv, njv, nkv;
+            string magic(19, ' ');
+            f.read(&magic[0], magic.size());
+            if (magic == "structured_grid 2.0") {
+                // Text header, as written by StructuredGrid.write_to_binary_file()
+                // in gdtk/geom/sgrid.py, ending with the end_header line.
+                string line, dtype = "<f8";
+                getline(f, line); // remainder of first line
+                bool header_complete = false;
+                while (getline(f, line)) {
+                    if (line.rfind("end_header", 0) == 0) { header_complete = true; break; }
+                    char buf[16];
+                    sscanf(line.c_str(), "niv: %d", &niv);
+                    sscanf(line.c_str(), "njv: %d", &njv);
+                    sscanf(line.c_str(), "nkv: %d", &nkv);
+                    if (sscanf(line.c_str(), "dtype: %15s", buf) == 1) dtype = buf;
+                }
+                if (!header_complete) {
+                    throw runtime_error("Incomplete header in binary grid file: "+fileName);
+                }
+                if (dtype != "<f8") {
+                    throw runtime_error("Cannot read grid data of type "+dtype+" from "+fileName);
+                }
+            } else {
+                // Original headerless format, with the metadata stored as numbers.
+                f.seekg(0);
+                number item;
+                f.read(reinterpret_cast<char*>(&item), sizeof(number)); // dimensions
+                f.read(reinterpret_cast<char*>(&item), sizeof(number)); // 0.0
+                f.read(reinterpret_cast<char*>(&item), sizeof(number)); // 0.0
+                f.read(reinterpret_cast<char*>(&item), sizeof(number)); niv = int(item);
+                f.read(reinterpret_cast<char*>(&item), sizeof(number)); njv = int(item);
+                f.read(reinterpret_cast<char*>(&item), sizeof(number)); nkv = int(item);
+            }
             if ((cfg.nic != niv-1) || (cfg.njc != njv-1) || (cfg.nkc != nkv-1)) {
                 throw runtime_error("Unexpected grid size: niv="+to_string(niv)+
                                     " njv="+to_string(njv)+ " nkv="+to_string(nkv));
@@ -11,6 +11,9 @@ Author:
 Versions:
   2022-09-23  First Python code adpated from chkn_prep.py
   2022-11-09  Rebuilt flow file reader.
+  2026-10-18  Read blocks concurrently and stream the snapshots.
+              Binary VTK data arrays.
+              KD-tree index for nearest-cell queries.
 """
 
 # ----------------------------------------------------------------------
@@ -25,13 +28,17 @@ import json
 import gzip
 import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from gdtk.geom.vector3 import Vector3, hexahedron_properties
 from gdtk.geom.sgrid import StructuredGrid
+from gdtk.flow.vtk_writer import write_vts_piece, vtk_points, VTK_FORMATS
+from gdtk.flow.cell_index import CellIndex
 
 
-shortOptions = "hf:t:bvp:s:o:"
-longOptions = ["help", "job=", "tindx=", "binary", "vtk-xml", "probe=", "slice=", "output-file="]
+shortOptions = "hf:t:bvp:s:o:n:e:z"
+longOptions = ["help", "job=", "tindx=", "binary", "vtk-xml", "probe=", "slice=", "output-file=",
+               "nproc=", "vtk-encoding=", "zlib"]
 
 def printUsage():
     print("Post-process a chicken run to produce VTK format files.")
@@ -41,11 +48,16 @@ def printUsage():
           " [--binary | -b]" +
           " [--tindx=<tindxSpec> | -t <tindxSpec>]" +
           " [--vtk-xml | -v]" +
+          " [--vtk-encoding=<ascii|base64|raw> | -e <encoding>]" +
+          " [--zlib | -z]" +
           " [--slice=<sliceSpec> | -s <sliceSpec>]" +
           " [--output-file=<name> | -o <name>]" +
-          " [--probe=<x,y,z> | -p <x,y,z>]"
+          " [--probe=<x,y,z> | -p <x,y,z>]" +
+          " [--nproc=<int> | -n <int>]"
     )
     print("  Default is to write VTK files. --vtk-xml")
+    print("  The VTK data arrays are appended as raw binary data unless")
+    print("  another encoding is given, and --zlib compresses the binary data.")
     print("  You may elect to select slices of data, instead, to be written to a GNUPlot file.")
     print("  Or you may probe the data close to a specific point in space.")
     print("")
@@ -59,8 +71,12 @@ def printUsage():
     print("  If the output file is not specified, it defaults to slice-tnnnn.data")
     print("")
     print("  For --probe, <x,y,z> represents 3 float numbers separated by commas.")
+    print("  Several points may be given, separated by semicolons.")
     print("  Output is just to the console.")
     print("")
+    print("  The blocks are read by nproc concurrent workers.")
+    print("  If nproc is not given, it defaults to the number of CPUs.")
+    print("")
     return
 
 # --------------------------------------------------------------------
@@ -69,6 +85,7 @@ config = {}
 times = {}
 grids = {}
 flows = {}
+cellIndex = None
 
 def read_config(jobDir):
     """
@@ -87,46 +104,93 @@ def read_config(jobDir):
         times[int(items[0])] = float(items[1])
     return
 
-def read_grids(jobDir, binaryData):
+def make_pool(nproc, binaryData):
+    """
+    Workers for reading the block files.
+
+    Binary files need little more than the I/O, so threads suffice,
+    but parsing text holds the interpreter lock so we use processes for that.
     """
-    Read the full set of grids.
+    if binaryData:
+        return ThreadPoolExecutor(max_workers=nproc)
+    return ProcessPoolExecutor(max_workers=nproc)
+
+def read_grids(jobDir, binaryData, pool):
+    """
+    Read the full set of grids, concurrently.
     """
     global config
     gridDir = jobDir+'/grid'
     if not os.path.exists(gridDir):
         raise RuntimeError('Cannot find grid directory: ' + gridDir)
+    futures = {}
     for k in range(config['nkb']):
         for j in range(config['njb']):
             for i in range(config['nib']):
                 fileName = gridDir + ('/grid-%04d-%04d-%04d' % (i, j, k))
-                if binaryData:
-                    fileName += '.bin'
-                    if os.path.exists(fileName):
-                        grids['%d,%d,%d'%(i,j,k)] = StructuredGrid(binaryfile=fileName)
-                else:
-                    fileName += '.gz'
-                    if os.path.exists(fileName):
-                        grids['%d,%d,%d'%(i,j,k)] = StructuredGrid(gzfile=fileName)
+                fileName += '.bin' if binaryData else '.gz'
+                if os.path.exists(fileName):
+                    futures['%d,%d,%d'%(i,j,k)] = pool.submit(read_grid, fileName, binaryData)
+    for key, future in futures.items():
+        grids[key] = future.result()
     return
 
-def read_flow_blocks(jobDir, tindx, binaryData):
+def read_grid(fileName, binaryData):
+    if binaryData:
+        # The vertex arrays are views into a memory-mapped file.
+        return StructuredGrid(binaryfile=fileName, memmap=True)
+    return StructuredGrid(gzfile=fileName)
+
+def submit_flow_blocks(jobDir, tindx, binaryData, pool):
     """
-    Read the flow blocks for an individual tindx.
+    Start reading the flow blocks for an individual tindx.
+
+    Returns a dictionary of futures, one for each block.
     """
     global config
     flowDir = jobDir + ('/flow/t%04d' % tindx)
     if not os.path.exists(flowDir):
         raise RuntimeError('Cannot find flow directory: ' + flowDir)
+    futures = {}
     for k in range(config['nkb']):
         for j in range(config['njb']):
             for i in range(config['nib']):
                 fileName = flowDir + ('/flow-%04d-%04d-%04d' % (i, j, k))
                 fileName += '.bin' if binaryData else '.gz'
                 if os.path.exists(fileName):
-                    flows['%d,%d,%d'%(i,j,k)] = read_block_of_flow_data(fileName, binaryData)
+                    futures['%d,%d,%d'%(i,j,k)] = pool.submit(read_block_of_flow_data, fileName,
+                                                              binaryData, config["iovar_names"])
+    return futures
+
+def read_flow_blocks(jobDir, tindx, binaryData, pool):
+    """
+    Read the flow blocks for an individual tindx, concurrently.
+    """
+    global flows
+    futures = submit_flow_blocks(jobDir, tindx, binaryData, pool)
+    flows = {key:future.result() for key, future in futures.items()}
     return
 
-def read_block_of_flow_data(fileName, binaryData):
+def flow_snapshots(jobDir, tindxList, binaryData, pool):
+    """
+    Step through the snapshots of tindxList, one at a time.
+
+    For each tindx generated, the global flows dictionary holds that snapshot.
+    The blocks of the next snapshot are read while the caller works on the
+    current one, so no more than two snapshots are in memory at once.
+    """
+    global flows
+    if len(tindxList) == 0: return
+    futures = submit_flow_blocks(jobDir, tindxList[0], binaryData, pool)
+    for n, tindx in enumerate(tindxList):
+        flows = {} # release the previous snapshot
+        flows = {key:future.result() for key, future in futures.items()}
+        if n+1 < len(tindxList):
+            futures = submit_flow_blocks(jobDir, tindxList[n+1], binaryData, pool)
+        yield tindx
+    return
+
+def read_block_of_flow_data(fileName, binaryData, varNames):
     """
     The flow field data comes as a 1D array of float numbers.
     The data for each flow variable is appended end-to-end.
@@ -134,16 +198,18 @@ def read_block_of_flow_data(fileName, binaryData):
     Return the flow data in flattened arrays, one column for each flow-variable,
     because that is the arrangement that suits the VTK format files.
     """
-    global config
-    f = open(fileName, 'rb') if binaryData else gzip.open(fileName, 'rt')
-    combinedData = np.frombuffer(f.read(), dtype=float) if binaryData else np.loadtxt(f)
-    f.close()
+    if binaryData:
+        combinedData = np.fromfile(fileName, dtype=float)
+    else:
+        with gzip.open(fileName, 'rb') as f:
+            # One number per line, so we can avoid the generality of np.loadtxt.
+            combinedData = np.array(f.read().split(), dtype=float)
     ntotal = combinedData.shape[0]
-    nvars = len(config["iovar_names"])
+    nvars = len(varNames)
     ncells = ntotal // nvars
     combinedData = combinedData.reshape((nvars,ncells))
     flowData = {}
-    for j,var in enumerate(config["iovar_names"]):
+    for j,var in enumerate(varNames):
         flowData[var] = combinedData[j,:]
     return flowData
 
@@ -165,34 +231,59 @@ def reshape_flow_data_arrays():
                     flows['%d,%d,%d'%(ib,jb,kb)] = flowData
     return
 
+def get_cell_index():
+    """
+    The spatial index over the cell centres of all blocks.
+
+    It is built from the (reshaped) flow data on first use and then kept
+    because the cells do not move from one snapshot to the next.
+    """
+    global cellIndex
+    if cellIndex is None:
+        cellIndex = CellIndex(flows, ('posx', 'posy', 'posz'))
+    return cellIndex
+
+def cell_list(distances, blocks, cells):
+    """
+    Arrange the result of CellIndex.nearest_cells as a list of lists of dictionaries.
+    """
+    result = []
+    for n in range(len(distances)):
+        row = []
+        for m in range(len(distances[n])):
+            ib, jb, kb = [int(item) for item in blocks[n][m].split(',')]
+            ic, jc, kc = [int(item) for item in cells[n,m]]
+            row.append({'ib':ib, 'jb':jb, 'kb':kb, 'ic':ic, 'jc':jc, 'kc':kc,
+                        'distance':float(distances[n,m])})
+        result.append(row)
+    return result
+
+def nearest_cells(points, k=1):
+    """
+    Locate the k nearest cells to each of the points, in any block.
+
+    Returns a list, one entry per point, of lists of k dictionaries
+    holding the block and cell indices and the distance.
+    """
+    return cell_list(*get_cell_index().nearest_cells(points, k))
+
+def probe(points, variables=None, k=4):
+    """
+    Flow data at the points, interpolated from the k nearest cells.
+
+    Returns a dictionary of arrays of values, one array per variable,
+    and the list of nearest cells, as from nearest_cells(points, 1).
+    """
+    values, nearest = get_cell_index().probe(points, flows, variables, k)
+    return values, cell_list(*nearest)
+
 def find_nearest_cell(x, y, z):
     """
     Locate the nearest cell to the location (x,y,z), in any block.
 
     Returns the block and cell indices of the closest cell centre in a dictionary.
     """
-    global config, flows
-    closest = {'ib':-1, 'jb':-1, 'kb':-1, 'ic':-1, 'jc':-1, 'kc':-1, 'distance':sys.float_info.max}
-    nics = config['nics']; njcs = config['njcs']; nkcs = config['nkcs']
-    blk_ids = config['blk_ids']
-    for ib in range(config['nib']):
-        for jb in range(config['njb']):
-            for kb in range(config['nkb']):
-                if blk_ids[ib][jb][kb] >= 0:
-                    # Block data should exist.
-                    flowData = flows['%d,%d,%d'%(ib,jb,kb)]
-                    for ic in range(nics[ib]):
-                        for jc in range(njcs[jb]):
-                            for kc in range(nkcs[kb]):
-                                xc = flowData['posx'][ic][jc][kc]
-                                yc = flowData['posy'][ic][jc][kc]
-                                zc = flowData['posz'][ic][jc][kc]
-                                distance = math.sqrt((x-xc)**2 + (y-yc)**2 + (z-zc)**2)
-                                if (distance < closest['distance']):
-                                    closest['ib'] = ib; closest['jb'] = jb; closest['kb'] = kb
-                                    closest['ic'] = ic; closest['jc'] = jc; closest['kc'] = kc
-                                    closest['distance'] = distance
-    return closest
+    return nearest_cells([[x, y, z]], 1)[0][0]
 
 # --------------------------------------------------------------------
 
@@ -250,10 +341,12 @@ def write_pvd_file(jobDir, tindxList, timesList):
     fp.close()
     return
 
-def write_vtk_files(jobDir, tindx):
+def write_vtk_files(jobDir, tindx, encoding="raw", compress=False):
     """
     Write snapshot of the flow data as a collection of VTK files for a single tindx.
     This collection of files will describe the pieces of an overall StructuredGrid.
+
+    encoding and compress are as for gdtk.flow.vtk_writer.write_vts_piece().
     """
     global config, grids, flows
     plotDir = jobDir + '/plot'
@@ -268,15 +361,16 @@ def write_vtk_files(jobDir, tindx):
     fp.write('<PStructuredGrid WholeExtent="%d %d %d %d %d %d" GhostLevel="0">\n' %
              (0, whole_niv-1, 0, whole_njv-1, 0, whole_nkv-1))
     fp.write('<PCellData>\n')
+    fmt = VTK_FORMATS[encoding]
     for var in config["iovar_names"]:
-        fp.write('<PDataArray Name="%s" type="Float64" NumberOfComponents="1" format="ascii" />\n' % (var,))
+        fp.write('<PDataArray Name="%s" type="Float64" NumberOfComponents="1" format="%s" />\n' % (var, fmt))
     if "velx" in config["iovar_names"] and "a" in config["iovar_names"]:
-        fp.write('<PDataArray Name="Mach" type="Float64" NumberOfComponents="1" format="ascii" />\n');
+        fp.write('<PDataArray Name="Mach" type="Float64" NumberOfComponents="1" format="%s" />\n' % fmt);
     if "velx" in config["iovar_names"]:
-        fp.write('<PDataArray Name="vel.vector" type="Float64" NumberOfComponents="3" format="ascii" />\n');
+        fp.write('<PDataArray Name="vel.vector" type="Float64" NumberOfComponents="3" format="%s" />\n' % fmt);
     fp.write('</PCellData>\n')
     fp.write('<PPoints>\n')
-    fp.write('<PDataArray type="Float64" NumberOfComponents="3" format="ascii" />\n')
+    fp.write('<PDataArray type="Float64" NumberOfComponents="3" format="%s" />\n' % fmt)
     fp.write('</PPoints>\n')
     start_nkv = 0
     for k in range(config['nkb']):
@@ -295,7 +389,8 @@ def write_vtk_files(jobDir, tindx):
                               start_nkv, start_nkv+grid.nkv-1, fileName))
                     write_vtk_structured_grid_file(plotDir+'/'+fileName, grid, flows[key],
                                                    whole_niv, whole_njv, whole_nkv,
-                                                   start_niv, start_njv, start_nkv)
+                                                   start_niv, start_njv, start_nkv,
+                                                   encoding, compress)
                 start_niv += config['nics'][i]
             start_njv += config['njcs'][j]
         start_nkv += config['nkcs'][k]
@@ -306,49 +401,25 @@ def write_vtk_files(jobDir, tindx):
 
 def write_vtk_structured_grid_file(fileName, grid, flowData,
                                    whole_niv, whole_njv, whole_nkv,
-                                   start_niv, start_njv, start_nkv):
+                                   start_niv, start_njv, start_nkv,
+                                   encoding="raw", compress=False):
     """
     Combine the grid and flow data for one block into a VTK StructuredGrid file
 
     for one piece of the overall grid..
     """
-    with open(fileName, mode='w') as fp:
-        fp.write('<VTKFile type="StructuredGrid" version="0.1" byte_order="BigEndian">\n')
-        fp.write('<StructuredGrid WholeExtent="%d %d %d %d %d %d">\n' %
-                 (0, whole_niv-1, 0, whole_njv-1, 0, whole_nkv-1))
-        fp.write('<Piece Extent="%d %d %d %d %d %d">\n' %
-                 (start_niv, start_niv+grid.niv-1,
-                  start_njv, start_njv+grid.njv-1,
-                  start_nkv, start_nkv+grid.nkv-1))
-        fp.write('<CellData>\n')
-        for var in config["iovar_names"]:
-            fp.write('<DataArray Name="%s" type="Float64" NumberOfComponents="1" format="ascii">\n' % (var,))
-            for item in flowData[var]: fp.write('%g\n' % (item,))
-            fp.write('</DataArray>\n')
-        if "velx" in config["iovar_names"] and  "a" in config["iovar_names"]:
-            fp.write('<DataArray Name="Mach" type="Float64" NumberOfComponents="1" format="ascii">\n');
-            for a,vx,vy,vz in zip(flowData["a"],flowData["velx"],flowData["vely"],flowData["velz"]):
-                fp.write('%g\n' % (math.sqrt(vx*vx+vy*vy+vz*vz)/a))
-            fp.write('</DataArray>\n')
-        if "velx" in config["iovar_names"]:
-            fp.write('<DataArray Name="vel.vector" type="Float64" NumberOfComponents="3" format="ascii">\n');
-            for velxyz in zip(flowData["velx"],flowData["vely"],flowData["velz"]): fp.write('%g %g %g\n' % velxyz)
-            fp.write('</DataArray>\n')
-        fp.write('</CellData>\n')
-        fp.write('<Points>\n')
-        fp.write('<DataArray type="Float64" NumberOfComponents="3" format="ascii">\n')
-        for k in range(grid.nkv):
-            for j in range(grid.njv):
-                for i in range(grid.niv):
-                    x = grid.vertices.x[i][j][k]
-                    y = grid.vertices.y[i][j][k]
-                    z = grid.vertices.z[i][j][k]
-                    fp.write('%g %g %g\n'%(x, y, z))
-        fp.write('</DataArray>\n')
-        fp.write('</Points>\n')
-        fp.write('</Piece>\n')
-        fp.write('</StructuredGrid>\n')
-        fp.write('</VTKFile>\n')
+    varNames = config["iovar_names"]
+    cellData = [(var, flowData[var]) for var in varNames]
+    if "velx" in varNames:
+        vel = np.column_stack([flowData["velx"], flowData["vely"], flowData["velz"]])
+        if "a" in varNames:
+            cellData.append(("Mach", np.sqrt(np.sum(vel**2, axis=1))/flowData["a"]))
+        cellData.append(("vel.vector", vel))
+    write_vts_piece(fileName, (0, whole_niv-1, 0, whole_njv-1, 0, whole_nkv-1),
+                    (start_niv, start_niv+grid.niv-1,
+                     start_njv, start_njv+grid.njv-1,
+                     start_nkv, start_nkv+grid.nkv-1),
+                    cellData, vtk_points(grid), encoding, compress)
     return
 
 # --------------------------------------------------------------------
@@ -375,7 +446,13 @@ if __name__ == '__main__':
     print("times=", times)
     #
     binaryData = ("--binary" in uoDict) or ("-f" in uoDict)
-    read_grids(jobDir, binaryData)
+    nproc = os.cpu_count()
+    if "--nproc" in uoDict:
+        nproc = int(uoDict.get("--nproc", nproc))
+    elif "-n" in uoDict:
+        nproc = int(uoDict.get("-n", nproc))
+    pool = make_pool(max(nproc, 1), binaryData)
+    read_grids(jobDir, binaryData, pool)
     #
     tindxSpec = "$" # default is the final-time index
     tindxList = []
@@ -435,10 +512,17 @@ if __name__ == '__main__':
     #
     if action == "vtk-xml":
         print("Write out flow data snapshots as VTK files.")
-        for tindx in tindxList:
+        encoding = "raw"
+        if "--vtk-encoding" in uoDict:
+            encoding = uoDict.get("--vtk-encoding", encoding)
+        elif "-e" in uoDict:
+            encoding = uoDict.get("-e", encoding)
+        if encoding not in VTK_FORMATS:
+            raise Exception("Unknown VTK encoding: " + encoding)
+        compress = ("--zlib" in uoDict) or ("-z" in uoDict)
+        for tindx in flow_snapshots(jobDir, tindxList, binaryData, pool):
             print("Writing tindx={}".format(tindx))
-            read_flow_blocks(jobDir, tindx, binaryData)
-            write_vtk_files(jobDir, tindx)
+            write_vtk_files(jobDir, tindx, encoding, compress)
         #
         timesList = [times[tindx] for tindx in tindxList]
         write_pvd_file(jobDir, tindxList, timesList)
@@ -448,18 +532,19 @@ if __name__ == '__main__':
             xyzSpec = uoDict.get("--probe", "")
         elif "-p" in uoDict:
             xyzSpec = uoDict.get("-p", "")
-        x, y, z = xyzSpec.strip().split(',')
-        x = float(x); y = float(y); z = float(z)
-        print("Probe the flow data close to ({}, {}, {}).".format(x,y,z))
-        for tindx in tindxList:
+        # Accept multiple points, separated by semicolons.
+        points = [[float(item) for item in pSpec.split(',')] for pSpec in xyzSpec.strip().split(';')]
+        for x, y, z in points:
+            print("Probe the flow data close to ({}, {}, {}).".format(x,y,z))
+        for tindx in flow_snapshots(jobDir, tindxList, binaryData, pool):
             print("Probing flow data at tindx={}".format(tindx))
-            read_flow_blocks(jobDir, tindx, binaryData)
             reshape_flow_data_arrays()
-            closest = find_nearest_cell(x, y, z)
-            print("closest cell at", closest)
-            flowData = flows['%d,%d,%d'%(closest['ib'],closest['jb'],closest['kb'])]
-            for var in config['iovar_names']:
-                print('  {}: {}'.format(var, flowData[var][closest['ic'],closest['jc'],closest['kc']]))
+            for row in nearest_cells(points, 1):
+                closest = row[0]
+                print("closest cell at", closest)
+                flowData = flows['%d,%d,%d'%(closest['ib'],closest['jb'],closest['kb'])]
+                for var in config['iovar_names']:
+                    print('  {}: {}'.format(var, flowData[var][closest['ic'],closest['jc'],closest['kc']]))
     #
     if action == "slice":
         print("Select just a 1D of flow data.")
@@ -507,12 +592,12 @@ if __name__ == '__main__':
                 filePrefix = uoDict.get("--output-file", "")
             elif "-o" in uoDict:
                 filePrefix = uoDict.get("-o", "")
-            for tindx in tindxList:
+            for tindx in flow_snapshots(jobDir, tindxList, binaryData, pool):
                 print("Slicing flow data at tindx={}".format(tindx))
-                read_flow_blocks(jobDir, tindx, binaryData)
                 reshape_flow_data_arrays()
                 fileName = "%s-t%04d.data" % (filePrefix, tindx)
                 write_slice_list_to_gnuplot_file(sliceList, fileName)
     #
+    pool.shutdown()
     print("Done in {:.3f} seconds.".format(time.process_time()))
     sys.exit(0)
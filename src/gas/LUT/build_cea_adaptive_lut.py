@@ -1,4 +1,4 @@
-#! /usr/bin/env python
+#! /usr/bin/env python3
 """
 build_cea_adaptive_lut.py
 
@@ -17,8 +17,12 @@ Split into sub-programs --build-grid and --write-table
 More info, report: 'An adpative look-up table for Eilmer4'
 
 Author: James M. Burgess, 12th Feb 2016
+Versions:
+    18-Oct-2026: Ported to Python 3. The patches of each refinement level
+        are sampled, interpolated and assessed together as array operations.
 """
-import sys, os, time, numpy, math, inspect, gzip 
+import sys, os, time, numpy, math, inspect, gzip, shutil
+import multiprocessing
 import matplotlib.pyplot as plt
 from cea2_gas import make_gas_from_name, Gas, list_gas_names
 
@@ -26,7 +30,7 @@ from cea2_gas import make_gas_from_name, Gas, list_gas_names
 global vars; vars = 7 # The number of varibles relevant to the gas model used 
                       # (so the code can be re-used for a different model)
 def build_function_grid(mygas, jobName, max_lr_splits=5, max_e_splits=9, T_min=200.0,
-                        T_max=20000.0, lr_min=-6.0, lr_max=2.0, T_for_offset=302.0):
+                        T_max=20000.0, lr_min=-6.0, lr_max=2.0, T_for_offset=302.0, nproc=1):
     """
     Main function of the --build-grid sub-program. Finds the bounds of table,
     determines data points the --write-table program might need, and calls
@@ -38,31 +42,74 @@ def build_function_grid(mygas, jobName, max_lr_splits=5, max_e_splits=9, T_min=2
     :param T_for_offset: temp of ground-state energy in CEA, needed to convert
        an energy offset, as Eilmer prefers to use 0K as ground.
     :param T/lr_min/max: Range of the table. 
+    :param nproc: number of worker processes calling CEA
     :returns nothing, but file  'function-grid-<jobName>.py.gz' saved to pwd
+
+    Each row of the grid (all lr values for one e value) is saved to the
+    checkpoint file 'function-grid-<jobName>.rows' as it is completed, so that
+    an interrupted build, restarted with the same settings, only computes
+    the missing rows.
     """
     fname = 'function-grid-' + jobName + '.py.gz'
-    fp = gzip.open(fname, 'wb')
 
-    print '\n\n\t\t----- Constructing function grid -----'
-    print 'CEA is called to create the sample space'
-    print 'T_for_offset=', T_for_offset
+    print('\n\n\t\t----- Constructing function grid -----')
+    print('CEA is called to create the sample space')
+    print('T_for_offset=', T_for_offset)
     global e_offset
     e_offset = get_e_offset(mygas, T_for_offset)
-    print 'e_offset=', e_offset
+    print('e_offset=', e_offset)
 
     # log_rho_values used for e_range call - not actual values saved in grid
-    log_rho_values = numpy.linspace(log_rho_min, log_rho_max, 50)
+    log_rho_values = numpy.linspace(lr_min, lr_max, 50)
     # energy range to represent those temperatures
     e_min, e_max = get_e_range(mygas, T_min, T_max, log_rho_values)
 
-    print 'log-density range = ', log_rho_min, ' : ', log_rho_max, ' log(kg/m^3)'
-    print 'temperature range', T_min, ' : ', T_max, ' K'
-    print 'computed energy range = ', e_min, ' : ', e_max, ' J/kg (in CEA - not offset)'
+    print('log-density range = ', lr_min, ' : ', lr_max, ' log(kg/m^3)')
+    print('temperature range', T_min, ' : ', T_max, ' K')
+    print('computed energy range = ', e_min, ' : ', e_max, ' J/kg (in CEA - not offset)')
     
     # Set the entropy offset condition
     de_min = (e_max - e_min) / max_e_splits
-    set_entropy_ref_conds(mygas, e_max, de_min, log_rho_max)
+    set_entropy_ref_conds(mygas, e_max, de_min, lr_max)
+
+    # Generate the grid points
+    ilr = 2**(max_lr_splits)
+    ie = 2**(max_e_splits)
+    res_factor = 4
+    lr_pnts = numpy.linspace(lr_min, lr_max, ilr*3*res_factor + 1)
+    e_pnts = numpy.linspace(e_min, e_max, ie*3*res_factor + 1)
 
+    # Compute the rows of the grid, picking up those saved by an earlier run.
+    header = "# %d %d %.17g %.17g %.17g %.17g %.17g %.17g %.17g %.17g\n" % \
+        (len(e_pnts), len(lr_pnts), e_min, e_max, lr_min, lr_max, e_offset, p1, T1, s1)
+    checkpointName = 'function-grid-' + jobName + '.rows'
+    rows = read_grid_checkpoint(checkpointName, header, len(lr_pnts))
+    todo = [i for i in range(len(e_pnts)) if i not in rows]
+    print('Rows to compute:', len(todo), 'of', len(e_pnts))
+    # Start the checkpoint afresh, with only the complete rows.
+    fpc = open(checkpointName, 'w')
+    fpc.write(header)
+    for i in sorted(rows.keys()): write_grid_checkpoint_row(fpc, i, rows[i])
+    tasks = [(i, e_pnts[i], lr_pnts) for i in todo]
+    if nproc > 1 and len(tasks) > 0:
+        # The worker processes are forked with a copy of the gas object,
+        # and each one runs CEA in its own directory.
+        workDir = os.path.abspath('function-grid-' + jobName + '-work')
+        pool = multiprocessing.get_context('fork').Pool(nproc, init_grid_worker, (workDir,))
+        for i, row in pool.imap_unordered(compute_grid_row, tasks):
+            rows[i] = row
+            write_grid_checkpoint_row(fpc, i, row)
+        pool.close()
+        pool.join()
+        shutil.rmtree(workDir, ignore_errors=True)
+    else:
+        for task in tasks:
+            i, row = compute_grid_row(task)
+            rows[i] = row
+            write_grid_checkpoint_row(fpc, i, row)
+    fpc.close()
+
+    fp = gzip.open(fname, 'wt')
     fp.write("# Auto-generated by build_cea_adaptive_lut.py on: %s\n" % time.asctime())
     fp.write("# Sample grid of CEA data to be used in construction of adaptive lut\n")
     fp.write("%-14g   #p1\n" % p1)
@@ -71,32 +118,76 @@ def build_function_grid(mygas, jobName, max_lr_splits=5, max_e_splits=9, T_min=2
     fp.write("%-14g   #e_offset\n" % e_offset)
     fp.write("%-14g   #e_min\n" % (e_min + e_offset))
     fp.write("%-14g   #e_max\n" % (e_max + e_offset))
-    fp.write("%-14g   #log_rho_min\n" % log_rho_min)
-    fp.write("%-14g   #log_rho_max\n" % log_rho_max)
+    fp.write("%-14g   #log_rho_min\n" % lr_min)
+    fp.write("%-14g   #log_rho_max\n" % lr_max)
     fp.write("%-14g   #max_lr_splits\n" % max_lr_splits)
     fp.write("%-14g   #max_e_splits\n" % max_e_splits)
-
-
-    # Generate the grid points
-    ilr = 2**(max_lr_splits)
-    ie = 2**(max_e_splits)
-    res_factor = 4
     fp.write("%-14g   #ilr\n" % ilr)
     fp.write("%-14g   #ie\n" % ie)
     fp.write("%-14g   #res_fac\n" % res_factor)
-    lr_pnts = numpy.linspace(lr_min, lr_max, ilr*3*res_factor + 1)
-    e_pnts = numpy.linspace(e_min, e_max, ie*3*res_factor + 1)
-    
-    for e in e_pnts:
-        for lr in lr_pnts:
-            # For an alternative source of data, change the CEA_state function
-            # to something else
-            res = CEA_state(lr, e) 
+    for i in range(len(e_pnts)):
+        for res in rows[i]:
             fp.write("%10g,\t%10g,\t%10g,\t%10g,\t%10g,\t%10g,\t%10g,\n" %
-                      tuple(res[i] for i in range(vars))) # vars is no. vars (7)
+                      tuple(res[k] for k in range(vars))) # vars is no. vars (7)
             
     fp.close()
-    print 'Finished writing grid to file: ', fname
+    # With the grid safely written, the checkpoint is no longer needed.
+    os.remove(checkpointName)
+    print('Finished writing grid to file: ', fname)
+
+def compute_grid_row(task):
+    """
+    Call CEA for one row of the function grid.
+    :param task: tuple of (row index, e, lr_pnts)
+    :returns tuple of (row index, list of the CEA results at each lr value)
+    """
+    i, e, lr_pnts = task
+    # For an alternative source of data, change the CEA_state function
+    # to something else
+    return i, [CEA_state(lr, e) for lr in lr_pnts]
+
+def init_grid_worker(workDir):
+    """
+    Move each worker process into its own directory, because CEA writes
+    its scratch files into the current directory.
+    """
+    myDir = os.path.join(workDir, 'worker-%d' % os.getpid())
+    if not os.path.isdir(myDir):
+        os.makedirs(myDir)
+    for libName in ['thermo.lib', 'trans.lib']:
+        if os.path.exists(libName):
+            shutil.copy(libName, myDir)
+    os.chdir(myDir)
+
+def read_grid_checkpoint(fileName, header, nvalues):
+    """
+    Read the rows saved by an earlier run for the same grid settings.
+    A row that was only partly written is ignored.
+    :returns dictionary of rows, keyed by row index
+    """
+    rows = {}
+    if not os.path.exists(fileName):
+        return rows
+    fp = open(fileName, 'r')
+    if fp.readline() != header:
+        print('Ignoring checkpoint file', fileName, 'which is for a different grid.')
+        fp.close()
+        return rows
+    for line in fp:
+        items = line.split()
+        if len(items) != 1 + vars*nvalues: continue
+        values = [float(item) for item in items[1:]]
+        rows[int(items[0])] = [values[vars*j:vars*(j+1)] for j in range(nvalues)]
+    fp.close()
+    print('Recovered', len(rows), 'rows from checkpoint file', fileName)
+    return rows
+
+def write_grid_checkpoint_row(fp, i, row):
+    fp.write("%d" % i)
+    for res in row:
+        fp.write(" %.17g %.17g %.17g %.17g %.17g %.17g %.17g" % tuple(res[k] for k in range(vars)))
+    fp.write("\n")
+    fp.flush()
 
 #------------------------------------------------------------------------------#
 class Grid:
@@ -113,14 +204,14 @@ class Grid:
         """
         fname = 'function-grid-' + jobName+ '.py.gz'
         if not os.path.isfile(fname):
-            print 'ERROR: File not found containing function grid with name:'
-            print 'ERROR: ' + fname 
-            print 'ERROR: The program has to run with --build-grid option'
-            print 'ERROR: Line number: ', inspect.currentframe().f_lineno 
+            print('ERROR: File not found containing function grid with name:')
+            print('ERROR: ' + fname) 
+            print('ERROR: The program has to run with --build-grid option')
+            print('ERROR: Line number: ', inspect.currentframe().f_lineno) 
             exit(1)
-        print '\nReading function grid from file:', fname
+        print('\nReading function grid from file:', fname)
         
-        fp = gzip.open(fname, 'r')
+        fp = gzip.open(fname, 'rt')
         next(fp); next(fp)
         
 
@@ -135,12 +226,12 @@ class Grid:
         self.max_lr_splits = float(fp.readline()[:14])
         self.max_e_splits = float(fp.readline()[:14])
         if max_lr_splits > self.max_lr_splits or max_e_splits > self.max_e_splits:
-            print 'ERROR: Cannot build a table with maximum split settings:'
-            print ('ERROR:    log-rho: %d   e: %d' % (max_lr_splits, max_e_splits))
-            print 'ERROR: File:', fname,'was constructed with the following settings:'
-            print ('ERROR:    log-rho: %d   e: %d' % (self.max_lr_splits, self.max_e_splits))
-            print 'ERROR: Must be less than or equal to those settings, or the table ',
-            print 'must be reconstructed'
+            print('ERROR: Cannot build a table with maximum split settings:')
+            print('ERROR:    log-rho: %d   e: %d' % (max_lr_splits, max_e_splits))
+            print('ERROR: File:', fname,'was constructed with the following settings:')
+            print('ERROR:    log-rho: %d   e: %d' % (self.max_lr_splits, self.max_e_splits))
+            print('ERROR: Must be less than or equal to those settings, or the table ', end=' ')
+            print('must be reconstructed')
             sys.exit(1)
 
 
@@ -161,34 +252,36 @@ class Grid:
         self.e_length =  int( self.ie*3*self.res_fact + 1 )
 
         # Single array for storing all the data; 3rd dim is for multiple properties
-        self.data = numpy.zeros((self.e_length, self.lr_length, vars)) # vars is no. vars (7)
-
-        # Read the file line by line
-        for i in range(self.e_length):
-            for j in range(self.lr_length):
-                line = fp.readline()
-                self.data[i,j] =  numpy.array( line.split(',')[:vars] ).astype(float)  # vars is no. vars (7)
+        self.data = numpy.loadtxt(fp, delimiter=',', usecols=range(vars), ndmin=2)
         fp.close()
-        print 'Finished reading grid from file:', fname
+        if self.data.shape[0] != self.e_length*self.lr_length:
+            print('ERROR: Expected', self.e_length*self.lr_length, 'rows of data in', fname)
+            print('ERROR: but found', self.data.shape[0])
+            sys.exit(1)
+        self.data = self.data.reshape((self.e_length, self.lr_length, vars)) # vars is no. vars (7)
+        print('Finished reading grid from file:', fname)
 
     def get_indices(self, lr, e):
         """
         Method for determining the index in the table of an input property
         The added '0.0001' is to account for any truncation errors
-        :param lr/e: input thermo state in log-rho and energy
+        :param lr/e: input thermo state in log-rho and energy, scalars or arrays
         :returns ilr/ie: tuple of array indices referring to data for the state
         """
 
-        ilr = int(  (lr - self.lr_min) / self.dlr_grid   * (self.lr_length-1) + 0.00001 )
-        ie = int( (e -  self.e_min  )  / self.de_grid    * (self.e_length-1) + 0.00001)
-
+        ilr = numpy.asarray( (lr - self.lr_min) / self.dlr_grid   * (self.lr_length-1) + 0.00001 )
+        ie = numpy.asarray( (e -  self.e_min  )  / self.de_grid    * (self.e_length-1) + 0.00001)
+        ilr = ilr.astype(int); ie = ie.astype(int)
+        if ilr.ndim == 0 and ie.ndim == 0:
+            return int(ilr), int(ie)
         return ilr, ie
 
     def get_values(self, lr, e):
         """
         Method for finding the CEA data for an input state by reading from the grid
         :param lr/e: input thermo state in log-rho and energy
-        :returns : A 7 element 1-D array of the CEA data for that state        
+        :returns : A 7 element 1-D array of the CEA data for that state, or an
+            array of such, with leading dimensions those of the lr/e arrays
         """
         ilr, ie = self.get_indices(lr, e)
         return self.data[ie, ilr] 
@@ -209,233 +302,68 @@ class Patch:
     Class defining a rectangular patch of data in log(density)-energy space
     Stores the data for interpolation. Includes methods for computing error
     in the patch and for sub-dividing and returning new patches.
+
+    The interpolation data and errors are usually found for many patches at
+    once, by the functions set_patch_data() and set_patch_errors().
     """
     counter = 0 # Class instance used for patch ID's
-    
+
     def __init__(self, lr_lo, lr_hi, e_lo, e_hi):
         """
     :param ID  = Unique ID for each patch, tracked by the static var 'counter'
-    :param lr_lo: log(rho) lower limit; lr_hi: log(rho) upper limit 
+    :param lr_lo: log(rho) lower limit; lr_hi: log(rho) upper limit
     :param e_lo: energy lower limit; e_hi: energy upper limit
     :param splitID = dimension the patch was split - e, lr or n if not split
-    :param errs = array of error for each property (max or rms depending on 
+    :param errs = array of error for each property (max or rms depending on
         error method selected (by global var, EM)
     :param left/right_patch_ID: ID's of patches resulting from patch been split
     :param props: If interpolation is linear (global var IM='linear'), properties
-        of all 7 variables stored at 4 patch corners (be calling grid.get_values func)
-    :param bs: If interpolation is bezier (global var IM='bezier'), 16 control 
-        points for all 7 vars. Determined by calling get_control_points() method
+        of all 7 variables stored at 4 patch corners (set by set_patch_data)
+    :param bs: If interpolation is bezier (global var IM='bezier'), 16 control
+        points for all 7 vars. (set by set_patch_data)
     :param splits: number of splits - could be used to enforce a split limit.
         """
         self.ID = self.__class__.counter # Assign patch ID
         self.__class__.counter +=1 # Increment the patch ID counter
-        
+
         self.lr_lo = lr_lo
         self.lr_hi = lr_hi
         self.e_lo = e_lo
         self.e_hi = e_hi
-        # For linear interpolation, save the CEA data at the patch corners
-        if IM == 'linear':
-            self.props = numpy.array( [grid.get_values( lr_lo, e_lo),
-                                       grid.get_values( lr_hi, e_lo),
-                                       grid.get_values( lr_lo, e_hi),
-                                       grid.get_values( lr_hi, e_hi) ])
-            
-        # For Bezier interpolation, we need the control points 
-        elif IM == 'bezier':
-            self.get_control_points()
-            assert hasattr(self, 'bs'), 'Control point array bs not initialised'
-        else:
-            print 'ERROR: The program should never have reached this point' 
-            print 'ERROR: Select valid interpolation method: bezier or linear'
-            print 'ERROR: Line number: ', inspect.currentframe().f_lineno 
-            sys.exit(1) 
-            
+
         self.errs = None # Temporary arary of property errors
-        
+
         self.splitID = 'n' # no split until it's explicitly changed
         self.splits = 0
 
         self.left_patchID = -1 # Value if the patch is not split further
         self.right_patchID = -1
+        self.children = None # The child patches, until the tree is numbered
         self.split_lr_cnt = 0 # counting the number of splits of each patch
         self.split_e_cnt = 0
 
     def get_control_points(self):
         """
-        If IM='bezier', find control point data (16 evenly spaced points on a grid) 
-        :param lr_pnts: 4 lr coords of control points
-        :param e_pnts: 4 e coords of control points
-        :param fs: array of properties at 16 control points (by calling CEA)
-        :param B_inv: Inverse Bezier matrix in bezier patch (see Luke & Collins)
-            This matrix is a global var saved at another point in thefile
-        :returns bs: 16 control point values in a flattened (1D) array which is 
-            more appropriate to write to a file. This is for all 7 properties, so
-            the array is actually 16x7.
+        Find the interpolation data for this patch alone; see set_patch_data()
         """
-        lr_pnts = numpy.linspace(self.lr_lo, self.lr_hi, 4)
-        e_pnts = numpy.linspace(self.e_lo, self.e_hi, 4)
-      
-            
-        fs = numpy.zeros((16,vars))  # vars is no. vars (7)
-        for i in range(4):
-            for j in range(4):
-                fs[4*i+j] = grid.get_values(lr_pnts[j], e_pnts[i])
-
-        bs = numpy.zeros((16,vars))  # vars is no. vars (7)
-        for i in range(16):
-            for j in range(16):
-                bs[i] += B_inv[i,j]*fs[j]
-        self.bs = bs 
+        set_patch_data([self])
 
     def interpolate(self, lr, e):
         """
         Interpolate 7 properties for a given value of lr, e.
-        For linear interpolation method:
-        :param lrfrac: log(rho) linear interpolation fraction 
-        :param efrac: energy linear interpolation fraction
         :returns result: 1D array of interpolated values (7 properties)
-
-        For bezier interpolation method:
-        :param u,v: parametric coordinates of lr,e in the patch
-        :param b: Array for implementing the De Casteljau algorithm - 16 control
-            points are mapped back to their 4x4 grid, which is nested inside a 4
-            element array (on the last element) - this outer array is for the 
-            iteration procedure. Each control point has a 7-element array nested
-            for the 7 properties
-        :returns the conerged result of the De Casteljau algorithm - which is 
-            the interpolated value for 7 values (so a 7 element 1D array)
         """
-        if IM == 'linear':
-            lrfrac = (lr - self.lr_lo) / (self.lr_hi - self.lr_lo)
-            efrac = (e - self.e_lo) / (self.e_hi - self.e_lo)
-            result = (1.0 - efrac) * (1.0 - lrfrac) * self.props[0] + \
-                     (1.0 - efrac) * lrfrac         * self.props[1] + \
-                     efrac         * (1.0 - lrfrac) * self.props[2] + \
-                     efrac         * lrfrac         * self.props[3]
-
-            return result # Returns a 1D array - 7 properties
-
-        elif IM == 'bezier':
-            if not hasattr(self, 'bs'):
-                 print 'ERROR: Interpolating requires the control points for the patch'
-                 print 'ERROR: Run object method: Patch.get_control_points() '
-                 print 'ERROR: Line number: ', inspect.currentframe().f_lineno 
-                 sys.exit(1)
-            u = (lr - self.lr_lo) / (self.lr_hi - self.lr_lo)
-            v = (e - self.e_lo) / (self.e_hi - self.e_lo)
-            b = numpy.zeros((4,4,4,vars)) # The last nesting is for the #vars(7) properties
-            for i in range(4):
-                for j in range(4):
-                    b[3,i,j] = self.bs[i*4+j]
-                
-            for k in range(2,-1,-1):
-                for i in range(k+1):
-                    for j in range(k+1):
-                        b[k,j,i] = (1-u)*(1-v)*b[k+1,j,i]+u*(1-v)*b[k+1,j,i+1]+\
-                                   (1-u)*v*b[k+1,j+1,i] + u*v*b[k+1,j+1,i+1];
-                      
-            return b[0,0,0] 
+        u = (lr - self.lr_lo) / (self.lr_hi - self.lr_lo)
+        v = (e - self.e_lo) / (self.e_hi - self.e_lo)
+        data = self.props if IM == 'linear' else self.bs
+        return interpolate_patches(data[numpy.newaxis], numpy.full((1,1,1,1), u),
+                                   numpy.full((1,1,1,1), v))[0,0,0]
 
-        else:
-            print 'ERROR: The program should never have reached this point' 
-            print 'ERROR: select valid interpolation method: bezier or linear'
-            print 'ERROR: Line number: ', inspect.currentframe().f_lineno 
-            sys.exit(1) 
-     
     def error(self):
         """
-        Compute a measure of patch error by taking sample points
-        
-        Sampling:
-        Two sets of sample cordinates are created. First - create a grid of 
-        spnts^2 (from the global var spnts). Second - grid with separation
-        equal to a globally defined min (dlr_sample, de_sample). Whichever
-        has the most sample points is chosed - this ensures large patches
-        are sampled regularly enough. The minimum sampling only occurs once
-        the split count is less than 4. This is because the largest patches
-        will be split anyway, and if we sample based on minimum sample size
-        for the largest ones, the grids are enormous, and CEA is called up
-        to tens of thousands of times for the one patch.
-
-        :param lr_pnts: lr coords of sample points.
-        :param e_pnts: e coords of sample points
-        :param CEA_results: 7 properties all sample points
-        :param interp_results: 7 properties all sample points - by calling 
-            interpolation method
-        :param error: Relative error at each sample point for each property
-
-        :returns: nothing, but the side-effect is that the patch now has
-            errs attribute, containing, for each property, either the max
-            or rms error, depending on the global variable, EM.
+        Compute a measure of error for this patch alone; see set_patch_errors()
         """
-
-        # Store the indices of the corners of the patch for making error grid
-        ilr_upper, ie_upper = grid.get_indices(self.lr_hi, self.e_hi)
-        ilr_lower, ie_lower = grid.get_indices(self.lr_lo, self.e_lo)
-        
-        step_lr = 1
-        step_e = 1
-        lim =200 # upper limit on number of points sampled in one dim
-        # The following provision is to make sure the number of sample
-        # points is not unreasonably high
-        while True:
-            lr_pnts = numpy.arange(ilr_lower + 1, ilr_upper, step_lr )
-            e_pnts = numpy.arange(ie_lower + 1, ie_upper, step_e)
-            
-            if len(lr_pnts) > lim: step_lr+=1
-            if len(e_pnts) > lim: step_e+=1
-
-            if len(lr_pnts) <= lim and len(e_pnts) <= lim:
-                break
-            
-        lr_len = len(lr_pnts)
-        e_len = len(e_pnts)
-     
-        CEA_results = numpy.zeros((lr_len*e_len, vars)) # vars is no. vars (7)
-        for i in range(e_len):
-            for j in range(lr_len):
-                CEA_results[lr_len*i+j] = grid.index_directly(lr_pnts[j], e_pnts[i])
-     
-        interp_results = numpy.zeros((lr_len*e_len, vars))  # vars is no. vars (7)
-        for i in range(e_len):
-            for j in range(lr_len):
-                # Points matrix only stores indices in the grid. To do inteprolation
-                # we need the actual e and lr values 
-                e = grid.e_min + grid.de_sample * e_pnts[i]
-                lr = grid.lr_min + grid.dlr_sample * lr_pnts[j]
-                interp_results[lr_len*i+j]= self.interpolate(lr,e)
-
-        error_array = numpy.absolute((interp_results - CEA_results) / CEA_results )
-        
-        if EM == 'maximum':
-            max_errs = numpy.zeros(vars) # max error for each property
-            for i in range(vars):  # vars is no. vars (7)
-                max_errs[i] = max(error_array[:,i])
-           
-            self.errs = max_errs
-     
-        elif EM == 'rms':
-            # if using bezier interpolation, 6 of the sample points are actually 
-            # control points, so their error shouldn't be considered in interpolation
-            if IM == 'bezier': 
-                adj = 9 
-            else: 
-                adj = 0
-            rms_errs = numpy.zeros(vars) # rms error for each property; vars is no. vars (7)
-            for i in range(vars):
-                for j in range(spnts**2):
-                    rms_errs[i] += error_array[j,i]**2
-                rms_errs[i] = math.sqrt(rms_errs[i]/ (lr_len*e_len - adj))
-            self.errs = rms_errs
-        else:
-            print 'ERROR: No valid error method has been selected'
-            print 'ERROR: Run print_build_parameters(EM = method) where'
-            print 'ERROR: method is \'maximum\' or \'rms\' '
-            print 'ERROR: Line number: ', inspect.currentframe().f_linen 
-            sys.exit(1)
-
-            
+        set_patch_errors([self])
 
     def split_lr(self):
         """  :return 2 new patches by splitting patch in half in lr dimension"""
@@ -450,108 +378,301 @@ class Patch:
         P1 = Patch(self.lr_lo, self.lr_hi, self.e_lo, e_split)
         P2 = Patch(self.lr_lo, self.lr_hi, e_split, self.e_hi)
         return P1, P2
-    
+
     def dlr(self):
         """ :return patch length in lr """
         return (self.lr_hi - self.lr_lo)
-    
+
     def de(self):
         """ :return patch length in e """
         return (self.e_hi - self.e_lo)
 
 # End Patch class
 
+def patch_bounds(patches):
+    """ :return arrays of lr_lo, lr_hi, e_lo, e_hi for a list of patches """
+    bounds = numpy.array([(p.lr_lo, p.lr_hi, p.e_lo, p.e_hi) for p in patches])
+    return bounds[:,0], bounds[:,1], bounds[:,2], bounds[:,3]
+
+def set_patch_data(patches):
+    """
+    Find the interpolation data for a list of patches, all at once.
+
+    If IM='linear', the CEA data at the 4 patch corners are stored as the
+    props attribute of each patch (4x7 array).
+
+    If IM='bezier', the control points are stored as the bs attribute.
+    :param lr_pnts: 4 lr coords of control points (for each patch)
+    :param e_pnts: 4 e coords of control points (for each patch)
+    :param fs: array of properties at 16 control points (from the grid)
+    :param B_inv: Inverse Bezier matrix in bezier patch (see Luke & Collins)
+        This matrix is a global var saved at another point in thefile
+    :param bs: 16 control point values in a flattened (1D) array which is
+        more appropriate to write to a file. This is for all 7 properties, so
+        the array is actually 16x7.
+    """
+    if len(patches) == 0: return
+    lr_lo, lr_hi, e_lo, e_hi = patch_bounds(patches)
+    if IM == 'linear':
+        lr = numpy.stack([lr_lo, lr_hi, lr_lo, lr_hi], axis=1)
+        e = numpy.stack([e_lo, e_lo, e_hi, e_hi], axis=1)
+        props = grid.get_values(lr, e)
+        for patch, p in zip(patches, props): patch.props = p
+    elif IM == 'bezier':
+        lr_pnts = numpy.linspace(lr_lo, lr_hi, 4, axis=1)
+        e_pnts = numpy.linspace(e_lo, e_hi, 4, axis=1)
+        # fs[:,4*i+j] is the data at lr_pnts[:,j], e_pnts[:,i]
+        fs = grid.get_values(lr_pnts[:,numpy.newaxis,:], e_pnts[:,:,numpy.newaxis])
+        fs = fs.reshape((len(patches), 16, vars))  # vars is no. vars (7)
+        bs = numpy.zeros((len(patches), 16, vars))
+        for j in range(16):
+            bs += B_inv[numpy.newaxis,:,j,numpy.newaxis] * fs[:,numpy.newaxis,j,:]
+        for patch, b in zip(patches, bs): patch.bs = b
+    else:
+        print('ERROR: The program should never have reached this point')
+        print('ERROR: Select valid interpolation method: bezier or linear')
+        print('ERROR: Line number: ', inspect.currentframe().f_lineno)
+        sys.exit(1)
+
+def interpolate_patches(data, u, v):
+    """
+    Interpolate 7 properties at many points in many patches.
+    :param data: props (linear) or bs (bezier) of the patches, stacked in
+        an array of shape (npatches, 4 or 16, 7)
+    :param u,v: parametric coordinates of lr,e in the patches, arrays of shape
+        (npatches, ne, nlr, 1)
+    :returns array of shape (npatches, ne, nlr, 7) of interpolated values
+
+    For linear interpolation, u and v are the log(rho) and energy linear
+    interpolation fractions.
+
+    For bezier interpolation, the De Casteljau algorithm is applied to the
+    16 control points, mapped back to their 4x4 grid, b. Each control point
+    holds the 7 properties, and at each step of the iteration the grid
+    shrinks by one in each direction until one point, the interpolated
+    value, remains.
+    """
+    if IM == 'linear':
+        props = data[:,numpy.newaxis,numpy.newaxis]
+        return (1.0 - v) * (1.0 - u) * props[...,0,:] + \
+               (1.0 - v) * u         * props[...,1,:] + \
+               v         * (1.0 - u) * props[...,2,:] + \
+               v         * u         * props[...,3,:]
+    elif IM == 'bezier':
+        bs = data[:,numpy.newaxis,numpy.newaxis]
+        b = {(i,j):bs[...,i*4+j,:] for i in range(4) for j in range(4)}
+        for k in range(2,-1,-1):
+            b = {(j,i):(1-u)*(1-v)*b[j,i] + u*(1-v)*b[j,i+1] + \
+                       (1-u)*v*b[j+1,i] + u*v*b[j+1,i+1]
+                 for i in range(k+1) for j in range(k+1)}
+        return b[0,0]
+    else:
+        print('ERROR: The program should never have reached this point')
+        print('ERROR: select valid interpolation method: bezier or linear')
+        print('ERROR: Line number: ', inspect.currentframe().f_lineno)
+        sys.exit(1)
+
+def set_patch_errors(patches, max_samples=100000):
+    """
+    Compute a measure of patch error by taking sample points, for a list of
+    patches whose interpolation data have been set.
+
+    Sampling:
+    The sample points are the grid points inside the patch. The number of
+    sample points in each dimension is limited by taking every second,
+    third, ... grid point, so that large patches are not sampled at
+    tens of thousands of points.
+
+    Patches with the same number of sample points are assessed together,
+    max_samples points at a time, as array operations.
+
+    :param CEA_results: 7 properties all sample points
+    :param interp_results: 7 properties all sample points - by interpolation
+    :param error_array: Relative error at each sample point for each property
+
+    :returns: nothing, but the side-effect is that each patch now has an
+        errs attribute, containing, for each property, either the max
+        or rms error, depending on the global variable, EM.
+    """
+    if len(patches) == 0: return
+    lr_lo, lr_hi, e_lo, e_hi = patch_bounds(patches)
+    # Store the indices of the corners of the patch for making error grid
+    ilr_upper, ie_upper = grid.get_indices(lr_hi, e_hi)
+    ilr_lower, ie_lower = grid.get_indices(lr_lo, e_lo)
+    lim =200 # upper limit on number of points sampled in one dim
+    # The sample points are every step-th point strictly inside the patch,
+    # with the smallest step giving no more than lim points.
+    n_lr = numpy.maximum(ilr_upper - ilr_lower - 1, 0)
+    n_e = numpy.maximum(ie_upper - ie_lower - 1, 0)
+    step_lr = numpy.maximum(-(-n_lr // lim), 1)
+    step_e = numpy.maximum(-(-n_e // lim), 1)
+    lr_len = -(-n_lr // step_lr)
+    e_len = -(-n_e // step_e)
+
+    groups = {}
+    for n in range(len(patches)):
+        groups.setdefault((lr_len[n], e_len[n]), []).append(n)
+    for (L, E), members in groups.items():
+        chunk = max(1, max_samples // max(1, L*E))
+        for start in range(0, len(members), chunk):
+            idx = numpy.array(members[start:start+chunk])
+            lr_pnts = (ilr_lower[idx] + 1)[:,numpy.newaxis] + \
+                step_lr[idx][:,numpy.newaxis] * numpy.arange(L)
+            e_pnts = (ie_lower[idx] + 1)[:,numpy.newaxis] + \
+                step_e[idx][:,numpy.newaxis] * numpy.arange(E)
+            CEA_results = grid.data[e_pnts[:,:,numpy.newaxis], lr_pnts[:,numpy.newaxis,:]]
+            # Points matrix only stores indices in the grid. To do inteprolation
+            # we need the actual e and lr values
+            e = grid.e_min + grid.de_sample * e_pnts
+            lr = grid.lr_min + grid.dlr_sample * lr_pnts
+            u = (lr - lr_lo[idx,numpy.newaxis]) / (lr_hi[idx] - lr_lo[idx])[:,numpy.newaxis]
+            v = (e - e_lo[idx,numpy.newaxis]) / (e_hi[idx] - e_lo[idx])[:,numpy.newaxis]
+            if IM == 'linear':
+                data = numpy.array([patches[n].props for n in idx])
+            else:
+                data = numpy.array([patches[n].bs for n in idx])
+            interp_results = interpolate_patches(data, u[:,numpy.newaxis,:,numpy.newaxis],
+                                                 v[:,:,numpy.newaxis,numpy.newaxis])
+            error_array = numpy.absolute((interp_results - CEA_results) / CEA_results)
+
+            if EM == 'maximum':
+                errs = numpy.max(error_array, axis=(1,2)) # max error for each property
+            elif EM == 'rms':
+                # if using bezier interpolation, 6 of the sample points are actually
+                # control points, so their error shouldn't be considered in interpolation
+                if IM == 'bezier':
+                    adj = 9
+                else:
+                    adj = 0
+                errs = numpy.sqrt(numpy.sum(error_array**2, axis=(1,2)) / (L*E - adj))
+            else:
+                print('ERROR: No valid error method has been selected')
+                print('ERROR: Run print_build_parameters(EM = method) where')
+                print('ERROR: method is \'maximum\' or \'rms\' ')
+                print('ERROR: Line number: ', inspect.currentframe().f_lineno)
+                sys.exit(1)
+            for n, err in zip(idx, errs): patches[n].errs = err
+
 #-------------------------------------------------------------------------------#      
   
-def split_patches(patch, grid, tree):  
+def split_patches(patch, grid, tree):
     """
-    This is a recursive function that does most of the work:
-
-    A patch is passed as a function parameter, and is sent to the split_test 
-    function, which tests if the minimum error or minimum patch size limits have
-    been reached. If yes, the patch is recorded as not been split (splitID='n')
-    and the recursion ends at that patch.
-
-    If split_test returns True, the patch is separately split in lr and in e, 
-    and their errors computed. They are passed to slelect_split_direction(). 
-    The split direction that returns the greatest reduction in error is retained. 
-    Those patches are added to the tree. The split direction in the parent patch
-    is recorded. The ID's of the child patches are stored in the parent patch.
-    
-    The two new child patches are then passed back into split_patches,
-    making the function recursive.
+    This function does most of the work, building the tree from the first
+    patch one refinement level at a time:
+
+    Each patch of the level is sent to the split_test function, which tests if
+    the minimum error or minimum patch size limits have been reached. If yes,
+    the patch is recorded as not been split (splitID='n') and the refinement
+    ends at that patch.
+
+    If split_test returns True, the patch is separately split in lr and in e,
+    and their errors computed. The errors of the candidate child patches of
+    all the patches in the level are computed together, by set_patch_errors().
+    They are passed to select_split_direction().
+    The split direction that returns the greatest reduction in error is retained.
+    The split direction in the parent patch is recorded.
+
+    The retained child patches make up the next refinement level.
+
+    Once the refinement is done, the patches are numbered in the order that
+    a depth-first recursion would visit them, and placed in the tree.
 
     :param grid: Data grid; instance of Grid class
     :param tree: python dictionary holding every patch
     """
-    #print 'ID: %s, lr_split_cnt: %s, e_split_cnt: %s ' % (patch.ID, patch.split_lr_cnt,patch.split_e_cnt)
-    if patch.ID % plot_freq == 0:
-        # Save a copy of the tree every 100th patch
-        if not os.path.isdir("./table_progress"):
-            os.makedirs("./table_progress")
-        plot_table(tree)
-        plt.savefig('table_progress/tree-patch-no-' + str(patch.ID), dpi = 200)
-        plt.close()  # Free up memory again (problem if making dozens of plots)
-
-    if split_test(patch) == False:
-        assert patch.ID in tree 
-        patch.splitID = 'n' 
-        return    # Stops the recursion
-
-    P1_lr, P2_lr = patch.split_lr()
-    P1_lr.splits = patch.splits + 1
-    P2_lr.splits = patch.splits + 1
-    # Only one of these sets of patches is retained - so they have the same ID
-    # So revert the static class counter back by 2
-    patch.__class__.counter -= 2 
-
-    P1_e, P2_e = patch.split_e()
-    P1_e.splits = patch.splits + 1
-    P2_e.splits = patch.splits + 1
-    
-    split = select_split_direction(patch, P1_lr, P2_lr, P1_e, P2_e)
-    if split == 'lr':
-        patch.splitID = 'lr'
-        # Increment the count of splits in lr from parent patch
-        P1_lr.split_lr_cnt = patch.split_lr_cnt +1;  
-        P2_lr.split_lr_cnt = patch.split_lr_cnt +1
-        # Copy the count of splits in e from parent patch
-        P1_lr.split_e_cnt = patch.split_e_cnt; 
-        P2_lr.split_e_cnt = patch.split_e_cnt; 
-        # Place the new patches in the tree (dictionary)
-        tree[P1_lr.ID] = P1_lr
-        tree[P2_lr.ID] = P2_lr
-        # Tell the parent patch the ID of the new child patches
-        patch.left_patchID = P1_lr.ID
-        patch.right_patchID = P2_lr.ID
-        # Recursively call split_patches for the new child patches
-        split_patches(P2_lr, grid, tree)
-        split_patches(P1_lr, grid, tree)
-        return
-    
-    elif split == 'e':
-        patch.splitID = 'e'
-        # Increment the count of splits in e from parent patch
-        P1_e.split_e_cnt = patch.split_e_cnt +1
-        P2_e.split_e_cnt = patch.split_e_cnt +1
-        # Copy the count of splits in lr from parent patch
-        P1_e.split_lr_cnt = patch.split_lr_cnt
-        P2_e.split_lr_cnt = patch.split_lr_cnt
-        # Place the new patches in the tree (dictionary)
-        tree[P1_e.ID] = P1_e
-        tree[P2_e.ID] = P2_e 
+    level = [patch]
+    all_patches = [patch]
+    level_cnt = 0
+    plot_cnt = 0
+    while len(level) > 0:
+        if len(all_patches) // plot_freq > plot_cnt:
+            # Save a copy of the tree every plot_freq patches
+            plot_cnt = len(all_patches) // plot_freq
+            if not os.path.isdir("./table_progress"):
+                os.makedirs("./table_progress")
+            plot_table(all_patches)
+            plt.savefig('table_progress/tree-level-' + str(level_cnt), dpi = 200)
+            plt.close()  # Free up memory again (problem if making dozens of plots)
+
+        # Candidate child patches for the patches that are to be split,
+        # only in directions that have not reached the recursion limit.
+        splits = []
+        candidates = []
+        for parent in level:
+            if split_test(parent) == False:
+                parent.splitID = 'n'
+                continue
+            P1_lr = P2_lr = P1_e = P2_e = None
+            if parent.split_lr_cnt < max_lr_splits:
+                P1_lr, P2_lr = parent.split_lr()
+                candidates += [P1_lr, P2_lr]
+            if parent.split_e_cnt < max_e_splits:
+                P1_e, P2_e = parent.split_e()
+                candidates += [P1_e, P2_e]
+            splits.append((parent, P1_lr, P2_lr, P1_e, P2_e))
+        set_patch_data(candidates)
+        set_patch_errors(candidates)
+
+        level = []
+        for parent, P1_lr, P2_lr, P1_e, P2_e in splits:
+            split = select_split_direction(parent, P1_lr, P2_lr, P1_e, P2_e)
+            if split == 'lr':
+                P1, P2 = P1_lr, P2_lr
+                # Increment the count of splits in lr from parent patch
+                # and copy the count of splits in e
+                P1.split_lr_cnt = parent.split_lr_cnt + 1
+                P2.split_lr_cnt = parent.split_lr_cnt + 1
+                P1.split_e_cnt = parent.split_e_cnt
+                P2.split_e_cnt = parent.split_e_cnt
+            elif split == 'e':
+                P1, P2 = P1_e, P2_e
+                # Increment the count of splits in e from parent patch
+                # and copy the count of splits in lr
+                P1.split_e_cnt = parent.split_e_cnt + 1
+                P2.split_e_cnt = parent.split_e_cnt + 1
+                P1.split_lr_cnt = parent.split_lr_cnt
+                P2.split_lr_cnt = parent.split_lr_cnt
+            else:
+                print('ERROR: The program should never have reached this point')
+                print('ERROR: Line number: ', inspect.currentframe().f_lineno)
+                sys.exit(1)
+            parent.splitID = split
+            P1.splits = parent.splits + 1
+            P2.splits = parent.splits + 1
+            parent.children = (P1, P2)
+            level += [P1, P2]
+        all_patches += level
+        level_cnt += 1
+        print('Refinement level', level_cnt, ':', len(level), 'patches')
+
+    number_patches(patch, tree)
+
+def number_patches(patch, tree):
+    """
+    Give the patches their ID's and place them in the tree.
+
+    Patch ID's are handed out as by a depth-first recursion, starting at
+    the first patch: the two children of a patch take the next two ID's,
+    then the right child's patches are numbered, then the left child's.
+    The ID's of the child patches are stored in the parent patch.
+    """
+    patch.ID = 0
+    counter = 1
+    stack = [patch]
+    while len(stack) > 0:
+        parent = stack.pop()
+        tree[parent.ID] = parent
+        if parent.children is None: continue
+        P1, P2 = parent.children
+        P1.ID = counter; P2.ID = counter + 1
+        counter += 2
         # Tell the parent patch the ID of the new child patches
-        patch.left_patchID = P1_e.ID
-        patch.right_patchID = P2_e.ID
-        # Recursively call split_patches for the new child patches
-        split_patches(P2_e, grid, tree)
-        split_patches(P1_e, grid, tree)
-        return
-    
-    else:
-        print 'ERROR: The program should never have reached this point' 
-        print 'ERROR: Line number: ', inspect.currentframe().f_lineno 
-        sys.exit(1)    
+        parent.left_patchID = P1.ID
+        parent.right_patchID = P2.ID
+        parent.children = None
+        stack += [P1, P2]
+    # Patches added later, while fixing hanging nodes, carry on the numbering.
+    Patch.counter = counter
         
 def split_test(Patch):
     """
@@ -578,7 +699,7 @@ def split_test(Patch):
     try:
         error_lim # Check for existence of error criteria 
     except NameError:
-        print 'Array \'error_lim\' must be defined globally for table build'; 
+        print('Array \'error_lim\' must be defined globally for table build'); 
         sys.exit(1)
 
     result = (Patch.errs <= error_lim) # Compare error to minimum acceptable error
@@ -596,7 +717,7 @@ def split_test(Patch):
 def select_split_direction(Patch, P1_lr, P2_lr, P1_e, P2_e):
     """
     Called by split_patches(). Determines which split direction to execute.
-    The two sets of child patches have their error computed. The error criterion
+    The two sets of child patches already have their error computed. The error criterion
     is somewhat arbitrary - but here it computes the worst relative error of any
     property in the patch. The average of these is taken between the child nodes.
     Whichever split has the smallest average error is retained.
@@ -605,16 +726,11 @@ def select_split_direction(Patch, P1_lr, P2_lr, P1_e, P2_e):
 
     :param Patch: the parent patch
     :param P1_lr, P2_lr: the child patches of a log-rho split
+        (None if the log-rho split limit has been reached)
     :param P1_e, P2_e: the child patches of an e split
+        (None if the e split limit has been reached)
     :returns the split direction as a string.
-    """   
-
-    P1_lr.error(); P2_lr.error()
-    P1_e.error(); P2_e.error()
-    P1_lr_worse = max(P1_lr.errs); P2_lr_worse = max(P2_lr.errs)
-    P1_e_worse = max(P1_e.errs); P2_e_worse = max(P2_e.errs)
-    P_lr_err = 0.5 * (P1_lr_worse + P2_lr_worse)
-    P_e_err = 0.5 * (P1_e_worse + P2_e_worse)
+    """
 
     # First test for the log-rho split limit
     if Patch.split_lr_cnt >= max_lr_splits:
@@ -624,14 +740,19 @@ def select_split_direction(Patch, P1_lr, P2_lr, P1_e, P2_e):
     if Patch.split_e_cnt >= max_e_splits:
         return 'lr'
 
+    P1_lr_worse = max(P1_lr.errs); P2_lr_worse = max(P2_lr.errs)
+    P1_e_worse = max(P1_e.errs); P2_e_worse = max(P2_e.errs)
+    P_lr_err = 0.5 * (P1_lr_worse + P2_lr_worse)
+    P_e_err = 0.5 * (P1_e_worse + P2_e_worse)
+
     # If cells haven't reached minimum size, split the direction that reduces error
     if P_e_err <= P_lr_err:
         return 'e'
     elif P_lr_err < P_e_err:
         return 'lr'
     else:
-        print 'ERROR: The program should never have reached this point' 
-        print 'ERROR: Line number: ', inspect.currentframe().f_lineno 
+        print('ERROR: The program should never have reached this point') 
+        print('ERROR: Line number: ', inspect.currentframe().f_lineno) 
         sys.exit(1)
     return
     
@@ -726,8 +847,8 @@ def fix_hanging_nodes(tree):
     stall the program till it is closed, so users can track progress.
     """
     split_flag = True
-    print '\nSearching for excessive hanging nodes'
-    print 'Search will continue until a sweep returns 0 splits'
+    print('\nSearching for excessive hanging nodes')
+    print('Search will continue until a sweep returns 0 splits')
     loop_count = 0
 
     # Make sure the directory exists to recod the progrss of fixing hanging nodes
@@ -735,12 +856,12 @@ def fix_hanging_nodes(tree):
             os.makedirs("./table_progress")
 
     while split_flag != False:
-        print 'tree length = ', len(tree)
+        print('tree length = ', len(tree))
         loop_count += 1
-        print 'Executing tree search no.', loop_count, ' to find excessive hanging nodes'
+        print('Executing tree search no.', loop_count, ' to find excessive hanging nodes')
         tree, split_flag = iterate_through_tree(tree)
        
-        plot_table(tree)
+        plot_table(tree.values())
         plt.savefig('table_progress/hanging-node-fix-iter-' + str(loop_count), dpi = 200)
         
     return tree
@@ -748,11 +869,15 @@ def fix_hanging_nodes(tree):
 def iterate_through_tree(tree):
     """
     Called by fix_hanging_nodes. 
-    Loop through each patch. For each, loop trhough all the other patches and 
-    look for patches sharing a common edge. If there are more than 2 neighbour
+    Loop through each patch, in order of ID. For each, look through the other
+    patches for those sharing a common edge. If there are more than 2 neighbour
     patches on an edge, there are too many hanging nodes. A split is executed 
     on that patch.
 
+    The neighbours are found from dictionaries of the leaf patches, keyed by
+    the coordinates of their edges, so that only patches lying along the same
+    line need to be compared.
+
     The new patches are stored in a temporary tree, and appended to the existing
     tree at the end (not possible to add to a tree that is been iterated through
     with the loop). The standard housekeeping that split_patches did when adding
@@ -766,49 +891,44 @@ def iterate_through_tree(tree):
     split_flag = False # will remain False if no splits are required
     problem_patches = 0 # Count of how many patches needed subdividing
 
+    # Index the leaf nodes by their edges.
+    by_e_lo = {}; by_e_hi = {}; by_lr_lo = {}; by_lr_hi = {}
+    for ID, patch in sorted(tree.items()):
+        if patch.splitID != 'n': # Only testing leaf nodes
+            continue
+        by_e_lo.setdefault(patch.e_lo, []).append(patch)
+        by_e_hi.setdefault(patch.e_hi, []).append(patch)
+        by_lr_lo.setdefault(patch.lr_lo, []).append(patch)
+        by_lr_hi.setdefault(patch.lr_hi, []).append(patch)
 
-    lr_split_IDs = []
-    e_split_IDs = []
-    tree_copy = tree.copy()
-    for this_ID, this_patch in tree.iteritems():   # for each patch in the tree
-        north_nghbr = 0; south_nghbr = 0  # Count neighbouring patches on sides
-        east_nghbr = 0; west_nghbr = 0 
-
+    for this_ID, this_patch in sorted(tree.items()):   # for each patch in the tree
         if this_patch.splitID != 'n': # Only want to apply this test to leaf nodes
             continue
 
-        for ID, patch in tree_copy.iteritems(): # loop through the other patches
-            if patch.splitID != 'n': # Again - only testing leaf nodes
-                continue
-                   
-            # Sweep south edge
-            if this_patch.e_lo == patch.e_hi:
-                if patch.lr_hi <= this_patch.lr_hi and patch.lr_lo >= this_patch.lr_lo:
-                    south_nghbr += 1
-
-            # Sweep north edge
-            if this_patch.e_hi == patch.e_lo: 
-                if patch.lr_hi <= this_patch.lr_hi and patch.lr_lo >= this_patch.lr_lo:
-                    north_nghbr += 1        
-                    
-            # Sweep west edge
-            if this_patch.lr_lo == patch.lr_hi:
-                if patch.e_hi <= this_patch.e_hi and patch.e_lo >= this_patch.e_lo:
-                    west_nghbr += 1
-                    
-            # Sweep east edge
-            if this_patch.lr_hi == patch.lr_lo:
-                if patch.e_hi <= this_patch.e_hi and patch.e_lo >= this_patch.e_lo:
-                    east_nghbr += 1
-                    
+        # Count neighbouring patches on sides. A patch split earlier in
+        # this sweep is no longer a leaf node, and is not counted.
+        # Sweep south edge
+        south_nghbr = sum(1 for patch in by_e_hi.get(this_patch.e_lo, [])
+                          if patch.splitID == 'n' and patch.lr_hi <= this_patch.lr_hi
+                          and patch.lr_lo >= this_patch.lr_lo)
+        # Sweep north edge
+        north_nghbr = sum(1 for patch in by_e_lo.get(this_patch.e_hi, [])
+                          if patch.splitID == 'n' and patch.lr_hi <= this_patch.lr_hi
+                          and patch.lr_lo >= this_patch.lr_lo)
+        # Sweep west edge
+        west_nghbr = sum(1 for patch in by_lr_hi.get(this_patch.lr_lo, [])
+                         if patch.splitID == 'n' and patch.e_hi <= this_patch.e_hi
+                         and patch.e_lo >= this_patch.e_lo)
+        # Sweep east edge
+        east_nghbr = sum(1 for patch in by_lr_lo.get(this_patch.lr_hi, [])
+                         if patch.splitID == 'n' and patch.e_hi <= this_patch.e_hi
+                         and patch.e_lo >= this_patch.e_lo)
+
         # If the patch needs splitting, do that, and the necessary housekeeping
         if west_nghbr > 2 or east_nghbr > 2:
-            # Save the patch ID to be split when this is done
-            lr_split_IDs.append(this_patch.ID)
             split_flag = True
             tree[this_ID].splitID = 'e'
             P1_e, P2_e = tree[this_ID].split_e()
-            P1_e.error(), P2_e.error()
             temp_tree[P1_e.ID] = P1_e
             temp_tree[P2_e.ID] = P2_e
             tree[this_ID].left_patchID = P1_e.ID # reference to the new child patches
@@ -817,29 +937,32 @@ def iterate_through_tree(tree):
             continue # Not allowed to split in lr and e at once - leads to overlap
        
         if north_nghbr > 2 or south_nghbr > 2: # Execute split for this_patch
-            # Save the patch ID to be split when this is done
-            lr_split_IDs.append(this_patch.ID)
             split_flag = True
             tree[this_ID].splitID = 'lr'
             P1_lr, P2_lr = tree[this_ID].split_lr()
-            P1_lr.error(), P2_lr.error()
             temp_tree[P1_lr.ID] = P1_lr
             temp_tree[P2_lr.ID] = P2_lr
             tree[this_ID].left_patchID = P1_lr.ID # reference to the new child patches
             tree[this_ID].right_patchID = P2_lr.ID
             problem_patches += 1
             continue
-    
+
+    new_patches = list(temp_tree.values())
+    set_patch_data(new_patches)
+    set_patch_errors(new_patches)
     tree.update(temp_tree) # add the new patches to the tree
-    print 'number of splits required in the last sweep: ', problem_patches
+    print('number of splits required in the last sweep: ', problem_patches)
     return tree, split_flag 
    
-def plot_table(tree):
+def plot_table(patches):
     """ Plot the table - only 'leaf node' in the tree that weren't split"""
-    for ID, patch in tree.iteritems():
-        if patch.splitID == 'n': # if the patch was not split
-            plt.plot([patch.lr_lo, patch.lr_lo, patch.lr_hi, patch.lr_hi, patch.lr_lo], 
-                     [patch.e_lo, patch.e_hi, patch.e_hi, patch.e_lo, patch.e_lo ], 'k')
+    # All the patch outlines are drawn as one line, broken by nan values.
+    leaves = [patch for patch in patches if patch.splitID == 'n']
+    lr = numpy.array([[patch.lr_lo, patch.lr_lo, patch.lr_hi, patch.lr_hi, patch.lr_lo, numpy.nan]
+                      for patch in leaves])
+    e = numpy.array([[patch.e_lo, patch.e_hi, patch.e_hi, patch.e_lo, patch.e_lo, numpy.nan]
+                     for patch in leaves])
+    plt.plot(lr.ravel(), e.ravel(), 'k')
 #------------------------------------------------------------------------------#
 
 def write_recursion_limit_file_header(fp2):
@@ -872,11 +995,11 @@ def write_tree_to_file(jobName):
     read by LUA.
     Default parameter values are a standard range used for air.
     """
-    print '\n\n\t\t----- Constructing table -----'
-    print 'Table updates saved to directory: \'./table_progress/\''
+    print('\n\n\t\t----- Constructing table -----')
+    print('Table updates saved to directory: \'./table_progress/\'')
 
     fname = 'cea-adaptive-lut-' + jobName + '.lua.gz'
-    fp = gzip.open(fname, 'wb')
+    fp = gzip.open(fname, 'wt')
     fp.write("-- Auto-generated by build_cea_adaptive_lut.py on: %s\n" % time.asctime())
     fp.write("model = 'CEA adaptive look-up table'\n")
     fp.write("interpolation_method = \'" + IM + "\' \n")
@@ -899,9 +1022,9 @@ def write_tree_to_file(jobName):
     
     # Generate the first patch, and put it in the tree 
     first_patch = Patch(grid.lr_min, grid.lr_max, grid.e_min, grid.e_max)
+    first_patch.get_control_points()
     first_patch.error()
     tree = {}
-    tree[first_patch.ID] = first_patch
 
     # Now call split_patches, which builds the tree 
     split_patches(first_patch, grid, tree)
@@ -914,7 +1037,7 @@ def write_tree_to_file(jobName):
     
     # All patches have the basic info of upper and lower bounds, splitID
     # ID of child patches (leaf nodes have this value set to -1)
-    for ID, patch in tree.iteritems():
+    for ID, patch in sorted(tree.items()):
         fp.write("{\n")
         fp.write(" { %d, \'%s\', %d, %d, },\n" % (patch.ID, patch.splitID, patch.left_patchID, 
                                            patch.right_patchID) )
@@ -934,8 +1057,8 @@ def write_tree_to_file(jobName):
                               tuple(patch.bs[i, j] for j in range(vars)))
                     
             else:
-                print 'ERROR: The program should never have reached this point' 
-                print 'ERROR: Line number: ', inspect.currentframe().f_lineno 
+                print('ERROR: The program should never have reached this point') 
+                print('ERROR: Line number: ', inspect.currentframe().f_lineno) 
                 sys.exit(1)  
 
         fp.write("\n }\n")
@@ -943,10 +1066,10 @@ def write_tree_to_file(jobName):
         
     fp.write("}\n\n")
     fp.close()  # main table file
-    print 'Finished writing table'
+    print('Finished writing table')
     
     # File for cells not divided due to recursion limit 
-    fp2 = gzip.open(jobName+'-recurs-lim-patches.gz', 'wb')
+    fp2 = gzip.open(jobName+'-recurs-lim-patches.gz', 'wt')
     write_recursion_limit_file_header(fp2)   
     # Count the number of leaf nodes, and check for patches with high error
     child_node_cnt = 0
@@ -960,12 +1083,12 @@ def write_tree_to_file(jobName):
                 write_patch_to_recursion_limit_file(tree[i], fp2) 
                 recurs_lim_cnt += 1       
     fp2.close() # recursion limit file 
-    print 'No. total nodes in tree:', len(tree)
-    print 'No. leaf nodes in tree:', child_node_cnt
-    print 'No. patches at recursion limit, but above error limit:', recurs_lim_cnt
+    print('No. total nodes in tree:', len(tree))
+    print('No. leaf nodes in tree:', child_node_cnt)
+    print('No. patches at recursion limit, but above error limit:', recurs_lim_cnt)
 
     # Plot the tree once we are done
-    plot_table(tree)
+    plot_table(tree.values())
     plt.title(  'cea-adaptive-lut-' + jobName )
     plt.xlabel('$log_{10}(rho)$')
     plt.ylabel('$e$')
@@ -1047,10 +1170,10 @@ B_inv = numpy.array(
          0.0000000000000000, 0.0000000000000000, 0.0000000000000000, 1.0000000000000000]]);
 
 def list_gases(option, opt, value, parser):
-    print "Available gases are:"
+    print("Available gases are:")
     for name in list_gas_names():
-        print "   %s" % name
-    print ""
+        print("   %s" % name)
+    print("")
     sys.exit()
 
 
@@ -1067,7 +1190,7 @@ if __name__ == '__main__':
     --build-grid or --write-table
     """
     
-    print 'Begin build_adaptive_lut.py'
+    print('Begin build_adaptive_lut.py')
     from optparse import OptionParser, OptionGroup
     usage = "Usage: %prog [options]"
     parser = OptionParser(usage=usage)
@@ -1102,6 +1225,8 @@ if __name__ == '__main__':
     group1.add_option("-T", "--T-for-offset", action="store", type="string", dest="T_for_offset",
                       default="302.0",
                       help="Temperature (degree K) at which to evaluate the internal energy offset.")
+    group1.add_option("-N", "--nproc", action="store", dest="nproc", default="1",
+                      help="Number of worker processes calling CEA")
 
     """
     Second program - write-table program that creates the adaptive look-up table.
@@ -1157,23 +1282,23 @@ if __name__ == '__main__':
 
     
     if (options.build_grid_flag == True and (options.gasName == None and not options.custom)):
-        print 'Error: Failed to defined a suitable gas object. You can define a'
-        print 'a gas by its name, or by custom options.'
-        print 'Some examples of how to do this are below.'
-        print 'Also see --help option for general help.'
-        print ''
-        print 'Some examples for function grid options:'
-        print ""
-        print "Example 1: build_cea_adaptive_lut.py --build-grid --job=air5species --gas=air5species --interpolation-method 'bezier'"
-        print "Example 2: build_cea_adaptive_lut.py --build-grid--job=example --custom --reactants=\"N2:0.79,O2:0.21\" --only-list=\"N2,O2,NO,O,N\" "
-        print "Example 3: build_cea_adaptive_lut.py --build-grid --job=air-ions --gas=air-ions --bounds=\"500,20000,-6.0,2.0\" --interpolation-method 'linear'"
-        print "Example 4: build_cea_adaptive_lut.py --build-grid --job=co2 --gas=co2 --T-for-offset=650.0 --bounds=\"1000.0,20000,-6.0,2.0\""
-        print "Example 5: build_cea_adaptive_lut.py --build-grid --job=co2-ions --gas=co2-ions --T-for-offset=1000.0 --bounds=\"1000.0,20000,-6.0,2.0\""
-        print ""
-        print "Sometimes CEA2 has problems and the table will fail to build."
-        print "The best approach to fixing the problem seems to be to raise"
-        print "the lower temperatures, as shown in examples 3, 4 and 5 (above)."
-        print ""
+        print('Error: Failed to defined a suitable gas object. You can define a')
+        print('a gas by its name, or by custom options.')
+        print('Some examples of how to do this are below.')
+        print('Also see --help option for general help.')
+        print('')
+        print('Some examples for function grid options:')
+        print("")
+        print("Example 1: build_cea_adaptive_lut.py --build-grid --job=air5species --gas=air5species --interpolation-method 'bezier'")
+        print("Example 2: build_cea_adaptive_lut.py --build-grid--job=example --custom --reactants=\"N2:0.79,O2:0.21\" --only-list=\"N2,O2,NO,O,N\" ")
+        print("Example 3: build_cea_adaptive_lut.py --build-grid --job=air-ions --gas=air-ions --bounds=\"500,20000,-6.0,2.0\" --interpolation-method 'linear'")
+        print("Example 4: build_cea_adaptive_lut.py --build-grid --job=co2 --gas=co2 --T-for-offset=650.0 --bounds=\"1000.0,20000,-6.0,2.0\"")
+        print("Example 5: build_cea_adaptive_lut.py --build-grid --job=co2-ions --gas=co2-ions --T-for-offset=1000.0 --bounds=\"1000.0,20000,-6.0,2.0\"")
+        print("")
+        print("Sometimes CEA2 has problems and the table will fail to build.")
+        print("The best approach to fixing the problem seems to be to raise")
+        print("the lower temperatures, as shown in examples 3, 4 and 5 (above).")
+        print("")
         sys.exit()
     
 
@@ -1181,8 +1306,8 @@ if __name__ == '__main__':
     global jobName
     jobName = options.jobName
     if jobName == 'None':
-        print 'ERROR: Must define a job name. Example:'
-        print '  $  ./build_cea_adaptive_lut.py --job=air --build-grid'
+        print('ERROR: Must define a job name. Example:')
+        print('  $  ./build_cea_adaptive_lut.py --job=air --build-grid')
         sys.exit(1)
 
     # Declare the recursion limits globally
@@ -1194,19 +1319,19 @@ if __name__ == '__main__':
     ##################### NOW  RUN ONE OF THE TWO PROGRAMS #####################
     
     if options.build_grid_flag == True:
-        print '\nRunning program: build-grid. This should take a few hours'
+        print('\nRunning program: build-grid. This should take a few hours')
 
         # Create the gas object
         if options.custom:
-            print "Building table for custom gas:"
-            print "    reactants=", options.reactants
-            print "    inputUnits=", options.inputUnits
-            print "    onlyList=", options.onlyList
-            print "    withIons=", options.withIons
+            print("Building table for custom gas:")
+            print("    reactants=", options.reactants)
+            print("    inputUnits=", options.inputUnits)
+            print("    onlyList=", options.onlyList)
+            print("    withIons=", options.withIons)
             if options.reactants == None:
                 parser.print_help()
-                print "To build a custom gas model, you need to specify reactant fractions"
-                print "in dictionary form.  For example: --reactants=\"N2:0.79,O2:0.21\""
+                print("To build a custom gas model, you need to specify reactant fractions")
+                print("in dictionary form.  For example: --reactants=\"N2:0.79,O2:0.21\"")
                 sys.exit()
             reactants = {}
             for species in options.reactants.split(','):
@@ -1219,7 +1344,7 @@ if __name__ == '__main__':
             mygas = Gas(reactants, onlyList, options.inputUnits, with_ions=options.withIons)
             gasName = "custom"
         else:
-            print "Building table for gas name: ", options.gasName
+            print("Building table for gas name: ", options.gasName)
             mygas = make_gas_from_name(options.gasName)
             gasName = options.gasName  
 
@@ -1231,19 +1356,20 @@ if __name__ == '__main__':
 
         # Call the main program to run the function
         build_function_grid(mygas, jobName, max_lr_splits, max_e_splits, T_min,
-                             T_max, log_rho_min, log_rho_max, T_for_offset)
+                             T_max, log_rho_min, log_rho_max, T_for_offset,
+                             int(options.nproc))
 
-        print 'Finished program build-grid'
+        print('Finished program build-grid')
 
         
     elif options.write_table_flag == True:
-        print '\nRunning program: write-table\n'
+        print('\nRunning program: write-table\n')
         # Read the global parameters from the command line options
         global IM; IM = str(options.IM)
         global EM; EM = str(options.EM)
 
-        print 'Interpolation method:', IM
-        print 'Error method:', EM
+        print('Interpolation method:', IM)
+        print('Error method:', EM)
         global plot_freq; plot_freq = float(options.plotFreq)
 
         max_lr_splits = int(options.max_lr_splits)
@@ -1264,14 +1390,14 @@ if __name__ == '__main__':
             elif prop == 'mu'       : indx = 5;
             elif prop == 'k'        : indx = 6;
             else:
-                print 'ERROR: In option \'p\' or \'--propert-errors\'.'
-                print 'ERROR: Unrecognised property, \'', prop, '\'. Choices are: '
-                print 'ERROR: Cv_hat, Cv, R_hat, Cp_hat, gamma_hat, mu, k (without spaces)'
+                print('ERROR: In option \'p\' or \'--propert-errors\'.')
+                print('ERROR: Unrecognised property, \'', prop, '\'. Choices are: ')
+                print('ERROR: Cv_hat, Cv, R_hat, Cp_hat, gamma_hat, mu, k (without spaces)')
                 sys.exit(1)
             error_lim[indx] = float(err)
-        print 'Error limits:'
-        print ('  Cv_hat: %g Cv: %g R_hat: %g Cp_hat: %g gamma_hat: %g mu: %g k: %g' %
-               tuple ([x for x in error_lim]))
+        print('Error limits:')
+        print('  Cv_hat: %g Cv: %g R_hat: %g Cp_hat: %g gamma_hat: %g mu: %g k: %g' %
+              tuple([x for x in error_lim]))
 
         # Load the grid into memory
         global grid; grid = Grid(jobName)
@@ -1279,17 +1405,17 @@ if __name__ == '__main__':
         # Build the table and write to file
         write_tree_to_file(jobName)
 
-        print 'Finished program build-grid'
+        print('Finished program build-grid')
 
 
     else:
-        print 'ERROR: No valid program option has been chosen. Procedure for',
-        print ' building look-up table:'
-        print ' 1. Build function grid:'
-        print '      $ ./build_cea_adaptive_lut.py --build-grid --job-name=<name> --gas=<gasName>'
-        print ' 2. Build adaptive look-up table:'
-        print '      $ ./build_cea_adaptive_lut.py --write-table --job-name=<name>'
-        print 'Try --help option for full list of features, or see documentation'
+        print('ERROR: No valid program option has been chosen. Procedure for', end=' ')
+        print(' building look-up table:')
+        print(' 1. Build function grid:')
+        print('      $ ./build_cea_adaptive_lut.py --build-grid --job-name=<name> --gas=<gasName>')
+        print(' 2. Build adaptive look-up table:')
+        print('      $ ./build_cea_adaptive_lut.py --write-table --job-name=<name>')
+        print('Try --help option for full list of features, or see documentation')
         sys.exit(1)
         
 
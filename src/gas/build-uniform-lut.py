@@ -9,10 +9,15 @@ Authors: PJ and RJG
 Versions:
     06-April-2012: Fresh start, building on cea2_gas module.
     16-Jan-2020: Port to DGD project.
+    18-Oct-2026: Rows computed in worker processes and checkpointed.
+    18-Oct-2026: Optional binary data file for the table.
 """
 
-import sys, numpy, math, time
+import sys, os, shutil, numpy, math, time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from gdtk.gas import GasModel, GasState
+from gdtk.uniform_lut import write_binary_table
 
 #-----------------------------------------------------------------------------
 
@@ -56,7 +61,8 @@ def get_u_range(gs, T_min, T_max, log_rho_values):
     return u_min, u_max
 
 def build_table(gs, tableName, T_min=200.0, T_max=20000.0,
-                log_rho_min=-6.0, log_rho_max=2.0, T_for_offset=302.0):
+                log_rho_min=-6.0, log_rho_max=2.0, T_for_offset=302.0, nproc=1,
+                binary=False):
     """
     Compute gas thermo properties for a mesh of internal-energy and density values
     and write an encoded form of the thermo data to a Lua-format file.
@@ -69,7 +75,13 @@ def build_table(gs, tableName, T_min=200.0, T_max=20000.0,
     log_rho_max: log-base-10 of maximum density in kg/m**3
     T_for_offset: Temperature at which to determine energy offset.
         Mostly, any low temperature will suffice, however co2 needs T=600.
+    nproc: number of worker processes computing the rows of the table
+    binary: if True, the table data are written at full precision to the
+        binary file lut-<tableName>.bin, which is named in the Lua file.
+        The two files are expected to stay together in the one directory.
 
+    Completed rows are saved to the file lut-<tableName>.rows as they arrive,
+    so that a run with the same parameters can pick up after an interruption.
     The file produced is intended for later use by the uniform-LUT gas model.
     """
     # Keep density range on a logarithmic scale.
@@ -97,43 +109,155 @@ def build_table(gs, tableName, T_min=200.0, T_max=20000.0,
     gs.update_trans_coeffs()
     T1 = gs.T; p1 = gs.p; s1 = gs.entropy
 
+    # Compute the rows of the table, one row per value of internal energy,
+    # picking up any rows that were completed by an earlier, interrupted run.
+    header = "# %d %d %.17g %.17g %.17g %.17g %.17g %.17g %.17g %.17g\n" % \
+        (iusteps, irsteps, u_min, u_max, log_rho_min, log_rho_max, u_offset, p1, T1, s1)
+    checkpointName = 'lut-' + tableName + '.rows'
+    rows = read_checkpoint(checkpointName, header, irsteps+1)
+    todo = [i for i in range(iusteps+1) if i not in rows]
+    print("Rows to compute: %d of %d" % (len(todo), iusteps+1))
+    # Start the checkpoint afresh, with only the complete rows.
+    fpc = open(checkpointName, 'w')
+    fpc.write(header)
+    for i in sorted(rows.keys()): write_checkpoint_row(fpc, i, rows[i])
+    reference = (u_offset, p1, T1, s1)
+    if nproc > 1 and len(todo) > 0:
+        # Each worker gets its own copy of the gas model, and rows are dealt out
+        # in small chunks so that the checkpoint keeps up with the work.
+        chunk_size = max(1, min(8, len(todo)//(4*nproc)))
+        chunks = [[(i, u_values[i]) for i in todo[j:j+chunk_size]]
+                  for j in range(0, len(todo), chunk_size)]
+        workDir = os.path.abspath('lut-' + tableName + '-work')
+        gasModelFile = os.path.abspath(gs.gmodel.file_name)
+        with ProcessPoolExecutor(max_workers=nproc, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(gasModelFile, workDir)) as pool:
+            futures = [pool.submit(compute_rows_in_worker, chunk, log_rho_values, reference)
+                       for chunk in chunks]
+            for future in as_completed(futures):
+                for i, row in future.result():
+                    rows[i] = row
+                    write_checkpoint_row(fpc, i, row)
+                print('*', end=' ')
+                sys.stdout.flush()
+        shutil.rmtree(workDir, ignore_errors=True)
+    else:
+        for i in todo:
+            rows[i] = compute_row(gs, u_values[i], log_rho_values, reference)
+            write_checkpoint_row(fpc, i, rows[i])
+            print('*', end=' ')
+            sys.stdout.flush()
+    fpc.close()
+    print()
+    #
     fname = 'lut-' + tableName + '.lua'
     print("Writing out look-up table: %s" % fname)
     fp = open(fname, 'w')
     fp.write("-- Auto-generated by build-uniform-lut.py on: %s\n" % time.asctime())
     fp.write("model = 'look-up table'\n")
     fp.write("with_entropy = 1\n")
-    fp.write("p1 = %g\n" % p1)
-    fp.write("T1 = %g\n" % T1)
-    fp.write("s1 = %g\n" % s1)
+    # The binary table keeps full precision, so its parameters should too.
+    fmt = "%.17g" if binary else "%g"
+    fp.write(("p1 = "+fmt+"\n") % p1)
+    fp.write(("T1 = "+fmt+"\n") % T1)
+    fp.write(("s1 = "+fmt+"\n") % s1)
     fp.write("iesteps = %d\n" % iusteps) # retain old name in table
     fp.write("irsteps = %d\n" % irsteps)
     # It is nice to have e = Cv * T in the table.
-    fp.write("emin = %g\n" % (u_min+u_offset))
-    fp.write("de = %g\n" % du)
-    fp.write("lrmin = %g\n" % log_rho_min)
-    fp.write("dlr = %g\n" % dlr)
+    fp.write(("emin = "+fmt+"\n") % (u_min+u_offset))
+    fp.write(("de = "+fmt+"\n") % du)
+    fp.write(("lrmin = "+fmt+"\n") % log_rho_min)
+    fp.write(("dlr = "+fmt+"\n") % dlr)
     # Now, write the table data.
-    fp.write("data = {\n")
-    for u in u_values:
-        print('*', end=' ')
-        sys.stdout.flush()
-        fp.write("{\n")
-        for log_rho in log_rho_values:
-            rho = math.pow(10.0, log_rho)
-            gs.rho = rho; gs.u = u
-            gs.update_thermo_from_rhou()
-            gs.update_trans_coeffs()
-            Cv_hat = (u + u_offset) / gs.T
-            R_hat = gs.p / (rho * gs.T)
-            gamma_hat = gs.a * gs.a / (R_hat * gs.T)
-            Cp_hat = (gs.entropy - s1 + R_hat*math.log(gs.p/p1))/(math.log(gs.T/T1))
-            fp.write("{%g, %g, %g, %g, %g, %g, %g},\n" %
-                     (Cv_hat, gs.Cv, R_hat, Cp_hat, gamma_hat, gs.mu, gs.k))
-        fp.write("},\n")
-    fp.write("}\n\n")
+    if binary:
+        bname = 'lut-' + tableName + '.bin'
+        print("Writing out table data: %s" % bname)
+        write_binary_table(bname, numpy.array([rows[i] for i in range(iusteps+1)]))
+        fp.write("data_file = \"%s\"\n" % bname)
+    else:
+        fp.write("data = {\n")
+        for i in range(iusteps+1):
+            fp.write("{\n")
+            for values in rows[i]:
+                fp.write("{%g, %g, %g, %g, %g, %g, %g},\n" % tuple(values))
+            fp.write("},\n")
+        fp.write("}\n\n")
     fp.close()
-    print()
+    # With the table safely written, the checkpoint is no longer needed.
+    os.remove(checkpointName)
+    return
+
+def compute_row(gs, u, log_rho_values, reference):
+    """
+    Compute the tabulated quantities along one row of the table.
+
+    gs: a GasState object
+    u: internal energy for the row, without the offset
+    log_rho_values: the densities along the row
+    reference: tuple of (u_offset, p1, T1, s1)
+    Returns: list of tuples (Cv_hat, Cv, R_hat, Cp_hat, gamma_hat, mu, k), one per density
+    """
+    u_offset, p1, T1, s1 = reference
+    row = []
+    for log_rho in log_rho_values:
+        rho = math.pow(10.0, log_rho)
+        gs.rho = rho; gs.u = u
+        gs.update_thermo_from_rhou()
+        gs.update_trans_coeffs()
+        Cv_hat = (u + u_offset) / gs.T
+        R_hat = gs.p / (rho * gs.T)
+        gamma_hat = gs.a * gs.a / (R_hat * gs.T)
+        Cp_hat = (gs.entropy - s1 + R_hat*math.log(gs.p/p1))/(math.log(gs.T/T1))
+        row.append((Cv_hat, gs.Cv, R_hat, Cp_hat, gamma_hat, gs.mu, gs.k))
+    return row
+
+# Each worker process has its own gas model, working in its own directory
+# because the CEA program writes its scratch files into the current directory.
+worker_gs = None
+
+def init_worker(gasModelFile, workDir):
+    global worker_gs
+    myDir = os.path.join(workDir, "worker-%d" % os.getpid())
+    os.makedirs(myDir, exist_ok=True)
+    os.chdir(myDir)
+    worker_gs = GasState(GasModel(gasModelFile))
+    return
+
+def compute_rows_in_worker(chunk, log_rho_values, reference):
+    """
+    chunk: list of (index, u) pairs for the rows to be computed
+    Returns: list of (index, row) pairs
+    """
+    return [(i, compute_row(worker_gs, u, log_rho_values, reference)) for i, u in chunk]
+
+def read_checkpoint(fileName, header, nvalues):
+    """
+    Read the rows saved by an earlier run for the same table.
+
+    Rows are kept only if the header matches that of the current table,
+    and a row that was only partly written is ignored.
+    Returns: dictionary of rows, keyed by row index
+    """
+    rows = {}
+    if not os.path.exists(fileName): return rows
+    with open(fileName, 'r') as fp:
+        if fp.readline() != header:
+            print("Ignoring checkpoint file %s, which is for a different table." % fileName)
+            return rows
+        for line in fp:
+            items = line.split()
+            if len(items) != 1 + 7*nvalues: continue
+            values = [float(item) for item in items[1:]]
+            rows[int(items[0])] = [tuple(values[7*j:7*j+7]) for j in range(nvalues)]
+    print("Recovered %d rows from checkpoint file %s" % (len(rows), fileName))
+    return rows
+
+def write_checkpoint_row(fp, i, row):
+    fp.write("%d" % i)
+    for values in row:
+        fp.write(" %.17g %.17g %.17g %.17g %.17g %.17g %.17g" % tuple(values))
+    fp.write("\n")
+    fp.flush()
     return
 
 #-----------------------------------------------------------------------------
@@ -153,6 +277,10 @@ if __name__ == '__main__':
     parser.add_option("-T", "--T-for-offset", action="store", type="string", dest="T_for_offset",
                       default="302.0",
                       help="Temperature (degree K) at which to evaluate the internal energy offset.")
+    parser.add_option("-p", "--nproc", action="store", type="int", dest="nproc", default=1,
+                      help="number of worker processes computing the table")
+    parser.add_option("--binary", action="store_true", dest="binary", default=False,
+                      help="write the table data to a binary file, lut-<table-name>.bin")
     (options, args) = parser.parse_args()
     if options.tableName == None or options.gasModelFile == None:
         parser.print_help()
@@ -180,5 +308,6 @@ if __name__ == '__main__':
     gmodel = GasModel(options.gasModelFile)
     assert gmodel.n_modes == 0, "Use only a single-temperature gas model."
     gs = GasState(gmodel)
-    build_table(gs, options.tableName, T_min, T_max, log_rho_min, log_rho_max, T_for_offset)
+    build_table(gs, options.tableName, T_min, T_max, log_rho_min, log_rho_max, T_for_offset,
+                options.nproc, options.binary)
     print("Done.")
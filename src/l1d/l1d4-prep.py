@@ -335,77 +335,44 @@ class Tube(object):
         if nsegments < 1:
             raise Exception("You did not specify at least two points in your tube.")
         self.xs = np.linspace(tube.x_list[0], tube.x_list[-1], num=tube.n+1)
-        self.ds = []
-        for x in self.xs:
-            iseg = nsegments
-            for i in range(nsegments):
-                if x <= self.x_list[i]:
-                    iseg = i
-                    break
-            # Have selected the segment containing x.
-            frac = (x - self.x_list[iseg-1]) / (self.x_list[iseg] - self.x_list[iseg-1])
-            d = (1.0-frac)*self.d_list[iseg-1] + frac*self.d_list[iseg]
-            self.ds.append(d)
+        # Linear variation of diameter between the break points.
+        self.ds = np.interp(self.xs, self.x_list, self.d_list)
+        # Where patches overlap, the one specified last takes effect.
+        self.K_over_Ls = np.zeros(self.xs.shape)
+        for region in self.loss_region_list:
+            xL = region['xL']; xR = region['xR']
+            self.K_over_Ls[(self.xs >= xL) & (self.xs <= xR)] = region['K']/(xR-xL)
         #
-        self.K_over_Ls = []
-        for x in self.xs:
-            value = 0.0
-            for region in self.loss_region_list:
-                xL = region['xL']; xR = region['xR']
-                if x >= xL and x <= xR: value = region['K']/(xR-xL)
-            self.K_over_Ls.append(value)
+        self.Ts = np.full(self.xs.shape, self.T_nominal)
+        for region in self.T_patch_list:
+            xL = region['xL']; xR = region['xR']
+            self.Ts[(self.xs >= xL) & (self.xs <= xR)] = region['T']
         #
-        self.Ts = []
-        for x in self.xs:
-            value = self.T_nominal
-            for region in self.T_patch_list:
-                xL = region['xL']; xR = region['xR']
-                if x >= xL and x <= xR: value = region['T']
-            self.Ts.append(value)
+        self.vfs = np.ones(self.xs.shape)
+        for region in self.viscous_factor_patch_list:
+            xL = region['xL']; xR = region['xR']
+            self.vfs[(self.xs >= xL) & (self.xs <= xR)] = region['vf']
         #
-        self.vfs = []
-        for x in self.xs:
-            value = 1.0
-            for region in self.viscous_factor_patch_list:
-                xL = region['xL']; xR = region['xR']
-                if x >= xL and x <= xR: value = region['vf']
-            self.vfs.append(value)
-        #
-        self.htcfs = []
-        for x in self.xs:
-            value = 1.0
-            for region in self.htc_factor_patch_list:
-                xL = region['xL']; xR = region['xR']
-                if x >= xL and x <= xR: value = region['htcf']
-            self.htcfs.append(value)
+        self.htcfs = np.ones(self.xs.shape)
+        for region in self.htc_factor_patch_list:
+            xL = region['xL']; xR = region['xR']
+            self.htcfs[(self.xs >= xL) & (self.xs <= xR)] = region['htcf']
         #
         return
 
     def eval(self, x):
         """
         Computes tube cross-section properties at position x.
+
+        x may be a single position or an array of positions,
+        in which case each of the properties is an array of the same shape.
+        Beyond the ends of the tube, the end values are used.
         """
-        if x <= self.xs[0]:
-            d = self.ds[0]
-            K_over_L = self.K_over_Ls[0]
-            Twall = self.Ts[0]
-            vf = self.vfs[0]
-            htcf = self.htcfs[0]
-        elif x >= self.xs[-1]:
-            d = self.ds[-1]
-            K_over_L = self.K_over_Ls[-1]
-            Twall = self.Ts[-1]
-            vf = self.vfs[-1]
-            htcf = self.htcfs[-1]
-        else:
-            dx = self.xs[1] - self.xs[0]
-            i = int((x - self.xs[0])/dx)
-            frac = (x - self.xs[i])/dx
-            d = (1.0-frac)*self.ds[i] + frac*self.ds[i+1]
-            K_over_L = (1.0-frac)*self.K_over_Ls[i] + frac*self.K_over_Ls[i+1]
-            Twall = (1.0-frac)*self.Ts[i] + frac*self.Ts[i+1]
-            vf = (1.0-frac)*self.vfs[i] + frac*self.vfs[i+1]
-            htcf = (1.0-frac)*self.htcfs[i] + frac*self.htcfs[i+1]
+        d = np.interp(x, self.xs, self.ds)
+        K_over_L = np.interp(x, self.xs, self.K_over_Ls)
+        Twall = np.interp(x, self.xs, self.Ts)
+        vf = np.interp(x, self.xs, self.vfs)
+        htcf = np.interp(x, self.xs, self.htcfs)
         # We compute the area from diameter, assuming a circular cross-section.
         # It is put into the file for later plotting.
         area = math.pi*(d**2)/4
@@ -418,10 +385,10 @@ class Tube(object):
         fp.write('# n= %d\n' % self.n) # n+1 points along tube to follow
         fp.write('# 1:x,m  2:d,m  3:area,m^2  4:K_over_L,1/m  5:Twall,K ' +
                  ' 6:viscous-factor  7:htc-factor\n')
-        for i in range(len(self.xs)):
-            fp.write('%e %e %e %e %e %e %e\n' %
-                     (self.xs[i], self.ds[i], math.pi*(self.ds[i]**2)/4,
-                      self.K_over_Ls[i], self.Ts[i], self.vfs[i], self.htcfs[i]))
+        areas = math.pi*(self.ds**2)/4
+        for row in zip(self.xs.tolist(), self.ds.tolist(), areas.tolist(), self.K_over_Ls.tolist(),
+                       self.Ts.tolist(), self.vfs.tolist(), self.htcfs.tolist()):
+            fp.write('%e %e %e %e %e %e %e\n' % row)
         return
 
 # We will create just one Tube object that the user can alter.
@@ -695,9 +662,9 @@ class GasSlug():
         if write_header:
             fp.write("#   x   area\n")
         fp.write("# tindx %d\n" % tindx)
-        for x in self.ifxs:
-            d, area, K_over_L, Twall, vf, htcf = tube.eval(x)
-            fp.write("%e %e\n" % (x, area))
+        d, area, K_over_L, Twall, vf, htcf = tube.eval(self.ifxs)
+        for row in zip(self.ifxs.tolist(), area.tolist()):
+            fp.write("%e %e\n" % row)
         fp.write("# end\n")
         return
 
@@ -718,10 +685,12 @@ class GasSlug():
         fp.write("# tindx %d\n" % tindx)
         L_bar = 0.0; dt_chem = -1.0; dt_therm = -1.0
         shear_stress=0.0; heat_flux = 0.0
+        xmids = 0.5*(self.ifxs[1:] + self.ifxs[:-1])
+        d, area, K_over_L, Twall, vf, htcf = tube.eval(xmids)
+        volumes = area * np.diff(self.ifxs)
         for j in range(self.ncells):
-            xmid = 0.5*(self.ifxs[j+1] + self.ifxs[j])
-            d, area, K_over_L, Twall, vf, htcf = tube.eval(xmid)
-            volume = area * (self.ifxs[j+1] - self.ifxs[j])
+            xmid = xmids[j]
+            volume = volumes[j]
             #
             if callable(self.initial_fs_fun):
                 fs = self.initial_fs_fun(xmid)
@@ -745,10 +714,13 @@ class GasSlug():
             fp.write('%e %e %e %e' % (xmid, volume, self.vel, L_bar))
             fp.write(' %e %e %e %e' % (self.gas.rho, self.gas.p, self.gas.T, self.gas.u))
             fp.write(' %e %e %e' % (self.gas.a, shear_stress, heat_flux))
-            for i in range(nsp): fp.write(' %e' % (self.gas.massf[i]))
+            massf = self.gas.massf
+            for i in range(nsp): fp.write(' %e' % (massf[i]))
             if nsp > 1: fp.write(' %e' % dt_chem)
+            T_modes = self.gas.T_modes
+            u_modes = self.gas.u_modes
             for i in range(nmodes):
-                fp.write(' %e %e' % (self.gas.T_modes[i], self.gas.u_modes[i]))
+                fp.write(' %e %e' % (T_modes[i], u_modes[i]))
             if nmodes > 0: fp.write(' %e' % dt_therm)
             fp.write('\n')
         fp.write("# end\n")
@@ -786,13 +758,10 @@ class GasSlug():
         """
         Returns total energy within slug of gas.
         """
-        e = 0.0
-        for j in range(self.ncells):
-            xmid = 0.5*(self.ifxs[j+1] + self.ifxs[j])
-            d, area, K_over_L, Twall, vf, htcf = tube.eval(xmid)
-            volume = area * (self.ifxs[j+1] - self.ifxs[j])
-            e += volume*self.gas.rho*(self.gas.internal_energy + 0.5*self.vel*self.vel)
-        return e
+        xmids = 0.5*(self.ifxs[1:] + self.ifxs[:-1])
+        d, area, K_over_L, Twall, vf, htcf = tube.eval(xmids)
+        volume = np.sum(area * np.diff(self.ifxs))
+        return volume*self.gas.rho*(self.gas.internal_energy + 0.5*self.vel*self.vel)
 
 #----------------------------------------------------------------------------
 
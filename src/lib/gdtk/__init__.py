@@ -1,4 +1,5 @@
 __all__ = ['imoc', 'geom', 'flow', 'numeric',
            'gas', 'ideal_gas_flow', 'reflected_shock_tunnel',
            'sutherland', 'oblique_detonation',
-           'billig', 'billig_patch', 'busemann']
+           'billig', 'billig_patch', 'busemann',
+           'uniform_lut']
@@ -28,11 +28,12 @@ Computational Fluid Dynamics Journal, 12(2):47, pp.408--414
 .. Author: RJG (and helpful discussions with Reece Otto)
 
 .. Version: 2024-07-03
+           2026-10-18 adaptive integration that stops exactly at M1
 """
 import numpy as np
 from math import sin, cos, tan, pi, sqrt, asin, ceil
 from gdtk.ideal_gas_flow import theta_obl, M2_obl, p02_p01_obl
-from gdtk.numeric.ode import rkf45_step
+from gdtk.numeric.ode import ode_integrate_adaptive
 from gdtk.numeric.spline import CubicSpline
 from collections import namedtuple
 
@@ -69,8 +70,14 @@ class BusemannDiffuser():
     def _xy_from_rtheta(self, r, theta):
         return r*cos(theta), r*sin(theta)
 
-    def generate_contour(self, r2=1.0, dtheta=pi/180.0):
-        """Generate the Busemann diffuser contour by integration."""
+    def generate_contour(self, r2=1.0, dtheta=pi/180.0, tol=1.0e-10):
+        """
+        Generate the Busemann diffuser contour by integration.
+
+        The integration takes adaptive steps, keeping the estimated error
+        of each step within tol, and stops where the flow normal to the rays
+        becomes sonic (v = -1).  The contour is then sampled every dtheta.
+        """
 
         def fODE(theta, Y, n):
             u, v, r = Y
@@ -86,44 +93,30 @@ class BusemannDiffuser():
             denom = (u/v)*cos(theta) - sin(theta)
             return numer/denom
 
-        # Initialise storage for the integration values and derived values
-        self._us = [self._u2]
-        self._vs = [self._v2]
-        self._Ms = [self._M2]
-        self._rs = [r2]
-        self._thetas = [self._theta2]
-        x, y = self._xy_from_rtheta(r2, self._theta2)
-        self._xs = [x]
-        self._ys = [y]
-        self._dydxs = [dydx(self._theta2, self._u2, self._v2)]
-
-        # Set initial conditions
+        # Integrate with adaptive steps until the flow normal to the rays is sonic.
         n = 3
-        theta = self._theta2
         Y = np.array([self._u2, self._v2, r2])
-        while (self._vs[-1] < -1.0):
-            theta, Y, err = rkf45_step(theta, dtheta, fODE, n, Y)
-            self._thetas.append(theta)
-            self._us.append(Y[0])
-            self._vs.append(Y[1])
-            self._rs.append(Y[2])
-            M = sqrt(Y[0]**2 + Y[1]**2)
-            self._Ms.append(M)
-            x, y = self._xy_from_rtheta(self._rs[-1], self._thetas[-1])
+        ts, Ys, errs, dense = ode_integrate_adaptive(self._theta2, pi, fODE, n, Y, h=dtheta,
+                                                     tol=tol, event=lambda theta, Y: Y[1] + 1.0)
+        theta1 = ts[-1]
+        # Sample the contour every dtheta, finishing exactly at the diffuser entrance.
+        n_spaces = max(int(ceil((theta1 - self._theta2)/dtheta - 1.0e-9)), 1)
+        thetas = np.linspace(self._theta2, theta1, n_spaces+1)
+        Ys = [dense(theta) for theta in thetas[:-1]] + [Ys[-1]]
+        self._thetas = list(thetas)
+        self._us = [Y[0] for Y in Ys]
+        self._vs = [Y[1] for Y in Ys]
+        self._rs = [Y[2] for Y in Ys]
+        self._Ms = [sqrt(Y[0]**2 + Y[1]**2) for Y in Ys]
+        self._xs = []
+        self._ys = []
+        self._dydxs = []
+        for theta, Y in zip(thetas, Ys):
+            x, y = self._xy_from_rtheta(Y[2], theta)
             self._xs.append(x)
             self._ys.append(y)
             self._dydxs.append(dydx(theta, Y[0], Y[1]))
 
-        # Remove final point.
-        self._thetas.pop()
-        self._us.pop()
-        self._vs.pop()
-        self._rs.pop()
-        self._Ms.pop()
-        self._xs.pop()
-        self._ys.pop()
-        self._dydxs.pop()
-
         # Set M1 now that we've completed integration
         self._M1 = self._Ms[-1]
             
@@ -1 +1 @@
-__all__ = ['field', 'vtk_writer']
+__all__ = ['field', 'vtk_writer', 'cell_index', 'dataset']
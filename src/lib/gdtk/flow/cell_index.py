@@ -0,0 +1,100 @@
+# cell_index.py
+# Spatial index over the cell centres of a collection of flow blocks.
+# 2026-10-18 for the Chicken and Lorikeet post-processors.
+#
+
+import numpy as np
+from scipy import spatial
+
+
+class CellIndex():
+    """
+    A KD-tree over the cell centres of all blocks, for batched
+    nearest-cell and probe queries.
+
+    The blocks are given as a dictionary of flow data, keyed by block,
+    where the flow data for each block is a dictionary of arrays of
+    the same shape, one array per variable.  The cell indices returned
+    are indices into those arrays.
+    """
+
+    def __init__(self, blocks, coords=('posx', 'posy', 'posz')):
+        """
+        blocks: dictionary of flow data for each block
+        coords: names of the variables holding the cell-centre coordinates
+        """
+        self.coords = coords
+        self.keys = list(blocks.keys())
+        self.shapes = [blocks[key][coords[0]].shape for key in self.keys]
+        self.offsets = np.cumsum([0] + [int(np.prod(shape)) for shape in self.shapes])
+        xyz = np.column_stack([np.concatenate([blocks[key][c].ravel() for key in self.keys])
+                               for c in coords])
+        self.kdtree = spatial.cKDTree(xyz)
+        return
+
+    def __repr__(self):
+        return f"CellIndex(nblocks={len(self.keys)}, ncells={self.offsets[-1]}, coords={self.coords})"
+
+    def nearest_cells(self, points, k=1):
+        """
+        Find the k nearest cell centres to each of the points.
+
+        points: array of shape (npoints, ndim), or a single point
+        Returns: tuple of (distances, blocks, cells), where
+          distances has shape (npoints, k),
+          blocks is a list of npoints lists of k block keys, and
+          cells has shape (npoints, k, ndim_block) holding the cell indices
+          within each block's arrays.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        distances, flat = self.kdtree.query(points, k=k)
+        distances = distances.reshape((len(points), k))
+        flat = flat.reshape((len(points), k))
+        return self._locate(distances, flat)
+
+    def _locate(self, distances, flat):
+        """
+        Convert the flat indices from a KD-tree query into block keys and cell indices.
+        """
+        npoints, k = flat.shape
+        ib = np.searchsorted(self.offsets, flat, side='right') - 1
+        blocks = [[self.keys[b] for b in row] for row in ib]
+        ndim = len(self.shapes[0])
+        cells = np.zeros((npoints, k, ndim), dtype=int)
+        for b in np.unique(ib):
+            mask = ib == b
+            cells[mask] = np.column_stack(np.unravel_index(flat[mask] - self.offsets[b], self.shapes[b]))
+        return distances, blocks, cells
+
+    def probe(self, points, blocks, variables=None, k=4):
+        """
+        Values of flow variables at the points, by inverse-distance weighting
+        of the k nearest cells.
+
+        points:    array of shape (npoints, ndim), or a single point
+        blocks:    dictionary of flow data, with the same layout as that indexed,
+                   perhaps for a different snapshot
+        variables: names of the variables wanted (default: all)
+        Returns: tuple of (values, nearest), where values is a dictionary of arrays
+          of npoints values and nearest is the result of nearest_cells(points, 1).
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        k = min(k, self.offsets[-1])
+        distances, flat = self.kdtree.query(points, k=k)
+        distances = distances.reshape((len(points), k))
+        flat = flat.reshape((len(points), k))
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / distances
+        # A point on a cell centre takes that cell's values.
+        exact = distances[:,0] == 0.0
+        weights[exact] = 0.0
+        weights[exact,0] = 1.0
+        weights /= np.sum(weights, axis=1)[:,None]
+        if variables is None: variables = list(blocks[self.keys[0]].keys())
+        values = {}
+        for var in variables:
+            data = np.concatenate([blocks[key][var].ravel() for key in self.keys])
+            values[var] = np.sum(weights * data[flat], axis=1)
+        # The closest of the k cells is the nearest cell; there is no need to search again.
+        nearest = self._locate(distances[:,:1], flat[:,:1])
+        return values, nearest
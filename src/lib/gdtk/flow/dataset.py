@@ -0,0 +1,270 @@
+# dataset.py
+"""
+FlowDataset class for working with all of the blocks and snapshots of an Eilmer job.
+
+The job directory is indexed from its config files and the field data
+for each block and snapshot are read, as Field objects, only when needed.
+A bounded cache of recently-used Field objects keeps the memory in check
+while reductions over the whole run are accumulated one snapshot at a time.
+
+2026-10-18
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+import numpy as np
+
+from gdtk.flow.field import Field
+from gdtk.geom.sgrid import StructuredGrid
+
+REDUCTIONS = ['min', 'max', 'mean', 'integral']
+
+class FlowDataset():
+    """
+    The blocks x snapshots x variables of field data for an Eilmer job.
+
+    Field objects are loaded on first use and kept in a least-recently-used
+    cache of at most cache_size entries.
+    """
+
+    def __init__(self, jobName, jobDir='.', tag='field', cache_size=32, lazy=True, nproc=None):
+        """
+        jobName: base name of the job's files
+        jobDir: directory in which the simulation was run
+        tag: the CellData tag, for the zip-archive flow format
+        cache_size: maximum number of Field objects held in memory
+        lazy: if True, variables are parsed on first access within each Field
+        nproc: number of worker processes used for prefetching (default os.cpu_count())
+        """
+        self.jobName = jobName
+        self.jobDir = jobDir
+        self.tag = tag
+        self.cache_size = cache_size
+        self.lazy = lazy
+        self.nproc = nproc if nproc else os.cpu_count()
+        #
+        configFileName = os.path.join(jobDir, 'config', jobName+'.config')
+        if not os.path.exists(configFileName):
+            raise RuntimeError(f"Could not find config file: {configFileName}")
+        with open(configFileName, 'r') as fp:
+            config = json.load(fp)
+        self.config = config
+        self.flow_format = config.get('flow_format', 'gziptext')
+        if self.flow_format not in ['gziptext', 'eilmer4text', 'eilmer4binary']:
+            raise RuntimeError(f"Field cannot read flow_format: {self.flow_format}")
+        self.grid_format = config.get('grid_format', 'gziptext')
+        self.grid_motion = config.get('grid_motion', 'none')
+        self.nblocks = config['nfluidblock']
+        #
+        # The block list gives the grid type of each block.
+        self.grid_types = []
+        listFileName = os.path.join(jobDir, 'config', jobName+'.list')
+        if os.path.exists(listFileName):
+            with open(listFileName, 'r') as fp:
+                for line in fp.readlines():
+                    items = line.strip().split()
+                    if len(items) == 0 or items[0].startswith('#'): continue
+                    self.grid_types.append(items[1])
+        #
+        # The times file lists the snapshots, with their simulation times.
+        self.times = {}
+        timesFileName = os.path.join(jobDir, 'config', jobName+'.times')
+        with open(timesFileName, 'r') as fp:
+            for line in fp.readlines():
+                items = line.strip().split()
+                if len(items) == 0 or items[0].startswith('#'): continue
+                self.times[int(items[0])] = float(items[1])
+        self.tindx_list = sorted(self.times.keys())
+        #
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = None
+        return
+
+    def __repr__(self):
+        str = "FlowDataset("
+        str += f"jobName={self.jobName}, jobDir={self.jobDir}"
+        str += f", nblocks={self.nblocks}, tindx_list={self.tindx_list}"
+        str += f", cache_size={self.cache_size}"
+        str += ")"
+        return str
+
+    def flow_file_name(self, ib, tindx):
+        """
+        Path to the field data for block ib at snapshot tindx.
+        """
+        if self.flow_format == 'gziptext':
+            name = f"flow/t{tindx:04d}/{self.jobName}.flow.b{ib:04d}.t{tindx:04d}.gz"
+        else:
+            name = f"CellData/{self.tag}/t{tindx:04d}/{self.jobName}.{self.tag}.b{ib:04d}.t{tindx:04d}.zip"
+        return os.path.join(self.jobDir, name)
+
+    def grid_file_name(self, ib, tindx=0):
+        """
+        Path to the grid for block ib, which only changes with tindx for moving grids.
+        """
+        gindx = tindx if self.grid_motion != 'none' else 0
+        ext = 'bin' if self.grid_format == 'rawbinary' else 'gz'
+        name = f"grid/t{gindx:04d}/{self.jobName}.grid.b{ib:04d}.t{gindx:04d}.{ext}"
+        return os.path.join(self.jobDir, name)
+
+    def grid(self, ib, tindx=0):
+        """
+        The StructuredGrid for block ib.
+        """
+        if self.grid_types and self.grid_types[ib] != 'structured_grid':
+            raise RuntimeError(f"Block {ib} does not have a structured grid.")
+        fileName = self.grid_file_name(ib, tindx)
+        if self.grid_format == 'rawbinary':
+            return StructuredGrid(binaryfile=fileName, memmap=True)
+        return StructuredGrid(gzfile=fileName)
+
+    def field(self, ib, tindx):
+        """
+        The Field for block ib at snapshot tindx, from the cache if possible.
+        """
+        key = (ib, tindx)
+        with self.lock:
+            item = self.cache.get(key)
+            if item is not None: self.cache.move_to_end(key)
+        if item is None:
+            item = _read_field(self.flow_file_name(ib, tindx), self.flow_format, self.lazy)
+            self._remember(key, item)
+        elif isinstance(item, Future):
+            item = item.result()
+            self._remember(key, item)
+        return item
+
+    def fields(self, tindx, blocks=None):
+        """
+        Dictionary of the Field objects for the blocks at snapshot tindx.
+        """
+        if blocks is None: blocks = range(self.nblocks)
+        return {ib:self.field(ib, tindx) for ib in blocks}
+
+    def prefetch(self, tindx_list, blocks=None):
+        """
+        Start reading the fields for the snapshots in worker processes.
+
+        The Field objects land in the cache and are picked up by later calls
+        to field(), so prefetch no more than cache_size fields at a time.
+        """
+        if blocks is None: blocks = range(self.nblocks)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.nproc)
+        for tindx in tindx_list:
+            for ib in blocks:
+                key = (ib, tindx)
+                with self.lock:
+                    if key in self.cache: continue
+                future = self.pool.submit(_read_field, self.flow_file_name(ib, tindx), self.flow_format, False)
+                self._remember(key, future)
+        return
+
+    def _remember(self, key, item):
+        with self.lock:
+            self.cache[key] = item
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return
+
+    def clear(self):
+        """
+        Forget the cached fields and stop the worker processes.
+        """
+        with self.lock:
+            pending = [item for item in self.cache.values() if isinstance(item, Future)]
+            self.cache.clear()
+        # Reads that have not yet started are dropped; those under way are waited for.
+        for future in pending: future.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        return
+
+    def reduce(self, variables, reductions=REDUCTIONS, tindx_list=None, blocks=None, prefetch=True):
+        """
+        Reductions of flow variables over the cells of the blocks, for each snapshot.
+
+        variables: names of the flow variables
+        reductions: any of 'min', 'max', 'mean' and 'integral'.
+          The mean and integral are weighted by the cell volume, 'vol',
+          if it is present in the field data, else the mean is a simple average
+          and the integral is a sum over the cells.
+        tindx_list: snapshots to visit (default: all)
+        blocks: blocks to include (default: all)
+        prefetch: if True, the next snapshot is read while the current one is reduced
+
+        Returns: tuple of (times, results) where times is an array of the
+          simulation times of the snapshots and results[var][reduction] is an array
+          with one entry per snapshot (and a trailing axis for array quantities).
+        """
+        if isinstance(variables, str): variables = [variables]
+        for r in reductions:
+            if r not in REDUCTIONS: raise RuntimeError(f"Unknown reduction: {r}")
+        if tindx_list is None: tindx_list = self.tindx_list
+        if blocks is None: blocks = list(range(self.nblocks))
+        results = {var:{r:[] for r in reductions} for var in variables}
+        # Reading ahead only pays if two snapshots fit in the cache.
+        prefetch = prefetch and 2*len(blocks) <= self.cache_size
+        if prefetch and len(tindx_list) > 0: self.prefetch(tindx_list[:1], blocks)
+        for n, tindx in enumerate(tindx_list):
+            if prefetch and n+1 < len(tindx_list): self.prefetch(tindx_list[n+1:n+2], blocks)
+            flows = self.fields(tindx, blocks)
+            weights = [_cell_weights(flow) for flow in flows.values()]
+            for var in variables:
+                # Each block's data, with cells along the first axis.
+                data = [_cell_values(flow, var) for flow in flows.values()]
+                if 'min' in reductions:
+                    results[var]['min'].append(np.min([np.min(d, axis=0) for d in data], axis=0))
+                if 'max' in reductions:
+                    results[var]['max'].append(np.max([np.max(d, axis=0) for d in data], axis=0))
+                if 'mean' in reductions or 'integral' in reductions:
+                    total = np.sum([np.sum(d*w, axis=0) for d, w in zip(data, weights)], axis=0)
+                    if 'integral' in reductions: results[var]['integral'].append(total)
+                    if 'mean' in reductions: results[var]['mean'].append(total/sum(np.sum(w) for w in weights))
+        times = np.array([self.times[tindx] for tindx in tindx_list])
+        for var in variables:
+            for r in reductions:
+                values = np.array(results[var][r])
+                # Drop the trailing axis for scalar quantities.
+                results[var][r] = values[:,0] if values.shape[-1] == 1 else values
+        return times, results
+
+    def time_series(self, var, reduction='mean', tindx_list=None, blocks=None):
+        """
+        A single reduction of one variable over the snapshots.
+
+        Returns: tuple of (times, values)
+        """
+        times, results = self.reduce([var], [reduction], tindx_list, blocks)
+        return times, results[var][reduction]
+
+
+def _read_field(fileName, flow_format, lazy):
+    """
+    Read a Field; at module level so that it can run in a worker process.
+    """
+    if flow_format == 'gziptext':
+        return Field(gzfile=fileName, lazy=lazy)
+    return Field(ziparchive=fileName, lazy=lazy)
+
+def _cell_values(flow, var):
+    """
+    The data for a variable as an array of shape (ncells, length),
+    where length is 1 for scalar quantities.
+    """
+    ncells = flow.nic*flow.njc*flow.nkc
+    return flow.data[var].reshape((ncells, -1))
+
+def _cell_weights(flow):
+    """
+    Cell volumes, if available, else unit weights, with the cells along the first axis.
+    """
+    ncells = flow.nic*flow.njc*flow.nkc
+    if 'vol' in flow.variables:
+        return flow.data['vol'].reshape((ncells, 1))
+    return np.ones((ncells, 1))
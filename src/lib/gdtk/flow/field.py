@@ -9,6 +9,7 @@ import re
 import zipfile
 import gzip
 import json
+from collections.abc import MutableMapping
 import numpy
 
 class Field():
@@ -16,17 +17,19 @@ class Field():
     Pick up a block of flow-field data from an Eilmer simulation.
 
     Once in memory, the data are available in a dictionary of numpy arrays.
+    With lazy=True, the dictionary parses each variable on first access.
     """
     __slots__ = ['new_format', 'ziparchive', 'gzfile',
                  'sim_time', 'variables', 'data', 'lengths',
                  'nic', 'njc', 'nkc', 'structured']
 
-    def __init__(self, ziparchive=None, gzfile=None):
+    def __init__(self, ziparchive=None, gzfile=None, lazy=False):
         """
         Read a block's field data from either a zip-archives or a gzipped file.
 
         ziparchive: file name of Daryl's zip archive.
         gzfile: file name of the "classic" Eilmer flow file.
+        lazy: if True, defer the parsing of each variable until it is first used.
         """
         if ziparchive and not gzfile:
             self.new_format = True
@@ -48,30 +51,45 @@ class Field():
             self.nic = header['nic']
             self.njc = header['njc']
             self.nkc = header['nkc']
-            self.data = {}
+            binary = header.get('data_type', 'string') == 'binary'
+            delimiter = header.get('delimiter', ' ')
             self.lengths = {} # a length of 1 indicates a scalar quantity
             for var in self.variables:
+                self.lengths[var] = header['variables'][var]['dimension'][1]
+            #
+            def load(var, za=None):
                 metaData = header['variables'][var]
-                dataFile = metaData['data']
-                n_cells = metaData['dimension'][0]
                 length = metaData['dimension'][1]
-                with za.open(dataFile, 'r') as fp:
-                    dataBlob = numpy.loadtxt(fp)
+                if za is None:
+                    with zipfile.ZipFile(self.ziparchive, mode='r') as z:
+                        blob = z.read(metaData['data'])
+                else:
+                    blob = za.read(metaData['data'])
+                if binary:
+                    dataBlob = numpy.frombuffer(blob, dtype=float).copy()
+                else:
+                    if delimiter.strip(): blob = blob.replace(delimiter.encode(), b' ')
+                    dataBlob = numpy.array(blob.split(), dtype=float)
                 if length == 1:
                     # Scalar quantity
                     if self.nkc > 1:
                         dataBlob = dataBlob.reshape(self.nkc, self.njc, self.nic)
                     else:
                         dataBlob = dataBlob.reshape(self.njc, self.nic)
-                    self.data[var] = dataBlob.transpose() # index as [i,j] or [i,j,k]
+                    return dataBlob.transpose() # index as [i,j] or [i,j,k]
                 else:
                     # Array quantity
                     if self.nkc > 1:
                         dataBlob = dataBlob.reshape(length, self.nkc, self.njc, self.nic)
                     else:
                         dataBlob = dataBlob.reshape(length, self.njc, self.nic)
-                    self.data[var] = dataBlob.transpose() # index as [i,j,n] or [i,j,k,n]
-                self.lengths[var] = length
+                    return dataBlob.transpose() # index as [i,j,n] or [i,j,k,n]
+            #
+            if lazy:
+                self.data = FieldData(self.variables, load)
+            else:
+                self.data = {var:load(var, za) for var in self.variables}
+            za.close()
         else:
             # Classic (gzipped text) format for Eilmer flow file.
             if not os.path.exists(gzfile):
@@ -105,32 +123,31 @@ class Field():
             text = fp.readline() # nkcell
             items = re.split(":", text)
             self.nkc = int(items[1])
-            self.data = {}
             if dimensions==2:
                 if not self.nkc==1:
                     raise RuntimeError(f"For a 2D grid, expect nkc==1 but got {self.nkc}")
-                for var in self.variables:
-                    self.data[var] = numpy.zeros((self.nic,self.njc), float)
-                for j in range(self.njc):
-                    for i in range(self.nic):
-                        text = fp.readline().strip()
-                        items = text.split(' ')
-                        assert nvariables == len(items), "Wrong number of items on data line."
-                        for n in range(nvariables):
-                            self.data[self.variables[n]][i,j] = float(items[n])
+                shape = (self.njc, self.nic)
             else:
-                # 3D grid
-                for var in self.variables:
-                    self.data[var] = numpy.zeros((self.nic,self.njc,self.nkc), float)
-                for k in range(self.nkc):
-                    for j in range(self.njc):
-                        for i in range(self.nic):
-                            text = fp.readline().strip()
-                            items = text.split(' ')
-                            assert nvariables == len(items), "Wrong number of items on data line."
-                            for n in range(nvariables):
-                                self.data[self.variables[n]][i,j,k] = float(items[n])
+                shape = (self.nkc, self.njc, self.nic)
+            # The rest of the file is one line per cell, with i varying fastest,
+            # and one item per variable on each line.
+            # All of the items are converted to floats in one pass.
+            # For the lazy dictionary, the converted array is kept and each variable
+            # is sliced from it on first access; the text itself is not kept.
+            items = fp.read().split()
             fp.close()
+            ncells = self.nic*self.njc*self.nkc
+            if len(items) != ncells*nvariables:
+                raise RuntimeError(f"Expected {ncells}x{nvariables} data items but found {len(items)}.")
+            allData = numpy.array(items, dtype=float).reshape(ncells, nvariables)
+            del items
+            def load(var):
+                n = self.variables.index(var)
+                return allData[:,n].reshape(shape).transpose() # index as [i,j] or [i,j,k]
+            if lazy:
+                self.data = FieldData(self.variables, load)
+            else:
+                self.data = {var:load(var) for var in self.variables}
         return
 
     def __repr__(self):
@@ -142,3 +159,45 @@ class Field():
         str += ")"
         return str
 
+
+class FieldData(MutableMapping):
+    """
+    Dictionary of the arrays for a block's variables,
+    with each array parsed on first access and then kept.
+    """
+    __slots__ = ['variables', 'loader', 'arrays']
+
+    def __init__(self, variables, loader):
+        """
+        variables: names of the variables available
+        loader: function that returns the array for a named variable
+        """
+        self.variables = list(variables)
+        self.loader = loader
+        self.arrays = {}
+        return
+
+    def __getitem__(self, var):
+        if var not in self.arrays:
+            if var not in self.variables: raise KeyError(var)
+            self.arrays[var] = self.loader(var)
+        return self.arrays[var]
+
+    def __setitem__(self, var, value):
+        if var not in self.variables: self.variables.append(var)
+        self.arrays[var] = value
+        return
+
+    def __delitem__(self, var):
+        self.variables.remove(var)
+        self.arrays.pop(var, None)
+        return
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __repr__(self):
+        return f"FieldData(variables={self.variables}, loaded={list(self.arrays.keys())})"
@@ -0,0 +1,62 @@
+"""
+Test module for the cell_index.py module.
+
+The flow data are for two side-by-side blocks of unit cells,
+with a field that is linear in x and y.
+
+.. Version: 2026-10-18
+"""
+
+import numpy as np
+import pytest
+
+from gdtk.flow.cell_index import CellIndex
+
+def linear_field(x, y):
+    return 2.0*x + 3.0*y + 1.0
+
+def make_block(x0, nic=4, njc=3):
+    # Cell centres, indexed as [i,j].
+    x, y = np.meshgrid(x0 + 0.5 + np.arange(nic), 0.5 + np.arange(njc), indexing='ij')
+    return {'posx':x, 'posy':y, 'phi':linear_field(x, y)}
+
+blocks = {'0,0':make_block(0.0), '1,0':make_block(4.0)}
+index = CellIndex(blocks, ('posx', 'posy'))
+
+def test_repr():
+    assert repr(index) == "CellIndex(nblocks=2, ncells=24, coords=('posx', 'posy'))"
+
+def test_nearest_cell():
+    distances, blks, cells = index.nearest_cells([5.1, 2.4])
+    assert blks == [['1,0']]
+    assert cells.tolist() == [[[1, 2]]]
+    assert distances[0,0] == pytest.approx(np.hypot(0.4, 0.1))
+
+def test_nearest_cells_in_both_blocks():
+    # On the interface between the blocks, two cells of each are equally near.
+    distances, blks, cells = index.nearest_cells([[4.0, 1.0], [0.6, 0.4]], k=4)
+    assert distances.shape == (2, 4)
+    assert sorted(blks[0]) == ['0,0', '0,0', '1,0', '1,0']
+    assert np.allclose(distances[0], np.sqrt(0.5))
+    for b, (i, j) in zip(blks[0], cells[0]):
+        assert blocks[b]['posx'][i,j] in [3.5, 4.5]
+        assert blocks[b]['posy'][i,j] in [0.5, 1.5]
+    assert blks[1][0] == '0,0'
+    assert cells[1,0].tolist() == [0, 0]
+
+def test_probe_reproduces_linear_field():
+    # At a cell centre, the probe takes that cell's value.
+    # At a grid node, the four surrounding cells are equally weighted
+    # and their average is the value of the linear field.
+    points = np.array([[2.5, 1.5], [2.0, 1.0], [4.0, 2.0], [6.0, 1.0]])
+    values, nearest = index.probe(points, blocks, ['phi'], k=4)
+    assert values['phi'] == pytest.approx(linear_field(points[:,0], points[:,1]))
+
+def test_probe_nearest_matches_nearest_cells():
+    points = [[0.3, 0.2], [5.1, 2.4], [4.0, 1.1]]
+    values, nearest = index.probe(points, blocks, k=4)
+    assert set(values.keys()) == {'posx', 'posy', 'phi'}
+    distances, blks, cells = index.nearest_cells(points, 1)
+    assert nearest[1] == blks
+    assert np.array_equal(nearest[2], cells)
+    assert np.allclose(nearest[0], distances)
@@ -0,0 +1,104 @@
+"""
+Test module for the dataset.py module.
+
+A small job, of two 2D blocks and three snapshots in the classic gzipped
+flow format, is written for the tests.
+
+.. Version: 2026-10-18
+"""
+
+import os
+import gzip
+import json
+import numpy as np
+import pytest
+
+from gdtk.flow.dataset import FlowDataset
+
+nic, njc = 4, 3
+times = [0.0, 0.5, 1.0]
+
+def cell_data(ib, tindx):
+    x, y = np.meshgrid(4.0*ib + 0.5 + np.arange(nic), 0.5 + np.arange(njc), indexing='ij')
+    vol = np.full(x.shape, 1.0 + ib)
+    rho = (tindx + 1.0) + x
+    return x, y, vol, rho
+
+@pytest.fixture
+def job_dir(tmp_path):
+    os.makedirs(str(tmp_path / "config"))
+    with open(str(tmp_path / "config" / "job.config"), 'w') as fp:
+        json.dump({'nfluidblock':2, 'flow_format':'gziptext'}, fp)
+    with open(str(tmp_path / "config" / "job.times"), 'w') as fp:
+        fp.write("# tindx sim_time dt_global\n")
+        for tindx, t in enumerate(times): fp.write(f"{tindx:04d} {t:.18e} 1.0e-6\n")
+    for tindx, t in enumerate(times):
+        os.makedirs(str(tmp_path / "flow" / f"t{tindx:04d}"))
+        for ib in range(2):
+            fileName = str(tmp_path / "flow" / f"t{tindx:04d}" / f"job.flow.b{ib:04d}.t{tindx:04d}.gz")
+            with gzip.open(fileName, 'wt') as fp:
+                fp.write("structured_grid_flow 1.0\n")
+                fp.write(f"label: block-{ib}\n")
+                fp.write(f"sim_time: {t:.18e}\n")
+                fp.write("variables: 4\n")
+                fp.write('"pos.x" "pos.y" "vol" "rho"\n')
+                fp.write("dimensions: 2\n")
+                fp.write(f"nicell: {nic}\nnjcell: {njc}\nnkcell: 1\n")
+                x, y, vol, rho = cell_data(ib, tindx)
+                # One line per cell, with i varying fastest.
+                for j in range(njc):
+                    for i in range(nic):
+                        fp.write(f"{x[i,j]:.18e} {y[i,j]:.18e} {vol[i,j]:.18e} {rho[i,j]:.18e}\n")
+    return str(tmp_path)
+
+def test_index(job_dir):
+    ds = FlowDataset('job', job_dir)
+    assert ds.nblocks == 2
+    assert ds.tindx_list == [0, 1, 2]
+    assert ds.times[1] == pytest.approx(0.5)
+
+def test_missing_config(tmp_path):
+    with pytest.raises(RuntimeError):
+        FlowDataset('job', str(tmp_path))
+
+def test_field_cache(job_dir):
+    ds = FlowDataset('job', job_dir, cache_size=2)
+    f = ds.field(1, 2)
+    assert (f.nic, f.njc) == (nic, njc)
+    assert np.allclose(f.data['rho'], cell_data(1, 2)[3])
+    assert ds.field(1, 2) is f
+    ds.field(0, 0)
+    ds.field(0, 1)
+    assert len(ds.cache) == 2
+    assert (1, 2) not in ds.cache
+    assert ds.field(1, 2) is not f
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_reduce(job_dir, prefetch):
+    ds = FlowDataset('job', job_dir, nproc=1)
+    t, results = ds.reduce(['rho'], prefetch=prefetch)
+    ds.clear()
+    assert ds.pool is None and len(ds.cache) == 0
+    assert np.allclose(t, times)
+    for tindx in ds.tindx_list:
+        data = [cell_data(ib, tindx) for ib in range(2)]
+        rho = np.concatenate([d[3].ravel() for d in data])
+        vol = np.concatenate([d[2].ravel() for d in data])
+        assert results['rho']['min'][tindx] == pytest.approx(np.min(rho))
+        assert results['rho']['max'][tindx] == pytest.approx(np.max(rho))
+        assert results['rho']['integral'][tindx] == pytest.approx(np.sum(rho*vol))
+        assert results['rho']['mean'][tindx] == pytest.approx(np.sum(rho*vol)/np.sum(vol))
+
+def test_time_series(job_dir):
+    ds = FlowDataset('job', job_dir)
+    t, values = ds.time_series('rho', 'max', tindx_list=[0, 2], blocks=[0])
+    assert np.allclose(t, [0.0, 1.0])
+    assert np.allclose(values, [1.0+3.5, 3.0+3.5])
+
+def test_clear_with_pending_reads(job_dir):
+    ds = FlowDataset('job', job_dir, nproc=1)
+    ds.prefetch(ds.tindx_list)
+    ds.clear()
+    assert ds.pool is None and len(ds.cache) == 0
+    # The dataset is still usable after being cleared.
+    assert np.allclose(ds.field(0, 1).data['rho'], cell_data(0, 1)[3])
@@ -0,0 +1,74 @@
+"""
+Test module for the classic-format reader of the field.py module.
+
+The bulk and lazy parsers are checked against the original
+line-by-line parser on small gzipped flow files.
+
+.. Version: 2026-10-18
+"""
+
+import gzip
+import numpy as np
+import pytest
+
+from gdtk.flow.field import Field, FieldData
+
+variables = ["pos.x", "pos.y", "pos.z", "rho", "vel.x"]
+
+def write_flow_file(fileName, nic, njc, nkc, nitems=None):
+    rng = np.random.default_rng(nic*njc*nkc)
+    values = rng.random((nic*njc*nkc, len(variables)))
+    with gzip.open(fileName, 'wt') as fp:
+        fp.write("structured_grid_flow 1.0\n")
+        fp.write("label: \n")
+        fp.write("sim_time: 1.5e-03\n")
+        fp.write(f"variables: {len(variables)}\n")
+        fp.write(" ".join(f'"{v}"' for v in variables) + "\n")
+        fp.write(f"dimensions: {2 if nkc == 1 else 3}\n")
+        fp.write(f"nicell: {nic}\nnjcell: {njc}\nnkcell: {nkc}\n")
+        for row in values:
+            fp.write(" ".join(f"{x:.18e}" for x in row[:nitems]) + "\n")
+    return
+
+def per_element_data(fileName):
+    """
+    The original parser, one line per cell and one float() per item.
+    """
+    fp = gzip.open(fileName, 'rt')
+    for n in range(6): fp.readline()
+    nic = int(fp.readline().split(":")[1])
+    njc = int(fp.readline().split(":")[1])
+    nkc = int(fp.readline().split(":")[1])
+    data = {var:np.zeros((nic,njc,nkc)) for var in variables}
+    for k in range(nkc):
+        for j in range(njc):
+            for i in range(nic):
+                items = fp.readline().strip().split(' ')
+                assert len(items) == len(variables), "Wrong number of items on data line."
+                for n in range(len(variables)):
+                    data[variables[n]][i,j,k] = float(items[n])
+    fp.close()
+    if nkc == 1: data = {var:a[:,:,0] for var,a in data.items()}
+    return data
+
+@pytest.mark.parametrize("dims", [(4, 3, 1), (3, 2, 2)])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_classic_format(tmp_path, dims, lazy):
+    fileName = str(tmp_path / "flow.gz")
+    write_flow_file(fileName, *dims)
+    expected = per_element_data(fileName)
+    f = Field(gzfile=fileName, lazy=lazy)
+    assert f.variables == variables
+    assert (f.nic, f.njc, f.nkc) == dims
+    assert f.sim_time == pytest.approx(1.5e-3)
+    assert isinstance(f.data, FieldData) == lazy
+    if lazy: assert len(f.data.arrays) == 0
+    for var in variables:
+        assert np.array_equal(f.data[var], expected[var])
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_wrong_item_count(tmp_path, lazy):
+    fileName = str(tmp_path / "flow.gz")
+    write_flow_file(fileName, 4, 3, 1, nitems=len(variables)-1)
+    with pytest.raises(RuntimeError):
+        Field(gzfile=fileName, lazy=lazy)
@@ -2,14 +2,18 @@
 # Write VTK-format files using the data from grid and flow-field objects.
 # Peter J.
 # 2023-04-09 adapted from the lorikeet-postprocessing code.
+# 2026-10-18 binary (base64 and appended raw) data arrays, optionally compressed.
 #
 
 import math
+import base64
+import zlib
+import numpy as np
 from gdtk.geom.sgrid import StructuredGrid
 from gdtk.flow.field import Field
 
 
-def write_vtk_structured_grid_file(vtkFile, grid, flow):
+def write_vtk_structured_grid_file(vtkFile, grid, flow, encoding="ascii", compress=False):
     """
     Combine the finite-volume grid and flow data for a structured-grid block
     into a VTK StructuredGrid file.
@@ -18,6 +22,7 @@ def write_vtk_structured_grid_file(vtkFile, grid, flow):
       vtkFile: name of the resulting VTK file, typically xxxx.vts
       grid:    StructuredGrid object
       flow:    flow/Field object
+      encoding, compress: as for write_vts_piece()
 
     It is the caller's responsibility to have matching grid and flow-field objects.
     """
@@ -30,59 +35,120 @@ def write_vtk_structured_grid_file(vtkFile, grid, flow):
     else:
         assert grid.nkv-1 == flow.nkc, "3D grid mismatch in cell and vertex numbers"
     #
-    fp = open(vtkFile, mode='w')
-    fp.write('<VTKFile type="StructuredGrid" version="0.1" byte_order="BigEndian">\n')
     if grid.dimensions == 2:
-        fp.write('<StructuredGrid WholeExtent="%d %d %d %d 0 0">\n' % (0, grid.niv-1, 0, grid.njv-1))
-        fp.write('<Piece Extent="%d %d %d %d 0 0">\n' % (0, grid.niv-1, 0, grid.njv-1))
+        extent = (0, grid.niv-1, 0, grid.njv-1, 0, 0)
     else:
-        fp.write('<StructuredGrid WholeExtent="%d %d %d %d %d %d">\n' % (0, grid.niv-1, 0, grid.njv-1, 0, grid.nkv-1))
-        fp.write('<Piece Extent="%d %d %d %d %d %d">\n' % (0, grid.niv-1, 0, grid.njv-1, 0, grid.nkv-1))
-    #
-    fp.write('<CellData>\n')
-    for var in flow.variables:
-        fp.write('<DataArray Name="%s" type="Float64" NumberOfComponents="1" format="ascii">\n' % (var,))
-        # Our arrays of data are indexed as [i, j, k]
-        # VTK format has k as outer loop and i as inner loop.
-        data = flow.data[var].transpose().flatten()
-        for item in data: fp.write('%g\n' % (item,))
-        fp.write('</DataArray>\n')
+        extent = (0, grid.niv-1, 0, grid.njv-1, 0, grid.nkv-1)
+    # Our arrays of data are indexed as [i, j, k]
+    # VTK format has k as outer loop and i as inner loop.
+    cell_data = [(var, flow.data[var].transpose().flatten()) for var in flow.variables]
     if "vel.x" in flow.variables:
-        vxdata = flow.data['vel.x'].transpose().flatten()
-        vydata = flow.data['vel.y'].transpose().flatten()
-        vzdata = flow.data['vel.z'].transpose().flatten()
+        vel = np.column_stack([flow.data[c].transpose().flatten() for c in ['vel.x', 'vel.y', 'vel.z']])
         if "a" in flow.variables:
-            adata = flow.data['a'].transpose().flatten()
-            fp.write('<DataArray Name="Mach" type="Float64" NumberOfComponents="1" format="ascii">\n');
-            for a,vx,vy,vz in zip(adata, vxdata, vydata, vzdata):
-                fp.write('%g\n' % (math.sqrt(vx*vx+vy*vy+vz*vz)/a))
-            fp.write('</DataArray>\n')
-        # Write the velocity vector.
-        fp.write('<DataArray Name="vel.vector" type="Float64" NumberOfComponents="3" format="ascii">\n');
-        for velxyz in zip(vxdata, vydata, vzdata): fp.write('%g %g %g\n' % velxyz)
-        fp.write('</DataArray>\n')
+            cell_data.append(("Mach", np.sqrt(np.sum(vel**2, axis=1))/flow.data['a'].transpose().flatten()))
+        cell_data.append(("vel.vector", vel))
     if "B.x" in flow.variables:
-        Bxdata = flow.data['B.x'].transpose().flatten()
-        Bydata = flow.data['B.y'].transpose().flatten()
-        Bzdata = flow.data['B.z'].transpose().flatten()
-        fp.write('<DataArray Name="B.vector" type="Float64" NumberOfComponents="3" format="ascii">\n');
-        for Bxyz in zip(Bxdata, Bydata, Bzdata): fp.write('%g %g %g\n' % Bxyz)
-        fp.write('</DataArray>\n')
-    fp.write('</CellData>\n')
-    #
-    fp.write('<Points>\n')
-    fp.write('<DataArray type="Float64" NumberOfComponents="3" format="ascii">\n')
-    xs = grid.vertices.x.transpose().flatten()
-    ys = grid.vertices.y.transpose().flatten()
-    zs = grid.vertices.z.transpose().flatten()
-    for xyz in zip(xs, ys, zs):
-        fp.write('%g %g %g\n' % xyz)
-    fp.write('</DataArray>\n')
-    fp.write('</Points>\n')
-    #
-    fp.write('</Piece>\n')
-    fp.write('</StructuredGrid>\n')
-    fp.write('</VTKFile>\n')
-    fp.close()
+        B = np.column_stack([flow.data[c].transpose().flatten() for c in ['B.x', 'B.y', 'B.z']])
+        cell_data.append(("B.vector", B))
+    write_vts_piece(vtkFile, extent, extent, cell_data, vtk_points(grid), encoding, compress)
     return
 
+
+# Values for the format attribute of the DataArray elements, for each encoding.
+VTK_FORMATS = {"ascii":"ascii", "base64":"binary", "raw":"appended"}
+
+def vtk_points(grid):
+    """
+    The vertices of a StructuredGrid as an (npoints,3) array in VTK order,
+    with k as the outer loop, then j and then i as the innermost loop.
+    """
+    return np.column_stack([grid.vertices.x.transpose().flatten(),
+                            grid.vertices.y.transpose().flatten(),
+                            grid.vertices.z.transpose().flatten()])
+
+def write_vts_piece(vtkFile, whole_extent, piece_extent, cell_data, points,
+                    encoding="raw", compress=False):
+    """
+    Write one piece of a structured grid, with its cell data, as a VTK XML file.
+
+    Input:
+      vtkFile:      name of the resulting VTK file, typically xxxx.vts
+      whole_extent: (i0, i1, j0, j1, k0, k1) vertex indices of the whole grid
+      piece_extent: (i0, i1, j0, j1, k0, k1) vertex indices of this piece
+      cell_data:    list of (name, array) pairs, with cells in VTK order;
+                    an array is 1D for scalars or (ncells,3) for vectors
+      points:       (npoints,3) array of vertex coordinates, in VTK order
+      encoding:     "ascii" for text,
+                    "base64" for binary data within each DataArray element,
+                    "raw" for binary data appended to the end of the file
+      compress:     if True, binary data are compressed with zlib
+    """
+    if encoding not in VTK_FORMATS:
+        raise RuntimeError("Invalid VTK encoding: " + encoding)
+    fmt = VTK_FORMATS[encoding]
+    arrays = [(name, np.asarray(data, dtype=float)) for name, data in cell_data]
+    points = np.asarray(points, dtype=float)
+    appended = []
+    offset = 0
+    with open(vtkFile, mode='wb') as fp:
+        if encoding == "ascii":
+            fp.write(b'<VTKFile type="StructuredGrid" version="0.1" byte_order="BigEndian">\n')
+        else:
+            compressor = ' compressor="vtkZLibDataCompressor"' if compress else ''
+            fp.write(('<VTKFile type="StructuredGrid" version="0.1" byte_order="LittleEndian"%s>\n'
+                      % compressor).encode('utf-8'))
+        fp.write(('<StructuredGrid WholeExtent="%d %d %d %d %d %d">\n' % tuple(whole_extent)).encode('utf-8'))
+        fp.write(('<Piece Extent="%d %d %d %d %d %d">\n' % tuple(piece_extent)).encode('utf-8'))
+        def write_data_array(name, data):
+            nonlocal offset
+            ncomp = 1 if data.ndim == 1 else data.shape[1]
+            name_attr = ' Name="%s"' % name if name else ''
+            if encoding == "ascii":
+                fp.write(('<DataArray%s type="Float64" NumberOfComponents="%d" format="ascii">\n'
+                          % (name_attr, ncomp)).encode('utf-8'))
+                np.savetxt(fp, data, fmt='%g')
+                fp.write(b'</DataArray>\n')
+                return
+            block = _binary_block(data, compress)
+            if encoding == "base64":
+                fp.write(('<DataArray%s type="Float64" NumberOfComponents="%d" format="binary">\n'
+                          % (name_attr, ncomp)).encode('utf-8'))
+                fp.write(b''.join(base64.b64encode(part) for part in block))
+                fp.write(b'\n</DataArray>\n')
+            else:
+                fp.write(('<DataArray%s type="Float64" NumberOfComponents="%d" format="appended" offset="%d" />\n'
+                          % (name_attr, ncomp, offset)).encode('utf-8'))
+                appended.extend(block)
+                offset += sum(len(part) for part in block)
+            return
+        fp.write(b'<CellData>\n')
+        for name, data in arrays: write_data_array(name, data)
+        fp.write(b'</CellData>\n')
+        fp.write(b'<Points>\n')
+        write_data_array(None, points)
+        fp.write(b'</Points>\n')
+        fp.write(b'</Piece>\n')
+        fp.write(b'</StructuredGrid>\n')
+        if appended:
+            fp.write(b'<AppendedData encoding="raw">\n_')
+            for part in appended: fp.write(part)
+            fp.write(b'\n</AppendedData>\n')
+        fp.write(b'</VTKFile>\n')
+    return
+
+def _binary_block(data, compress, block_size=32768):
+    """
+    The VTK binary representation of an array: a UInt32 header and the data,
+    little-endian, with the data optionally zlib-compressed in blocks.
+
+    Returns a list of (header, data) byte strings, to be base64-encoded
+    separately or to be appended, one after the other.
+    """
+    raw = np.ascontiguousarray(data, dtype='<f8').tobytes()
+    if not compress:
+        return [np.array([len(raw)], dtype='<u4').tobytes(), raw]
+    nblocks = (len(raw) + block_size - 1) // block_size
+    chunks = [zlib.compress(raw[i*block_size:(i+1)*block_size]) for i in range(nblocks)]
+    last_size = len(raw) - (nblocks-1)*block_size if nblocks > 0 else 0
+    header = [nblocks, block_size, last_size] + [len(c) for c in chunks]
+    return [np.array(header, dtype='<u4').tobytes(), b''.join(chunks)]
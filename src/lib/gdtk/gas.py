@@ -5,17 +5,28 @@
 # PJ 2019-07-24: start of experiment with FFI.
 #    2019-07-25: added Python wrapper
 #    2023-06-01: added PyGasState with shadow attributes
+#    2026-10-18: added GasStateArray for batched updates
+#    2026-10-18: release Dlang objects when the Python objects go away
+#    2026-10-18: integer field ids and a bulk get for the state data
+#    2026-10-18: optional StateCache for expensive (equilibrium) gas models
 #
 PC_P_atm = 101.325e3
 
 from cffi import FFI
+import hashlib
 import math
+import os
+import pickle
+from collections import OrderedDict
+import numpy as np
 
 ffi = FFI()
 ffi.cdef("""
     int cwrap_gas_init();
+    int cwrap_gas_live_counts(int* counts);
 
     int gas_model_new(char* file_name);
+    int gas_model_free(int gm_i);
     int gas_model_type_str(int gm_i, char* dest_str, int n);
     int gas_model_n_species(int gm_i);
     int gas_model_n_modes(int gm_i);
@@ -23,14 +34,24 @@ ffi.cdef("""
     int gas_model_mol_masses(int gm_i, double* mm);
 
     int gas_state_new(int gm_i);
+    int gas_state_free(int gs_i);
     int gas_state_set_scalar_field(int gs_i, char* field_name, double value);
     int gas_state_get_scalar_field(int gs_i, char* field_name, double* value);
     int gas_state_get_thermo_scalars(int gs_i, double* values);
+    int gas_state_set_scalar_field_by_id(int gs_i, int field_id, double value);
+    int gas_state_get_scalar_field_by_id(int gs_i, int field_id, double* value);
+    int gas_state_get_all(int gs_i, double* values);
+    int gas_state_set_all(int gs_i, double* values);
     int gas_state_set_array_field(int gs_i, char* field_name, double* values, int n);
     int gas_state_get_array_field(int gs_i, char* field_name, double* values, int n);
     int gas_state_get_ceaSavedData_field(int gs_i, char* field_name, double* value);
     int gas_state_get_ceaSavedData_massf(int gs_i, char* species_name, double* value);
     int gas_state_get_ceaSavedData_species_names(int gs_i, char* dest_str, int n);
+    int gas_state_get_ceaSavedData_problemType(int gs_i, char* dest_str, int n);
+    int gas_state_set_ceaSavedData_field(int gs_i, char* field_name, double value);
+    int gas_state_clear_ceaSavedData_massf(int gs_i);
+    int gas_state_set_ceaSavedData_massf(int gs_i, char* species_name, double value);
+    int gas_state_set_ceaSavedData_problemType(int gs_i, char* problem_type);
     int gas_state_copy_values(int gs_to_i, int gs_from_i);
 
     int gas_model_gas_state_update_thermo_from_pT(int gm_i, int gs_i);
@@ -42,6 +63,22 @@ ffi.cdef("""
     int gas_model_gas_state_update_sound_speed(int gm_i, int gs_i);
     int gas_model_gas_state_update_trans_coeffs(int gm_i, int gs_i);
 
+    int gas_model_gas_state_array_update_thermo_from_pT(int gm_i, int n,
+        double* rho, double* p, double* T, double* u, double* a, double* mu, double* k,
+        double* massf, double* T_modes, double* u_modes, double* k_modes, int* flags);
+    int gas_model_gas_state_array_update_thermo_from_rhou(int gm_i, int n,
+        double* rho, double* p, double* T, double* u, double* a, double* mu, double* k,
+        double* massf, double* T_modes, double* u_modes, double* k_modes, int* flags);
+    int gas_model_gas_state_array_update_thermo_from_rhoT(int gm_i, int n,
+        double* rho, double* p, double* T, double* u, double* a, double* mu, double* k,
+        double* massf, double* T_modes, double* u_modes, double* k_modes, int* flags);
+    int gas_model_gas_state_array_update_thermo_from_rhoT_with_enthalpy(int gm_i, int n,
+        double* rho, double* p, double* T, double* u, double* a, double* mu, double* k,
+        double* massf, double* T_modes, double* u_modes, double* k_modes, int* flags, double* h);
+    int gas_model_gas_state_array_update_trans_coeffs(int gm_i, int n,
+        double* rho, double* p, double* T, double* u, double* a, double* mu, double* k,
+        double* massf, double* T_modes, double* u_modes, double* k_modes, int* flags);
+
     int gas_model_gas_state_Cv(int gm_i, int gs_i, double* result);
     int gas_model_gas_state_Cp(int gm_i, int gs_i, double* result);
     int gas_model_gas_state_dpdrho_const_T(int gm_i, int gs_i, double* result);
@@ -126,6 +163,24 @@ ffi.cdef("""
 so = ffi.dlopen("libgas.so")
 so.cwrap_gas_init()
 
+# Integer identifiers for the scalar fields of a GasState.
+# These must be kept in step with enum GasStateField in gas_cwrap.d.
+FIELD_RHO, FIELD_P, FIELD_P_E, FIELD_T, FIELD_U, FIELD_A, FIELD_K, FIELD_MU = range(8)
+N_SCALAR_FIELDS = 8
+
+def live_handle_counts():
+    """
+    Returns a dictionary with the numbers of live GasModel and GasState objects
+    in the Dlang domain, together with the numbers of slots allocated for them.
+    A steadily growing count of live states usually indicates that Python
+    objects are being kept alive somewhere.
+    """
+    counts = ffi.new("int[]", [0]*4)
+    flag = so.cwrap_gas_live_counts(counts)
+    if flag < 0: raise Exception("could not get live-handle counts.")
+    return {'gas_models':counts[0], 'gas_model_slots':counts[1],
+            'gas_states':counts[2], 'gas_state_slots':counts[3]}
+
 # -----------------------------------------------------------------------------------
 # Service classes that wrap the C-API in a nice Pythonic API...
 
@@ -145,6 +200,23 @@ class GasModel(object):
         self._massf = ffi.new("double[]", [0.0]*self.n_species)
         self._molef = ffi.new("double[]", [0.0]*self.n_species)
         self._modes = ffi.new("double[]", [0.0]*self.n_modes)
+        # An optional StateCache, consulted by the update_thermo_from_* methods.
+        self.state_cache = None
+        return
+
+    def __del__(self):
+        self.free()
+
+    def free(self):
+        """
+        Release the underlying Dlang GasModel so that its slot may be reused.
+
+        Any GasState objects constructed with this model keep a reference to it,
+        so the model is normally released only after all of its states.
+        """
+        if getattr(self, 'id', -1) >= 0 and so is not None:
+            so.gas_model_free(self.id)
+        self.id = -1
         return
 
     def __copy__(self):
@@ -179,35 +251,66 @@ class GasModel(object):
         so.gas_model_mol_masses(self.id, self._massf)
         return [self._massf[i] for i in range(self.n_species)]
 
+    def use_state_cache(self, cache):
+        """
+        Attach a StateCache (or None, to detach) to this gas model.
+        The same cache may be shared by several gas models.
+        """
+        self.state_cache = cache
+        return
+
+    def _cached_update(self, kind, gstate, update_fn, extra=()):
+        cache = self.state_cache
+        if cache is None:
+            update_fn()
+            return
+        key = cache.make_key(self, kind, gstate, extra)
+        if cache.restore(key, self, gstate): return
+        update_fn()
+        cache.store(key, self, gstate)
+        return
+
     def update_thermo_from_pT(self, gstate):
-        flag = so.gas_model_gas_state_update_thermo_from_pT(self.id, gstate.id)
-        if flag < 0: raise Exception("could not update thermo from p,T.")
-        self.update_sound_speed(gstate)
+        def update():
+            flag = so.gas_model_gas_state_update_thermo_from_pT(self.id, gstate.id)
+            if flag < 0: raise Exception("could not update thermo from p,T.")
+            self.update_sound_speed(gstate)
+        self._cached_update('pT', gstate, update)
         return
     def update_thermo_from_rhou(self, gstate):
-        flag = so.gas_model_gas_state_update_thermo_from_rhou(self.id, gstate.id)
-        if flag < 0: raise Exception("could not update thermo from rho,u.")
-        self.update_sound_speed(gstate)
+        def update():
+            flag = so.gas_model_gas_state_update_thermo_from_rhou(self.id, gstate.id)
+            if flag < 0: raise Exception("could not update thermo from rho,u.")
+            self.update_sound_speed(gstate)
+        self._cached_update('rhou', gstate, update)
         return
     def update_thermo_from_rhoT(self, gstate):
-        flag = so.gas_model_gas_state_update_thermo_from_rhoT(self.id, gstate.id)
-        if flag < 0: raise Exception("could not update thermo from rho,T.")
-        self.update_sound_speed(gstate)
+        def update():
+            flag = so.gas_model_gas_state_update_thermo_from_rhoT(self.id, gstate.id)
+            if flag < 0: raise Exception("could not update thermo from rho,T.")
+            self.update_sound_speed(gstate)
+        self._cached_update('rhoT', gstate, update)
         return
     def update_thermo_from_rhop(self, gstate):
-        flag = so.gas_model_gas_state_update_thermo_from_rhop(self.id, gstate.id)
-        if flag < 0: raise Exception("could not update thermo from rho,p.")
-        self.update_sound_speed(gstate)
+        def update():
+            flag = so.gas_model_gas_state_update_thermo_from_rhop(self.id, gstate.id)
+            if flag < 0: raise Exception("could not update thermo from rho,p.")
+            self.update_sound_speed(gstate)
+        self._cached_update('rhop', gstate, update)
         return
     def update_thermo_from_ps(self, gstate, s):
-        flag = so.gas_model_gas_state_update_thermo_from_ps(self.id, gstate.id, s)
-        if flag < 0: raise Exception("could not update thermo from p,s.")
-        self.update_sound_speed(gstate)
+        def update():
+            flag = so.gas_model_gas_state_update_thermo_from_ps(self.id, gstate.id, s)
+            if flag < 0: raise Exception("could not update thermo from p,s.")
+            self.update_sound_speed(gstate)
+        self._cached_update('ps', gstate, update, (s,))
         return
     def update_thermo_from_hs(self, gstate, h, s):
-        flag = so.gas_model_gas_state_update_thermo_from_hs(self.id, gstate.id, h, s)
-        if flag < 0: raise Exception("could not update thermo from h,s.")
-        self.update_sound_speed(gstate)
+        def update():
+            flag = so.gas_model_gas_state_update_thermo_from_hs(self.id, gstate.id, h, s)
+            if flag < 0: raise Exception("could not update thermo from h,s.")
+            self.update_sound_speed(gstate)
+        self._cached_update('hs', gstate, update, (h, s))
         return
     def update_sound_speed(self, gstate):
         flag = so.gas_model_gas_state_update_sound_speed(self.id, gstate.id)
@@ -281,16 +384,16 @@ class GasModel(object):
 
     def massf2molef(self, massf_given):
         nsp = self.n_species
-        if type(massf_given) == type([]):
-            massf_list = massf_given.copy()
-            assert len(massf_list) == self.n_species, "incorrect massf list length"
-        elif type(massf_given) == type({}):
+        if isinstance(massf_given, dict):
             massf_list = []
             for name in self.species_names:
                 if name in massf_given.keys():
                     massf_list.append(massf_given[name])
                 else:
                     massf_list.append(0.0)
+        else:
+            massf_list = list(massf_given)
+            assert len(massf_list) == self.n_species, "incorrect massf list length"
         if abs(sum(massf_list) - 1.0) > 1.0e-6:
             raise Exception("mass fractions do not sum to 1.")
         for i in range(self.n_species): self._massf[i] = massf_list[i]
@@ -299,16 +402,16 @@ class GasModel(object):
 
     def molef2massf(self, molef_given):
         nsp = self.n_species
-        if type(molef_given) == type([]):
-            molef_list = molef_given.copy()
-            assert len(molef_list) == self.n_species, "incorrect molef list length"
-        elif type(molef_given) == type({}):
+        if isinstance(molef_given, dict):
             molef_list = []
             for name in self.species_names:
                 if name in molef_given.keys():
                     molef_list.append(molef_given[name])
                 else:
                     molef_list.append(0.0)
+        else:
+            molef_list = list(molef_given)
+            assert len(molef_list) == self.n_species, "incorrect molef list length"
         if abs(sum(molef_list) - 1.0) > 1.0e-6:
             raise Exception("mole fractions do not sum to 1.")
         for i in range(self.n_species): self._molef[i] = molef_list[i]
@@ -317,6 +420,14 @@ class GasModel(object):
 
 
 # -----------------------------------------------------------------------------------
+def _numpy_view(cdata, writeable=True):
+    """
+    Returns a NumPy array that shares memory with an ffi array of doubles.
+    """
+    view = np.frombuffer(ffi.buffer(cdata), dtype=np.float64)
+    view.flags.writeable = writeable
+    return view
+
 class GasState(object):
     """
     A GasState that has most of its data in the Dlang domain.
@@ -329,11 +440,47 @@ class GasState(object):
         self.gmodel = gmodel
         self.id = so.gas_state_new(self.gmodel.id)
         # Allocate ffi buffers here, so that they can be reused.
+        # The array-valued properties are presented as NumPy views of these buffers.
         self._valuep = ffi.new("double *")
-        self._mf = ffi.new("double[]", [0.0]*gmodel.n_species)
-        self._modes = ffi.new("double[]", [0.0]*gmodel.n_modes)
+        nsp = gmodel.n_species
+        nmodes = gmodel.n_modes
+        self._massf_buf = ffi.new("double[]", nsp)
+        self._massf = _numpy_view(self._massf_buf)
+        self._molef_buf = ffi.new("double[]", nsp)
+        self._molef = _numpy_view(self._molef_buf, writeable=False)
+        self._conc_buf = ffi.new("double[]", nsp)
+        self._conc = _numpy_view(self._conc_buf, writeable=False)
+        self._T_modes_buf = ffi.new("double[]", nmodes)
+        self._T_modes = _numpy_view(self._T_modes_buf)
+        self._u_modes_buf = ffi.new("double[]", nmodes)
+        self._u_modes = _numpy_view(self._u_modes_buf)
+        self._k_modes_buf = ffi.new("double[]", nmodes)
+        self._k_modes = _numpy_view(self._k_modes_buf, writeable=False)
         return
 
+    def __del__(self):
+        self.free()
+
+    def free(self):
+        """
+        Release the underlying Dlang GasState so that its slot may be reused.
+
+        This happens automatically when the Python object is garbage collected
+        or at the end of a with-block but may be called explicitly
+        in long-running loops.  The object must not be used afterwards.
+        """
+        if getattr(self, 'id', -1) >= 0 and so is not None:
+            so.gas_state_free(self.id)
+        self.id = -1
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.free()
+        return False
+
     def __copy__(self):
         gs_new = GasState(self.gmodel)
         gs_new.p = self.p
@@ -372,63 +519,63 @@ class GasState(object):
 
     @property
     def rho(self):
-        flag = so.gas_state_get_scalar_field(self.id, b"rho", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(self.id, FIELD_RHO, self._valuep)
         if flag < 0: raise Exception("could not get density.")
         return self._valuep[0]
     @rho.setter
     def rho(self, value):
-        flag = so.gas_state_set_scalar_field(self.id, b"rho", value)
+        flag = so.gas_state_set_scalar_field_by_id(self.id, FIELD_RHO, value)
         if flag < 0: raise Exception("could not set density.")
         return
 
     @property
     def p(self):
-        flag = so.gas_state_get_scalar_field(self.id, b"p", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(self.id, FIELD_P, self._valuep)
         if flag < 0: raise Exception("could not get pressure.")
         return self._valuep[0]
     @p.setter
     def p(self, value):
-        flag = so.gas_state_set_scalar_field(self.id, b"p", value)
+        flag = so.gas_state_set_scalar_field_by_id(self.id, FIELD_P, value)
         if flag < 0: raise Exception("could not set pressure.")
         return
 
     @property
     def T(self):
-        flag = so.gas_state_get_scalar_field(self.id, b"T", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(self.id, FIELD_T, self._valuep)
         if flag < 0: raise Exception("could not get temperature.")
         return self._valuep[0]
     @T.setter
     def T(self, value):
-        flag = so.gas_state_set_scalar_field(self.id, b"T", value)
+        flag = so.gas_state_set_scalar_field_by_id(self.id, FIELD_T, value)
         if flag < 0: raise Exception("could not set temperature.")
         return
 
     @property
     def u(self):
-        flag = so.gas_state_get_scalar_field(self.id, b"u", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(self.id, FIELD_U, self._valuep)
         if flag < 0: raise Exception("could not get internal energy.")
         return self._valuep[0]
     @u.setter
     def u(self, value):
-        flag = so.gas_state_set_scalar_field(self.id, b"u", value)
+        flag = so.gas_state_set_scalar_field_by_id(self.id, FIELD_U, value)
         if flag < 0: raise Exception("could not set internal energy.")
         return
 
     @property
     def a(self):
-        flag = so.gas_state_get_scalar_field(self.id, b"a", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(self.id, FIELD_A, self._valuep)
         if flag < 0: raise Exception("could not get sound speed.")
         return self._valuep[0]
 
     @property
     def k(self):
-        flag = so.gas_state_get_scalar_field(self.id, b"k", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(self.id, FIELD_K, self._valuep)
         if flag < 0: raise Exception("could not get conductivity.")
         return self._valuep[0]
 
     @property
     def mu(self):
-        flag = so.gas_state_get_scalar_field(self.id, b"mu", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(self.id, FIELD_MU, self._valuep)
         if flag < 0: raise Exception("could not get viscosity.")
         return self._valuep[0]
 
@@ -439,70 +586,64 @@ class GasState(object):
     @property
     def massf(self):
         """
-        Mass fractions are always returned as a list.
+        Mass fractions are returned as a NumPy array that views
+        a buffer owned by this GasState.
+
+        The array is refreshed from the Dlang domain on each access,
+        so keep a copy if you want the values to persist.
+        If you modify its elements in place, call sync() to send
+        the new values to the Dlang domain.
         """
-        nsp = self.gmodel.n_species
-        flag = so.gas_state_get_array_field(self.id, b"massf", self._mf, nsp)
+        flag = so.gas_state_get_array_field(self.id, b"massf", self._massf_buf, len(self._massf))
         if flag < 0: raise Exception("could not get mass-fractions.")
-        return [self._mf[i] for i in range(nsp)]
+        return self._massf
     @property
     def massf_as_dict(self):
-        nsp = self.gmodel.n_species
-        names = self.gmodel.species_names
-        mf = self.massf
-        result = {}
-        for i in range(nsp): result[names[i]] = mf[i]
-        return result
+        return dict(zip(self.gmodel.species_names, self.massf.tolist()))
     @massf.setter
     def massf(self, mf_given):
         """
-        Mass fractions may be provided as a list or dictionary.
+        Mass fractions may be provided as a list, array or dictionary.
         """
-        nsp = self.gmodel.n_species
-        if type(mf_given) == type([]):
-            if len(mf_given) != nsp:
-                raise Exception(f"mass fraction list is not correct length. nsp={nsp}; len(massf)={len(mf_given)}")
-            mf_list = mf_given.copy()
-        elif type(mf_given) == type({}):
+        nsp = len(self._massf)
+        if isinstance(mf_given, dict):
             mf_list = []
             for name in self.gmodel.species_names:
                 if name in mf_given.keys():
                     mf_list.append(mf_given[name])
                 else:
                     mf_list.append(0.0)
+        else:
+            mf_list = list(mf_given)
+            if len(mf_list) != nsp:
+                raise Exception(f"mass fraction list is not correct length. nsp={nsp}; len(massf)={len(mf_list)}")
         if abs(sum(mf_list) - 1.0) > 1.0e-6:
             raise Exception("mass fractions do not sum to 1.")
-        for i in range(nsp): self._mf[i] = mf_list[i]
-        flag = so.gas_state_set_array_field(self.id, b"massf", self._mf, nsp)
+        self._massf[:] = mf_list
+        flag = so.gas_state_set_array_field(self.id, b"massf", self._massf_buf, nsp)
         if flag < 0: raise Exception("could not set mass-fractions.")
         return mf_list
 
     @property
     def molef(self):
         """
-        Mole fractions are always returned as a list.
+        Mole fractions are returned as a read-only NumPy array
+        that is refreshed from the Dlang domain on each access.
         """
-        nsp = self.gmodel.n_species
-        flag = so.gas_model_gas_state_get_molef(self.gmodel.id, self.id, self._mf)
+        flag = so.gas_model_gas_state_get_molef(self.gmodel.id, self.id, self._molef_buf)
         if flag < 0: raise Exception("could not get mole-fractions.")
-        return [self._mf[i] for i in range(nsp)]
+        return self._molef
     @property
     def molef_as_dict(self):
-        nsp = self.gmodel.n_species
-        names = self.gmodel.species_names
-        mf = self.molef
-        result = {}
-        for i in range(nsp): result[names[i]] = mf[i]
-        return result
+        return dict(zip(self.gmodel.species_names, self.molef.tolist()))
     @molef.setter
     def molef(self, molef_given):
         """
-        Mole fractions may be provided as a list or dictionary.
+        Mole fractions may be provided as a list, array or dictionary.
         """
-        nsp = self.gmodel.n_species
-        mf_list = self.gmodel.molef2massf(molef_given)
-        for i in range(nsp): self._mf[i] = mf_list[i]
-        flag = so.gas_state_set_array_field(self.id, b"massf", self._mf, nsp)
+        nsp = len(self._massf)
+        self._massf[:] = self.gmodel.molef2massf(molef_given)
+        flag = so.gas_state_set_array_field(self.id, b"massf", self._massf_buf, nsp)
         if flag < 0: raise Exception("could not set mass-fractions from mole-fractions.")
         # At this point, we may not have the mole-fractions as a list
         # because it may have been provided as a dictionary.
@@ -511,18 +652,16 @@ class GasState(object):
 
     @property
     def conc(self):
-        nsp = self.gmodel.n_species
-        flag = so.gas_model_gas_state_get_conc(self.gmodel.id, self.id, self._mf)
+        """
+        Concentrations are returned as a read-only NumPy array
+        that is refreshed from the Dlang domain on each access.
+        """
+        flag = so.gas_model_gas_state_get_conc(self.gmodel.id, self.id, self._conc_buf)
         if flag < 0: raise Exception("could not get concentrations.")
-        return [self._mf[i] for i in range(nsp)]
+        return self._conc
     @property
     def conc_as_dict(self):
-        nsp = self.gmodel.n_species
-        names = self.gmodel.species_names
-        conc_list = self.conc
-        result = {}
-        for i in range(nsp): result[names[i]] = conc_list[i]
-        return result
+        return dict(zip(self.gmodel.species_names, self.conc.tolist()))
 
     @property
     def n_modes(self):
@@ -530,51 +669,66 @@ class GasState(object):
 
     @property
     def u_modes(self):
-        n = self.gmodel.n_modes
-        if n == 0: return []
-        flag = so.gas_state_get_array_field(self.id, b"u_modes", self._modes, n)
+        n = len(self._u_modes)
+        if n == 0: return self._u_modes
+        flag = so.gas_state_get_array_field(self.id, b"u_modes", self._u_modes_buf, n)
         if flag < 0: raise Exception("could not get u_modes.")
-        return [self._modes[i] for i in range(n)]
+        return self._u_modes
     @u_modes.setter
     def u_modes(self, um_given):
-        n = self.gmodel.n_modes
+        n = len(self._u_modes)
         if n == 0: return []
-        if type(um_given) != type([]):
-            raise Exception("u_modes needs to be supplied as a list.")
         if len(um_given) != n:
             raise Exception(f"u_modes list is not correct length. nmodes={n}; len(u_modes)={len(um_given)}")
-        for i in range(n): self._modes[i] = um_given[i]
-        flag = so.gas_state_set_array_field(self.id, b"u_modes", self._modes, n)
+        self._u_modes[:] = um_given
+        flag = so.gas_state_set_array_field(self.id, b"u_modes", self._u_modes_buf, n)
         if flag < 0: raise Exception("could not set u_modes.")
         return um_given
 
     @property
     def T_modes(self):
-        n = self.gmodel.n_modes
-        if n == 0: return []
-        flag = so.gas_state_get_array_field(self.id, b"T_modes", self._modes, n)
+        n = len(self._T_modes)
+        if n == 0: return self._T_modes
+        flag = so.gas_state_get_array_field(self.id, b"T_modes", self._T_modes_buf, n)
         if flag < 0: raise Exception("could not get T_modes.")
-        return [self._modes[i] for i in range(n)]
+        return self._T_modes
     @T_modes.setter
     def T_modes(self, Tm_given):
-        n = self.gmodel.n_modes
+        n = len(self._T_modes)
         if n == 0: return []
-        if type(Tm_given) != type([]):
-            raise Exception("T_modes needs to be supplied as a list.")
         if len(Tm_given) != n:
             raise Exception(f"T_modes list is not correct length. nmodes={n}; len(T_modes)={len(Tm_given)}")
-        for i in range(n): self._modes[i] = Tm_given[i]
-        flag = so.gas_state_set_array_field(self.id, b"T_modes", self._modes, n)
+        self._T_modes[:] = Tm_given
+        flag = so.gas_state_set_array_field(self.id, b"T_modes", self._T_modes_buf, n)
         if flag < 0: raise Exception("could not set T_modes.")
         return Tm_given
 
     @property
     def k_modes(self):
-        n = self.gmodel.n_modes
-        if n == 0: return []
-        flag = so.gas_state_get_array_field(self.id, b"k_modes", self._modes, n)
+        n = len(self._k_modes)
+        if n == 0: return self._k_modes
+        flag = so.gas_state_get_array_field(self.id, b"k_modes", self._k_modes_buf, n)
         if flag < 0: raise Exception("could not get k_modes.")
-        return [self._modes[i] for i in range(n)]
+        return self._k_modes
+
+    def sync(self):
+        """
+        Send the current contents of the massf, T_modes and u_modes arrays
+        to the Dlang domain, after they have been modified in place.
+
+        Note that reading any of those properties refreshes the array
+        from the Dlang domain, so call sync() before reading them again.
+        """
+        nsp = len(self._massf)
+        flag = so.gas_state_set_array_field(self.id, b"massf", self._massf_buf, nsp)
+        if flag < 0: raise Exception("could not set mass-fractions.")
+        n = len(self._T_modes)
+        if n > 0:
+            flag = so.gas_state_set_array_field(self.id, b"T_modes", self._T_modes_buf, n)
+            if flag < 0: raise Exception("could not set T_modes.")
+            flag = so.gas_state_set_array_field(self.id, b"u_modes", self._u_modes_buf, n)
+            if flag < 0: raise Exception("could not set u_modes.")
+        return
 
     @property
     def ceaSavedData(self):
@@ -597,7 +751,30 @@ class GasState(object):
             if flag < 0: raise Exception("could not get ceaSavedData massf[%s]." % name)
             massf_data[name] = valuep[0]
         my_data["massf"] = massf_data
+        buf = ffi.new("char[]", b'\000'*32)
+        flag = so.gas_state_get_ceaSavedData_problemType(self.id, buf, 32)
+        if flag < 0: raise Exception("could not get ceaSavedData previous_problemType.")
+        my_data["previous_problemType"] = ffi.string(buf).decode('utf-8')
         return my_data
+    @ceaSavedData.setter
+    def ceaSavedData(self, my_data):
+        """
+        Put back CEA data, in the same form as returned by the getter.
+        """
+        for name, value in my_data.items():
+            if name in ["massf", "previous_problemType"]: continue
+            flag = so.gas_state_set_ceaSavedData_field(self.id, bytes(name, 'utf-8'), value)
+            if flag < 0: raise Exception("could not set ceaSavedData field %s." % name)
+        flag = so.gas_state_clear_ceaSavedData_massf(self.id)
+        if flag < 0: raise Exception("could not clear ceaSavedData massf.")
+        for name, value in my_data["massf"].items():
+            flag = so.gas_state_set_ceaSavedData_massf(self.id, bytes(name, 'utf-8'), value)
+            if flag < 0: raise Exception("could not set ceaSavedData massf[%s]." % name)
+        if "previous_problemType" in my_data:
+            problem_type = bytes(my_data["previous_problemType"], 'utf-8')
+            flag = so.gas_state_set_ceaSavedData_problemType(self.id, problem_type)
+            if flag < 0: raise Exception("could not set ceaSavedData previous_problemType.")
+        return
 
     def copy_values(self, gstate):
         flag = so.gas_state_copy_values(self.id, gstate.id)
@@ -688,7 +865,7 @@ class PyGasState(object):
     __slots__ = ('gmodel', 'dgs', 'rho', 'p', 'T', 'u',
                  'n_modes', 'T_modes', 'u_modes', 'k_modes',
                  'a', 'n_species', '_massf', 'k', 'mu',
-                 '_valuep', '_mf', '_modes', '_thermo_values')
+                 '_valuep', '_mf', '_modes', '_all_values')
     # Beyond the slots listed above, there are a number of properties defined below.
     # Together, these attributes allow the PyGasState object to look and behave like
     # a corresponding GasState object.
@@ -714,13 +891,30 @@ class PyGasState(object):
         self._valuep = ffi.new("double *")
         self._mf = ffi.new("double[]", [0.0]*gmodel.n_species)
         self._modes = ffi.new("double[]", [0.0]*gmodel.n_modes)
-        self._thermo_values = ffi.new("double[]", [0.0,]*5)
+        self._all_values = ffi.new("double[]", N_SCALAR_FIELDS+gmodel.n_species+3*gmodel.n_modes)
         return
 
     @property
     def id(self):
         return self.dgs.id
 
+    def free(self):
+        """
+        Release the underlying Dlang GasState.
+
+        The GasState object in dgs does this itself when it is garbage collected,
+        so this is needed only for explicit release.
+        """
+        self.dgs.free()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.free()
+        return False
+
     def __copy__(self):
         gs_new = PyGasState(self.gmodel)
         gs_new.p = self.p
@@ -761,22 +955,19 @@ class PyGasState(object):
         return text
 
     def copy_thermo_properties_from_dgs(self):
-        id = self.id
-        flag = so.gas_state_get_thermo_scalars(id, self._thermo_values)
-        if flag < 0: raise Exception("could not get thermo scalars from Dlang GasState")
-        self.rho = self._thermo_values[0]
-        self.p = self._thermo_values[1]
-        self.T = self._thermo_values[2]
-        self.u = self._thermo_values[3]
-        self.a = self._thermo_values[4]
+        flag = so.gas_state_get_all(self.id, self._all_values)
+        if flag < 0: raise Exception("could not get thermo data from Dlang GasState")
+        values = self._all_values
+        self.rho = values[FIELD_RHO]
+        self.p = values[FIELD_P]
+        self.T = values[FIELD_T]
+        self.u = values[FIELD_U]
+        self.a = values[FIELD_A]
         # We assume that the mass fractions have not have changed.
         if self.n_modes > 0:
-            flag = so.gas_state_get_array_field(self.id, b"T_modes", self._modes, self.n_modes)
-            if flag < 0: raise Exception("could not get T_modes from Dlang GasState")
-            self.T_modes = [self._modes[i] for i in range(self.n_modes)]
-            flag = so.gas_state_get_array_field(self.id, b"u_modes", self._modes, self.n_modes)
-            if flag < 0: raise Exception("could not get u_modes from Dlang GasState")
-            self.u_modes = [self._modes[i] for i in range(self.n_modes)]
+            j = N_SCALAR_FIELDS + self.n_species
+            self.T_modes = ffi.unpack(values+j, self.n_modes); j += self.n_modes
+            self.u_modes = ffi.unpack(values+j, self.n_modes)
         return
 
     def copy_mass_fractions_into_dgs(self):
@@ -793,9 +984,9 @@ class PyGasState(object):
 
     def update_thermo_from_pT(self):
         id = self.id
-        flag = so.gas_state_set_scalar_field(id, b"p", self.p)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_P, self.p)
         if flag < 0: raise Exception("could not set pressure in Dlang GasState")
-        flag = so.gas_state_set_scalar_field(id, b"T", self.T)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_T, self.T)
         if flag < 0: raise Exception("could not set temperature in Dlang GasState")
         if self.n_species > 1: self.copy_mass_fractions_into_dgs()
         if self.n_modes > 0:
@@ -812,9 +1003,9 @@ class PyGasState(object):
 
     def update_thermo_from_rhou(self):
         id = self.id
-        flag = so.gas_state_set_scalar_field(id, b"rho", self.rho)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_RHO, self.rho)
         if flag < 0: raise Exception("could not set density in Dlang GasState")
-        flag = so.gas_state_set_scalar_field(id, b"u", self.u)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_U, self.u)
         if flag < 0: raise Exception("could not set internal-energy in Dlang GasState")
         if self.n_species > 1: self.copy_mass_fractions_into_dgs()
         if self.n_modes > 0:
@@ -831,9 +1022,9 @@ class PyGasState(object):
 
     def update_thermo_from_rhoT(self):
         id = self.id
-        flag = so.gas_state_set_scalar_field(id, b"rho", self.rho)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_RHO, self.rho)
         if flag < 0: raise Exception("could not set density in Dlang GasState")
-        flag = so.gas_state_set_scalar_field(id, b"T", self.T)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_T, self.T)
         if flag < 0: raise Exception("could not set temperature in Dlang GasState")
         if self.n_species > 1: self.copy_mass_fractions_into_dgs()
         if self.n_modes > 0:
@@ -850,9 +1041,9 @@ class PyGasState(object):
 
     def update_thermo_from_rhop(self):
         id = self.id
-        flag = so.gas_state_set_scalar_field(id, b"rho", self.rho)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_RHO, self.rho)
         if flag < 0: raise Exception("could not set density in Dlang GasState")
-        flag = so.gas_state_set_scalar_field(id, b"p", self.p)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_P, self.p)
         if flag < 0: raise Exception("could not set pressure in Dlang GasState")
         if self.n_species > 1: self.copy_mass_fractions_into_dgs()
         if self.n_modes > 0: raise NotImplementedError('T_modes')
@@ -862,7 +1053,7 @@ class PyGasState(object):
 
     def update_thermo_from_ps(self, s):
         id = self.id
-        flag = so.gas_state_set_scalar_field(id, b"p", self.p)
+        flag = so.gas_state_set_scalar_field_by_id(id, FIELD_P, self.p)
         if flag < 0: raise Exception("could not set pressure in Dlang GasState")
         if self.n_species > 1: self.copy_mass_fractions_into_dgs()
         if self.n_modes > 0: raise NotImplementedError('T_modes')
@@ -880,7 +1071,7 @@ class PyGasState(object):
     def update_sound_speed(self):
         self.dgs.gmodel.update_sound_speed(self.dgs)
         id = self.dgs.id
-        flag = so.gas_state_get_scalar_field(id, b"a", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(id, FIELD_A, self._valuep)
         if flag < 0: raise Exception("could not get sound-speed from Dlang GasState")
         self.a = self._valuep[0]
         return
@@ -888,10 +1079,10 @@ class PyGasState(object):
     def update_trans_coeffs(self):
         self.dgs.gmodel.update_trans_coeffs(self.dgs)
         id = self.dgs.id
-        flag = so.gas_state_get_scalar_field(id, b"mu", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(id, FIELD_MU, self._valuep)
         if flag < 0: raise Exception("could not get viscosity from Dlang GasState")
         self.mu = self._valuep[0]
-        flag = so.gas_state_get_scalar_field(id, b"k", self._valuep)
+        flag = so.gas_state_get_scalar_field_by_id(id, FIELD_K, self._valuep)
         if flag < 0: raise Exception("could not get thermal-conductivity from Dlang GasState")
         self.k = self._valuep[0]
         if self.n_modes > 0:
@@ -905,38 +1096,27 @@ class PyGasState(object):
         There are places in the gas-dynamic functions where a new GasState
         has been filled in over in the DLang domain and
         all of the Python-domain data needs to be updated.
+
+        All of the data come across in a single call to gas_state_get_all.
         """
-        id = self.id
-        flag = so.gas_state_get_thermo_scalars(id, self._thermo_values)
-        if flag < 0: raise Exception("could not get thermo scalars from Dlang GasState")
-        self.rho = self._thermo_values[0]
-        self.p = self._thermo_values[1]
-        self.T = self._thermo_values[2]
-        self.u = self._thermo_values[3]
-        self.a = self._thermo_values[4]
-        #
-        flag = so.gas_state_get_array_field(id, b"massf", self._mf, self.n_species)
-        if flag < 0: raise Exception("could not get mass-fractions from Dlang GasState")
-        self.massf = [self._mf[i] for i in range(self.n_species)]
-        #
-        flag = so.gas_state_get_scalar_field(id, b"mu", self._valuep)
-        if flag < 0: raise Exception("could not get viscosity from Dlang GasState")
-        self.mu = self._valuep[0]
-        flag = so.gas_state_get_scalar_field(id, b"k", self._valuep)
-        if flag < 0: raise Exception("could not get thermal-conductivity from Dlang GasState")
-        self.k = self._valuep[0]
-        #
-        if self.n_modes > 0:
-            flag = so.gas_state_get_array_field(self.id, b"T_modes", self._modes, self.n_modes)
-            if flag < 0: raise Exception("could not get T_modes from Dlang GasState")
-            self.T_modes = [self._modes[i] for i in range(self.n_modes)]
-            flag = so.gas_state_get_array_field(self.id, b"u_modes", self._modes, self.n_modes)
-            if flag < 0: raise Exception("could not get u_modes from Dlang GasState")
-            self.u_modes = [self._modes[i] for i in range(self.n_modes)]
-            #
-            flag = so.gas_state_get_array_field(self.id, b"k_modes", self._modes, self.n_modes)
-            if flag < 0: raise Exception("could not get k_modes from Dlang GasState")
-            self.k_modes = [self._modes[i] for i in range(self.n_modes)]
+        flag = so.gas_state_get_all(self.id, self._all_values)
+        if flag < 0: raise Exception("could not get all data from Dlang GasState")
+        values = self._all_values
+        self.rho = values[FIELD_RHO]
+        self.p = values[FIELD_P]
+        self.T = values[FIELD_T]
+        self.u = values[FIELD_U]
+        self.a = values[FIELD_A]
+        self.k = values[FIELD_K]
+        self.mu = values[FIELD_MU]
+        nsp = self.n_species
+        nmodes = self.n_modes
+        j = N_SCALAR_FIELDS
+        self.massf = ffi.unpack(values+j, nsp); j += nsp
+        if nmodes > 0:
+            self.T_modes = ffi.unpack(values+j, nmodes); j += nmodes
+            self.u_modes = ffi.unpack(values+j, nmodes); j += nmodes
+            self.k_modes = ffi.unpack(values+j, nmodes)
         return
 
     @property
@@ -952,16 +1132,16 @@ class PyGasState(object):
         return result
     @massf.setter
     def massf(self, massf_given):
-        if isinstance(massf_given, list):
-            nsp = self.n_species
-            if len(massf_given) != nsp:
-                raise Exception(f"mass fraction list is not correct length. nsp={nsp}; len(massf)={len(mf_given)}")
-            massf_list = massf_given.copy()
-        elif isinstance(massf_given, dict):
+        if isinstance(massf_given, dict):
             massf_list = [0.0] * self.n_species
             for ind, spcs in enumerate(self.gmodel.species_names):
                 if spcs in massf_given.keys():
                     massf_list[ind] = massf_given[spcs]
+        else:
+            nsp = self.n_species
+            if len(massf_given) != nsp:
+                raise Exception(f"mass fraction list is not correct length. nsp={nsp}; len(massf)={len(massf_given)}")
+            massf_list = [float(mf) for mf in massf_given]
         self._massf = massf_list
 
     @property
@@ -1056,6 +1236,350 @@ class PyGasState(object):
         return self.gmodel.gibbs_free_energy_isp(self.dgs, isp)
 
 
+# -----------------------------------------------------------------------------------
+def _gas_state_array_property(name, doc):
+    def getter(self):
+        return self._data[name]
+    def setter(self, value):
+        # Copy into the existing buffer so that the data stay contiguous
+        # and visible to the Dlang domain.
+        self._data[name][...] = value
+    return property(getter, setter, doc=doc)
+
+class GasStateArray(object):
+    """
+    A collection of n gas states with the data held in contiguous NumPy arrays.
+
+    The update methods hand all of the states across to the Dlang domain
+    in a single call, so this class is suited to evaluating many states at once,
+    for example, the cell data of a flow slice or the points of a look-up table.
+    The scalar properties are arrays of shape (n,), massf has shape (n, n_species)
+    and T_modes, u_modes and k_modes have shape (n, n_modes).
+    Assigning to a property copies the values into the existing arrays,
+    so usual NumPy broadcasting applies.
+    """
+    _scalar_names = ('rho', 'p', 'T', 'u', 'a', 'mu', 'k')
+    _array_names = ('massf', 'T_modes', 'u_modes', 'k_modes')
+
+    def __init__(self, gmodel, n):
+        self.gmodel = gmodel
+        self.n = n
+        self.n_species = gmodel.n_species
+        self.n_modes = gmodel.n_modes
+        self._data = {}
+        for name in self._scalar_names:
+            self._data[name] = np.zeros(n)
+        self._data['massf'] = np.zeros((n, self.n_species))
+        if self.n_species == 1: self._data['massf'][:,0] = 1.0
+        for name in ('T_modes', 'u_modes', 'k_modes'):
+            self._data[name] = np.zeros((n, self.n_modes))
+        self._data['enthalpy'] = np.zeros(n)
+        self.flags = np.zeros(n, dtype=np.intc)
+        # Keep cffi views of the NumPy buffers, ready to hand across to the Dlang domain.
+        self._buffers = [ffi.from_buffer("double[]", self._data[name], require_writable=True)
+                         for name in self._scalar_names+self._array_names]
+        self._flags_buffer = ffi.from_buffer("int[]", self.flags, require_writable=True)
+        self._enthalpy_buffer = ffi.from_buffer("double[]", self._data['enthalpy'], require_writable=True)
+        return
+
+    @classmethod
+    def from_gas_states(cls, gmodel, gstates):
+        """
+        Gather the data from a sequence of GasState or PyGasState objects.
+        """
+        gsa = cls(gmodel, len(gstates))
+        for i, gs in enumerate(gstates): gsa.set_state(i, gs)
+        return gsa
+
+    def __len__(self):
+        return self.n
+
+    def __str__(self):
+        text = 'GasStateArray(n=%d' % self.n
+        for name in ('rho', 'p', 'T', 'u', 'a'):
+            text += ', %s=%s' % (name, self._data[name])
+        if self.n_species > 1:
+            text += ', massf=%s' % self._data['massf']
+        text += ', gmodel.id=%d)' % self.gmodel.id
+        return text
+
+    rho = _gas_state_array_property('rho', "Densities, kg/m^3")
+    p = _gas_state_array_property('p', "Pressures, Pa")
+    T = _gas_state_array_property('T', "Temperatures, K")
+    u = _gas_state_array_property('u', "Specific internal energies, J/kg")
+    a = _gas_state_array_property('a', "Sound speeds, m/s")
+    mu = _gas_state_array_property('mu', "Viscosities, Pa.s")
+    k = _gas_state_array_property('k', "Thermal conductivities, W/(m.K)")
+    T_modes = _gas_state_array_property('T_modes', "Temperatures of the energy modes, K")
+    u_modes = _gas_state_array_property('u_modes', "Specific energies of the modes, J/kg")
+    k_modes = _gas_state_array_property('k_modes', "Conductivities of the energy modes, W/(m.K)")
+    enthalpy = _gas_state_array_property('enthalpy',
+                                         "Specific enthalpies, J/kg, from update_thermo_from_rhoT(with_enthalpy=True)")
+
+    @property
+    def massf(self):
+        return self._data['massf']
+    @massf.setter
+    def massf(self, mf_given):
+        """
+        Mass fractions may be provided as an array that broadcasts to (n, n_species)
+        or as a dictionary of species names with (broadcastable) values.
+        """
+        if isinstance(mf_given, dict):
+            mf = np.zeros((self.n, self.n_species))
+            for isp, name in enumerate(self.gmodel.species_names):
+                if name in mf_given: mf[:,isp] = mf_given[name]
+        else:
+            mf = np.broadcast_to(np.asarray(mf_given, dtype=float), (self.n, self.n_species))
+        if np.any(np.abs(mf.sum(axis=1) - 1.0) > 1.0e-6):
+            raise Exception("mass fractions do not sum to 1.")
+        self._data['massf'][...] = mf
+        return
+
+    def set_state(self, i, gstate):
+        """
+        Copy the data of a single GasState (or PyGasState) into slot i.
+        """
+        for name in self._scalar_names:
+            self._data[name][i] = getattr(gstate, name)
+        self._data['massf'][i,:] = gstate.massf
+        if self.n_modes > 0:
+            self._data['T_modes'][i,:] = gstate.T_modes
+            self._data['u_modes'][i,:] = gstate.u_modes
+            self._data['k_modes'][i,:] = gstate.k_modes
+        return
+
+    def get_state(self, i, gstate):
+        """
+        Copy the data in slot i into a single GasState (or PyGasState)
+        and bring its thermodynamic properties up to date.
+        """
+        gstate.p = float(self._data['p'][i])
+        gstate.T = float(self._data['T'][i])
+        gstate.massf = self._data['massf'][i,:].tolist()
+        if self.n_modes > 0:
+            gstate.T_modes = self._data['T_modes'][i,:].tolist()
+        gstate.update_thermo_from_pT()
+        return
+
+    def _update(self, fn, description, raise_on_failure, *extra):
+        n_fail = fn(self.gmodel.id, self.n, *self._buffers, self._flags_buffer, *extra)
+        if n_fail < 0: raise Exception("could not update %s for gas-state array." % description)
+        if n_fail > 0 and raise_on_failure:
+            raise Exception("could not update %s for %d of %d states; see flags." %
+                            (description, n_fail, self.n))
+        return n_fail
+
+    # Each of the update methods returns the number of states that could not be updated.
+    # Those states are marked with -1 in the flags array and their data are left untouched,
+    # so that the rest of the batch is still usable.
+    # With raise_on_failure=True, an exception is raised if any of the states failed.
+
+    def update_thermo_from_pT(self, raise_on_failure=False):
+        return self._update(so.gas_model_gas_state_array_update_thermo_from_pT,
+                            "thermo from p,T", raise_on_failure)
+    def update_thermo_from_rhou(self, raise_on_failure=False):
+        return self._update(so.gas_model_gas_state_array_update_thermo_from_rhou,
+                            "thermo from rho,u", raise_on_failure)
+    def update_thermo_from_rhoT(self, with_enthalpy=False, raise_on_failure=False):
+        """
+        With with_enthalpy=True, the specific enthalpy of each state is evaluated
+        in the same pass and left in the enthalpy array.
+        """
+        if with_enthalpy:
+            return self._update(so.gas_model_gas_state_array_update_thermo_from_rhoT_with_enthalpy,
+                                "thermo from rho,T", raise_on_failure, self._enthalpy_buffer)
+        return self._update(so.gas_model_gas_state_array_update_thermo_from_rhoT,
+                            "thermo from rho,T", raise_on_failure)
+    def update_trans_coeffs(self, raise_on_failure=False):
+        """
+        Each state is given a thermo update from its rho and T, on the Dlang side,
+        before its transport coefficients are evaluated; only mu, k and k_modes
+        are written back.
+        """
+        return self._update(so.gas_model_gas_state_array_update_trans_coeffs,
+                            "transport coefficients", raise_on_failure)
+
+
+# -----------------------------------------------------------------------------------
+class StateCache(object):
+    """
+    A bounded, least-recently-used cache of the results of thermodynamic updates.
+
+    Equilibrium gas models, such as the CEAGas, are expensive to evaluate
+    and a script that works through many conditions tends to ask for
+    the same (or nearly the same) states over and over.
+    Once a cache is attached to a GasModel, with gmodel.use_state_cache(cache),
+    each update_thermo_from_* call looks up the cache before calling the gas model.
+
+    Only the update_thermo_from_* calls made through the Python GasModel are cached.
+    The GasFlow methods do their thermodynamic updates within the Dlang library
+    and do not see the cache.
+    PITOT3 attaches a shared cache to its CEAGas models when its file cache
+    is set up, as it is in the condition builder's in-memory mode.
+
+    The key is built from a digest of the contents of the gas-model file,
+    the kind of update and the input values, quantised to a number of
+    significant digits, together with the mass fractions and any energy-mode values.
+    Editing the gas-model file therefore invalidates the entries made with
+    the old version, including those loaded from a saved cache.
+    The cached result holds the full Dlang GasState data and, for a CEAGas,
+    the ceaSavedData so that the restored state behaves as if freshly computed.
+
+    The cache may be saved to, and loaded from, a file so that the states
+    computed in one run are available to the next.
+    """
+    # For each kind of update, the scalar fields that are inputs to the update,
+    # and the energy-mode array that is also an input.
+    _inputs = {'pT': ((FIELD_P, FIELD_T), 'T_modes'),
+               'rhou': ((FIELD_RHO, FIELD_U), 'u_modes'),
+               'rhoT': ((FIELD_RHO, FIELD_T), 'T_modes'),
+               'rhop': ((FIELD_RHO, FIELD_P), None),
+               'ps': ((FIELD_P,), None),
+               'hs': ((), None)}
+
+    def __init__(self, max_entries=10000, significant_digits=10, filename=None):
+        self.max_entries = max_entries
+        self.significant_digits = significant_digits
+        self.filename = filename
+        self._entries = OrderedDict()
+        self._file_digests = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if filename and os.path.exists(filename): self.load(filename)
+        return
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return 'StateCache(entries=%d, max_entries=%d, hits=%d, misses=%d, evictions=%d)' % \
+            (len(self._entries), self.max_entries, self.hits, self.misses, self.evictions)
+
+    @property
+    def stats(self):
+        n = self.hits + self.misses
+        return {'entries':len(self._entries), 'hits':self.hits, 'misses':self.misses,
+                'evictions':self.evictions, 'hit_rate':(self.hits/n if n > 0 else 0.0)}
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return
+
+    def _quantise(self, x):
+        return float('%.*g' % (self.significant_digits, x))
+
+    def _file_digest(self, file_name):
+        """
+        Returns a digest of the contents of the gas-model file.
+        It is recomputed only when the size or modification time of the file changes.
+        """
+        st = os.stat(file_name)
+        stamp = (st.st_mtime_ns, st.st_size)
+        known = self._file_digests.get(file_name)
+        if known is None or known[0] != stamp:
+            with open(file_name, 'rb') as f:
+                known = (stamp, hashlib.sha1(f.read()).hexdigest())
+            self._file_digests[file_name] = known
+        return known[1]
+
+    def make_key(self, gmodel, kind, gstate, extra=()):
+        """
+        Returns the key for the update of kind on gstate, given its current data.
+        The extra values are for the inputs that are not held in the gas state,
+        such as the entropy for an update_thermo_from_ps.
+        """
+        nsp = gmodel.n_species
+        nmodes = gmodel.n_modes
+        values = ffi.new("double[]", N_SCALAR_FIELDS+nsp+3*nmodes)
+        flag = so.gas_state_get_all(gstate.id, values)
+        if flag < 0: raise Exception("could not get data for state cache key.")
+        fields, modes = self._inputs[kind]
+        j = N_SCALAR_FIELDS
+        inputs = [values[i] for i in fields] + list(extra) + ffi.unpack(values+j, nsp)
+        if modes == 'T_modes': inputs += ffi.unpack(values+j+nsp, nmodes)
+        if modes == 'u_modes': inputs += ffi.unpack(values+j+nsp+nmodes, nmodes)
+        return (self._file_digest(gmodel.file_name), kind) + tuple(self._quantise(x) for x in inputs)
+
+    def restore(self, key, gmodel, gstate):
+        """
+        If there is an entry for key, copy it into gstate and return True.
+        The transport coefficients of gstate are left as they were.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False
+        self._entries.move_to_end(key)
+        self.hits += 1
+        cached_values, cea_data = entry
+        nsp = gmodel.n_species
+        nmodes = gmodel.n_modes
+        values = ffi.new("double[]", N_SCALAR_FIELDS+nsp+3*nmodes)
+        flag = so.gas_state_get_all(gstate.id, values)
+        if flag < 0: raise Exception("could not get data for state cache restore.")
+        k, mu = values[FIELD_K], values[FIELD_MU]
+        k_modes = ffi.unpack(values+N_SCALAR_FIELDS+nsp+2*nmodes, nmodes)
+        for i, v in enumerate(cached_values): values[i] = v
+        values[FIELD_K] = k
+        values[FIELD_MU] = mu
+        for i in range(nmodes): values[N_SCALAR_FIELDS+nsp+2*nmodes+i] = k_modes[i]
+        flag = so.gas_state_set_all(gstate.id, values)
+        if flag < 0: raise Exception("could not restore gas state from state cache.")
+        if cea_data is not None: gstate.ceaSavedData = cea_data
+        return True
+
+    def store(self, key, gmodel, gstate):
+        """
+        Save the (just updated) data of gstate against key.
+        """
+        nsp = gmodel.n_species
+        nmodes = gmodel.n_modes
+        values = ffi.new("double[]", N_SCALAR_FIELDS+nsp+3*nmodes)
+        flag = so.gas_state_get_all(gstate.id, values)
+        if flag < 0: raise Exception("could not get data for state cache entry.")
+        cea_data = gstate.ceaSavedData if gmodel.type_str == 'CEAGas' else None
+        self._entries[key] = (tuple(ffi.unpack(values, len(values))), cea_data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return
+
+    def save(self, filename=None):
+        """
+        Write the cache entries to a file (in Python's pickle format).
+        """
+        filename = filename or self.filename
+        if not filename: raise Exception("no file name given for saving state cache.")
+        with open(filename, 'wb') as f:
+            pickle.dump({'version':2, 'entries':list(self._entries.items())}, f,
+                        pickle.HIGHEST_PROTOCOL)
+        return
+
+    def load(self, filename=None):
+        """
+        Add the entries previously saved in a file.
+        Entries already in the cache are kept as the most recently used.
+        """
+        filename = filename or self.filename
+        if not filename: raise Exception("no file name given for loading state cache.")
+        with open(filename, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('version') != 2: raise Exception("unknown state cache file version.")
+        for key, entry in data['entries']:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._entries.move_to_end(key, last=False)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return
+
+
 # -----------------------------------------------------------------------------------
 class ThermochemicalReactor(object):
     def __init__(self, gmodel, filename1, filename2=""):
@@ -1146,6 +1670,14 @@ class GasFlow(object):
     def __str__(self):
         return "GasFlow(gmodel.id=%d)" % self.gmodel.id
 
+    # A GasFlow object holds no Dlang objects of its own but it may be used
+    # in a with-statement alongside the GasState objects that it works on.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
     def ideal_shock(self, state1, vs, state2):
         my_results = ffi.new("double[]", [0.0]*2)
         flag = so.gasflow_shock_ideal(state1.id, vs, state2.id, self.gmodel.id, my_results)
@@ -13,10 +13,69 @@ from abc import ABC, abstractmethod
 from gdtk.geom.vector3 import Vector3, cross
 
 
+def _sample(path, t):
+    """
+    Coordinates of the path at the array of t values, evaluated in one call.
+    """
+    p = path(t)
+    return (np.broadcast_to(p.x, t.shape), np.broadcast_to(p.y, t.shape),
+            np.broadcast_to(p.z, t.shape))
+
+def _arc_length_table(path, n, tol, max_levels=30):
+    """
+    Build the table for Path.arc_length_table, with one path evaluation per level.
+    """
+    t = np.linspace(0.0, 1.0, n+1)
+    x, y, z = _sample(path, t)
+    if tol is not None:
+        for level in range(max_levels):
+            chords = np.sqrt(np.diff(x)**2 + np.diff(y)**2 + np.diff(z)**2)
+            tm = 0.5*(t[:-1] + t[1:])
+            xm, ym, zm = _sample(path, tm)
+            halves = np.sqrt((xm-x[:-1])**2 + (ym-y[:-1])**2 + (zm-z[:-1])**2) + \
+                np.sqrt((x[1:]-xm)**2 + (y[1:]-ym)**2 + (z[1:]-zm)**2)
+            refine = (halves - chords) > tol*halves
+            if not np.any(refine): break
+            order = np.argsort(np.concatenate((t, tm[refine])), kind='stable')
+            t = np.concatenate((t, tm[refine]))[order]
+            x = np.concatenate((x, xm[refine]))[order]
+            y = np.concatenate((y, ym[refine]))[order]
+            z = np.concatenate((z, zm[refine]))[order]
+    L = np.concatenate(([0.0], np.cumsum(np.sqrt(np.diff(x)**2 + np.diff(y)**2 + np.diff(z)**2))))
+    t.setflags(write=False)
+    L.setflags(write=False)
+    return t, L
+
+def _geometry_key(value):
+    """
+    A hashable snapshot of the data that define a path, so that a cached
+    arc-length table can be seen to be stale once the path has been changed.
+    """
+    if isinstance(value, Vector3):
+        return tuple(np.asarray(c, dtype=float).tobytes() for c in (value.x, value.y, value.z))
+    if isinstance(value, Path):
+        names = [name for cls in type(value).__mro__ for name in getattr(cls, '__slots__', [])
+                 if name != '_arc_length_tables']
+        items = [getattr(value, name, None) for name in names]
+        items += list(getattr(value, '__dict__', {}).values())
+        return (type(value),) + tuple(_geometry_key(item) for item in items)
+    if isinstance(value, (list, tuple)):
+        return tuple(_geometry_key(item) for item in value)
+    if isinstance(value, np.ndarray):
+        return value.tobytes()
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return id(value)
+
+
 class Path(ABC):
     """
     Base class for the family of paths.
     """
+    __slots__ = ['_arc_length_tables']
+
     @abstractmethod
     def __repr__(self):
         pass
@@ -31,14 +90,34 @@ class Path(ABC):
 
         Subclasses may fall back to using this method.
         """
-        L = 0.0
-        p0 = self.__call__(0.0)
-        dt = 1.0/n
-        for i in range(n):
-            p1 = self.__call__((i+1)*dt)
-            L += abs(p1-p0)
-            p0 = p1
-        return L
+        x, y, z = _sample(self, np.linspace(0.0, 1.0, n+1))
+        return np.sum(np.sqrt(np.diff(x)**2 + np.diff(y)**2 + np.diff(z)**2))
+
+    def arc_length_table(self, n=1000, tol=None):
+        """
+        Cumulative arc lengths at samples of t along the path.
+
+        n:   number of equal intervals in t
+        tol: if given, intervals are bisected, starting from the n intervals,
+             until the length of each chord agrees with the sum of the chords
+             of its halves to within this relative tolerance.
+
+        Returns: tuple of arrays (t_values, arc_lengths)
+
+        The table is kept with the path, along with a snapshot of the points
+        that define the path, and is built again once those points have changed.
+        A deepcopy of the path gets its own copy of the table.
+        """
+        geometry = _geometry_key(self)
+        cached = getattr(self, '_arc_length_tables', None)
+        if cached is None or cached[0] != geometry:
+            cached = (geometry, {})
+            self._arc_length_tables = cached
+        tables = cached[1]
+        key = (n, tol)
+        if key not in tables:
+            tables[key] = _arc_length_table(self, n, tol)
+        return tables[key]
 
 
 class Line(Path):
@@ -204,12 +283,14 @@ class Polyline(Path):
         return
 
     def reset_breakpoints(self):
-        self.t_values = [0.0]
+        t_values = [0.0]
         t_total = 0.0
         for seg in self.segments:
             t_total += seg.length()
-            self.t_values.append(t_total)
-        for i in range(len(self.t_values)): self.t_values[i] /= t_total
+            t_values.append(t_total)
+        self.t_values = np.array(t_values) / t_total
+        # Any arc-length tables were for the old segments.
+        self._arc_length_tables = None
         return
 
     def __repr__(self):
@@ -229,20 +310,31 @@ class Polyline(Path):
         """
         n = len(self.segments)
         if n == 1: return self.segments[0](t)
-
-        f = self.segments[0](t)
-        f*= 0.0
-
-        for i, tl, tu in zip(range(n),self.t_values[:-1], self.t_values[1:]):
-            t_local = (t-tl)/(tu-tl)
-            if i==0:
-                isokay = t_local<=1.0
-            elif i==n-1:
-                isokay = t_local>0.0
-            else:
-                isokay = np.logical_and(t_local>0.0, t_local<=1.0)
-            f += self.segments[i](t_local)*isokay
-        return f
+        # Segment i takes tl < t <= tu, with the first and last segments
+        # also taking any t beyond the ends of the range.
+        inner = self.t_values[1:-1]
+        if np.ndim(t) == 0:
+            i = int(np.searchsorted(inner, t, side='left'))
+            tl = self.t_values[i]; tu = self.t_values[i+1]
+            return self.segments[i]((t-tl)/(tu-tl))
+
+        t = np.asarray(t, dtype=float)
+        tf = t.ravel()
+        seg_index = np.searchsorted(inner, tf, side='left')
+        tl = self.t_values[seg_index]
+        tu = self.t_values[seg_index+1]
+        t_local = (tf-tl)/(tu-tl)
+        # Group the points by segment so that each segment
+        # is evaluated only on its own points.
+        order = np.argsort(seg_index, kind='stable')
+        bounds = np.searchsorted(seg_index[order], np.arange(n+1), side='left')
+        x = np.zeros(tf.shape); y = np.zeros(tf.shape); z = np.zeros(tf.shape)
+        for i in range(n):
+            if bounds[i] == bounds[i+1]: continue
+            pts = order[bounds[i]:bounds[i+1]]
+            p = self.segments[i](t_local[pts])
+            x[pts] = p.x; y[pts] = p.y; z[pts] = p.z
+        return Vector3(x.reshape(t.shape), y.reshape(t.shape), z.reshape(t.shape))
 
     def length(self):
         L = 0.0
@@ -362,13 +454,21 @@ class ArcLengthParameterizedPath(Path):
     A Path reparameterized such that equal increments in t correspond
     to approximately equal increments in arc length.
     """
-    __slots__ = ['underlying_path', 'arc_lengths', 't_values', '_n']
+    __slots__ = ['underlying_path', 'arc_lengths', 't_values', '_n', '_tol']
 
-    def __init__(self, underlying_path, n=1000):
+    def __init__(self, underlying_path, n=1000, tol=None):
+        """
+        underlying_path: the Path to be reparameterized
+        n:   number of equal intervals in t for sampling the arc length
+        tol: if given, the samples are refined adaptively from the n intervals
+             until, within each interval, the chord agrees with the sum of the
+             chords of its halves to within this relative tolerance
+        """
         if isinstance(underlying_path, Path):
             self.underlying_path = underlying_path
             if n < 1: raise RuntimeError("Should have at least one arc-length sample.")
             self._n = n
+            self._tol = tol
             self.set_arc_lengths()
         else:
             raise NotImplementedError("underlying_path should be a type of Path")
@@ -377,22 +477,13 @@ class ArcLengthParameterizedPath(Path):
     def set_arc_lengths(self):
         """
         Compute the arc lengths for a number of sample points along the Path
-        (in equally-spaced values of t) so that these can later be used to do
-        a reverse interpolation on the evaluation parameter.
+        (in equally-spaced values of t, unless refined to a tolerance) so that
+        these can later be used to do a reverse interpolation on the evaluation parameter.
+
+        The table is held by the underlying path, so reparameterizing the same path,
+        or a copy of it, again does not recompute it.
         """
-        dt = 1.0/self._n
-        L = 0.0
-        self.arc_lengths = [0.0,]
-        self.t_values = [0.0,]
-        p0 = self.underlying_path(0.0)
-        for i in range(1, self._n+1):
-            p1 = self.underlying_path(dt*i)
-            L += abs(p1-p0)
-            self.arc_lengths.append(L)
-            self.t_values.append(dt*i)
-            p0 = p1
-        self.t_values = np.array(self.t_values)
-        self.arc_lengths = np.array(self.arc_lengths)
+        self.t_values, self.arc_lengths = self.underlying_path.arc_length_table(self._n, self._tol)
         return
 
     def underlying_t(self, t):
@@ -408,8 +499,8 @@ class ArcLengthParameterizedPath(Path):
         return ut
 
     def __repr__(self):
-        return "ArcLengthParameterizedPath(underlying_path={}, n={})".format(
-            self.underlying_path, self._n)
+        return "ArcLengthParameterizedPath(underlying_path={}, n={}, tol={})".format(
+            self.underlying_path, self._n, self._tol)
 
     def __call__(self, t):
         return self.underlying_path(self.underlying_t(t))
@@ -540,6 +631,15 @@ if __name__=='__main__':
     assert(np.isclose(polyline(0.75).x,     xx.x[2]))
     assert(np.isclose(polyline(1.0).x,      xx.x[3]))
 
+    # Points beyond the ends are extrapolated along the end segments,
+    # and arrays of t keep their shape.
+    tt = np.array([[-0.1, 0.2], [0.5, 1.1]])
+    xx = polyline(tt)
+    assert(xx.x.shape == (2,2))
+    assert(np.isclose(polyline(-0.1).x, xx.x[0,0]))
+    assert(np.isclose(polyline(1.1).x,  xx.x[1,1]))
+    assert(np.isclose(polyline(-0.1).x, polyline2(-0.1).x))
+
     a = [0.0, 0.0]
     b = [0.25, 0.25]
     c = [1.0, 1.0]
@@ -575,3 +675,13 @@ if __name__=='__main__':
     xx = ppath(np.array([0.5, 0.5]))
     assert(np.isclose(x.x, xx.x[0]))
     assert(np.isclose(x.y, xx.y[0]))
+
+    # Adaptive arc-length table, shared with a copy of the path.
+    from copy import deepcopy
+    arc = Arc(Vector3(1.0, 0.0), Vector3(0.0, 1.0), Vector3(0.0, 0.0))
+    apath = ArcLengthParameterizedPath(arc, n=8, tol=1.0e-8)
+    assert(np.isclose(apath.arc_lengths[-1], arc.length(), rtol=1.0e-6))
+    apath2 = ArcLengthParameterizedPath(deepcopy(arc), n=8, tol=1.0e-8)
+    assert(len(apath2.t_values) == len(apath.t_values))
+    x = apath(0.5)
+    assert(np.isclose(x.x, np.sqrt(0.5), rtol=1.0e-6))
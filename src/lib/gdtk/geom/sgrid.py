@@ -8,6 +8,7 @@ PJ, 2020-07-05 Initial code
     2022-09-16 Add Volume grid
 NNG 2022-11-01 Arrayification (Canberra, ACT)
 PJ  2022-11-03 Binary files
+    2026-10-18 Self-describing binary format 2.0 that can be memory mapped
 """
 import numpy as np
 from abc import ABC, abstractmethod
@@ -20,6 +21,11 @@ from gdtk.geom.surface import ParametricSurface, CoonsPatch
 from gdtk.geom.volume import ParametricVolume, TFIVolume
 from gdtk.geom.cluster import *
 
+# Binary grid files, format 2.0, start with this line
+# and have their vertex data aligned to this many bytes.
+BINARY_MAGIC = b"structured_grid 2.0"
+BINARY_ALIGNMENT = 64
+
 class StructuredGrid():
     """
     A structured grid can be constructed on a parametric surface or volume or
@@ -70,11 +76,12 @@ class StructuredGrid():
             self.tags = kwargs.get('tags', self.tags)
         elif "binaryfile" in kwargs.keys():
             self.tags = []
-            self.read_from_binary_file(kwargs.get('binaryfile'))
+            self.read_from_binary_file(kwargs.get('binaryfile'), kwargs.get('memmap', False))
             self.tags = kwargs.get('tags', self.tags)
         else:
             raise Exception("Do not know how to make grid.")
-        self.label = "unknown"
+        # Keep any label that came with a grid file.
+        if not getattr(self, 'label', ""): self.label = "unknown"
         return
 
     def __repr__(self):
@@ -218,20 +225,54 @@ class StructuredGrid():
         self.vertices = Vector3(x=x.copy(), y=y.copy(), z = z.copy())
         return
 
-    def read_from_binary_file(self, file_name):
+    def read_from_binary_file(self, file_name, memmap=False):
         """
-        Bare-bones binary reading for Chicken and Lorikeet.
-        Not for Eilmer. No reading of boundary tags.
+        Binary format for Chicken and Lorikeet, either version 2.0 or the
+        original headerless format (see write_to_binary_file).
+
+        With memmap=True, the vertex arrays of a version 2.0 file are views
+        into a read-only numpy.memmap of the file, so nothing is copied
+        and pages are read from disk only as they are used.
         """
-        data = np.fromfile(file_name, dtype=float)
-        data = data.reshape((data.shape[0]//3,3))
-        self.dimensions = int(data[0,0])
-        self.niv = int(data[1,0])
-        self.njv = int(data[1,1])
-        self.nkv = int(data[1,2])
-        x = data[2:,0]
-        y = data[2:,1]
-        z = data[2:,2]
+        with open(file_name, "rb") as f:
+            magic = f.read(len(BINARY_MAGIC))
+            if magic == BINARY_MAGIC:
+                f.readline() # remainder of first line
+                dtype = "<f8"
+                while True:
+                    line = f.readline().decode('utf-8')
+                    if line == "":
+                        raise RuntimeError("Incomplete header in binary grid file: " + file_name)
+                    if line.startswith("end_header"): break
+                    key, value = [item.strip() for item in line.split(":", 1)]
+                    if key == "label": self.label = value
+                    elif key == "dimensions": self.dimensions = int(value)
+                    elif key == "niv": self.niv = int(value)
+                    elif key == "njv": self.njv = int(value)
+                    elif key == "nkv": self.nkv = int(value)
+                    elif key == "dtype": dtype = value
+                    elif key.startswith("tag["): self.tags.append(value)
+                offset = f.tell()
+                nvertices = self.nkv*self.njv*self.niv
+                if memmap:
+                    data = np.memmap(file_name, dtype=dtype, mode='r', offset=offset,
+                                     shape=(nvertices,3))
+                else:
+                    data = np.fromfile(f, dtype=dtype, count=3*nvertices).reshape((nvertices,3))
+                    data = data.astype(float)
+            else:
+                f.seek(0)
+                data = np.fromfile(f, dtype=float)
+                data = data.reshape((data.shape[0]//3,3))
+                self.dimensions = int(data[0,0])
+                self.niv = int(data[1,0])
+                self.njv = int(data[1,1])
+                self.nkv = int(data[1,2])
+                data = data[2:,:]
+                memmap = False
+        x = data[:,0]
+        y = data[:,1]
+        z = data[:,2]
         if self.dimensions == 1:
             pass
         elif self.dimensions == 2:
@@ -244,7 +285,10 @@ class StructuredGrid():
             z = z.reshape((self.nkv, self.njv, self.niv)).transpose()
         else:
             raise RuntimeError("Invalid dimensions.")
-        self.vertices = Vector3(x=x.copy(), y=y.copy(), z=z.copy())
+        if memmap:
+            self.vertices = Vector3(x=x, y=y, z=z)
+        else:
+            self.vertices = Vector3(x=x.copy(), y=y.copy(), z=z.copy())
         return
 
     def write_to_gzip_file(self, file_name, format_version="1.0"):
@@ -272,20 +316,66 @@ class StructuredGrid():
         f.close()
         return
 
-    def write_to_binary_file(self, file_name):
+    def write_to_binary_file(self, file_name, format_version="2.0"):
         """
-        Bare-bones binary writing for Chicken and Lorikeet.
-        Not for Eilmer. No writing of boundary tags.
+        Binary format for Chicken and Lorikeet.
+
+        Format 2.0 starts with a text header:
+          structured_grid 2.0
+          label: <string>
+          dimensions: <int>
+          niv: <int>
+          njv: <int>
+          nkv: <int>
+          dtype: <f8
+          ntags: <int>
+          tag[0]: <string>
+          ...
+          end_header
+        where the end_header line is padded with spaces so that the vertex
+        data start at a multiple of 64 bytes into the file.
+        The vertex data are (x,y,z) triples of little-endian float64 values,
+        with k as the outer loop, then j and then i as the innermost loop,
+        so the file can be opened directly as a numpy.memmap.
+
+        Format 1.0 is the original bare-bones format, for older readers.
+        It has two rows of metadata, as floats, in front of the vertex data
+        and it has no label or boundary tags.
         """
-        data = np.zeros((self.nkv*self.njv*self.niv+2,3), dtype=float)
-        # Pack the metadata into the first two rows.
-        data[0,:] = [float(self.dimensions), 0.0, 0.0]
-        data[1,:] = [float(self.niv), float(self.njv), float(self.nkv)]
-        # Pack the main data into the remaining rows.
-        data[2:,0] = self.vertices.x.transpose().flatten()
-        data[2:,1] = self.vertices.y.transpose().flatten()
-        data[2:,2] = self.vertices.z.transpose().flatten()
-        data.tofile(file_name)
+        if format_version == "1.0":
+            data = np.zeros((self.nkv*self.njv*self.niv+2,3), dtype=float)
+            # Pack the metadata into the first two rows.
+            data[0,:] = [float(self.dimensions), 0.0, 0.0]
+            data[1,:] = [float(self.niv), float(self.njv), float(self.nkv)]
+            # Pack the main data into the remaining rows.
+            data[2:,0] = self.vertices.x.transpose().flatten()
+            data[2:,1] = self.vertices.y.transpose().flatten()
+            data[2:,2] = self.vertices.z.transpose().flatten()
+            data.tofile(file_name)
+            return
+        if format_version != "2.0":
+            raise RuntimeError("Invalid binary format version: " + format_version)
+        header = BINARY_MAGIC.decode('utf-8') + "\n"
+        header += f"label: {self.label}\n"
+        header += f"dimensions: {self.dimensions}\n"
+        header += f"niv: {self.niv}\n"
+        header += f"njv: {self.njv}\n"
+        header += f"nkv: {self.nkv}\n"
+        header += "dtype: <f8\n"
+        header += f"ntags: {len(self.tags)}\n"
+        for i, tag in enumerate(self.tags):
+            header += f"tag[{i}]: {tag}\n"
+        header = header.encode('utf-8')
+        end = b"end_header"
+        npad = (-(len(header) + len(end) + 1)) % BINARY_ALIGNMENT
+        header += end + b" "*npad + b"\n"
+        data = np.zeros((self.nkv*self.njv*self.niv,3), dtype="<f8")
+        data[:,0] = self.vertices.x.transpose().flatten()
+        data[:,1] = self.vertices.y.transpose().flatten()
+        data[:,2] = self.vertices.z.transpose().flatten()
+        with open(file_name, "wb") as f:
+            f.write(header)
+            data.tofile(f)
         return
 
     def write_to_vtk_file(self, file_name):
@@ -342,7 +432,8 @@ class StructuredGrid_old():
             self.read_from_gzip_file(kwargs.get('gzfile'))
         else:
             raise Exception("Do not know how to make grid.")
-        self.label = "unknown"
+        # Keep any label that came with a grid file.
+        if not getattr(self, 'label', ""): self.label = "unknown"
         return
 
     def __repr__(self):
@@ -0,0 +1,81 @@
+"""
+Test module for the arc-length tables of the path.py module.
+
+.. Version: 2026-10-18
+"""
+
+import copy
+import numpy as np
+import pytest
+
+from gdtk.geom.vector3 import Vector3
+from gdtk.geom.path import Line, Arc, Bezier, Polyline, Spline, ArcLengthParameterizedPath
+
+def test_line_table():
+    line = Line(Vector3(0.0, 0.0), Vector3(3.0, 4.0))
+    t, L = line.arc_length_table(10)
+    assert np.allclose(t, np.linspace(0.0, 1.0, 11))
+    assert np.allclose(L, 5.0*t)
+    # The second request is answered from the cache.
+    t2, L2 = line.arc_length_table(10)
+    assert t2 is t and L2 is L
+    assert not L.flags.writeable
+
+def test_paths_have_no_attribute_dictionary():
+    line = Line(Vector3(0.0, 0.0), Vector3(1.0, 0.0))
+    line.arc_length_table(10)
+    assert not hasattr(line, '__dict__')
+
+def test_mutated_points_give_new_table():
+    line = Line(Vector3(0.0, 0.0), Vector3(1.0, 0.0))
+    assert line.arc_length_table(10)[1][-1] == pytest.approx(1.0)
+    line.p1.x = 2.0
+    assert line.arc_length_table(10)[1][-1] == pytest.approx(2.0)
+    line.p1 = Vector3(0.0, 3.0)
+    assert line.arc_length_table(10)[1][-1] == pytest.approx(3.0)
+    #
+    bez = Bezier([Vector3(0.0, 0.0), Vector3(0.5, 0.0), Vector3(1.0, 0.0)])
+    assert bez.arc_length_table(10)[1][-1] == pytest.approx(1.0)
+    bez.B[2].x = 4.0
+    assert bez.arc_length_table(10)[1][-1] == pytest.approx(4.0)
+    #
+    arc = Arc(Vector3(1.0, 0.0), Vector3(0.0, 1.0), Vector3(0.0, 0.0))
+    assert arc.arc_length_table(100, tol=1.0e-8)[1][-1] == pytest.approx(0.5*np.pi, rel=1.0e-6)
+    arc.b = Vector3(-1.0, 1.0e-9)
+    assert arc.arc_length_table(100, tol=1.0e-8)[1][-1] == pytest.approx(np.pi, rel=1.0e-6)
+
+def test_deepcopy_gets_own_table():
+    spl = Spline([Vector3(0.0, 0.0), Vector3(1.0, 1.0), Vector3(2.0, 0.0)])
+    t, L = spl.arc_length_table(50)
+    spl2 = copy.deepcopy(spl)
+    t2, L2 = spl2.arc_length_table(50)
+    assert np.array_equal(L2, L)
+    assert L2 is not L and not np.shares_memory(L2, L)
+    # Changing the copy leaves the original, and its table, alone.
+    spl2.segments[-1].B[-1].x = 3.0
+    spl2.reset_breakpoints()
+    assert spl2.arc_length_table(50)[1][-1] > L[-1]
+    assert spl.arc_length_table(50)[1] is L
+
+def test_adaptive_table_meets_tolerance():
+    arc = Arc(Vector3(1.0, 0.0), Vector3(0.0, 1.0), Vector3(0.0, 0.0))
+    tol = 1.0e-6
+    t, L = arc.arc_length_table(4, tol=tol)
+    assert len(t) > 5
+    # Each interval has chord and half-chords in agreement, relative to the interval.
+    p = arc(t); pm = arc(0.5*(t[:-1] + t[1:]))
+    chords = np.hypot(np.diff(p.x), np.diff(p.y))
+    halves = np.hypot(pm.x-p.x[:-1], pm.y-p.y[:-1]) + np.hypot(p.x[1:]-pm.x, p.y[1:]-pm.y)
+    assert np.all(halves - chords <= tol*halves)
+
+def test_arc_length_parameterized_path():
+    bez = Bezier([Vector3(0.0, 0.0), Vector3(0.1, 0.0), Vector3(1.0, 0.0)])
+    alpp = ArcLengthParameterizedPath(bez, n=1000)
+    p = alpp(np.linspace(0.0, 1.0, 11))
+    assert np.allclose(p.x, np.linspace(0.0, 1.0, 11), atol=1.0e-4)
+    assert alpp.length() == pytest.approx(1.0)
+    poly = Polyline([Line(Vector3(0.0, 0.0), Vector3(1.0, 0.0)),
+                     Line(Vector3(1.0, 0.0), Vector3(1.0, 3.0))])
+    alpp = ArcLengthParameterizedPath(poly, n=8, tol=1.0e-9)
+    p = alpp(0.5)
+    assert (p.x, p.y) == (pytest.approx(1.0), pytest.approx(1.0))
@@ -13,6 +13,9 @@ Versions:
    27-Feb-2012: Use relative import in cfpylib
    29-Dec-2019: Port to the Eilmer4 collection, update to Python3.
    17-jul-2022: Bring in Maciej's additions (theta_cone_flowfield).
+   18-Oct-2026: Accept NumPy arrays as well as scalars.  The inverse functions
+      PM2, M_Rayleigh and beta_obl use a bracketed Newton iteration
+      that works on whole arrays at once.
 
 Contents:
 
@@ -35,7 +38,50 @@ Two-dimensional flows:
 from math import *
 import numpy
 from gdtk.numeric.zero_solvers import secant as solve
-from gdtk.numeric.zero_solvers import newton as solve_newton
+from gdtk.numeric.zero_solvers import newton_bracketed
+from gdtk.numeric.ode import ode_integrate_adaptive
+
+# ---------------------------------------------------------------
+# Array support
+#
+# The flow relations are written with NumPy functions so that
+# M, beta, theta, etc may be given as arrays (of any shape, broadcast
+# together in the usual NumPy way) as well as plain numbers.
+# Scalar arguments still give scalar results.
+
+def _scalar_or_array(x):
+    """
+    Return a 0-d result as a scalar, any other result as an array.
+    """
+    x = numpy.asarray(x)
+    return x[()] if x.ndim == 0 else x
+
+def _elementwise(fn, *args):
+    """
+    Apply the scalar function fn over the broadcast array arguments.
+
+    This is used for the Taylor-Maccoll functions, where each element
+    needs its own integration across the shock layer.
+    If fn returns a tuple, a tuple of arrays is returned.
+    """
+    arrays = numpy.broadcast_arrays(*[numpy.asarray(a, dtype=float) for a in args])
+    shape = arrays[0].shape
+    results = [fn(*[float(a[idx]) for a in arrays]) for idx in numpy.ndindex(shape)]
+    if len(results) > 0 and isinstance(results[0], tuple):
+        return tuple(numpy.array([r[j] for r in results]).reshape(shape)
+                     for j in range(len(results[0])))
+    return numpy.array(results).reshape(shape)
+
+def _expand_upper_bracket(fun, x_hi, max_doublings=64):
+    """
+    Double the elements of x_hi until fun(x_hi) >= 0 for all of them.
+    """
+    x_hi = numpy.array(x_hi, dtype=float)
+    for i in range(max_doublings):
+        short = fun(x_hi) < 0.0
+        if not numpy.any(short): return x_hi
+        x_hi = numpy.where(short, 2.0*x_hi, x_hi)
+    raise Exception("Could not bracket the solution.")
 
 # ---------------------------------------------------------------
 # Isentropic flow
@@ -51,7 +97,7 @@ def A_Astar(M, g=1.4):
     t1 = (g + 1.0) / (g - 1.0)
     m2 = M**2
     t2 = 1.0 / m2 * (2.0 / (g + 1.0) * (1.0 + (g - 1.0) * 0.5 * m2))**t1
-    t2 = sqrt(t2)
+    t2 = numpy.sqrt(t2)
     return t2
 
 def T0_T(M, g=1.4):
@@ -97,7 +143,7 @@ def m2_shock(M1, g=1.4):
     """
     numer = 1.0 + (g - 1.0) * 0.5 * M1**2
     denom = g * M1**2 - (g - 1.0) * 0.5
-    return sqrt(numer / denom)
+    return numpy.sqrt(numer / denom)
 
 def r2_r1(M1, g=1.4):
     """
@@ -163,7 +209,7 @@ def ds_Cv(M1, g=1.4):
     """
     t1 = p2_p1(M1, g)
     t2 = r2_r1(M1, g)
-    return log(t1 * t2**g)
+    return numpy.log(t1 * t2**g)
 
 def pitot_p(p1, M1, g=1.4):
     """
@@ -175,12 +221,13 @@ def pitot_p(p1, M1, g=1.4):
     g: ratio of specific heats
     Returns: Pitot pressure (absolute)
     """
-    if M1 > 1.0:
-        p2 = p2_p1(M1,g)*p1
-        M2 = m2_shock(M1, g)
-        return p0_p(M2, g)*p2
-    else:
-        return p0_p(M1, g)*p1
+    M1 = numpy.asarray(M1, dtype=float)
+    # The shocked branch is meaningless for subsonic elements
+    # but they are discarded by the where() below.
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        p_shocked = p0_p(m2_shock(M1, g), g) * p2_p1(M1, g) * p1
+    p_unshocked = p0_p(M1, g) * p1
+    return _scalar_or_array(numpy.where(M1 > 1.0, p_shocked, p_unshocked))
 
 
 # -----------------------------------------------------------------
@@ -209,10 +256,19 @@ def M_Rayleigh(T0T0star, g=1.4):
     g: ratio of specific heats
     Returns: initial Mach number of flow
 
-    Note that supersonic flow is assumed for the initial guess.
+    Note that supersonic flow is assumed, so T0T0star must lie
+    between (g**2-1)/g**2 (for M -> infinity) and 1 (for M = 1).
     """
+    T0T0star = numpy.asarray(T0T0star, dtype=float)
+    T0T0star_limit = (g**2 - 1.0) / g**2
+    bad = (T0T0star <= T0T0star_limit) | (T0T0star > 1.0)
+    if numpy.any(bad):
+        raise Exception("No supersonic solution for T0/T0star=%g" % T0T0star[bad].flat[0])
     def f_to_solve(m): return T0_T0star(m, g) - T0T0star
-    return solve(f_to_solve, 2.5, 2.4)
+    def f_dash(m): return 4.0 * (g + 1.0) * m * (1.0 - m**2) / (1.0 + g * m**2)**3
+    # T0/T0star decreases with M on the supersonic branch.
+    m_hi = _expand_upper_bracket(lambda m: -f_to_solve(m), numpy.full(T0T0star.shape, 2.0))
+    return _scalar_or_array(newton_bracketed(f_to_solve, f_dash, 1.0, m_hi))
 
 def T_Tstar(M, g=1.4):
     """
@@ -275,15 +331,13 @@ def PM1(M, g=1.4):
     g: ratio of specific heats
     Returns: Prandtl-Meyer function value (in radians)
     """
-    if M > 1.0:
-        t1 = M**2 - 1.0
-        t2 = sqrt((g - 1.0) / (g + 1.0) * t1)
-        t3 = sqrt(t1)
-        t4 = sqrt((g + 1.0) / (g - 1.0))
-        nu = t4 * atan(t2) - atan(t3)
-    else:
-        nu = 0.0
-    return nu
+    # Subsonic and sonic elements get t1 = 0 and, so, nu = 0.
+    t1 = numpy.maximum(numpy.asarray(M, dtype=float)**2 - 1.0, 0.0)
+    t2 = numpy.sqrt((g - 1.0) / (g + 1.0) * t1)
+    t3 = numpy.sqrt(t1)
+    t4 = numpy.sqrt((g + 1.0) / (g - 1.0))
+    nu = t4 * numpy.arctan(t2) - numpy.arctan(t3)
+    return _scalar_or_array(nu)
 
 def PM2(nu, g=1.4):
     """
@@ -295,8 +349,15 @@ def PM2(nu, g=1.4):
 
     Solves the equation PM1(m, g) - nu = 0, assuming supersonic flow.
     """
+    nu = numpy.asarray(nu, dtype=float)
+    nu_max = 0.5 * pi * (sqrt((g + 1.0) / (g - 1.0)) - 1.0)
+    bad = (nu < 0.0) | (nu >= nu_max)
+    if numpy.any(bad):
+        raise Exception("Prandtl-Meyer function value out of range: %g" % nu[bad].flat[0])
     def f_to_solve(m): return PM1(m, g) - nu
-    return solve(f_to_solve, 2.0, 2.1)
+    def f_dash(m): return numpy.sqrt(m**2 - 1.0) / (m * (1.0 + 0.5 * (g - 1.0) * m**2))
+    m_hi = _expand_upper_bracket(f_to_solve, numpy.full(nu.shape, 2.0))
+    return _scalar_or_array(newton_bracketed(f_to_solve, f_dash, 1.0, m_hi))
 
 # -----------------------------------------------------------------
 # Oblique shock relations
@@ -310,10 +371,17 @@ def beta_obl(M1, theta, g=1.4, tol=1.0e-6):
     M1: upstream Mach number
     theta: flow deflection angle (radians)
     Returns: shock angle with respect to initial flow direction (radians)
+
+    The weak-shock solution is found between the Mach angle and
+    the shock angle for maximum deflection.
     """
-    if M1 < 1.0: raise Exception("M1 is subsonic")
-    sign_beta = -1 if theta < 0.0 else 1
-    theta = abs(theta)
+    M1, theta = numpy.broadcast_arrays(numpy.asarray(M1, dtype=float),
+                                       numpy.asarray(theta, dtype=float))
+    shape = M1.shape
+    M1 = M1.ravel(); theta = theta.ravel()
+    if numpy.any(M1 < 1.0): raise Exception("M1 is subsonic")
+    sign_beta = numpy.where(theta < 0.0, -1.0, 1.0)
+    theta = numpy.abs(theta)
     # AM and RJG, 2024-02-13
     # We add a small value (epislon) to our starting guess.
     # We found we needed this in the unlucky situation
@@ -321,17 +389,23 @@ def beta_obl(M1, theta, g=1.4, tol=1.0e-6):
     # sin() and back through asin() would put the
     # value on the wrong side of 1.0, ie. < 1.0.
     EPS = 1.0e-12
-    b1 = asin(1.0/M1) + EPS;
-    if theta < tol:
-        # Small deflection will produce a very weak shock.
-        return sign_beta * b1
-    b2 = b1 * 1.05
-    def f_to_solve(beta): return theta_obl(M1, beta, g) - theta
-    f1 = f_to_solve(b1)
-    if abs(f1) < tol: return sign_beta * b1
-    f2 = f_to_solve(b2)
-    if abs(f2) < tol: return sign_beta * b2
-    return sign_beta * solve(f_to_solve, b1, b2, tol=tol)
+    b1 = numpy.arcsin(1.0/M1) + EPS
+    beta = b1.copy()
+    # Small deflection will produce a very weak shock,
+    # so we only need to solve for the other elements.
+    solve_for = theta >= tol
+    if numpy.any(solve_for):
+        M1s = M1[solve_for]; thetas = theta[solve_for]
+        b_max = beta_max_obl(M1s, g)
+        theta_max = _theta_obl(M1s, b_max, g)
+        too_big = thetas > theta_max
+        if numpy.any(too_big):
+            raise Exception("Deflection angle %g is larger than maximum %g for M1=%g" %
+                            (thetas[too_big][0], theta_max[too_big][0], M1s[too_big][0]))
+        def f_to_solve(b): return _theta_obl(M1s, b, g) - thetas
+        def f_dash(b): return _dtheta_obl_dbeta(M1s, b, g)
+        beta[solve_for] = newton_bracketed(f_to_solve, f_dash, b1[solve_for], b_max, tol=tol)
+    return _scalar_or_array((sign_beta * beta).reshape(shape))
 
 def beta_obl_newt(M1, theta, g=1.4, tol=1.0e-6):
     """
@@ -341,32 +415,25 @@ def beta_obl_newt(M1, theta, g=1.4, tol=1.0e-6):
     M1: upstream Mach number
     theta: flow deflection angle (radians)
     Returns: shock angle with respect to initial flow direction (radians)
+
+    beta_obl() now uses a bracketed Newton iteration with the
+    analytic derivative, so this function just delegates to it.
+    """
+    return beta_obl(M1, theta, g, tol)
+
+def beta_max_obl(M1, g=1.4):
+    """
+    Oblique shock wave angle for maximum flow deflection.
+
+    M1: upstream Mach number
+    Returns: shock angle (radians) that separates the weak- and
+      strong-shock solutions, theta_obl(M1, beta) is largest here.
     """
-    if M1 < 1.0: raise Exception("M1 is subsonic")
-    sign_beta = -1 if theta < 0.0 else 1
-    theta = abs(theta)
-    b0 = asin(1.0/M1)
-    if theta < tol:
-        # Small deflection will produce a very weak shock.
-        return sign_beta * b0
-    def fun(beta):
-        m1sb = M1 * abs(sin(beta))
-        m1cb = M1 * abs(cos(beta))
-        if m1cb < 1.0: raise Exception("Subsonic normal Mach number: %g" % m1cb)
-        t1 = 2.0 / tan(beta) * (m1sb**2 - 1.0)
-        t2 = 1/(M1**2 * (g + cos(2.0 * beta)) + 2.0)
-        return atan(t1*t2) - theta
-    def fun_dash(beta):
-        m1sb = M1 * abs(sin(beta))
-        t1 = 2.0 / tan(beta) * (m1sb**2 - 1.0)
-        t2 = 1/(M1**2 * (g + cos(2.0 * beta)) + 2.0)
-        x = t1*t2
-        df_dx = 1/(1+x**2)
-        dt1_db = 2*M1**2 * cos(2*beta) + 2/(sin(beta)**2)
-        dt2_db = (M1**2 * (g + cos(2.0 * beta)) + 2.0)**-2 * M1**2 * 2 *sin(2*beta)
-        dx_db = dt1_db*t2 + t1*dt2_db
-        return df_dx*dx_db
-    return sign_beta * solve_newton(fun, fun_dash, 0.9*b0, tol=tol)
+    m2 = numpy.asarray(M1, dtype=float)**2
+    t1 = (g + 1.0) * m2 - 4.0
+    t2 = numpy.sqrt((g + 1.0) * ((g + 1.0) * m2**2 + 8.0 * (g - 1.0) * m2 + 16.0))
+    sin2b = (t1 + t2) / (4.0 * g * m2)
+    return _scalar_or_array(numpy.arcsin(numpy.sqrt(numpy.minimum(sin2b, 1.0))))
 
 def beta_obl2(M1, p2_p1, g=1.4):
     """
@@ -376,10 +443,33 @@ def beta_obl2(M1, p2_p1, g=1.4):
     p2_p1: static pressure ratio p2/p1 across the oblique shock
     Returns: shock angle with respect to initial flow direction (radians)
     """
-    if M1 < 1.0: raise Exception("M1 is subsonic: %g" % M1)
-    if p2_p1 < 1.0: raise Exception("Invalid p2_p1: %g" % p2_p1)
-    dum1 = sqrt(((g+1.0)*p2_p1+g-1.0)/2.0/g)
-    return asin(dum1/M1)
+    if numpy.any(M1 < 1.0): raise Exception("M1 is subsonic: %g" % numpy.min(M1))
+    if numpy.any(p2_p1 < 1.0): raise Exception("Invalid p2_p1: %g" % numpy.min(p2_p1))
+    dum1 = numpy.sqrt(((g+1.0)*p2_p1+g-1.0)/2.0/g)
+    return numpy.arcsin(dum1/M1)
+
+def _check_normal_mach(m1sb):
+    if numpy.any(m1sb < 1.0):
+        raise Exception("Subsonic normal Mach number: %g" % numpy.min(m1sb))
+
+def _theta_obl(M1, beta, g):
+    """
+    Deflection angle without the check on normal Mach number.
+    """
+    t1 = 2.0 / numpy.tan(beta) * ((M1 * numpy.sin(beta))**2 - 1.0)
+    t2 = M1**2 * (g + numpy.cos(2.0 * beta)) + 2.0
+    return numpy.arctan(t1/t2)
+
+def _dtheta_obl_dbeta(M1, beta, g):
+    """
+    Derivative of _theta_obl() with respect to beta.
+    """
+    s = numpy.sin(beta); c = numpy.cos(beta)
+    t1 = 2.0 * c / s * ((M1 * s)**2 - 1.0)
+    t2 = M1**2 * (g + numpy.cos(2.0 * beta)) + 2.0
+    dt1 = 2.0 * M1**2 * numpy.cos(2.0 * beta) + 2.0 / s**2
+    dt2 = -2.0 * M1**2 * numpy.sin(2.0 * beta)
+    return (dt1 * t2 - t1 * dt2) / (t2**2 + t1**2)
 
 def theta_obl(M1, beta, g=1.4):
     """
@@ -389,12 +479,9 @@ def theta_obl(M1, beta, g=1.4):
     beta: shock angle with respect to initial flow direction (radians)
     Returns: theta, flow deflection angle (radians)
     """
-    m1sb = M1 * abs(sin(beta))
-    m1cb = M1 * abs(cos(beta))
-    if m1sb < 1.0: raise Exception("Subsonic normal Mach number: %g" % m1sb)
-    t1 = 2.0 / tan(beta) * (m1sb**2 - 1.0)
-    t2 = M1**2 * (g + cos(2.0 * beta)) + 2.0
-    theta = atan(t1/t2)
+    m1sb = M1 * numpy.abs(numpy.sin(beta))
+    _check_normal_mach(m1sb)
+    theta = _theta_obl(M1, beta, g)
     return theta
 
 def M2_obl(M1, beta, theta, g=1.4):
@@ -405,12 +492,11 @@ def M2_obl(M1, beta, theta, g=1.4):
     beta: shock angle with respect to initial flow direction (radians)
     Returns: M2, Mach number in flow after the shock
     """
-    m1sb = M1 * abs(sin(beta))
-    m1cb = M1 * abs(cos(beta))
-    if m1sb < 1.0: raise Exception("Subsonic normal Mach number: %g" % m1sb)
+    m1sb = M1 * numpy.abs(numpy.sin(beta))
+    _check_normal_mach(m1sb)
     numer = 1.0 + (g - 1.0) * 0.5 * m1sb**2
     denom = g * m1sb**2 - (g - 1.0) * 0.5
-    m2 = sqrt(numer / denom / (sin(beta - theta))**2 )
+    m2 = numpy.sqrt(numer / denom / (numpy.sin(beta - theta))**2 )
     return m2
 
 def r2_r1_obl(M1, beta, g=1.4):
@@ -421,9 +507,8 @@ def r2_r1_obl(M1, beta, g=1.4):
     beta: shock angle with respect to initial flow direction (radians)
     Returns: r2/r1
     """
-    m1sb = M1 * abs(sin(beta))
-    m1cb = M1 * abs(cos(beta))
-    if m1sb < 1.0: raise Exception("Subsonic normal Mach number: %g" % m1sb)
+    m1sb = M1 * numpy.abs(numpy.sin(beta))
+    _check_normal_mach(m1sb)
     numer = (g + 1.0) * m1sb**2
     denom = 2.0 + (g - 1.0) * m1sb**2
     return numer / denom
@@ -446,7 +531,7 @@ def v2_v1_obl(M1, beta, g=1.4):
     beta: shock angle with respect to initial flow direction (radians)
     Returns: v2/v1
     """
-    return sqrt((sin(beta) / r2_r1_obl(M1, beta, g))**2 + (cos(beta))**2)
+    return numpy.sqrt((numpy.sin(beta) / r2_r1_obl(M1, beta, g))**2 + (numpy.cos(beta))**2)
 
 def p2_p1_obl(M1, beta, g=1.4):
     """
@@ -456,9 +541,8 @@ def p2_p1_obl(M1, beta, g=1.4):
     beta: shock angle with respect to initial flow direction (radians)
     Returns: p2/p1
     """
-    m1sb = M1 * abs(sin(beta))
-    m1cb = M1 * abs(cos(beta))
-    if m1sb < 1.0: raise Exception("Subsonic normal Mach number: %g" % m1sb)
+    m1sb = M1 * numpy.abs(numpy.sin(beta))
+    _check_normal_mach(m1sb)
     return 1.0 + 2.0 * g / (g + 1.0) * (m1sb**2 - 1.0)
 
 def T2_T1_obl(M1, beta, g=1.4):
@@ -479,13 +563,13 @@ def p02_p01_obl(M1, beta, g=1.4):
     beta: shock angle with respect to initial flow direction (radians)
     Returns: p02/p01
     """
-    m1sb = M1 * abs(sin(beta))
-    m1cb = M1 * abs(cos(beta))
-    if m1sb < 1.0: raise Exception("Subsonic normal Mach number: %g" % m1sb)
+    m1sb = M1 * numpy.abs(numpy.sin(beta))
+    _check_normal_mach(m1sb)
     t1 = (g + 1.0) / (2.0 * g * m1sb**2 - (g - 1.0))
     t2 = (g + 1.0) * m1sb**2 / (2.0 + (g - 1.0) * m1sb**2)
     return t1**(1.0/(g-1.0)) * t2**(g/(g-1.0))
 
+
 #------------------------------------------------------------------------
 # Taylor-Maccoll cone flow.
 
@@ -494,8 +578,8 @@ def taylor_maccoll_odes(z, theta, g=1.4):
     The ODEs from the Taylor-Maccoll formulation.
 
     See PJ's workbook for Feb 2012 for details.
-    We've packaged them formally so that we might one day use
-    a more sophisticated ODE integrator requiring fewer steps.
+    We've packaged them formally so that they can be handed to
+    the adaptive-step integrator in gdtk.numeric.ode.
     """
     rho, V_r, V_theta, h, p = z
     # Assemble linear system for determining the derivatives wrt theta.
@@ -509,7 +593,7 @@ def taylor_maccoll_odes(z, theta, g=1.4):
     dzdtheta = numpy.linalg.solve(A,b)
     return dzdtheta
 
-def theta_cone(V1, p1, T1, beta, R=287.1, g=1.4, dtheta=-1.0e-5):
+def theta_cone(V1, p1, T1, beta, R=287.1, g=1.4, dtheta=-1.0e-5, accuracy=None, tol=1.0e-10):
     """
     Compute the cone-surface angle and conditions given the shock wave angle.
 
@@ -519,7 +603,13 @@ def theta_cone(V1, p1, T1, beta, R=287.1, g=1.4, dtheta=-1.0e-5):
     beta: shock wave angle wrt stream direction (in radians)
     R: gas constant
     g: ratio of specific heats
-    dtheta: angular increment for integration to the cone surface (in radians)
+    dtheta: first angular step for integration to the cone surface (in radians)
+    accuracy: if given, the acceptable error in theta_c (radians) and
+      relative error in V_c, p_c and T_c.  The precomputed table in
+      gdtk.taylor_maccoll_table is then used wherever its error estimate
+      is within accuracy, and an adaptive-step integration elsewhere.
+      The default (None) always integrates, starting with the step dtheta.
+    tol: acceptable relative error for each integration step
 
     Returns: tuple of theta_c, V_c, p_c, T_c:
       theta_c is stream deflection angle in radians
@@ -528,15 +618,24 @@ def theta_cone(V1, p1, T1, beta, R=287.1, g=1.4, dtheta=-1.0e-5):
       T_c is the cone-surface static temperature
 
     The computation starts with the oblique-shock jump and then integrates
-    across theta until V_theta goes through zero.
-    The cone surface corresponds to V_theta == 0.
+    across theta, with adaptive steps, until V_theta goes through zero.
+    The cone surface corresponds to V_theta == 0 and is located
+    on the interpolant through the final step.
 
     Versions:
     08-Mar-2012: This ideal-gas version adapted from the cea2_gas_flow version.
     24-Jun-2012: RJG added checks to catch the limiting case when beta < mu and
       a linear interpolation when beta is only slightly larger than mu (1% larger)
     June 2022: Pass in the angular increment.
-    """
+    Oct 2026: Optionally use the precomputed table.
+      Adaptive RKF45 integration with location of the V_theta == 0 event.
+    """
+    if accuracy is not None:
+        return _theta_cone_from_table(V1, p1, T1, beta, R, g, accuracy)
+    if numpy.ndim(V1) or numpy.ndim(p1) or numpy.ndim(T1) or numpy.ndim(beta):
+        def theta_cone_scalar(V1, p1, T1, beta):
+            return theta_cone(V1, p1, T1, beta, R, g, dtheta, tol=tol)
+        return _elementwise(theta_cone_scalar, V1, p1, T1, beta)
     # When beta is only this fraction larger than mu,
     # we'll apply a linear interpolation
     LINEAR_INTERP_SWITCH = 1.01
@@ -558,7 +657,7 @@ def theta_cone(V1, p1, T1, beta, R=287.1, g=1.4, dtheta=-1.0e-5):
         # when the shock angle is only slightly larger than the Mach
         # angle. In this instance, find the value at LINEAR_INTER_SWITCH*mu
         # and linearly interpolate to find the value at beta
-        (theta2, V2, p2, T2) = theta_cone(V1, p1, T1, beta2, R, g)
+        (theta2, V2, p2, T2) = theta_cone(V1, p1, T1, beta2, R, g, dtheta, tol=tol)
         frac = (beta - mu)/(beta2 - mu)
         theta_c = frac*theta2
         V = (1.0 - frac)*V1 + frac*V2
@@ -582,29 +681,19 @@ def theta_cone(V1, p1, T1, beta, R=287.1, g=1.4, dtheta=-1.0e-5):
     # For integrating across the shock layer, the state vector is:
     z = numpy.array([rho2, V_r, V_theta, h2, p2])
     #
-    while V_theta < 0.0:
-        # Keep a copy for linear interpolation at the end.
-        z_old = z.copy(); theta_old = theta
-        # Do the update using a low-order method (Euler) for the moment.
-        dzdtheta = taylor_maccoll_odes(z, theta, g)
-        z += dtheta * dzdtheta; theta += dtheta
-        rho, V_r, V_theta, h, p = z
-        if False: print("DEBUG theta=", theta, "V_r=", V_r, "V_theta=", V_theta)
-    #
-    # At this point, V_theta should have crossed zero so
-    # we can linearly-interpolate the cone-surface conditions.
-    V_theta_old = z_old[2]
-    frac = (0.0 - V_theta_old)/(V_theta - V_theta_old)
-    z_c = z_old*(1.0-frac) + z*frac
-    theta_c = theta_old*(1.0-frac) + theta*frac
+    # Integrate with adaptive steps until V_theta goes through zero.
+    def f(theta, z, n): return taylor_maccoll_odes(z, theta, g)
+    thetas, zs, errs, dense = ode_integrate_adaptive(beta, 0.0, f, 5, z, h=dtheta, tol=tol,
+                                                     event=lambda theta, z: z[2])
     # At the cone surface...
-    rho, V_r, V_theta, h, p = z_c
+    theta_c = thetas[-1]
+    rho, V_r, V_theta, h, p = zs[-1]
     T = h / C_p
     assert abs(V_theta) < 1.0e-6
     #
     return theta_c, V_r, p, T
 
-def beta_cone(V1, p1, T1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1.0e-5):
+def beta_cone(V1, p1, T1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1.0e-5, accuracy=None):
     """
     Compute the conical shock wave angle given the cone-surface deflection angle.
 
@@ -616,11 +705,18 @@ def beta_cone(V1, p1, T1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1.0e-5):
     g: ratio of specific heats
     tol: tolerance on the computed angle of the cone surface (in radians)
     dtheta: angular increment for integration to the cone surface (in radians)
+    accuracy: if given, use the precomputed table as for theta_cone()
 
     Returns: shock wave angle wrt incoming stream direction (in radians)
 
     This ideal-gas version adapted from the cea2_gas_flow version, 08-Mar-2012.
     """
+    if accuracy is not None:
+        return _beta_cone_from_table(V1, p1, T1, theta, R, g, tol, accuracy)
+    if numpy.ndim(V1) or numpy.ndim(p1) or numpy.ndim(T1) or numpy.ndim(theta):
+        def beta_cone_scalar(V1, p1, T1, theta):
+            return beta_cone(V1, p1, T1, theta, R, g, tol, dtheta)
+        return _elementwise(beta_cone_scalar, V1, p1, T1, theta)
     # Free-stream properties and gas model.
     a1 = sqrt(g*R*T1)
     M1 = V1 / a1
@@ -636,7 +732,7 @@ def beta_cone(V1, p1, T1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1.0e-5):
         return theta_guess - theta
     return solve(error_in_theta, b1, b2, tol=tol, limits=[asin(1.0/M1), pi/2.0])
 
-def beta_cone2(M1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1e-5):
+def beta_cone2(M1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1e-5, accuracy=None):
     """
     Compute the conical shock wave angle given the cone-surface deflection angle and
     free stream Mach number.
@@ -647,6 +743,7 @@ def beta_cone2(M1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1e-5):
     g: ratio of specific heats
     tol: tolerance on the computed angle of the cone surface (in radians)
     dtheta: angular increment for integration to the cone surface (in radians)
+    accuracy: if given, use the precomputed table as for theta_cone()
 
     Returns: shock wave angle wrt incoming stream direction (in radians)
 
@@ -655,18 +752,80 @@ def beta_cone2(M1, theta, R=287.1, g=1.4, tol=1.0e-8, dtheta=-1e-5):
     # Compute free stream velocity assuming unit value temperature
     T1 = 1.0
     a1 = sqrt(g*R*T1)
-    V1 = M1*a1
+    V1 = numpy.multiply(M1, a1)
     # Set free stream pressure to unit value
     p1 = 1.0
     # Now ready to call beta_cone()
-    return beta_cone(V1, p1, T1, theta, R, g, tol, dtheta)
+    return beta_cone(V1, p1, T1, theta, R, g, tol, dtheta, accuracy)
+
+def _flat_cone_arguments(V1, p1, T1, angle, R, g):
+    V1, p1, T1, angle = numpy.broadcast_arrays(*[numpy.asarray(a, dtype=float)
+                                                 for a in (V1, p1, T1, angle)])
+    shape = V1.shape
+    V1, p1, T1, angle = [a.ravel() for a in (V1, p1, T1, angle)]
+    M1 = V1 / numpy.sqrt(g*R*T1)
+    if numpy.any(M1 < 1.0): raise Exception("M1 is subsonic: %g" % numpy.min(M1))
+    return shape, V1, p1, T1, angle, M1
+
+def _theta_cone_from_table(V1, p1, T1, beta, R, g, accuracy):
+    """
+    theta_cone() answered from the precomputed table, where it is accurate enough.
+    """
+    from gdtk.taylor_maccoll_table import get_default_table, surface_conditions, \
+        THETA_C, V_C_V1, P_C_P1, T_C_T1
+    shape, V1, p1, T1, beta, M1 = _flat_cone_arguments(V1, p1, T1, beta, R, g)
+    fields, ok = get_default_table().lookup(M1, beta, g, accuracy)
+    # An infinitely weak shock angle leaves the free stream unchanged.
+    weak = beta <= numpy.arcsin(1.0/M1)
+    fields[weak] = [0.0, 1.0, 1.0, 1.0]
+    integrate = ~ok & ~weak
+    if numpy.any(integrate):
+        fields[integrate] = numpy.array(surface_conditions(M1[integrate], beta[integrate], g)).T
+    return (_scalar_or_array(fields[:, THETA_C].reshape(shape)),
+            _scalar_or_array((V1 * fields[:, V_C_V1]).reshape(shape)),
+            _scalar_or_array((p1 * fields[:, P_C_P1]).reshape(shape)),
+            _scalar_or_array((T1 * fields[:, T_C_T1]).reshape(shape)))
+
+def _beta_cone_from_table(V1, p1, T1, theta, R, g, tol, accuracy):
+    """
+    beta_cone() answered from the precomputed table, where it is accurate enough.
+    """
+    from gdtk.taylor_maccoll_table import get_default_table, surface_conditions, beta_sonic_obl
+    shape, V1, p1, T1, theta, M1 = _flat_cone_arguments(V1, p1, T1, theta, R, g)
+    beta, ok = get_default_table().beta_for_theta(M1, theta, g, accuracy)
+    if not numpy.all(ok):
+        # Integrate for the rest, all together, bracketing the weak solution
+        # between the Mach angle and the sonic-flow shock angle.
+        idx = numpy.flatnonzero(~ok)
+        Mi = M1[idx]; thetai = theta[idx]
+        b_lo = numpy.arcsin(1.0/Mi); b_hi = beta_sonic_obl(Mi, g)
+        bracketed = surface_conditions(Mi, b_hi, g)[0] >= thetai
+        if numpy.any(bracketed):
+            Mb = Mi[bracketed]; thetab = thetai[bracketed]
+            def error_in_theta(b): return surface_conditions(Mb, b, g)[0] - thetab
+            def error_dash(b):
+                h = 1.0e-7
+                return (error_in_theta(b) - error_in_theta(b - h)) / h
+            beta[idx[bracketed]] = newton_bracketed(error_in_theta, error_dash,
+                                                    b_lo[bracketed], b_hi[bracketed], tol=tol)
+        for i in idx[~bracketed]:
+            # Cones that leave subsonic flow behind the shock, as for beta_cone().
+            mu = asin(1.0 / M1[i])
+            def error_in_theta(beta_guess):
+                return float(surface_conditions(M1[i], beta_guess, g)[0]) - theta[i]
+            beta[i] = solve(error_in_theta, mu*1.01, mu*1.01*1.05, tol=tol, limits=[mu, pi/2.0])
+    return _scalar_or_array(beta.reshape(shape))
 
 def theta_cone_flowfield(V1, p1, T1, beta, theta_cone, rays_num,
-                         R=287.1, g=1.4, dtheta=-1.0e-5):
+                         R=287.1, g=1.4, dtheta=-1.0e-5, tol=1.0e-10):
     """
     Returns the flowfield properties for a collection of rays
     through the conical shock layer.
 
+    The shock layer is integrated with adaptive steps, the first being dtheta
+    and each being within the relative error tol, and the rays are
+    sampled from the interpolant through those steps.
+
     Maciej Grybko, University of Southern Queensland, 2022
     """
     # Free-stream properties and gas model.
@@ -701,46 +860,34 @@ def theta_cone_flowfield(V1, p1, T1, beta, theta_cone, rays_num,
     S = beta - theta_cone                  # sum of all theta increments
     n = rays_num - 2
     q = 1 + 2.0/rays_num + 500/rays_num**2 # multiplier (for non-uniform theta)
-    i = 0
-    theta_series = beta - S*(1-q)/(1-q**n)*q**i
     #
-    while V_theta < 0.0:
-        # Keep a copy for linear interpolation at the end.
-        z_old = z.copy(); theta_old = theta
-        # Do the update using a low-order method (Euler) for the moment.
-        dzdtheta = taylor_maccoll_odes(z, theta, g)
-        z += dtheta * dzdtheta; theta += dtheta
+    # Integrate with adaptive steps until V_theta goes through zero.
+    def f(theta, z, n): return taylor_maccoll_odes(z, theta, g)
+    thetas, zs, errs, dense = ode_integrate_adaptive(beta, 0.0, f, 5, z, h=dtheta, tol=tol,
+                                                     event=lambda theta, z: z[2])
+    theta_c = thetas[-1]
+    #
+    def save_ray(theta, z):
         rho, V_r, V_theta, h, p = z
-        if False: print("DEBUG theta=", theta, "V_r=", V_r, "V_theta=", V_theta)
-        #
-        if theta < theta_series: # save flow properties for desired thetas
-            i += 1
-            theta_series -= S*(1-q)/(1-q**n)*q**i
-            V = sqrt(V_r**2 + V_theta**2)
-            T = h / C_p
-            a = sqrt(g*R*T)
-            M.append(V/a)
-            flow_dir.append(theta + atan(V_theta/V_r))
-            theta_vec.append(theta)
-            mu.append(asin(1/M[-1]))
+        V = sqrt(V_r**2 + V_theta**2)
+        T = h / C_p
+        a = sqrt(g*R*T)
+        M.append(V/a)
+        flow_dir.append(theta + atan(V_theta/V_r))
+        theta_vec.append(theta)
+        mu.append(asin(1/M[-1]))
     #
-    # At this point, V_theta should have crossed zero so
-    # we can linearly-interpolate the cone-surface conditions.
-    V_theta_old = z_old[2]
-    frac = (0.0 - V_theta_old)/(V_theta - V_theta_old)
-    z_c = z_old*(1.0-frac) + z*frac
-    theta_c = theta_old*(1.0-frac) + theta*frac
-    # At the cone surface...
-    rho, V_r, V_theta, h, p = z_c
-    V = sqrt(V_r**2 + V_theta**2)
-    T = h / C_p
-    a = sqrt(g*R*T)
-    M.append(V/a)
-    flow_dir.append(theta + atan(V_theta/V_r))
-    theta_vec.append(theta_c)
-    mu.append(asin(1/M[-1]))
+    # Save flow properties for the desired thetas, from the interpolant.
+    # The last of these is at (or very near) the cone surface.
+    theta_series = beta
+    for i in range(n):
+        theta_series -= S*(1-q)/(1-q**n)*q**i
+        theta = max(theta_series, theta_c)
+        save_ray(theta, dense(theta))
     #
-    assert abs(V_theta) < 1.0e-6
+    # At the cone surface...
+    save_ray(theta_c, zs[-1])
+    assert abs(zs[-1][2]) < 1.0e-6
     #
     return M, flow_dir, theta_vec, mu
 
@@ -7,6 +7,7 @@ Version:
   2003-10-05 implementation with lists for storage
   2005-02-21 use Numeric arrays for storage and manipulation of the state data.
   2020-07-10 Changed to accumulating the sample data and adapted to Python3.
+  2026-10-18 ode_integrate_adaptive() with dense output and event location.
 
 Running this module as a Python script gives me the following transcript::
 
@@ -19,6 +20,10 @@ err1= [5.55111512e-17 1.11022302e-16 0.00000000e+00]
 t1= 6.283185307179586
 y1= [-5.64489861e-15  1.00000000e+00]
 err1= [6.16715441e-11 6.16715459e-11]
+(3) Adaptive steps to the first zero of cos(t):
+steps= 53
+t_event= 1.5707963267841207
+y(pi/4)= [ 0.70710678 -0.70710678]
 Done.
 """
 
@@ -95,6 +100,128 @@ def rkf45_step(t0, h, f, n, y0):
     err = abs(h*k1/360.0-128.0*h*k3/4275.0-2197.0*h*k4/75240.0+h*k5/50.0+2.0*h*k6/55.0)
     return t1, y1, err
 
+
+class DenseOutput():
+    """
+    Piecewise-cubic Hermite interpolant through the steps of an integration.
+
+    Calling the object with a value of t within the integrated range
+    returns the interpolated array of y values.
+    """
+    def __init__(self, ts, ys, dys):
+        self.ts = np.array(ts)
+        self.ys = np.array(ys)
+        self.dys = np.array(dys)
+        return
+
+    def __call__(self, t):
+        ts = self.ts
+        # The integration may have run in either direction.
+        if ts[-1] >= ts[0]:
+            i = np.searchsorted(ts, t, side='right') - 1
+        else:
+            i = np.searchsorted(-ts, -t, side='right') - 1
+        i = min(max(i, 0), len(ts)-2)
+        return hermite_cubic(t, ts[i], ts[i+1], self.ys[i], self.ys[i+1],
+                             self.dys[i], self.dys[i+1])
+
+
+def hermite_cubic(t, t0, t1, y0, y1, dy0, dy1):
+    """
+    Cubic that matches y and its derivative at t0 and t1.
+    """
+    h = t1 - t0
+    s = (t - t0) / h
+    h00 = (1.0 + 2.0*s) * (1.0 - s)**2
+    h10 = s * (1.0 - s)**2
+    h01 = s*s * (3.0 - 2.0*s)
+    h11 = s*s * (s - 1.0)
+    return h00*y0 + h10*h*dy0 + h01*y1 + h11*h*dy1
+
+
+def ode_integrate_adaptive(t0, tlast, f, n, y0, h=None, tol=1.0e-10, event=None,
+                           h_min=1.0e-12, max_steps=100000):
+    """
+    Steps the set of ODEs from t0 toward tlast, adjusting the step size
+    to keep the rkf45_step error estimate within tol.
+
+    t0: is the starting value of the independent variable
+    tlast: the finishing value for t, which may be less than t0
+    f: a callable function that returns the derivative of y wrt t,
+      with signature f(t, y, n) as for ode_integrate()
+    n: the number of dependent variables (in y)
+    y0: an array of starting values for the dependent variables
+    h: the size of the first step to try (default: 1/100 of the range)
+    tol: acceptable error for each step, relative to the magnitude of
+      each element of y (the largest seen so far, or 1 if that is zero)
+    event: optional callable g(t, y) returning a float.
+      Integration stops where g first changes sign.
+    h_min: an exception is raised if the step size must fall below this
+    max_steps: an exception is raised if more steps than this are needed
+
+    Returns: a tuple of ts, ys, err_sums (as for ode_integrate) and
+      a DenseOutput that interpolates y(t) between the steps.
+      If an event was found, the last entries of ts and ys are at the event.
+    """
+    assert callable(f)
+    assert n <= len(y0)
+    direction = 1.0 if tlast >= t0 else -1.0
+    if h is None: h = (tlast - t0) / 100.0
+    h = direction * abs(h)
+    t = t0
+    y = np.array(y0[:n], dtype=float)
+    dy = f(t, y.copy(), n)
+    ts = [t]; ys = [y.copy()]; dys = [dy]
+    err_sums = [np.zeros(n)]
+    scale = np.abs(y)
+    g_old = event(t, y) if event else None
+    nsteps = 0
+    while direction * (tlast - t) > 0.0:
+        if direction * (t + h - tlast) > 0.0: h = tlast - t
+        t1, y1, err = rkf45_step(t, h, f, n, y)
+        step_scale = np.maximum(scale, np.abs(y1))
+        step_scale[step_scale == 0.0] = 1.0
+        err_ratio = np.max(err / (tol * step_scale))
+        if not np.isfinite(err_ratio): err_ratio = np.inf
+        if err_ratio > 1.0:
+            # Reject the step and try again with a smaller one.
+            h *= max(0.9 * err_ratio**-0.2, 0.1)
+            if abs(h) < h_min:
+                raise Exception("Step size too small at t=%g" % t)
+            continue
+        nsteps += 1
+        if nsteps > max_steps:
+            raise Exception("Too many steps, reached t=%g" % t1)
+        dy1 = f(t1, y1.copy(), n)
+        scale = step_scale
+        if event:
+            g_new = event(t1, y1)
+            if g_old * g_new <= 0.0 and g_new != g_old:
+                # Locate the sign change on the cubic through this step,
+                # by the Illinois variant of regula falsi.
+                a, ga, b, gb = t, g_old, t1, g_new
+                tc = t1
+                for it in range(60):
+                    tc = b - gb * (b - a) / (gb - ga)
+                    gc = event(tc, hermite_cubic(tc, t, t1, y, y1, dy, dy1))
+                    if gc == 0.0 or abs(b - a) < 1.0e-15*max(1.0, abs(tc)): break
+                    if gc * gb < 0.0:
+                        a, ga = b, gb
+                    else:
+                        ga *= 0.5
+                    b, gb = tc, gc
+                yc = hermite_cubic(tc, t, t1, y, y1, dy, dy1)
+                ts.append(tc); ys.append(yc); dys.append(f(tc, yc.copy(), n))
+                err_sums.append(err_sums[-1] + err)
+                break
+            g_old = g_new
+        t, y, dy = t1, y1, dy1
+        ts.append(t); ys.append(y.copy()); dys.append(dy)
+        err_sums.append(err_sums[-1] + err)
+        # Grow the step, cautiously.
+        h *= min(0.9 * max(err_ratio, 1.0e-10)**-0.2, 5.0)
+    return np.array(ts), ys, err_sums, DenseOutput(ts, ys, dys)
+
 #----------------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -122,5 +249,14 @@ if __name__ == "__main__":
     print("y1=", ys[-1])
     print("err1=", errs[-1])
     assert all(np.isclose(ys[-1], np.array([0.0, 1.0]))), "Linear second-order ODE test"
+
+    print("(3) Adaptive steps to the first zero of cos(t):")
+    ts, ys, errs, dense = ode_integrate_adaptive(0.0, 10.0, f_sample_2, 2, np.array([1.0, 0.0]),
+                                                 event=lambda t, y: y[0])
+    print("steps=", len(ts)-1)
+    print("t_event=", ts[-1])
+    print("y(pi/4)=", dense(math.pi/4))
+    assert abs(ts[-1] - math.pi/2) < 1.0e-9, "Event location test"
+    assert all(np.isclose(dense(math.pi/4), np.array([1.0, -1.0])/math.sqrt(2.0))), "Dense output test"
     print("Done.")
 
@@ -10,6 +10,8 @@ Versions:
   16-Apr-2012: PJ, make more efficient by not evaluating f redundantly
     Also, make the code more compact (so that it fits in the editor window).
   29-Dec-2019: PJ, Python3 port.  Make better use of exceptions.
+  18-Oct-2026: newton_bracketed() for solving many independent problems
+    held in NumPy arrays with one call.
 
 Example transcript:
 
@@ -62,6 +64,8 @@ Caught RuntimeError: Cannot proceed with zero slope.
 Done.
 """
 
+import numpy
+
 def secant(f, x0, x1, tol=1.0e-11, limits=[], max_iterations=1000, tf=False):
     """
     The iterative secant method for zero-finding in one-dimension.
@@ -157,6 +161,59 @@ def newton(fun, fun_dash, x0, tol=1.0e-11, limits=[], max_iterations=100, tf=Fal
     # end newton()
 
 
+def newton_bracketed(fun, fun_dash, lo, hi, x0=None, tol=1.0e-11,
+                     max_iterations=100):
+    """
+    Safeguarded Newton iteration applied elementwise to arrays.
+
+    Each element of the arrays is an independent one-dimensional problem,
+    so a whole table of solutions is found with array-valued calls to
+    fun and fun_dash rather than a Python loop over the elements.
+
+    fun: user-defined function f(x), evaluated elementwise on arrays
+    fun_dash: differential of function f(x) d/dx(f(x)), also elementwise
+    lo, hi: arrays (or scalars) bracketing the solutions;
+            f(lo) and f(hi) must have opposing signs (or be zero)
+    x0: optional first guess, defaults to the middle of the bracket
+    tol: stopping tolerance for f(x)=0
+    max_iterations: to stop the iterations running forever, just in case...
+
+    Returns: array x such that f(x)=0, shaped like the broadcast inputs.
+
+    Whenever the Newton step would leave the current bracket
+    (or the slope is zero), a bisection step is taken instead.
+    """
+    lo = numpy.array(lo, dtype=float)
+    hi = numpy.array(hi, dtype=float)
+    lo, hi = numpy.broadcast_arrays(lo, hi)
+    lo = lo.copy(); hi = hi.copy()
+    f_lo = fun(lo)
+    f_hi = fun(hi)
+    if numpy.any(numpy.sign(f_lo) * numpy.sign(f_hi) > 0.0):
+        raise ValueError('Bad initial lower and upper limits')
+    if x0 is None:
+        x = 0.5 * (lo + hi)
+    else:
+        x = numpy.clip(numpy.broadcast_to(numpy.asarray(x0, dtype=float), lo.shape), lo, hi)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for i in range(max_iterations):
+            fx = fun(x)
+            done = (numpy.abs(fx) < tol) | \
+                (hi - lo <= 4.0 * numpy.finfo(float).eps * numpy.abs(x))
+            if numpy.all(done): return x
+            # Shrink the bracket around the root.
+            same_side = numpy.sign(fx) == numpy.sign(f_lo)
+            lo = numpy.where(same_side, x, lo)
+            f_lo = numpy.where(same_side, fx, f_lo)
+            hi = numpy.where(same_side, hi, x)
+            x_new = x - fx / fun_dash(x)
+            outside = ~numpy.isfinite(x_new) | (x_new <= lo) | (x_new >= hi)
+            x_new = numpy.where(outside, 0.5 * (lo + hi), x_new)
+            x = numpy.where(done, x, x_new)
+    raise RuntimeError('Did not converge after ', i+1, ' iterations')
+    # end newton_bracketed()
+
+
 # -------------------------------------------------------------------
 
 def demo():
@@ -0,0 +1,427 @@
+# taylor_maccoll_table.py
+"""
+Precomputed Taylor-Maccoll solutions for conical shocks in an ideal gas.
+
+For an ideal gas, the cone-surface angle and the surface-to-free-stream
+ratios of speed, pressure and temperature depend only on the free-stream
+Mach number M1, the ratio of specific heats g and the shock angle beta.
+This module tabulates (g, M1, beta) -> (theta_c, V_c/V1, p_c/p1, T_c/T1)
+once, stores the table on disk, and then answers queries by tensor-product
+cubic interpolation.
+
+The table coordinates are chosen so that the grid is uniform:
+  g    : ratio of specific heats
+  m    : log(sqrt(M1**2 - 1)), which spreads out the rapid changes near
+         M1 = 1 and becomes log(M1) at hypersonic speeds
+  x    : ((beta - mu)/(beta_sonic - mu))**(1/4) where beta_sonic is the
+         shock angle that leaves sonic flow behind an oblique shock.
+         x = 0 is the infinitely-weak shock; x = 1 is the limit of the
+         supersonic post-shock flows that theta_cone() will integrate.
+         Near the Mach angle, theta_c grows like (beta - mu)**(1/4),
+         so the fourth root makes theta_c close to linear in x.
+
+Each table cell carries an error estimate, measured when the table was
+built by comparing the interpolated values at the cell centre with a
+direct integration there.
+The functions in ideal_gas_flow use this estimate to decide, query by
+query, whether the table is accurate enough or whether they should
+integrate the Taylor-Maccoll equations instead.
+
+Typical use is through ideal_gas_flow:
+
+  from gdtk.ideal_gas_flow import theta_cone, beta_cone2
+  beta = beta_cone2(M1, theta, accuracy=1.0e-6)
+
+The table is built on first use (taking a minute or so) and saved to
+$GDTK_CONE_TABLE or, if that is not set,
+~/.cache/gdtk/taylor-maccoll-table.npz.
+It can be built explicitly with:
+
+  $ python3 -m gdtk.taylor_maccoll_table [filename]
+
+.. Version: 18-Oct-2026
+"""
+
+import os
+import numpy
+from numpy import exp, log
+from gdtk.numeric.ode import rkf45_step
+from gdtk.numeric.zero_solvers import newton_bracketed
+
+TABLE_VERSION = 1
+# Fields held at each node of the table.
+N_FIELDS = 4
+THETA_C, V_C_V1, P_C_P1, T_C_T1 = range(N_FIELDS)
+# Integrations that get this close to the axis are abandoned.
+LOG_THETA_MIN = numpy.log(1.0e-9)
+
+
+def default_table_file():
+    """
+    The on-disk location of the shared table.
+    """
+    filename = os.getenv("GDTK_CONE_TABLE")
+    if filename: return filename
+    return os.path.join(os.path.expanduser("~"), ".cache", "gdtk", "taylor-maccoll-table.npz")
+
+
+def beta_sonic_obl(M1, g=1.4):
+    """
+    Oblique shock wave angle that leaves sonic flow after the shock.
+
+    M1: upstream Mach number
+    g: ratio of specific heats
+    Returns: shock angle (radians); weaker shocks leave supersonic flow.
+    """
+    m2 = numpy.asarray(M1, dtype=float)**2
+    t1 = (g + 1.0) * m2 - (3.0 - g)
+    t2 = numpy.sqrt((g + 1.0) * ((g + 1.0) * m2**2 - 2.0 * (3.0 - g) * m2 + (g + 9.0)))
+    sin2b = (t1 + t2) / (4.0 * g * m2)
+    return numpy.arcsin(numpy.sqrt(numpy.minimum(sin2b, 1.0)))
+
+
+def surface_conditions(M1, beta, g=1.4, tol=1.0e-11, max_step=-0.05):
+    """
+    Cone-surface conditions for arrays of (M1, beta, g), all integrated together.
+
+    M1: free-stream Mach number
+    beta: shock wave angle wrt stream direction (in radians)
+    g: ratio of specific heats
+    tol: error tolerance for each step of the integration
+    max_step: largest step in log(theta)
+
+    Returns: tuple of arrays theta_c, V_c/V1, p_c/p1, T_c/T1
+      Elements for which the integration fails are set to nan.
+
+    The Taylor-Maccoll equations are written for the velocity components
+    scaled by the maximum (adiabatic) speed, so that they do not depend on
+    R or the free-stream temperature.
+    Every element takes rkf45 steps, alongside the others but each with
+    its own step size, and drops out of the march once its V_theta
+    has passed through zero.
+    The crossing is then located by Newton iteration on the size of
+    a final partial step.
+    """
+    M1, beta, g = numpy.broadcast_arrays(numpy.asarray(M1, dtype=float),
+                                         numpy.asarray(beta, dtype=float),
+                                         numpy.asarray(g, dtype=float))
+    shape = M1.shape
+    M1 = M1.ravel(); beta = beta.ravel(); g = g.ravel()
+    # Oblique-shock jump, written out without the subsonic check.
+    m1sb2 = (M1 * numpy.sin(beta))**2
+    t1 = 2.0 / numpy.tan(beta) * (m1sb2 - 1.0)
+    t2 = M1**2 * (g + numpy.cos(2.0 * beta)) + 2.0
+    theta_s = numpy.arctan(t1/t2)
+    r2_r1 = (g + 1.0) * m1sb2 / (2.0 + (g - 1.0) * m1sb2)
+    v2_v1 = numpy.sqrt((numpy.sin(beta) / r2_r1)**2 + numpy.cos(beta)**2)
+    p2_p1 = 1.0 + 2.0 * g / (g + 1.0) * (m1sb2 - 1.0)
+    V1 = 1.0 / numpy.sqrt(1.0 + 2.0 / ((g - 1.0) * M1**2)) # V1/V_max
+    V2 = V1 * v2_v1
+    #
+    # Near a weak shock the cone is slender and the cot(theta) term varies
+    # rapidly, so we integrate in log(theta).
+    def tm_odes(log_theta, Y, n):
+        V_r, V_theta, gg = Y
+        theta = numpy.exp(log_theta)
+        a2 = 0.5 * (gg - 1.0) * (1.0 - V_r**2 - V_theta**2)
+        # Failed steps show up as non-finite error estimates and are retried.
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            dV_theta = (V_theta**2 * V_r - a2 * (2.0 * V_r + V_theta / numpy.tan(theta))) / \
+                (a2 - V_theta**2)
+        return theta * numpy.array([V_theta, dV_theta, numpy.zeros_like(gg)])
+    #
+    n = M1.size
+    theta_c = numpy.zeros(n); V_c = numpy.zeros(n)
+    log_theta = numpy.log(beta)
+    Y = numpy.array([V2 * numpy.cos(beta - theta_s), -V2 * numpy.sin(beta - theta_s), g])
+    h = numpy.full(n, -1.0e-3)
+    # A shock at (or weaker than) the Mach angle does not turn the flow.
+    # The equations are singular there, so we don't integrate.
+    weak = m1sb2 <= 1.0 + 1.0e-12
+    V_c[weak] = V1[weak]
+    active = numpy.flatnonzero(~weak)
+    while active.size > 0:
+        lt_new, Y_new, err = rkf45_step(log_theta[active], h[active], tm_odes, 3, Y[:, active])
+        err = numpy.max(err[:2], axis=0)
+        err[~numpy.isfinite(err)] = numpy.inf
+        accept = err <= tol
+        crossed = accept & (Y_new[1] >= 0.0)
+        if numpy.any(crossed):
+            lt0 = log_theta[active][crossed]; Y0 = Y[:, active][:, crossed]
+            hc = h[active][crossed]
+            for i in range(6):
+                lt1, Y1, err1 = rkf45_step(lt0, hc, tm_odes, 3, Y0)
+                hc = hc - Y1[1] / tm_odes(lt1, Y1, 3)[1]
+            lt1, Y1, err1 = rkf45_step(lt0, hc, tm_odes, 3, Y0)
+            idx = active[crossed]
+            theta_c[idx] = numpy.exp(lt1); V_c[idx] = Y1[0]
+        idx = active[accept]
+        log_theta[idx] = lt_new[accept]; Y[:, idx] = Y_new[:, accept]
+        # For a shock very close to the Mach angle, V_theta may only
+        # approach zero as theta does.
+        stalled = accept & ~crossed & (lt_new < LOG_THETA_MIN)
+        theta_c[active[stalled]] = 0.0; V_c[active[stalled]] = V1[active[stalled]]
+        # Usual step-size control for a fifth-order step.
+        with numpy.errstate(divide='ignore'):
+            factor = numpy.clip(0.9 * (tol / err)**0.2, 0.2, 5.0)
+        h[active] = numpy.maximum(h[active] * factor, max_step)
+        # Should the step size collapse, give up on that element.
+        failed = numpy.abs(h[active]) < 1.0e-12
+        theta_c[active[failed]] = numpy.nan; V_c[active[failed]] = numpy.nan
+        active = active[~(crossed | stalled | failed)]
+    #
+    T_c_T1 = (1.0 - V_c**2) / (1.0 - V1**2)
+    T2_T1 = (1.0 - V2**2) / (1.0 - V1**2)
+    p_c_p1 = p2_p1 * (T_c_T1 / T2_T1)**(g / (g - 1.0))
+    return (theta_c.reshape(shape), (V_c / V1).reshape(shape),
+            p_c_p1.reshape(shape), T_c_T1.reshape(shape))
+
+
+def _stencil(q, q0, dq, n):
+    """
+    Locate q on the uniform grid q0 + i*dq, i = 0..n-1.
+
+    Returns the first index of the four-point stencil, the four
+    Lagrange interpolation weights, their derivatives with respect to q
+    and the index of the containing cell.
+    """
+    s = (q - q0) / dq
+    cell = numpy.clip(numpy.floor(s).astype(int), 0, n-2)
+    i = numpy.clip(cell, 1, n-3)
+    t = s - i
+    w = numpy.stack([-t * (t - 1.0) * (t - 2.0) / 6.0,
+                     (t + 1.0) * (t - 1.0) * (t - 2.0) / 2.0,
+                     -(t + 1.0) * t * (t - 2.0) / 2.0,
+                     (t + 1.0) * t * (t - 1.0) / 6.0])
+    dw = numpy.stack([-(3.0 * t**2 - 6.0 * t + 2.0) / 6.0,
+                      (3.0 * t**2 - 4.0 * t - 1.0) / 2.0,
+                      -(3.0 * t**2 - 2.0 * t - 2.0) / 2.0,
+                      (3.0 * t**2 - 1.0) / 6.0]) / dq
+    return i - 1, w, dw, cell
+
+
+def _m_from_M1(M1):
+    # log(cot(mu)) spreads out the rapid changes near M1 = 1
+    # and becomes log(M1) for hypersonic flow.
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return 0.5 * log(M1**2 - 1.0)
+
+def _M1_from_m(m):
+    return numpy.sqrt(1.0 + exp(2.0 * m))
+
+def _x_from_beta(M1, beta, g):
+    mu = numpy.arcsin(1.0 / M1)
+    with numpy.errstate(invalid='ignore'):
+        # Shocks weaker than a Mach wave give nan and so fall outside the table.
+        return ((beta - mu) / (beta_sonic_obl(M1, g) - mu))**0.25
+
+def _beta_from_x(M1, x, g):
+    mu = numpy.arcsin(1.0 / M1)
+    return mu + x**4 * (beta_sonic_obl(M1, g) - mu)
+
+
+class ConeTable():
+    """
+    Taylor-Maccoll surface conditions tabulated over (g, m, x).
+
+    data[i,j,k,:] holds theta_c and the logarithms of V_c/V1, p_c/p1, T_c/T1
+    at the node g_values[i], m_values[j], x_values[k].
+    The pressure ratio grows like M1**2, so its logarithm is the smoother
+    quantity to interpolate.
+    err[i,j,k,:] holds, for the cell with that lowest corner, the estimated
+    absolute interpolation error in theta_c and the estimated relative
+    error in the three ratios.
+    """
+
+    def __init__(self, g_values, m_values, x_values, data, err):
+        self.g_values = numpy.asarray(g_values, dtype=float)
+        self.m_values = numpy.asarray(m_values, dtype=float)
+        self.x_values = numpy.asarray(x_values, dtype=float)
+        self.data = numpy.asarray(data, dtype=float)
+        self.err = numpy.asarray(err, dtype=float)
+        return
+
+    @classmethod
+    def build(cls, g_range=(1.1, 1.7), n_g=13, M1_range=(1.05, 50.0), n_m=100, n_x=81,
+              tol=1.0e-11):
+        """
+        Integrate the Taylor-Maccoll equations at every node of a new table.
+        """
+        g_values = numpy.linspace(g_range[0], g_range[1], n_g)
+        m_values = numpy.linspace(_m_from_M1(M1_range[0]), _m_from_M1(M1_range[1]), n_m)
+        x_values = numpy.linspace(0.0, 1.0, n_x)
+        G, Mv, X = numpy.meshgrid(g_values, m_values, x_values, indexing='ij')
+        data = cls._integrate(G, Mv, X, tol)
+        table = cls(g_values, m_values, x_values, data, numpy.zeros((n_g-1, n_m-1, n_x-1, 2)))
+        # Measure the interpolation error at the middle of each cell.
+        Gm, Mm, Xm = numpy.meshgrid(0.5*(g_values[:-1]+g_values[1:]),
+                                    0.5*(m_values[:-1]+m_values[1:]),
+                                    0.5*(x_values[:-1]+x_values[1:]), indexing='ij')
+        exact = cls._integrate(Gm, Mm, Xm, tol)
+        interp = table._interpolate(Gm.ravel(), Mm.ravel(), Xm.ravel())[0].reshape(exact.shape)
+        # The cell centre need not be the worst point, so allow a factor of 2.
+        table.err[..., 0] = 2.0 * numpy.abs(interp[..., THETA_C] - exact[..., THETA_C])
+        table.err[..., 1] = 2.0 * numpy.max(numpy.abs(interp[..., V_C_V1:] /
+                                                      numpy.exp(exact[..., V_C_V1:]) - 1.0),
+                                            axis=-1)
+        return table
+
+    @staticmethod
+    def _integrate(G, Mv, X, tol):
+        M1 = _M1_from_m(Mv)
+        beta = _beta_from_x(M1, X, G)
+        data = numpy.zeros(G.shape + (N_FIELDS,))
+        # The infinitely-weak shock (x=0) leaves the free stream unchanged,
+        # so theta_c and the logarithms of the ratios are zero there.
+        weak = X > 0.0
+        fields = surface_conditions(M1[weak], beta[weak], G[weak], tol)
+        data[..., THETA_C][weak] = fields[THETA_C]
+        for j in range(V_C_V1, N_FIELDS): data[..., j][weak] = numpy.log(fields[j])
+        return data
+
+    def save(self, filename):
+        dirname = os.path.dirname(filename)
+        if dirname: os.makedirs(dirname, exist_ok=True)
+        # Write to a temporary name first so that a concurrent reader
+        # never sees a partial file.
+        tmp_filename = filename + ".tmp.npz"
+        numpy.savez(tmp_filename, version=TABLE_VERSION, g_values=self.g_values,
+                    m_values=self.m_values, x_values=self.x_values,
+                    data=self.data, err=self.err)
+        os.replace(tmp_filename, filename)
+        return
+
+    @classmethod
+    def load(cls, filename):
+        with numpy.load(filename) as f:
+            if int(f['version']) != TABLE_VERSION:
+                raise Exception("Taylor-Maccoll table %s has version %d, expected %d" %
+                                (filename, int(f['version']), TABLE_VERSION))
+            return cls(f['g_values'], f['m_values'], f['x_values'], f['data'], f['err'])
+
+    def _stencils(self, g, m):
+        gv, mv = self.g_values, self.m_values
+        ig, wg, dwg, cg = _stencil(g, gv[0], gv[1]-gv[0], len(gv))
+        im, wm, dwm, cm = _stencil(m, mv[0], mv[1]-mv[0], len(mv))
+        return ig, wg, cg, im, wm, cm
+
+    def _interpolate(self, g, m, x):
+        """
+        Cubic interpolation of all fields at the (flat) query arrays.
+
+        Returns the fields, shape (n, N_FIELDS), and the cell error estimates.
+        """
+        ig, wg, cg, im, wm, cm = self._stencils(g, m)
+        xv = self.x_values
+        ix, wx, dwx, cx = _stencil(x, xv[0], xv[1]-xv[0], len(xv))
+        result = numpy.zeros((len(g), N_FIELDS))
+        for a in range(4):
+            for b in range(4):
+                wab = wg[a] * wm[b]
+                for c in range(4):
+                    result += (wab * wx[c])[:, None] * self.data[ig+a, im+b, ix+c]
+        result[:, V_C_V1:] = numpy.exp(result[:, V_C_V1:])
+        return result, self.err[cg, cm, cx]
+
+    def _in_range(self, M1, g):
+        m = _m_from_M1(M1)
+        return ((g >= self.g_values[0]) & (g <= self.g_values[-1]) &
+                (m >= self.m_values[0]) & (m <= self.m_values[-1]))
+
+    def contains(self, M1, beta, g):
+        """
+        True where a query lies within the table.
+        """
+        x = _x_from_beta(M1, beta, g)
+        return self._in_range(M1, g) & (x >= 0.0) & (x <= 1.0)
+
+    def lookup(self, M1, beta, g=1.4, accuracy=1.0e-6):
+        """
+        Interpolated cone-surface conditions for flat arrays M1, beta, g.
+
+        Returns: tuple of the fields array, shape (n, N_FIELDS),
+          and a boolean array that is True where the query was inside
+          the table and the error estimate is within accuracy.
+          The fields are not meaningful where that flag is False.
+        """
+        M1, beta, g = [numpy.ravel(a) for a in numpy.broadcast_arrays(
+            numpy.asarray(M1, dtype=float), numpy.asarray(beta, dtype=float),
+            numpy.asarray(g, dtype=float))]
+        ok = self.contains(M1, beta, g)
+        fields = numpy.zeros((len(M1), N_FIELDS))
+        if numpy.any(ok):
+            x = _x_from_beta(M1[ok], beta[ok], g[ok])
+            fields[ok], err = self._interpolate(g[ok], _m_from_M1(M1[ok]), x)
+            good = numpy.all(err <= accuracy, axis=-1)
+            ok[ok] = good
+        return fields, ok
+
+    def beta_for_theta(self, M1, theta, g=1.4, accuracy=1.0e-6):
+        """
+        Weak conical shock angle for cone angle theta, for flat arrays M1, theta, g.
+
+        Returns: tuple of beta and a boolean array that is True where
+          the solution was found inside the table with an error estimate
+          for theta_c within accuracy.
+        """
+        M1, theta, g = [numpy.ravel(a) for a in numpy.broadcast_arrays(
+            numpy.asarray(M1, dtype=float), numpy.asarray(theta, dtype=float),
+            numpy.asarray(g, dtype=float))]
+        beta = numpy.zeros(len(M1))
+        idx = numpy.flatnonzero(self._in_range(M1, g) & (theta > 0.0))
+        ok = numpy.zeros(len(M1), dtype=bool)
+        if len(idx) == 0: return beta, ok
+        # Interpolate in g and m once, to get theta_c along x for each query.
+        ig, wg, cg, im, wm, cm = self._stencils(g[idx], _m_from_M1(M1[idx]))
+        rows = numpy.zeros((len(idx), len(self.x_values)))
+        for a in range(4):
+            for b in range(4):
+                rows += (wg[a] * wm[b])[:, None] * self.data[ig+a, im+b, :, THETA_C]
+        # Only cone angles up to that at the sonic limit (x = 1) are in the table.
+        inside = theta[idx] <= rows[:, -1]
+        idx = idx[inside]; rows = rows[inside]; cg = cg[inside]; cm = cm[inside]
+        if len(idx) == 0: return beta, ok
+        n = numpy.arange(len(idx))
+        xv = self.x_values
+        def theta_c(x):
+            ix, wx, dwx, cx = _stencil(x, xv[0], xv[1]-xv[0], len(xv))
+            return (sum(wx[c] * rows[n, ix+c] for c in range(4)),
+                    sum(dwx[c] * rows[n, ix+c] for c in range(4)))
+        thk = theta[idx]
+        def f_to_solve(x): return theta_c(x)[0] - thk
+        def f_dash(x): return theta_c(x)[1]
+        x = newton_bracketed(f_to_solve, f_dash, 0.0, 1.0, tol=0.01*accuracy)
+        beta[idx] = _beta_from_x(M1[idx], x, g[idx])
+        cx = numpy.clip(numpy.floor((x - xv[0]) / (xv[1]-xv[0])).astype(int), 0, len(xv)-2)
+        ok[idx] = self.err[cg, cm, cx, 0] <= accuracy
+        return beta, ok
+
+
+_default_table = None
+
+def get_default_table():
+    """
+    The shared table, loaded from (or, the first time, built into)
+    the default table file.
+    """
+    global _default_table
+    if _default_table is None:
+        filename = default_table_file()
+        if os.path.exists(filename):
+            _default_table = ConeTable.load(filename)
+        else:
+            print("Building Taylor-Maccoll table %s; this is done once only." % filename)
+            _default_table = ConeTable.build()
+            _default_table.save(filename)
+    return _default_table
+
+
+if __name__ == '__main__':
+    import sys
+    filename = sys.argv[1] if len(sys.argv) > 1 else default_table_file()
+    print("Building Taylor-Maccoll table...")
+    table = ConeTable.build()
+    table.save(filename)
+    print("Table written to", filename)
+    print("Largest error estimates: theta_c %g rad, ratios %g" %
+          (table.err[..., 0].max(), table.err[..., 1].max()))
@@ -30,7 +30,7 @@ def test_field_integration():
     dtheta = 0.001
     bd.generate_contour(r, dtheta)
     props = bd.properties()
-    assert props.M1 == pytest.approx(5.76788)
+    assert props.M1 == pytest.approx(5.77019, rel=1.0e-5)
     assert props.M2 == pytest.approx(3.0)
     assert props.M3 == pytest.approx(2.48155)
     assert props.Pi == pytest.approx(0.958194)
@@ -0,0 +1,78 @@
+"""
+Test module for the GasStateArray class in gas.py.
+
+These tests need the loadable gas library, libgas.so,
+and are skipped when it cannot be found.
+The CEAGas tests are also skipped when the cea2 program is not on the PATH.
+
+.. Version: 2026-10-18
+"""
+
+import os
+import shutil
+import numpy as np
+import pytest
+
+try:
+    from gas import GasModel, GasState, GasStateArray
+except OSError:
+    pytest.skip("libgas.so is not available", allow_module_level=True)
+
+sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "gas", "sample-data")
+
+rho = np.array([0.05, 0.1, 0.5, 1.0])
+T = np.array([1500.0, 2500.0, 3500.0, 4500.0])
+
+def single_state_values(gmodel, i, massf=None):
+    gs = GasState(gmodel)
+    if massf is not None: gs.massf = massf
+    gs.rho = rho[i]
+    gs.T = T[i]
+    gs.update_thermo_from_rhoT()
+    gs.update_trans_coeffs()
+    return gs.p, gs.u, gs.mu, gs.k
+
+def check_batch(gmodel, massf=None):
+    gsa = GasStateArray(gmodel, len(rho))
+    if massf is not None: gsa.massf = massf
+    gsa.rho = rho
+    gsa.T = T
+    # The transport update does its own thermo update from rho and T, so it can come first.
+    assert gsa.update_trans_coeffs() == 0
+    assert gsa.update_thermo_from_rhoT() == 0
+    assert np.all(gsa.flags == 0)
+    for i in range(len(rho)):
+        p, u, mu, k = single_state_values(gmodel, i, massf)
+        assert gsa.p[i] == pytest.approx(p)
+        assert gsa.u[i] == pytest.approx(u)
+        assert gsa.mu[i] == pytest.approx(mu)
+        assert gsa.k[i] == pytest.approx(k)
+    return
+
+def test_multi_species_batch():
+    gmodel = GasModel(os.path.join(sample_dir, "therm-perf-equil-5-species-air.lua"))
+    assert gmodel.n_species > 1
+    check_batch(gmodel, {'N2':0.7, 'O2':0.2, 'NO':0.1})
+
+@pytest.mark.skipif(shutil.which("cea2") is None, reason="cea2 is not available")
+def test_cea_batch(tmp_path, monkeypatch):
+    # The CEAGas writes its working files into the current directory.
+    monkeypatch.chdir(tmp_path)
+    gmodel = GasModel(os.path.join(sample_dir, "cea-air5species-gas-model.lua"))
+    check_batch(gmodel)
+
+def test_failed_states_are_flagged():
+    gmodel = GasModel(os.path.join(sample_dir, "therm-perf-equil-5-species-air.lua"))
+    gsa = GasStateArray(gmodel, len(rho))
+    gsa.massf = {'N2':0.7, 'O2':0.2, 'NO':0.1}
+    gsa.rho = rho
+    gsa.T = T
+    gsa.rho[1] = np.nan
+    assert gsa.update_thermo_from_rhoT() == 1
+    assert gsa.flags.tolist() == [0, -1, 0, 0]
+    # The good states are updated and the failed one is left as it was.
+    assert np.all(gsa.p[[0, 2, 3]] > 0.0)
+    assert gsa.p[1] == 0.0
+    assert np.isnan(gsa.rho[1])
+    with pytest.raises(Exception):
+        gsa.update_thermo_from_rhoT(raise_on_failure=True)
@@ -0,0 +1,134 @@
+"""
+Test module for the StateCache class in gas.py.
+
+These tests need the loadable gas library, libgas.so,
+and are skipped when it cannot be found.
+
+.. Version: 2026-10-18
+"""
+
+import os
+import pytest
+
+try:
+    from gas import GasModel, GasState, StateCache
+except OSError:
+    pytest.skip("libgas.so is not available", allow_module_level=True)
+
+ideal_air = """
+model = 'IdealGas'
+IdealGas = {
+   speciesName = 'air',
+   mMass = 0.02896000,
+   gamma = 1.40000000,
+   entropyRefValues = {
+      s1 = 0.00000000e+00,
+      T1 = 298.15000000,
+      p1 = 1.01325000e+05,
+   },
+   viscosity = {
+      model = 'Sutherland',
+      mu_ref = 1.71600000e-05,
+      T_ref = 273.00000000,
+      S = 111.00000000,
+   },
+   thermCondModel = {
+      model = 'Sutherland',
+      k_ref = 2.41000000e-02,
+      T_ref = 273.00000000,
+      S = 194.00000000,
+   }
+}
+"""
+
+@pytest.fixture
+def gas_file(tmp_path):
+    file_name = tmp_path / "ideal-air-gas-model.lua"
+    file_name.write_text(ideal_air)
+    return str(file_name)
+
+def pT_state(gmodel, p, T):
+    gs = GasState(gmodel)
+    gs.p = p
+    gs.T = T
+    gs.update_thermo_from_pT()
+    return gs
+
+def test_hit_and_miss(gas_file):
+    gmodel = GasModel(gas_file)
+    cache = StateCache()
+    gmodel.use_state_cache(cache)
+    gs1 = pT_state(gmodel, 100.0e3, 300.0)
+    assert (cache.hits, cache.misses) == (0, 1)
+    gs2 = pT_state(gmodel, 100.0e3, 300.0)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert gs2.rho == pytest.approx(gs1.rho)
+    assert gs2.u == pytest.approx(gs1.u)
+    assert gs2.a == pytest.approx(gs1.a)
+    pT_state(gmodel, 100.0e3, 350.0)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert len(cache) == 2
+
+def test_eviction(gas_file):
+    gmodel = GasModel(gas_file)
+    cache = StateCache(max_entries=2)
+    gmodel.use_state_cache(cache)
+    for T in [300.0, 400.0, 500.0]: pT_state(gmodel, 100.0e3, T)
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    # The least-recently-used state has gone; the most recent ones remain.
+    pT_state(gmodel, 100.0e3, 500.0)
+    assert cache.hits == 1
+    pT_state(gmodel, 100.0e3, 300.0)
+    assert cache.misses == 4
+
+def test_save_and_load(gas_file, tmp_path):
+    gmodel = GasModel(gas_file)
+    cache_file = str(tmp_path / "states.pickle")
+    cache = StateCache(filename=cache_file)
+    gmodel.use_state_cache(cache)
+    gs1 = pT_state(gmodel, 100.0e3, 300.0)
+    cache.save()
+    cache2 = StateCache(filename=cache_file)
+    assert len(cache2) == 1
+    gmodel.use_state_cache(cache2)
+    gs2 = pT_state(gmodel, 100.0e3, 300.0)
+    assert cache2.hits == 1
+    assert gs2.rho == pytest.approx(gs1.rho)
+
+def test_edited_gas_file_misses(gas_file, tmp_path):
+    gmodel = GasModel(gas_file)
+    cache_file = str(tmp_path / "states.pickle")
+    cache = StateCache(filename=cache_file)
+    gmodel.use_state_cache(cache)
+    pT_state(gmodel, 100.0e3, 300.0)
+    cache.save()
+    with open(gas_file, 'w') as f:
+        f.write(ideal_air.replace("gamma = 1.40000000", "gamma = 1.30000000"))
+    gmodel2 = GasModel(gas_file)
+    cache2 = StateCache(filename=cache_file)
+    gmodel2.use_state_cache(cache2)
+    gs = pT_state(gmodel2, 100.0e3, 300.0)
+    assert (cache2.hits, cache2.misses) == (0, 1)
+    assert gs.a == pytest.approx((1.3*287.1*300.0)**0.5, rel=1.0e-3)
+
+def test_cea_restore_into_fresh_state(tmp_path, monkeypatch):
+    # A CEAGas state restored from the cache must remember the kind of
+    # its last CEA update so that the transport coefficients can be evaluated.
+    monkeypatch.chdir(tmp_path)
+    sample_file = os.path.join(os.path.dirname(__file__), "..", "..", "gas",
+                               "sample-data", "cea-air7species-gas-model.lua")
+    try:
+        gmodel = GasModel(os.path.abspath(sample_file))
+    except RuntimeError:
+        pytest.skip("the CEAGas model (with cea2) is not available")
+    cache = StateCache()
+    gmodel.use_state_cache(cache)
+    gs1 = pT_state(gmodel, 100.0e3, 3000.0)
+    gs1.update_trans_coeffs()
+    gs2 = pT_state(gmodel, 100.0e3, 3000.0)
+    assert cache.hits == 1
+    assert gs2.ceaSavedData["previous_problemType"] == "pT"
+    gs2.update_trans_coeffs()
+    assert gs2.mu == pytest.approx(gs1.mu)
+    assert gs2.k == pytest.approx(gs1.k)
@@ -0,0 +1,109 @@
+"""
+Test module for the uniform_lut.py module.
+
+The round trip through build-uniform-lut needs the gdtk package, with libgas.so,
+and is skipped when that is not available.
+
+.. Version: 2026-10-18
+"""
+
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+from uniform_lut import write_binary_table, read_binary_table, UniformLUTTable
+
+gas_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "gas")
+
+ideal_air = """
+model = 'IdealGas'
+IdealGas = {
+   speciesName = 'air',
+   mMass = 0.02896000,
+   gamma = 1.40000000,
+   entropyRefValues = {
+      s1 = 0.00000000e+00,
+      T1 = 298.15000000,
+      p1 = 1.01325000e+05,
+   },
+   viscosity = {
+      model = 'Sutherland',
+      mu_ref = 1.71600000e-05,
+      T_ref = 273.00000000,
+      S = 111.00000000,
+   },
+   thermCondModel = {
+      model = 'Sutherland',
+      k_ref = 2.41000000e-02,
+      T_ref = 273.00000000,
+      S = 194.00000000,
+   }
+}
+"""
+
+def test_binary_table(tmp_path):
+    data = np.random.default_rng(1).random((5, 3, 7))
+    fileName = str(tmp_path / "table.bin")
+    write_binary_table(fileName, data)
+    assert os.path.getsize(fileName) == 40 + data.size*8
+    assert np.array_equal(read_binary_table(fileName, mmap=True), data)
+    assert np.array_equal(read_binary_table(fileName, mmap=False), data)
+
+def test_bad_binary_table(tmp_path):
+    fileName = str(tmp_path / "table.bin")
+    with open(fileName, 'wb') as fp: fp.write(b'NOT-A-LUT' + bytes(40))
+    with pytest.raises(RuntimeError):
+        read_binary_table(fileName)
+
+def test_text_table_to_binary(tmp_path, monkeypatch):
+    text_table = UniformLUTTable(os.path.join(gas_dir, "sample-data", "cea-lut-air-version-test.lua"))
+    assert text_table.data.shape == (401, 51, 7)
+    assert text_table['Cv_hat'][0,0] == pytest.approx(721.782)
+    assert text_table['k'][0,0] == pytest.approx(0.03885)
+    # Write the same table with a binary data file, in its own directory,
+    # and read it from elsewhere; data_file is relative to the Lua file.
+    lut_dir = tmp_path / "lut"
+    lut_dir.mkdir()
+    text_table.write_binary(str(lut_dir / "lut-air.bin"))
+    with open(str(lut_dir / "lut-air.lua"), 'w') as fp:
+        fp.write("model = 'look-up table'\nwith_entropy = 1\n")
+        for name in ['p1', 'T1', 's1', 'emin', 'de', 'lrmin', 'dlr']:
+            fp.write("%s = %.17g\n" % (name, getattr(text_table, name)))
+        fp.write("iesteps = %d\nirsteps = %d\n" % (text_table.iesteps, text_table.irsteps))
+        fp.write("data_file = \"lut-air.bin\"\n")
+    monkeypatch.chdir(tmp_path)
+    binary_table = UniformLUTTable(os.path.join("lut", "lut-air.lua"))
+    assert binary_table.data_file == os.path.join("lut", "lut-air.bin")
+    assert np.array_equal(binary_table.data, text_table.data)
+    assert np.array_equal(binary_table.e_values, text_table.e_values)
+    assert np.array_equal(binary_table.log_rho_values, text_table.log_rho_values)
+
+def build_uniform_lut(work_dir, *options):
+    subprocess.run([sys.executable, os.path.join(gas_dir, "build-uniform-lut.py"),
+                    "--gas-model=ideal-air-gas-model.lua", "--table-name=air", *options],
+                   cwd=str(work_dir), check=True, stdout=subprocess.DEVNULL)
+    return
+
+def test_build_uniform_lut_binary(tmp_path, monkeypatch):
+    try:
+        import gdtk.gas
+    except (ImportError, OSError):
+        pytest.skip("the gdtk package, with libgas.so, is not available")
+    for name in ["text", "binary"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "ideal-air-gas-model.lua").write_text(ideal_air)
+    build_uniform_lut(tmp_path / "text")
+    build_uniform_lut(tmp_path / "binary", "--binary")
+    assert os.path.exists(str(tmp_path / "binary" / "lut-air.bin"))
+    monkeypatch.chdir(tmp_path)
+    text_table = UniformLUTTable(os.path.join("text", "lut-air.lua"))
+    binary_table = UniformLUTTable(os.path.join("binary", "lut-air.lua"))
+    assert binary_table.data_file is not None
+    assert binary_table.data.shape == text_table.data.shape
+    # The text table holds 6 significant digits; the binary table holds all of them.
+    assert np.allclose(binary_table.data, text_table.data, rtol=1.0e-5, atol=0.0)
+    assert binary_table.emin == pytest.approx(text_table.emin, rel=1.0e-5)
+    # For an ideal gas, Cv_hat is the constant R/(gamma-1).
+    assert np.allclose(binary_table['Cv_hat'], 8.31446/0.02896/0.4, rtol=1.0e-3)
@@ -0,0 +1,140 @@
+# uniform_lut.py
+"""
+Reading and writing the tables of the uniform look-up-table gas model.
+
+The table is described by a Lua file, as written by build-uniform-lut,
+holding the table parameters and, traditionally, the nested Lua table of data.
+Alternatively, the Lua file names a binary data file with
+
+    data_file = "lut-air5species.bin"
+
+and the data are stored there at full precision, in a form that can be
+memory-mapped.  The binary file has a 40-byte header, the 8 characters
+'GDTK-LUT' and four little-endian 64-bit integers (version, ne, nr, nvars),
+followed by ne*nr*nvars little-endian float64 values in the order [ie][ir][var].
+The variables are (Cv_hat, Cv, R_hat, Cp_hat, gamma_hat, mu, k) for a table
+with entropy, and (Cv_hat, Cv, R_hat, gamma_hat, mu, k) for the old arrangement.
+
+2026-10-18
+"""
+
+import os
+import re
+import numpy as np
+
+MAGIC = b'GDTK-LUT'
+VERSION = 1
+HEADER_SIZE = 40
+VARIABLES = ('Cv_hat', 'Cv', 'R_hat', 'Cp_hat', 'gamma_hat', 'mu', 'k')
+VARIABLES_WITHOUT_ENTROPY = ('Cv_hat', 'Cv', 'R_hat', 'gamma_hat', 'mu', 'k')
+
+
+def write_binary_table(fileName, data):
+    """
+    Write the table data, an array of shape (ne, nr, nvars), to a binary file.
+    """
+    data = np.ascontiguousarray(data, dtype='<f8')
+    if data.ndim != 3:
+        raise RuntimeError(f"Expected data of shape (ne, nr, nvars), got {data.shape}")
+    with open(fileName, 'wb') as fp:
+        fp.write(MAGIC)
+        fp.write(np.array([VERSION, *data.shape], dtype='<i8').tobytes())
+        fp.write(data.tobytes())
+    return
+
+def read_binary_table(fileName, mmap=True):
+    """
+    Read the table data from a binary file.
+
+    Returns: array of shape (ne, nr, nvars), memory-mapped read-only if mmap is True.
+    """
+    with open(fileName, 'rb') as fp:
+        magic = fp.read(len(MAGIC))
+        if magic != MAGIC:
+            raise RuntimeError(f"File {fileName} is not a binary look-up table.")
+        version, ne, nr, nvars = np.frombuffer(fp.read(HEADER_SIZE-len(MAGIC)), dtype='<i8')
+        if version != VERSION:
+            raise RuntimeError(f"Unknown binary look-up table version {version} in {fileName}")
+        shape = (int(ne), int(nr), int(nvars))
+        if not mmap:
+            data = np.frombuffer(fp.read(), dtype='<f8')
+            if data.size != ne*nr*nvars:
+                raise RuntimeError(f"Expected {ne*nr*nvars} values in {fileName}, found {data.size}")
+            return data.reshape(shape)
+    return np.memmap(fileName, dtype='<f8', mode='r', offset=HEADER_SIZE, shape=shape)
+
+
+class UniformLUTTable():
+    """
+    The parameters and data of a uniform look-up table, read from its Lua file.
+
+    The data array has shape (iesteps+1, irsteps+1, nvars), with energy
+    along the first axis and log10(density) along the second.
+    """
+
+    def __init__(self, fileName, mmap=True):
+        """
+        fileName: name of the Lua file describing the table
+        mmap: if True, a binary data file is memory-mapped rather than read
+
+        A relative data_file is taken relative to the directory of the Lua file.
+        """
+        self.fileName = fileName
+        with open(fileName, 'r') as fp:
+            text = fp.read()
+        # The table data, if present, follow all of the parameters.
+        m = re.search(r'^data\s*=\s*\{', text, re.MULTILINE)
+        head = text[:m.start()] if m else text
+        params = {}
+        for name, value in re.findall(r'^\s*(\w+)\s*=\s*(.+?)\s*$', head, re.MULTILINE):
+            if value[0] in '"\'':
+                params[name] = value.strip('"\'')
+            else:
+                params[name] = float(value)
+        self.with_entropy = int(params.get('with_entropy', 0))
+        self.p1 = params.get('p1'); self.T1 = params.get('T1'); self.s1 = params.get('s1')
+        self.iesteps = int(params['iesteps'])
+        self.irsteps = int(params['irsteps'])
+        self.emin = params['emin']; self.de = params['de']
+        self.lrmin = params['lrmin']; self.dlr = params['dlr']
+        self.variables = VARIABLES if self.with_entropy == 1 else VARIABLES_WITHOUT_ENTROPY
+        shape = (self.iesteps+1, self.irsteps+1, len(self.variables))
+        if 'data_file' in params:
+            self.data_file = os.path.join(os.path.dirname(fileName), params['data_file'])
+            self.data = read_binary_table(self.data_file, mmap)
+        elif m:
+            self.data_file = None
+            body = re.sub(r'[{},]', ' ', text[m.end():])
+            self.data = np.fromstring(body, sep=' ')
+            if self.data.size != np.prod(shape):
+                raise RuntimeError(f"Expected {np.prod(shape)} values in the data table, found {self.data.size}")
+            self.data = self.data.reshape(shape)
+        else:
+            raise RuntimeError(f"No data table or data_file found in {fileName}")
+        if self.data.shape != shape:
+            raise RuntimeError(f"Table data has shape {self.data.shape} but {shape} was expected.")
+        return
+
+    def __repr__(self):
+        return f"UniformLUTTable(fileName={self.fileName}, iesteps={self.iesteps}, irsteps={self.irsteps})"
+
+    def __getitem__(self, var):
+        """
+        The array of tabulated values for one variable.
+        """
+        return self.data[:,:,self.variables.index(var)]
+
+    @property
+    def e_values(self):
+        return self.emin + self.de*np.arange(self.iesteps+1)
+
+    @property
+    def log_rho_values(self):
+        return self.lrmin + self.dlr*np.arange(self.irsteps+1)
+
+    def write_binary(self, fileName):
+        """
+        Write the data to a binary file, to be named as data_file in a Lua file.
+        """
+        write_binary_table(fileName, self.data)
+        return
@@ -2,6 +2,7 @@
 # Place: UQ, Brisbane, Queensland, Australia
 # Date: 25-Jun-2012
 
+import numpy as np
 from gdtk.geom.vector3 import *
 
 def tri_centroid(p0, p1, p2):
@@ -95,63 +96,131 @@ class AxiCell(Cell):
         AxiCell.count = AxiCell.count + 1
         return
 
-def unique(lst):
-    seen = set()
-    unique = []
-    for item in lst:
-        if not item in seen:
-            unique.append(item)
-            seen.add(item)
-    return unique
+class Slice(Cell):
+    """
+    All of the cells of a slice, held as NumPy arrays with one entry per cell.
+
+    The accessors are those of Cell but they return arrays, with the normal
+    and centroid as Vector3 objects with array components, so that fluxes
+    and averages can be computed as vectorised reductions over the slice.
+    """
+    def __init__(self, data, area, normal, centroid):
+        Cell.__init__(self, data)
+        self._area = area
+        self._normal = normal
+        self._centroid = centroid
+        return
+
+    def __len__(self):
+        return len(self._area)
+
+    def __getitem__(self, i):
+        "Returns a single Cell, for code that works cell by cell."
+        c = Cell({k:v[i] for k,v in self._data.items()})
+        c._area = self._area[i]
+        c._normal = Vector3(self._normal.x[i], self._normal.y[i], self._normal.z[i])
+        c._centroid = Vector3(self._centroid.x[i], self._centroid.y[i], self._centroid.z[i])
+        return c
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def select(self, mask):
+        "Returns a new Slice with the cells picked out by a boolean mask or an index array."
+        n = self._normal
+        c = self._centroid
+        return Slice({k:v[mask] for k,v in self._data.items()}, self._area[mask],
+                     Vector3(n.x[mask], n.y[mask], n.z[mask]),
+                     Vector3(c.x[mask], c.y[mask], c.z[mask]))
+
+    def filter(self, fn):
+        "Returns a new Slice with the cells for which fn(cell) is True."
+        return self.select(np.array([bool(fn(c)) for c in self], dtype=bool))
+
+    def align_normals(self):
+        "Make all cell normals consistent with the very first cell."
+        n = self._normal
+        ncells = len(self)
+        self._normal = Vector3(np.full(ncells, n.x[0]), np.full(ncells, n.y[0]), np.full(ncells, n.z[0]))
+        return
+
+def _vector_area(a, b, scale):
+    "Returns the vector area scale*(a x b) and its magnitude, for arrays of vectors."
+    va = scale*np.cross(a, b)
+    return va, np.sqrt(np.sum(va*va, axis=1))
+
+def _quad_area(p0, p1, p2, p3):
+    return _vector_area(p1-p0+p2-p3, p3-p0+p2-p1, 0.25)[1]
 
-def create_cell(idx, data, cell_cnrs, var_map, scale):
-    c_list = unique(cell_cnrs[idx])
-    pts = []
-    xlabel = var_map['x']
-    ylabel = var_map['y']
-    zlabel = var_map['z']
-    for cnr in c_list:
-        i = cnr-1
-        pts.append(scale*Vector3(data[xlabel][i], data[ylabel][i], data[zlabel][i]))
+def _tri_area(p0, p1, p2):
+    return _vector_area(p1-p0, p2-p1, 0.5)[1]
 
-    if len(pts) == 3:
-        pC = tri_centroid(pts[0], pts[1], pts[2])
-        area = tri_area(pts[0], pts[1], pts[2])
-        a0 = tri_area(pts[1], pts[2], pC)
-        a1 = tri_area(pts[0], pts[2], pC)
-        a2 = tri_area(pts[0], pts[1], pC)
-        d = {}
-        for v in list(data.keys()):
-            d0 = data[v][c_list[0]-1]
-            d1 = data[v][c_list[1]-1]
-            d2 = data[v][c_list[2]-1]
-            d[v] = (a0*d0 + a1*d1 + a2*d2)/area
-        return TriCell(d, pts)
-    elif len(pts) == 4:
-        pC = quad_centroid(pts[0], pts[1], pts[2], pts[3])
-        area = quad_area(pts[0], pts[1], pts[2], pts[3])
-        p01 = 0.5*(pts[0]+pts[1])
-        p12 = 0.5*(pts[1]+pts[2])
-        p23 = 0.5*(pts[2]+pts[3])
-        p30 = 0.5*(pts[3]+pts[0])
-        a0 = quad_area(pC, p12, pts[2], p23)
-        a1 = quad_area(pC, p23, pts[3], p30)
-        a2 = quad_area(pC, p30, pts[0], p01)
-        a3 = quad_area(pC, p01, pts[1], p12)
-        d = {}
-        for v in list(data.keys()):
-            d0 = data[v][c_list[0]-1]
-            d1 = data[v][c_list[1]-1]
-            d2 = data[v][c_list[2]-1]
-            d3 = data[v][c_list[3]-1]
-            d[v] = (a0*d0 + a1*d1 + a2*d2 + a3*d3)/area
-        return QuadCell(d, pts)
-    else:
-        print("Unknown cell type with num points= ", len(pts))
+def create_slice(data, cell_cnrs, var_map, scale):
+    """
+    Build a Slice from nodal data and the element connectivity.
+
+    data: dictionary of arrays of nodal values, one per variable
+    cell_cnrs: array of shape (ncells, 4) of 1-based node indices;
+      a triangle has one of its nodes repeated.
+    The value of each variable in a cell is the average of its nodal values,
+    weighted by the area of the part of the cell nearest each node.
+    """
+    cnrs = np.asarray(cell_cnrs, dtype=int) - 1
+    # Move the repeated nodes of each element to the end.
+    dup = np.zeros(cnrs.shape, dtype=bool)
+    for k in range(1, 4):
+        dup[:,k] = np.any(cnrs[:,:k] == cnrs[:,k:k+1], axis=1)
+    cnrs = np.take_along_axis(cnrs, np.argsort(dup, axis=1, kind='stable'), axis=1)
+    npts = 4 - np.sum(dup, axis=1)
+    if np.any(npts < 3):
+        print("Unknown cell type with num points= ", npts[npts < 3][0])
         print("Bailing out!")
         import sys
         sys.exit(1)
-    return
+    #
+    pts = scale*np.column_stack([data[var_map['x']], data[var_map['y']], data[var_map['z']]])
+    ncells = len(cnrs)
+    vector_area = np.zeros((ncells, 3))
+    area = np.zeros(ncells)
+    centroid = np.zeros((ncells, 3))
+    weights = np.zeros((ncells, 4))
+    #
+    tri = np.flatnonzero(npts == 3)
+    p0, p1, p2 = [pts[cnrs[tri,k]] for k in range(3)]
+    pC = (1.0/3.0)*(p0 + p1 + p2)
+    vector_area[tri], area[tri] = _vector_area(p1-p0, p2-p1, 0.5)
+    centroid[tri] = pC
+    weights[tri,0] = _tri_area(p1, p2, pC)
+    weights[tri,1] = _tri_area(p0, p2, pC)
+    weights[tri,2] = _tri_area(p0, p1, pC)
+    #
+    quad = np.flatnonzero(npts == 4)
+    p0, p1, p2, p3 = [pts[cnrs[quad,k]] for k in range(4)]
+    pC = 0.25*(p0 + p1 + p2 + p3)
+    vector_area[quad], area[quad] = _vector_area(p1-p0+p2-p3, p3-p0+p2-p1, 0.25)
+    centroid[quad] = pC
+    p01 = 0.5*(p0+p1)
+    p12 = 0.5*(p1+p2)
+    p23 = 0.5*(p2+p3)
+    p30 = 0.5*(p3+p0)
+    weights[quad,0] = _quad_area(pC, p12, p2, p23)
+    weights[quad,1] = _quad_area(pC, p23, p3, p30)
+    weights[quad,2] = _quad_area(pC, p30, p0, p01)
+    weights[quad,3] = _quad_area(pC, p01, p1, p12)
+    #
+    good = area > 0.0
+    if not np.all(good):
+        print("Attempts to create %d cells with essentially zero area were made." % np.sum(~good))
+        cnrs = cnrs[good]; area = area[good]; weights = weights[good]
+        vector_area = vector_area[good]; centroid = centroid[good]
+    weights /= area[:,np.newaxis]
+    normal = vector_area/area[:,np.newaxis]
+    cell_data = {}
+    for v in data.keys():
+        cell_data[v] = np.sum(weights*np.asarray(data[v])[cnrs], axis=1)
+    return Slice(cell_data, area, Vector3(normal[:,0], normal[:,1], normal[:,2]),
+                 Vector3(centroid[:,0], centroid[:,1], centroid[:,2]))
 
 def create_cells_from_slice(fname, var_map, scale):
     f = open(fname, 'r')
@@ -182,30 +251,21 @@ def create_cells_from_slice(fname, var_map, scale):
     f.readline()
     # Read datatype and discard
     f.readline()
-    # Read all data and place in tks
-    tks = f.read().split()
+    # Read the whole data block in one pass; the connectivity follows the
+    # nodal values and comes through as floats, which hold integers exactly.
+    # A malformed item raises a ValueError rather than cutting the block short.
+    block = np.array(f.read().split(), dtype=float)
     f.close()
-    # Now pick up some data
+    # Now pick up some data: a block of nodal values for each variable
+    # followed by the four corners of each element.
+    nvals = len(var_list)*nnodes
+    values = block[:nvals].reshape(len(var_list), nnodes)
     data = {}
-    pos = 0
-    for v in var_list:
-        data[v] = []
-        for i in range(nnodes):
-            data[v].append(float(tks[pos]))
-            pos = pos + 1
-    cell_cnrs = []
-    for i in range(nelems):
-        cell_cnrs.append([int(tks[pos]), int(tks[pos+1]), int(tks[pos+2]), int(tks[pos+3])])
-        pos = pos + 4
-    #
-    cells = []
-    for i in range(nelems):
-        try:
-            cells.append(create_cell(i, data, cell_cnrs, var_map, scale))
-        except ZeroDivisionError:
-            print("An attempt to create a cell with essentially zero area was made.")
+    for iv, v in enumerate(var_list):
+        data[v] = values[iv]
+    cell_cnrs = block[nvals:nvals+4*nelems].astype(int).reshape(nelems, 4)
     #
-    return cells
+    return create_slice(data, cell_cnrs, var_map, scale)
 
 def create_cells_from_line(fname, var_map, scale):
     f = open(fname, 'r')
@@ -232,53 +292,25 @@ def create_cells_from_line(fname, var_map, scale):
     f.readline()
     # Read datatype and discard
     f.readline()
-    # Read all data and place it in tks
-    tks = f.read().split()
+    # Read the whole data block in one pass.
+    block = np.array(f.read().split(), dtype=float)
     f.close()
-    # Now pick up data
+    # Now pick up data, with all of the variables for each point together.
+    values = block[:npoints*len(var_list)].reshape(npoints, len(var_list))
     data = {}
-    pos = 0
-    for v in var_list:
-        data[v] = []
-    for i in range(npoints):
-        for v in var_list:
-            data[v].append(float(tks[pos]))
-            pos = pos + 1
-    # Create cells; first and last are special
-    xlabel = var_map['x']
-    ylabel = var_map['y']
-    zlabel = var_map['z']
-    cells = []
-    # First cell:
-    pt0 = Vector3(data[xlabel][0], data[ylabel][0], data[zlabel][0])
-    pt1 = Vector3(data[xlabel][1], data[ylabel][1], data[zlabel][1])
-    pts = [ pt0, 0.5*(pt0+pt1) ]
-    d = {}
-    for v in list(data.keys()):
-        d[v] = data[v][0]
-    cells.append(AxiCell(d, pts))
-    # Interior cells:
-    for i in range(1,npoints-1):
-        ptA = Vector3(data[xlabel][i-1], data[ylabel][i-1], data[zlabel][i-1])
-        ptB = Vector3(data[xlabel][i], data[ylabel][i], data[zlabel][i])
-        ptC = Vector3(data[xlabel][i+1], data[ylabel][i+1], data[zlabel][i+1])
-        pts = [ 0.5*(ptA+ptB), 0.5*(ptB+ptC) ]
-        d = {}
-        for v in list(data.keys()):
-            d[v] = data[v][i]
-        cells.append(AxiCell(d, pts))
-    # Last cell
-    ptB = Vector3(data[xlabel][npoints-2], data[ylabel][npoints-2], data[zlabel][npoints-2])
-    ptC = Vector3(data[xlabel][npoints-1], data[ylabel][npoints-1], data[zlabel][npoints-1])
-    pts = [ 0.5*(ptB+ptC), ptC ]
-    for v in list(data.keys()):
-        d[v] = data[v][npoints-1]
-    cells.append(AxiCell(d, pts))
+    for iv, v in enumerate(var_list):
+        data[v] = values[:,iv]
+    # Each cell spans from the mid-point with its lower neighbour to the
+    # mid-point with its upper neighbour; the first and last cells end at the points.
+    pts = np.column_stack([data[var_map['x']], data[var_map['y']], data[var_map['z']]])
+    mid = 0.5*(pts[:-1] + pts[1:])
+    lower = np.vstack([pts[:1], mid])
+    upper = np.vstack([mid, pts[-1:]])
+    centroid = 0.5*(lower + upper)
+    area = centroid[:,1]*(upper[:,1] - lower[:,1])
+    normal = Vector3(np.ones(npoints), np.zeros(npoints), np.zeros(npoints))
     #
-    return cells
+    return Slice(data, area, normal, Vector3(centroid[:,0], centroid[:,1], centroid[:,2]))
 
 def area(cells):
-    A = 0.0
-    for c in cells:
-        A = A + c.area()
-    return A
+    return np.sum(cells.area())
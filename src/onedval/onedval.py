@@ -16,9 +16,14 @@ the 2D surface based on the methods selected by the user.
 """
 
 import sys
+import io
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from math import *
 from gdtk.gas import GasModel, GasState
 from cell import create_cells_from_slice, create_cells_from_line, area
+import prop_avg
 from prop_avg import *
 from copy import copy
 
@@ -131,20 +136,12 @@ def data_file_row(f, pos, area, phis, int_quants, one_d_av, one_d_out, int_out,
     f.write("\n")
 
 
-def main():
+def read_config(config_file):
     """
-    Top-level function for the onedval program.
+    Read the user's config file, fill in the defaults and set up the gas model.
+
+    Returns: cfg, gmodel
     """
-    print("onedval: A program to compute integrated and one-dimensionalised quantities.")
-    print("onedval: Beginning.")
-    # 0. Gather command-line info
-    if len(sys.argv) < 3:
-        print("At least two arguments are required.")
-        print_usage()
-        sys.exit(1)
-    #
-    config_file = sys.argv[1]
-    #
     # 1. Gather info from config file
     # Set some defaults.
     # If set to 'None', we expect to find something from the user.
@@ -232,151 +229,218 @@ def main():
         print("The default type of 3D will be used.")
         cfg['geometry_type'] = '3D'
     #
-    # 2. Read data from slices and process
-    print("onedval: Reading in data from slice(s)")
-    f = open(cfg['output_file'], 'w')
+    # 1j. Look for the enthalpy surrogate option
+    if 'enthalpy_surrogate' in cfg:
+        prop_avg.ENTHALPY_SURROGATE = cfg['enthalpy_surrogate']
+    if 'enthalpy_surrogate_tol' in cfg:
+        prop_avg.SURROGATE_TOL = cfg['enthalpy_surrogate_tol']
+    #
+    # 1k. Look for the number of worker processes
+    if not 'nproc' in cfg:
+        cfg['nproc'] = 1
+    #
+    return cfg, gmodel
+
+
+def process_slice(slice_file, cfg, gmodel):
+    """
+    Do all of the requested calculations for one slice.
+
+    Returns: the text to go into the output file for this slice.
+    """
+    f = io.StringIO()
     phis = {}
     int_quants = {}
-    if cfg['output_format'] == 'as_data_file':
-        data_file_header(f, cfg['one_d_averages'], cfg['one_d_outputs'], cfg['integrated_outputs'], cfg['species'])
+    result = 'success'
+    print("onedval: Creating cells from slice: ", slice_file)
+    if cfg['geometry_type'] == 'axi':
+        cells = create_cells_from_line(slice_file, cfg['variable_map'], cfg['grid_scale'])
+    else:
+        cells = create_cells_from_slice(slice_file, cfg['variable_map'], cfg['grid_scale'])
+    print("Total number of cells created from slice: ", len(cells))
+    print("Make all cell normals consistent with very first cell.")
+    cells.align_normals()
+    # 2a. apply filtering if required
+    if 'filter_function' in cfg:
+        print("Using filter function to remove unwanted or unimportant cells.")
+        cells = cells.filter(cfg['filter_function'])
+        print("Number of cells after filtering: ", len(cells))
     #
-    for slice_file in sys.argv[2:]:
-        result = 'success'
-        print("onedval: Creating cells from slice: ", slice_file)
-        if cfg['geometry_type'] == 'axi':
-            cells = create_cells_from_line(slice_file, cfg['variable_map'], cfg['grid_scale'])
-        else:
-            cells = create_cells_from_slice(slice_file, cfg['variable_map'], cfg['grid_scale'])
-        print("Total number of cells created from slice: ", len(cells))
-        print("Make all cell normals consistent with very first cell.")
-        for c in cells[1:]:
-             c._normal = cells[0]._normal
-        # 2a. apply filtering if required
-        if 'filter_function' in cfg:
-            print("Using filter function to remove unwanted or unimportant cells.")
-            cells = list(filter(cfg['filter_function'], cells))
-            print("Number of cells after filtering: ", len(cells))
-        #
-        # 3. Do some work.
-        print("onedval: Doing the requested calculations")
-        if cfg['output_format'] == 'verbose':
-            f.write("------------------- onedval output ---------------------\n\n")
-            f.write("number of cells in averaging:\n")
-            f.write("ncells = %d\n" % len(cells))
-            f.write("cumulative area of cells (m^2):\n")
-            f.write("area = %.6e\n" % area(cells))
-        #
-        # 3a. Compute requested integrated quantities (if required)
-        # Grab any special fluxes.
-        special_fns = {}
-        for i in cfg['integrated_outputs']:
-            if isinstance(i, tuple):
-                special_fns[i[0]] = i[1]
-        fluxes = compute_fluxes(cells, cfg['variable_map'], cfg['species'], gmodel, special_fns)
-        #
-        if cfg['output_format'] == 'verbose':
-            if len(cfg['integrated_outputs']) > 0:
-                print("onedval: Writing out integrated quantities")
-                f.write("\n---------------------\n")
-                f.write("Integrated quantities\n")
-                f.write("---------------------\n")
-                f.write("\n")
-                #
-                for flux in cfg['integrated_outputs']:
-                    if isinstance(flux, str):
-                        if flux == 'mass flux':
-                            f.write("mass flux (kg/s)\n")
-                            f.write("m_dot = %.6e\n\n" % fluxes['mass'])
-                        elif flux == 'momentum flux':
-                            f.write("momentum flux (kg.m/s^2)\n")
-                            f.write("mom_dot = %s\n\n" % fluxes['mom'])
-                        elif flux == 'energy flux':
-                            f.write("energy flux (W)\n")
-                            f.write("e_dot = %.6e\n\n" % fluxes['energy'])
-                        elif flux == 'species mass flux':
-                            for isp, sp in enumerate(cfg['species']):
-                                f.write("mass flux of %s (kg/s)\n" % sp)
-                                f.write("m%s_dot = %.6e\n\n" % (sp, fluxes['species'][isp]))
-                        else:
-                            print("Requested integrated quantity: ", flux)
-                            print("is not part of the list of available integrated quantities.")
-                            print("Bailing out!")
-                            sys.exit(1)
-                    else:
-                        f.write("flux of %s\n")
-                        f.write("flux = %.6e\n\n" % fluxes[flux[0]])
-        #
-        if cfg['output_format'] == 'as_data_file':
+    # 3. Do some work.
+    print("onedval: Doing the requested calculations")
+    if cfg['output_format'] == 'verbose':
+        f.write("------------------- onedval output ---------------------\n\n")
+        f.write("number of cells in averaging:\n")
+        f.write("ncells = %d\n" % len(cells))
+        f.write("cumulative area of cells (m^2):\n")
+        f.write("area = %.6e\n" % area(cells))
+    #
+    # 3a. Compute requested integrated quantities (if required)
+    # Grab any special fluxes.
+    special_fns = {}
+    for i in cfg['integrated_outputs']:
+        if isinstance(i, tuple):
+            special_fns[i[0]] = i[1]
+    fluxes = compute_fluxes(cells, cfg['variable_map'], cfg['species'], gmodel, special_fns)
+    #
+    if cfg['output_format'] == 'verbose':
+        if len(cfg['integrated_outputs']) > 0:
+            print("onedval: Writing out integrated quantities")
+            f.write("\n---------------------\n")
+            f.write("Integrated quantities\n")
+            f.write("---------------------\n")
+            f.write("\n")
+            #
             for flux in cfg['integrated_outputs']:
                 if isinstance(flux, str):
                     if flux == 'mass flux':
-                        int_quants['mass flux'] = fluxes['mass']
+                        f.write("mass flux (kg/s)\n")
+                        f.write("m_dot = %.6e\n\n" % fluxes['mass'])
                     elif flux == 'momentum flux':
-                        int_quants['momentum flux'] = abs(fluxes['mom'])
+                        f.write("momentum flux (kg.m/s^2)\n")
+                        f.write("mom_dot = %s\n\n" % fluxes['mom'])
                     elif flux == 'energy flux':
-                        int_quants['energy flux'] = fluxes['energy']
+                        f.write("energy flux (W)\n")
+                        f.write("e_dot = %.6e\n\n" % fluxes['energy'])
                     elif flux == 'species mass flux':
-                        int_quants['species mass flux'] = {}
                         for isp, sp in enumerate(cfg['species']):
-                            int_quants['species mass flux'][sp] = fluxes['species'][isp]
+                            f.write("mass flux of %s (kg/s)\n" % sp)
+                            f.write("m%s_dot = %.6e\n\n" % (sp, fluxes['species'][isp]))
                     else:
                         print("Requested integrated quantity: ", flux)
                         print("is not part of the list of available integrated quantities.")
                         print("Bailing out!")
                         sys.exit(1)
                 else:
-                    int_quants[flux[0]] = fluxes[flux[0]]
-        #
-        # 3b. Compute requested one_d_properties
-        if cfg['output_format'] == 'verbose':
-            if len(cfg['one_d_averages']) > 0:
-                print("onedval: Writing out one-dimensionalised quantities")
-                f.write("\n------------------------------\n")
-                f.write("One-dimensionalised quantities\n")
-                f.write("------------------------------\n")
-        #
-        phis_all = {}
-        for avg in cfg['one_d_averages']:
-            if avg == 'area-weighted':
-                phis = area_weighted_avg(cells, cfg['one_d_outputs'], cfg['variable_map'])
-                phis_all[avg] = copy(phis)
-                if cfg['output_format'] == 'verbose':
-                    f.write("-- area-weighted average --\n\n")
-                    pretty_print_props(f, phis, cfg['species'], cfg['one_d_outputs'])
-                    f.write("\n")
-            elif avg == 'mass-flux-weighted':
-                phis = mass_flux_weighted_avg(cells, cfg['one_d_outputs'], cfg['variable_map'])
-                phis_all[avg] = copy(phis)
-                if cfg['output_format'] == 'verbose':
-                    f.write("-- mass-flux-weighted average --\n\n")
-                    pretty_print_props(f, phis, cfg['species'], cfg['one_d_outputs'])
-                    f.write("\n")
-            elif avg == 'flux-conserved':
-                phis, result = stream_thrust_avg(cells, cfg['one_d_outputs'], cfg['variable_map'], cfg['species'], gmodel)
-                if result != 'success':
-                    print("WARNING: Something went wrong trying to compute flux-conserved averages for slice: ", slice_file)
-                    if cfg['skip_bad_slices']:
-                        print("Skipping this slice and continuing.")
-                    else:
-                        print("Bailing out at this point because 'skip_bad_cells' is set to false.")
-                        sys.exit(1)
-                #
-                phis_all[avg] = copy(phis)
-                if cfg['output_format'] == 'verbose' and result == 'success':
-                    f.write("-- flux-conserved average --\n\n")
-                    pretty_print_props(f, phis, cfg['species'], cfg['one_d_outputs'])
-                    f.write("\n")
+                    f.write("flux of %s\n")
+                    f.write("flux = %.6e\n\n" % fluxes[flux[0]])
+    #
+    if cfg['output_format'] == 'as_data_file':
+        for flux in cfg['integrated_outputs']:
+            if isinstance(flux, str):
+                if flux == 'mass flux':
+                    int_quants['mass flux'] = fluxes['mass']
+                elif flux == 'momentum flux':
+                    int_quants['momentum flux'] = abs(fluxes['mom'])
+                elif flux == 'energy flux':
+                    int_quants['energy flux'] = fluxes['energy']
+                elif flux == 'species mass flux':
+                    int_quants['species mass flux'] = {}
+                    for isp, sp in enumerate(cfg['species']):
+                        int_quants['species mass flux'][sp] = fluxes['species'][isp]
+                else:
+                    print("Requested integrated quantity: ", flux)
+                    print("is not part of the list of available integrated quantities.")
+                    print("Bailing out!")
+                    sys.exit(1)
             else:
-                print("Requested one-D averaging method: ", avg)
-                print("is not known or not implemented.")
-                print("Bailing out!")
-                sys.exit(1)
-        #
-        if cfg['output_format'] == 'as_data_file' and result == 'success':
-            A = area(cells)
-            pos = avg_pos(cells, cfg['variable_map'])
-            data_file_row(f, pos, A, phis_all, int_quants, cfg['one_d_averages'], cfg['one_d_outputs'],
-                              cfg['integrated_outputs'], cfg['species'])
+                int_quants[flux[0]] = fluxes[flux[0]]
+    #
+    # 3b. Compute requested one_d_properties
+    if cfg['output_format'] == 'verbose':
+        if len(cfg['one_d_averages']) > 0:
+            print("onedval: Writing out one-dimensionalised quantities")
+            f.write("\n------------------------------\n")
+            f.write("One-dimensionalised quantities\n")
+            f.write("------------------------------\n")
+    #
+    phis_all = {}
+    for avg in cfg['one_d_averages']:
+        if avg == 'area-weighted':
+            phis = area_weighted_avg(cells, cfg['one_d_outputs'], cfg['variable_map'])
+            phis_all[avg] = copy(phis)
+            if cfg['output_format'] == 'verbose':
+                f.write("-- area-weighted average --\n\n")
+                pretty_print_props(f, phis, cfg['species'], cfg['one_d_outputs'])
+                f.write("\n")
+        elif avg == 'mass-flux-weighted':
+            phis = mass_flux_weighted_avg(cells, cfg['one_d_outputs'], cfg['variable_map'])
+            phis_all[avg] = copy(phis)
+            if cfg['output_format'] == 'verbose':
+                f.write("-- mass-flux-weighted average --\n\n")
+                pretty_print_props(f, phis, cfg['species'], cfg['one_d_outputs'])
+                f.write("\n")
+        elif avg == 'flux-conserved':
+            phis, result = stream_thrust_avg(cells, cfg['one_d_outputs'], cfg['variable_map'], cfg['species'], gmodel)
+            if result != 'success':
+                print("WARNING: Something went wrong trying to compute flux-conserved averages for slice: ", slice_file)
+                if cfg['skip_bad_slices']:
+                    print("Skipping this slice and continuing.")
+                else:
+                    print("Bailing out at this point because 'skip_bad_cells' is set to false.")
+                    sys.exit(1)
+            #
+            phis_all[avg] = copy(phis)
+            if cfg['output_format'] == 'verbose' and result == 'success':
+                f.write("-- flux-conserved average --\n\n")
+                pretty_print_props(f, phis, cfg['species'], cfg['one_d_outputs'])
+                f.write("\n")
+        else:
+            print("Requested one-D averaging method: ", avg)
+            print("is not known or not implemented.")
+            print("Bailing out!")
+            sys.exit(1)
+    #
+    if cfg['output_format'] == 'as_data_file' and result == 'success':
+        A = area(cells)
+        pos = avg_pos(cells, cfg['variable_map'])
+        data_file_row(f, pos, A, phis_all, int_quants, cfg['one_d_averages'], cfg['one_d_outputs'],
+                          cfg['integrated_outputs'], cfg['species'])
+    #
+    return f.getvalue()
+
+# Each worker process reads the config file and sets up its own gas model.
+worker_cfg = None
+worker_gmodel = None
+
+def init_worker(config_file):
+    global worker_cfg, worker_gmodel
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker_cfg, worker_gmodel = read_config(config_file)
+    return
+
+def process_slice_in_worker(slice_file):
+    return process_slice(slice_file, worker_cfg, worker_gmodel)
+
+
+def main():
+    """
+    Top-level function for the onedval program.
+    """
+    print("onedval: A program to compute integrated and one-dimensionalised quantities.")
+    print("onedval: Beginning.")
+    # 0. Gather command-line info
+    if len(sys.argv) < 3:
+        print("At least two arguments are required.")
+        print_usage()
+        sys.exit(1)
+    #
+    config_file = sys.argv[1]
+    slice_files = sys.argv[2:]
+    #
+    # 1. Gather info from config file
+    cfg, gmodel = read_config(config_file)
+    #
+    # 2. Read data from slices and process
+    print("onedval: Reading in data from slice(s)")
+    f = open(cfg['output_file'], 'w')
+    if cfg['output_format'] == 'as_data_file':
+        data_file_header(f, cfg['one_d_averages'], cfg['one_d_outputs'], cfg['integrated_outputs'], cfg['species'])
+    #
+    nproc = min(cfg['nproc'], len(slice_files))
+    if nproc > 1:
+        # The slices are processed concurrently but their output
+        # is written in the order that the files were given.
+        print("onedval: Processing slices with %d worker processes" % nproc)
+        # The workers are spawned, rather than forked, so that none of them
+        # inherits the state of the gas library loaded in this process.
+        with ProcessPoolExecutor(max_workers=nproc, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(config_file,)) as pool:
+            for text in pool.map(process_slice_in_worker, slice_files):
+                f.write(text)
+    else:
+        for slice_file in slice_files:
+            f.write(process_slice(slice_file, cfg, gmodel))
     #
     f.close()
     print("onedval: Done.")
@@ -11,192 +11,216 @@ import sys
 
 from math import sqrt, pow
 from gdtk.geom.vector3 import Vector3, dot
-from gdtk.gas import GasModel, GasState, PC_P_atm
+from gdtk.gas import GasModel, GasState, GasStateArray, PC_P_atm
 from gdtk.numeric.zero_solvers import secant
 from scipy.optimize import minimize, brute
-from numpy import median
+from scipy.interpolate import RectBivariateSpline
+import numpy as np
 from copy import copy
 
 DEBUG = False
 N_RETRIES = 3
 
+# Options for the evaluation of static enthalpy over a slice; see cell_enthalpies().
+ENTHALPY_SURROGATE = False
+SURROGATE_TABLE_SIZE = (33, 65) # points in log(rho) and T
+SURROGATE_TOL = 1.0e-4
+SURROGATE_NCHECK = 200
+
 def area(cells):
-    A = 0.0
-    for c in cells:
-        A = A + c.area()
-    return A
+    return np.sum(cells.area())
 
 def avg_pos(cells, var_map):
-    x = 0.0; y = 0.0; z = 0.0
-    xlabel = var_map['x']
-    ylabel = var_map['y']
-    zlabel = var_map['z']
-    A = area(cells)
-    for c in cells:
-        dA = c.area()
-        x += c.get(xlabel)*dA
-        y += c.get(ylabel)*dA
-        z += c.get(zlabel)*dA
-    x /= A
-    y /= A
-    z /= A
+    dA = cells.area()
+    A = np.sum(dA)
+    x = np.sum(cells.get(var_map['x'])*dA)/A
+    y = np.sum(cells.get(var_map['y'])*dA)/A
+    z = np.sum(cells.get(var_map['z'])*dA)/A
     return Vector3(x, y, z)
 
+def batch_enthalpies(gmodel, rho, T, massf=None):
+    """
+    Static enthalpies for arrays of densities and temperatures,
+    evaluated by the gas model in a single batch.
+
+    massf: mass fractions, of shape (n, n_species) or (n_species,), for
+      a multi-species gas model.
+    Any energy modes are taken to be in equilibrium with T.
+    """
+    gsa = GasStateArray(gmodel, len(rho))
+    gsa.rho = rho
+    gsa.T = T
+    if massf is not None: gsa.massf = massf
+    if gmodel.n_modes > 0: gsa.T_modes = np.asarray(T)[:,np.newaxis]
+    gsa.update_thermo_from_rhoT(with_enthalpy=True, raise_on_failure=True)
+    return gsa.enthalpy.copy()
+
+def surrogate_enthalpies(gmodel, rho, T, massf=None):
+    """
+    Static enthalpies interpolated from a table of h(log(rho), T)
+    that is built with the gas model at the mean composition.
+
+    Returns None if, at a sample of SURROGATE_NCHECK of the states,
+    the interpolated values differ from those of the gas model
+    by more than SURROGATE_TOL, relative to the largest magnitude of h.
+    """
+    def grid(values, n):
+        lo, hi = np.min(values), np.max(values)
+        if hi - lo <= 1.0e-9*abs(hi): hi = lo + 1.0e-6*max(abs(lo), 1.0)
+        return np.linspace(lo, hi, n)
+    log_rho = np.log(rho)
+    x = grid(log_rho, SURROGATE_TABLE_SIZE[0])
+    y = grid(T, SURROGATE_TABLE_SIZE[1])
+    X, Y = np.meshgrid(x, y, indexing='ij')
+    mf = None if massf is None else np.mean(massf, axis=0)
+    table = batch_enthalpies(gmodel, np.exp(X.ravel()), Y.ravel(), mf).reshape(X.shape)
+    h = RectBivariateSpline(x, y, table).ev(log_rho, T)
+    #
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(rho), size=min(SURROGATE_NCHECK, len(rho)), replace=False)
+    exact = batch_enthalpies(gmodel, rho[sample], T[sample], None if massf is None else massf[sample])
+    error = np.max(np.abs(h[sample] - exact))/max(np.max(np.abs(exact)), 1.0)
+    if error > SURROGATE_TOL:
+        print("Enthalpy surrogate error %.3e exceeds tolerance %.3e; using the gas model." %
+              (error, SURROGATE_TOL))
+        return None
+    return h
+
+def cell_enthalpies(cells, var_map, species, gmodel):
+    """
+    Static enthalpy of the gas in each cell, from its density, temperature
+    and (for a multi-species gas model) mass fractions.
+
+    The gas model is called once, for the distinct states in the slice.
+    With ENTHALPY_SURROGATE set, and enough distinct states to make it pay,
+    the enthalpies are interpolated from a table of h(rho,T) instead,
+    provided that the table passes its check against the gas model.
+    The result is kept with the cells for later calls.
+    """
+    cached = getattr(cells, '_enthalpy', None)
+    if cached is not None and cached[0] is gmodel: return cached[1]
+    columns = [cells.get(var_map['rho']), cells.get(var_map['T'])]
+    if gmodel.n_species > 1:
+        columns += [cells.get(var_map.get(sp, sp)) for sp in species]
+    states, inverse = np.unique(np.column_stack(columns), axis=0, return_inverse=True)
+    rho = states[:,0]
+    T = states[:,1]
+    massf = states[:,2:] if gmodel.n_species > 1 else None
+    h = None
+    table_size = SURROGATE_TABLE_SIZE[0]*SURROGATE_TABLE_SIZE[1]
+    if ENTHALPY_SURROGATE and len(states) > 2*table_size + SURROGATE_NCHECK:
+        h = surrogate_enthalpies(gmodel, rho, T, massf)
+    if h is None:
+        h = batch_enthalpies(gmodel, rho, T, massf)
+    h = h[inverse.ravel()]
+    cells._enthalpy = (gmodel, h)
+    return h
+
+def flux_integrals(cells, var_map, species, gmodel):
+    """
+    Integrals of the mass, momentum, energy and species fluxes across the cells.
+
+    Returns: f_mass, f_mom, f_energy, f_sp
+    """
+    dA = cells.area()
+    n = cells.normal()
+    rho = cells.get(var_map['rho'])
+    p = cells.get(var_map['p'])
+    vel = Vector3(cells.get(var_map['u']), cells.get(var_map['v']), cells.get(var_map['w']))
+    u_n = dot(vel, n)
+    mass_flux = rho*u_n*dA
+    f_mass = np.sum(mass_flux)
+    f_mom = Vector3(np.sum(mass_flux*vel.x + p*n.x*dA),
+                    np.sum(mass_flux*vel.y + p*n.y*dA),
+                    np.sum(mass_flux*vel.z + p*n.z*dA))
+    if gmodel.n_species > 1:
+        f_sp = [np.sum(cells.get(var_map.get(sp, sp))*mass_flux) for sp in species]
+    else:
+        f_sp = [0.0,]*len(species)
+        f_sp[0] = f_mass
+    h = cell_enthalpies(cells, var_map, species, gmodel)
+    h0 = h + 0.5*(vel.x**2 + vel.y**2 + vel.z**2)
+    f_energy = np.sum(mass_flux*h0)
+    return f_mass, f_mom, f_energy, f_sp
+
+def special_flux(f, cells, rho, u_n, dA, A, fluxes):
+    """
+    Integrate a user-supplied flux function over the cells.
+
+    The function is first tried on the whole slice at once, which works
+    when it is written with plain arithmetic on the values it is given.
+    Otherwise, it is called cell by cell.
+    Only the TypeError and ValueError that a function written for a single cell
+    raises when given arrays are taken as the signal to fall back;
+    any other error is a real one and is passed on.
+    """
+    name = getattr(f, '__name__', repr(f))
+    try:
+        values = f(cells, rho, u_n, dA, A, fluxes)
+    except (TypeError, ValueError) as e:
+        print("onedval: special flux function %s cannot take the whole slice (%s)." % (name, e))
+        values = None
+    if values is not None:
+        if np.shape(values) == np.shape(dA):
+            return np.sum(values)
+        print("onedval: special flux function %s returned shape %s for the whole slice." %
+              (name, np.shape(values)))
+    print("onedval: calling special flux function %s cell by cell." % name)
+    return sum(f(cells[i], rho[i], u_n[i], dA[i], A, fluxes) for i in range(len(cells)))
+
 def compute_fluxes(cells, var_map, species, gmodel, special_fns):
-    f_mass = 0.0
-    f_mom = Vector3(0.0, 0.0, 0.0)
-    f_energy = 0.0
-    f_sp = [0.0,]*len(species)
-    nsp = gmodel.n_species
-    N = Vector3(0.0, 0.0, 0.0)
-    A = 0.0
-    rholabel = var_map['rho']
-    plabel = var_map['p']
-    ulabel = var_map['u']
-    vlabel = var_map['v']
-    wlabel = var_map['w']
-    Tlabel = var_map['T']
-    Q = GasState(gmodel)
-    special_fluxes = copy(special_fns)
-    for k in special_fluxes:
-        special_fluxes[k] = 0.0
-    for c in cells:
-        dA = c.area()
-        A += dA
-        n = c.normal()
-        rho = c.get(rholabel)
-        p = c.get(plabel)
-        vel = Vector3(c.get(ulabel), c.get(vlabel), c.get(wlabel))
-        T = c.get(Tlabel)
-        # Add increments
-        u_n = dot(vel, n)
-        f_mass = f_mass + rho*u_n*dA
-        f_mom = f_mom + (rho*u_n*vel + p*n)*dA
-        if gmodel.n_species > 1:
-            massfs = {}
-            for isp, sp in enumerate(species):
-                splabel = var_map.get(sp, sp)
-                massf = c.get(splabel)
-                f_sp[isp] = f_sp[isp] + rho*massf*u_n*dA
-                massfs[sp] = massf
-            Q.massf = massfs
-        else:
-            Q.massf = [1.0,]
-            f_sp[0] = f_sp[0] + rho*u_n*dA
-        Q.rho = c.get(rholabel)
-        Q.T = c.get(Tlabel)
-        Q.update_thermo_from_rhoT()
-        h = Q.enthalpy
-        h0 = h + 0.5*abs(vel)*abs(vel)
-        f_energy = f_energy + rho*u_n*h0*dA
+    f_mass, f_mom, f_energy, f_sp = flux_integrals(cells, var_map, species, gmodel)
     #
     # Process any special fns.
     # Special fns may like to know total flux and area
     fluxes = {'mass':abs(f_mass), 'mom':f_mom, 'energy':abs(f_energy), 'species':list(map(abs, f_sp))}
     #
-    for c in cells:
-        dA = c.area()
-        rho = c.get(rholabel)
-        vel = Vector3(c.get(ulabel), c.get(vlabel), c.get(wlabel))
-        n = c.normal()
-        u_n = dot(vel, n)
-        for l,f in special_fns.items():
-            special_fluxes[l] += f(c, rho, u_n, dA, A, fluxes)
+    dA = cells.area()
+    A = np.sum(dA)
+    rho = cells.get(var_map['rho'])
+    vel = Vector3(cells.get(var_map['u']), cells.get(var_map['v']), cells.get(var_map['w']))
+    u_n = dot(vel, cells.normal())
     output = {'mass': f_mass, 'mom': f_mom, 'energy': f_energy, 'species':f_sp}
-    for l,f in special_fluxes.items():
-        output[l] = special_fluxes[l]
+    for l,f in special_fns.items():
+        output[l] = special_flux(f, cells, rho, u_n, dA, A, fluxes)
     return output
 
 def area_weighted_avg(cells, props, var_map):
     phis = dict.fromkeys(props, 0.0)
-    area = 0.0
-    for c in cells:
-        dA = c.area()
-        area = area + dA
-        for p in props:
-            label = p
-            if p in var_map:
-                label = var_map[p]
-            phis[p] = phis[p] + c.get(label)*dA
-    #
+    dA = cells.area()
+    area = np.sum(dA)
     for p in props:
-        phis[p] = phis[p]/area
+        label = var_map.get(p, p)
+        phis[p] = np.sum(cells.get(label)*dA)/area
     #
     return phis
 
 def mass_flux_weighted_avg(cells, props, var_map):
     phis = dict.fromkeys(props, 0.0)
-    f_mass = 0.0
-    rholabel = var_map['rho']
-    ulabel = var_map['u']
-    vlabel = var_map['v']
-    wlabel = var_map['w']
-    Tlabel = var_map['T']
-    for c in cells:
-        dA = c.area()
-        rho = c.get(rholabel)
-        vel = Vector3(c.get(ulabel), c.get(vlabel), c.get(wlabel))
-        n = c.normal()
-        w = rho*dot(vel, n)
-        f_mass = f_mass + w*dA
-        for p in props:
-            label = p
-            if p in var_map:
-                label = var_map[p]
-            phis[p] = phis[p] + c.get(label)*w*dA
-    #
+    vel = Vector3(cells.get(var_map['u']), cells.get(var_map['v']), cells.get(var_map['w']))
+    w = cells.get(var_map['rho'])*dot(vel, cells.normal())*cells.area()
+    f_mass = np.sum(w)
     for p in props:
-        phis[p] = phis[p]/f_mass
+        label = var_map.get(p, p)
+        phis[p] = np.sum(cells.get(label)*w)/f_mass
     #
     return phis
 
 
 def stream_thrust_avg(cells, props, var_map, species, gmodel):
     flag = 'success'
-    f_mass = 0.0
-    f_mom = Vector3(0.0, 0.0, 0.0)
-    f_energy = 0.0
-    f_sp = [0.0,]*len(species)
     nsp = gmodel.n_species
-    N = Vector3(0.0, 0.0, 0.0)
-    A = 0.0
     rholabel = var_map['rho']
     plabel = var_map['p']
     ulabel = var_map['u']
     vlabel = var_map['v']
     wlabel = var_map['w']
     Tlabel = var_map['T']
-    Q = GasState(gmodel)
-    for c in cells:
-        dA = c.area()
-        n = c.normal()
-        rho = c.get(rholabel)
-        p = c.get(plabel)
-        vel = Vector3(c.get(ulabel), c.get(vlabel), c.get(wlabel))
-        T = c.get(Tlabel)
-        # Add increments
-        u_n = dot(vel, n)
-        f_mass = f_mass + rho*u_n*dA
-        f_mom = f_mom + (rho*u_n*vel + p*n)*dA
-        if gmodel.n_species > 1:
-            massfs = {}
-            for isp, sp in enumerate(species):
-                splabel = var_map.get(sp, sp)
-                massf = c.get(splabel)
-                f_sp[isp] = f_sp[isp] + rho*massf*u_n*dA
-                massfs[sp] = massf
-            Q.massf = massfs
-        else:
-            Q.massf = [1.0,]
-            f_sp[0] = f_sp[0] + rho*u_n*dA
-        Q.rho = c.get(rholabel)
-        Q.T = c.get(Tlabel)
-        Q.update_thermo_from_rhoT()
-        h = Q.enthalpy
-        h0 = h + 0.5*abs(vel)*abs(vel)
-        f_energy = f_energy + rho*u_n*h0*dA
-        A = A + dA
-        N = N + n*dA
+    f_mass, f_mom, f_energy, f_sp = flux_integrals(cells, var_map, species, gmodel)
+    dA = cells.area()
+    n = cells.normal()
+    A = np.sum(dA)
+    N = Vector3(np.sum(n.x*dA), np.sum(n.y*dA), np.sum(n.z*dA))
 
     N = N / A
     f_mom_s = dot(f_mom, N)
@@ -236,18 +260,18 @@ def stream_thrust_avg(cells, props, var_map, species, gmodel):
         return fmass_err + fmom_err + fe_err
     #
     # Find bounds for answer.
-    rhos = [c.get(rholabel) for c in cells]
-    rho_min = min(rhos)
-    rho_max = max(rhos)
-    rho_mid = median(rhos)
-    Ts = [c.get(Tlabel) for c in cells]
-    T_min = min(Ts)
-    T_max = max(Ts)
-    T_mid = median(Ts)
-    us = [sqrt(c.get(ulabel)**2 + c.get(vlabel)**2 + c.get(wlabel)**2) for c in cells]
-    u_min = min(us)
-    u_max = max(us)
-    u_mid = median(us)
+    rhos = cells.get(rholabel)
+    rho_min = np.min(rhos)
+    rho_max = np.max(rhos)
+    rho_mid = np.median(rhos)
+    Ts = cells.get(Tlabel)
+    T_min = np.min(Ts)
+    T_max = np.max(Ts)
+    T_mid = np.median(Ts)
+    us = np.sqrt(cells.get(ulabel)**2 + cells.get(vlabel)**2 + cells.get(wlabel)**2)
+    u_min = np.min(us)
+    u_max = np.max(us)
+    u_mid = np.median(us)
     # ------------ This is a complicated way to get an initial guess ----------- #
 #    aw_props = area_weighted_avg(cells, ['rho', 'p', 'T', 'u', 'v', 'w', 'M'], var_map)
     # Use the Nelder-Mead minimiser with area-weighted averages as starting guess
@@ -285,6 +309,7 @@ def stream_thrust_avg(cells, props, var_map, species, gmodel):
         aw_props = area_weighted_avg(cells, ['rho', 'p', 'T', 'u', 'v', 'w', 'M'], var_map)
         u = sqrt(aw_props['u']**2 + aw_props['v']**2 + aw_props['w']**2)
         rho = aw_props['rho']
+        p = aw_props['p']
         Q.rho = rho
         Q.p = p
         gmodel.eval_thermo_state_rhop(Q)
@@ -15,7 +15,8 @@ import yaml
 # TO DO: the functions could even be put in a functions file...
 from pitot3_utils.pitot3_classes import Facility, Driver, Diaphragm, Facility_State, Tube, Nozzle, Test_Section
 from pitot3_utils.pitot3_classes import eilmer4_CEAGas_input_file_creator, expansion_tube_test_time_calculator, \
-    state_output_for_final_output, pitot3_results_output, cleanup_function, pitot3_species_MW_dict_loader
+    state_output_for_final_output, pitot3_results_output, cleanup_function, pitot3_species_MW_dict_loader, \
+    pitot3_yaml_file_loader
 
 #-----------------------------------------------------------------------------------
 
@@ -45,8 +46,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
     #--------------------------------------------------------------------------------
     # load the default config which loads everything which runs the program...
 
-    default_config_file = open(os.path.expandvars(pitot3_data_folder +  '/' + default_config_yaml_filename))
-    default_config_data = yaml.load(default_config_file, Loader=yaml.FullLoader)
+    default_config_data = pitot3_yaml_file_loader(pitot3_data_folder +  '/' + default_config_yaml_filename)
 
     # go through and any remove any None values which yaml has loaded as None
     for variable in default_config_data.keys():
@@ -126,8 +126,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
             print (f"Chosen facility is '{facility_name}'.")
 
         facility_yaml_filename = '{0}/{1}.yaml'.format(facilities_folder, facility_name)
-        facility_yaml_file = open(os.path.expandvars(facility_yaml_filename))
-        facility_input_data = yaml.load(facility_yaml_file , Loader=yaml.FullLoader)
+        facility_input_data = pitot3_yaml_file_loader(facility_yaml_filename)
 
         # TO DO: this class should maybe take inputs instead of just taking the config file...
         facility = Facility(facility_input_data)
@@ -183,8 +182,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
             driver_condition_file_location = config_data['driver_condition_filename']
 
         if os.path.isfile(os.path.expandvars(driver_condition_file_location)):
-            driver_yaml_file = open(os.path.expandvars(driver_condition_file_location))
-            driver_condition_input_data = yaml.load(driver_yaml_file, Loader=yaml.FullLoader)
+            driver_condition_input_data = pitot3_yaml_file_loader(driver_condition_file_location)
         elif not os.path.isfile(os.path.expandvars(driver_condition_file_location)) and driver_condition_name != 'custom':
             if verbose:
                 print(f"Your selected facility is {facility_name}. ")
@@ -417,6 +415,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
         vsd_limits = config_data['vsd_limits']
         vsd_tolerance = config_data['vsd_tolerance']
         vsd_max_iterations = config_data['vsd_max_iterations']
+        vsd_warm_start = config_data['vsd_warm_start']
 
 
         secondary_driver_shocked_state_name = config_data['secondary_driver_shocked_state_name']
@@ -435,7 +434,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
                                 unsteady_expansion_steps=secondary_driver_unsteady_expansion_steps,
                                 vs_guess_1=vsd_guess_1, vs_guess_2=vsd_guess_2, vs_limits=vsd_limits,
                                 vs_tolerance=vsd_tolerance, vs_max_iterations = vsd_max_iterations,
-                                outputUnits = outputUnits, species_MW_dict = species_MW_dict)
+                                outputUnits = outputUnits, species_MW_dict = species_MW_dict, vs_warm_start = vsd_warm_start)
 
         gas_path.append(secondary_driver)
         object_dict['secondary_driver'] = secondary_driver
@@ -480,6 +479,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
     vs1_limits = config_data['vs1_limits']
     vs1_tolerance = config_data['vs1_tolerance']
     vs1_max_iterations = config_data['vs1_max_iterations']
+    vs1_warm_start = config_data['vs1_warm_start']
 
     shock_tube_shocked_state_name = config_data['shock_tube_shocked_state_name']
     shock_tube_unsteadily_expanded_state_name = config_data['shock_tube_unsteadily_expanded_state_name']
@@ -496,7 +496,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
                       unsteady_expansion_steps = shock_tube_unsteady_expansion_steps,
                       vs_guess_1 = vs1_guess_1, vs_guess_2 = vs1_guess_2, vs_limits = vs1_limits,
                       vs_tolerance = vs1_tolerance, vs_max_iterations = vs1_max_iterations,
-                      outputUnits = outputUnits, species_MW_dict = species_MW_dict)
+                      outputUnits = outputUnits, species_MW_dict = species_MW_dict, vs_warm_start = vs1_warm_start)
 
     gas_path.append(shock_tube)
     object_dict['shock_tube'] = shock_tube
@@ -570,6 +570,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
         vs2_limits = config_data['vs2_limits']
         vs2_tolerance = config_data['vs2_tolerance']
         vs2_max_iterations = config_data['vs2_max_iterations']
+        vs2_warm_start = config_data['vs2_warm_start']
 
         acceleration_tube_shocked_state_name = config_data['acceleration_tube_shocked_state_name']
         acceleration_tube_unsteadily_expanded_state_name = config_data['acceleration_tube_unsteadily_expanded_state_name']
@@ -615,7 +616,7 @@ def run_pitot3(config_dict = {}, config_filename = None,
                                  unsteady_expansion_steps = acceleration_tube_unsteady_expansion_steps,
                                  vs_guess_1 = vs2_guess_1, vs_guess_2 = vs2_guess_2, vs_limits = vs2_limits,
                                  vs_tolerance = vs2_tolerance, vs_max_iterations = vs2_max_iterations,
-                                 outputUnits = outputUnits, species_MW_dict = species_MW_dict)
+                                 outputUnits = outputUnits, species_MW_dict = species_MW_dict, vs_warm_start = vs2_warm_start)
 
         gas_path.append(acceleration_tube)
         object_dict['acceleration_tube'] = acceleration_tube
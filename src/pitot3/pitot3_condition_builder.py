@@ -7,7 +7,7 @@ Chris James (c.james4@uq.edu.au) - 02/01/23
 
 """
 
-CONDITION_BUILDER_VERSION_STRING = '15-Dec-2023'
+CONDITION_BUILDER_VERSION_STRING = '18-Oct-2026'
 
 #----------------------------------------------------------------------------------------
 
@@ -23,11 +23,26 @@ import zlib
 import zipfile
 import shutil
 import time
+import glob
+import csv
+
 
 from pitot3 import run_pitot3
 from pitot3_utils.pitot3_classes import pitot3_remote_run_creator, pitot3_pickle_output_file_loader, \
     pitot3_single_line_output_file_creator, pitot3_pickle_output_file_creator, pitot3_json_output_file_loader, Facility, \
-    cleanup_function
+    cleanup_function, pitot3_file_cache_setup
+
+#----------------------------------------------------------------------------------------
+
+# the shock speeds which the 'in_memory' mode can warm start, by their name in the output csv,
+# with the name of their tube in the PITOT3 object_dict and the config variable which sets their warm start.
+WARM_START_SHOCK_SPEEDS = {'vsd1':('secondary_driver', 'vsd_warm_start'),
+                           'vs1':('shock_tube', 'vs1_warm_start'),
+                           'vs2':('acceleration_tube', 'vs2_warm_start')}
+
+# the start of the error message of a test which failed because its worker process stopped,
+# rather than because PITOT3 raised an exception. these tests are run again when we re-start.
+WORKER_STOPPED_ERROR_MESSAGE = 'Worker process stopped:'
 
 #----------------------------------------------------------------------------------------
 
@@ -84,6 +99,27 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
     else:
         condition_builder_cleanup = False
 
+    # the original 'folders' mode makes a folder with an input file for each test, runs the test in it,
+    # and then loads the results back in at the end (zipping the folders up when it is done).
+    # the 'in_memory' mode instead keeps the facility, driver and gas models loaded in each process,
+    # passes each test to the processes as a config dictionary, and adds the one line result of each test
+    # to the output csv as it comes back. This is a lot quicker for big condition builders.
+    # (a run in this mode can be re-started, and the tests in the output csv will not be re-ran.)
+    if 'condition_builder_mode' in condition_builder_config_dict:
+        condition_builder_mode = condition_builder_config_dict['condition_builder_mode']
+    else:
+        condition_builder_mode = 'folders'
+
+    if condition_builder_mode not in ['folders', 'in_memory']:
+        raise Exception(f"pitot3_condition_builder() condition_builder_mode '{condition_builder_mode}' is not valid. It must be 'folders' or 'in_memory'.")
+
+    # in the 'in_memory' mode, each test starts its shock speed calculations from the shock speeds of the nearest
+    # test (by fill pressures) which has already finished, as they should be very similar.
+    if 'condition_builder_warm_start' in condition_builder_config_dict:
+        condition_builder_warm_start = condition_builder_config_dict['condition_builder_warm_start']
+    else:
+        condition_builder_warm_start = True
+
     if condition_builder_cleanup:
         print('-' * 60)
         print("Removing any evidence of an old condition builder run with the same name from the folder.")
@@ -93,7 +129,7 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
         # this is teh end of the filename, the base filename will be added to it
         filenames_to_remove_list = ['_condition_builder_output.csv', '_final_result_dict_output.json',
                                     '_final_result_dict_output.pickle','_individual_log_and_result_files.zip',
-                                    '_condition_builder_summary.txt']
+                                    '_condition_builder_summary.txt', '_condition_builder_failed_tests.csv']
 
         for partial_filename in filenames_to_remove_list:
             filename = f'{base_output_filename}{partial_filename}'
@@ -227,11 +263,17 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
     # start by building the output folders...
 
     print('-'*60)
-    print('Setting up the run folders for each simulation.')
+    if condition_builder_mode == 'folders':
+        print('Setting up the run folders for each simulation.')
+    else:
+        print('Setting up the config for each simulation.')
     print('-'*60)
 
     test_names = []
 
+    # the config dictionary of each test for the 'in_memory' mode
+    test_config_dicts = {}
+
     # we store the config that we are changing for each simulation in case we need it later on...
     changing_input_config_dict = {}
 
@@ -279,7 +321,10 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
             config_dict['p5'] = p5
         config_dict['test_number'] = test_number
 
-        pitot3_remote_run_creator(config_dict, run_folder, pitot_3_input_file_filename)
+        if condition_builder_mode == 'folders':
+            pitot3_remote_run_creator(config_dict, run_folder, pitot_3_input_file_filename)
+        else:
+            test_config_dicts[test_name] = config_dict
 
         # store the input variables in the dictionary we made for if we need it...
 
@@ -289,13 +334,14 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
             changing_input_config_dict[test_name][variable] = config_dict[variable]
 
     # ----------------------------------------------------------------------------------------
-    print('-' * 60)
-    print('Checking for any excess old condition builder folders in the simulation folder and cleaning them up.')
-    print('-' * 60)
+    if condition_builder_mode == 'folders':
+        print('-' * 60)
+        print('Checking for any excess old condition builder folders in the simulation folder and cleaning them up.')
+        print('-' * 60)
 
-    # this is important, as a previous simulation could have had more simulations...
+        # this is important, as a previous simulation could have had more simulations...
 
-    remove_condition_builder_folders(mode='conserve folders', base_output_filename=base_output_filename, folder_list=test_names, cwd='.')
+        remove_condition_builder_folders(mode='conserve folders', base_output_filename=base_output_filename, folder_list=test_names, cwd='.')
 
     #----------------------------------------------------------------------------------------
     print('-'*60)
@@ -309,7 +355,14 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
     # using some tips from here:
     # https://superfastpython.com/multiprocessing-pool-python/
 
-    if no_of_processes == 1:
+    # a report of the shock speed iterations the warm starts have saved, for the 'in_memory' mode
+    shock_speed_report_lines = []
+
+    if condition_builder_mode == 'in_memory':
+        shock_speed_report_lines = pitot3_condition_builder_in_memory_run(test_names, test_config_dicts, changing_input_config_dict,
+                                                                          variables_we_iterate_through, base_output_filename, no_of_processes,
+                                                                          warm_start = condition_builder_warm_start)
+    elif no_of_processes == 1:
         for test_name in test_names:
             pitot3_condition_builder_test_run(test_name, changing_input_config_dict, variables_we_iterate_through)
     else:
@@ -344,91 +397,95 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
     print("Creating output csv and results dictionaries.")
     print('-'*60)
 
-    # this will store a list for each variable from each test
-    results_dict = {}
+    if condition_builder_mode == 'in_memory':
+        # the output csv was written as we went, so we just need to put it in order and load the results from it...
+        results_dict, unsuccessful_simulations = pitot3_condition_builder_csv_results_loader(test_names, base_output_filename)
+    else:
+        # this will store a list for each variable from each test
+        results_dict = {}
 
-    # this will store the dict_of_objects for each simulation
-    results_objects_dict = {}
+        # this will store the dict_of_objects for each simulation
+        results_objects_dict = {}
 
-    unsuccessful_simulations = []
+        unsuccessful_simulations = []
 
-    condition_builder_output_filename = f'{base_output_filename}_condition_builder_output.csv'
+        condition_builder_output_filename = f'{base_output_filename}_condition_builder_output.csv'
 
-    with open(condition_builder_output_filename, 'w') as condition_builder_output_file:
-        condition_builder_header = f"#Output of PITOT3 condition builder version {CONDITION_BUILDER_VERSION_STRING}"
-        condition_builder_output_file.write(condition_builder_header + '\n')
+        with open(condition_builder_output_filename, 'w') as condition_builder_output_file:
+            condition_builder_header = f"#Output of PITOT3 condition builder version {CONDITION_BUILDER_VERSION_STRING}"
+            condition_builder_output_file.write(condition_builder_header + '\n')
 
-        have_added_title_line = False
+            have_added_title_line = False
 
-        for test_name in test_names:
-            print('-'*60)
-            print(f"Loading result from test {test_name}.")
-            print('-'*60)
+            for test_name in test_names:
+                print('-'*60)
+                print(f"Loading result from test {test_name}.")
+                print('-'*60)
 
-            # grab the test number too in case we need it ...
-            test_number = test_name[len(base_output_filename)+1:]
+                # grab the test number too in case we need it ...
+                test_number = test_name[len(base_output_filename)+1:]
 
-            # where we start out...
-            starting_working_directory = os.getcwd()
+                # where we start out...
+                starting_working_directory = os.getcwd()
 
-            # change directory to the one of the simulation
-            os.chdir(starting_working_directory + '/' + test_name)
+                # change directory to the one of the simulation
+                os.chdir(starting_working_directory + '/' + test_name)
 
-            files_in_the_current_run_directory = os.listdir(os.getcwd())
+                files_in_the_current_run_directory = os.listdir(os.getcwd())
 
-            json_filename = f'{test_name}.json'
+                json_filename = f'{test_name}.json'
 
-            # this should ignore anything that failed...
-            if  json_filename in files_in_the_current_run_directory:
+                # this should ignore anything that failed...
+                if  json_filename in files_in_the_current_run_directory:
 
-                json_output_dict = pitot3_json_output_file_loader(json_filename)
+                    json_output_dict = pitot3_json_output_file_loader(json_filename)
 
-                # I added the single line output stuff from each PITOT3 run to the .json output
-                # so I could use it here instead of re-creating it like I did before...
+                    # I added the single line output stuff from each PITOT3 run to the .json output
+                    # so I could use it here instead of re-creating it like I did before...
 
-                single_line_output_dict = json_output_dict['single_line_output_dict']
+                    single_line_output_dict = json_output_dict['single_line_output_dict']
 
-                title_line = single_line_output_dict['title_line']
-                result_line = single_line_output_dict['result_line']
-                title_list = single_line_output_dict['title_list']
-                result_list = single_line_output_dict['result_list']
+                    title_line = single_line_output_dict['title_line']
+                    result_line = single_line_output_dict['result_line']
+                    title_list = single_line_output_dict['title_list']
+                    result_list = single_line_output_dict['result_list']
 
-                # we need to add the test number and test name here as it won't be in the original output...
+                    # we need to add the test number and test name here as it won't be in the original output...
 
-                title_line = 'test_number,test_name,' + title_line
+                    title_line = 'test_number,test_name,' + title_line
 
-                result_line = f'{test_number},{test_name},' + result_line
+                    result_line = f'{test_number},{test_name},' + result_line
 
-                title_list.insert(0, 'test_number')
-                result_list.insert(0, test_number)
+                    title_list.insert(0, 'test_number')
+                    result_list.insert(0, test_number)
 
-                title_list.insert(1, 'test_name')
-                result_list.insert(1, test_name)
+                    title_list.insert(1, 'test_name')
+                    result_list.insert(1, test_name)
 
-                if not have_added_title_line:
-                    condition_builder_output_file.write(title_line + '\n')
+                    if not have_added_title_line:
+                        condition_builder_output_file.write(title_line + '\n')
 
-                    have_added_title_line = True
+                        have_added_title_line = True
 
-                condition_builder_output_file.write(result_line + '\n')
+                    condition_builder_output_file.write(result_line + '\n')
 
-                # add the result to the results dict
-                for title, result in zip(title_list, result_list):
-                    # add the variable if it isn't there yet...
-                    if title not in results_dict:
-                        results_dict[title] = []
-                    results_dict[title].append(result)
+                    # add the result to the results dict
+                    for title, result in zip(title_list, result_list):
+                        # add the variable if it isn't there yet...
+                        if title not in results_dict:
+                            results_dict[title] = []
+                        results_dict[title].append(result)
 
-                # add the json_output_dict to the dictionary for that too...
+                    # add the json_output_dict to the dictionary for that too...
 
-                results_objects_dict[test_name] = json_output_dict
+                    results_objects_dict[test_name] = json_output_dict
 
-            else:
-                print(f"{test_name} does not have a .json output file so it must have failed.")
-                unsuccessful_simulations.append(test_number)
+                else:
+                    print(f"{test_name} does not have a .json output file so it must have failed.")
+                    unsuccessful_simulations.append(test_number)
 
-            # return to the original directory when we're done... (this may actually be unnecessary except for at teh end?)
-            os.chdir(starting_working_directory)
+                # return to the original directory when we're done... (this may actually be unnecessary except for at teh end?)
+                os.chdir(starting_working_directory)
 
     #----------------------------------------------------------------------------------------
     # now we export the results dict to a json file...
@@ -442,77 +499,79 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
     with open(json_results_dict_output_filename, "w") as output_file:
         json.dump(results_dict, output_file)
 
-    #----------------------------------------------------------------------------------------
-    # And we pickle the
+    # the 'in_memory' mode has no results objects or folders, so there is nothing more to do before the summary...
+    if condition_builder_mode == 'folders':
+        #----------------------------------------------------------------------------------------
+        # And we pickle the
 
-    print('-'*60)
-    print("Saving the json result for each simulation to a .pickle file.")
-    print('-'*60)
+        print('-'*60)
+        print("Saving the json result for each simulation to a .pickle file.")
+        print('-'*60)
 
-    pickle_results_dict_output_filename = f'{base_output_filename}_final_result_dict_output.pickle'
+        pickle_results_dict_output_filename = f'{base_output_filename}_final_result_dict_output.pickle'
 
-    # may as well use the pitot3 pickle output function for this...
-    pitot3_pickle_output_file_creator(results_objects_dict, pickle_results_dict_output_filename)
+        # may as well use the pitot3 pickle output function for this...
+        pitot3_pickle_output_file_creator(results_objects_dict, pickle_results_dict_output_filename)
 
-    #----------------------------------------------------------------------------------------
-    # now zip up the result... this kind of works, but just needs some work as it also zips unnecessary stuff...
+        #----------------------------------------------------------------------------------------
+        # now zip up the result... this kind of works, but just needs some work as it also zips unnecessary stuff...
 
-    print('-'*60)
-    print("Zipping up the individual simulation results.")
-    print('-'*60)
+        print('-'*60)
+        print("Zipping up the individual simulation results.")
+        print('-'*60)
 
-    cwd = '.'  # easier than the full path now...
+        cwd = '.'  # easier than the full path now...
 
-    zipfile_name = f'{base_output_filename}_individual_log_and_result_files.zip'
+        zipfile_name = f'{base_output_filename}_individual_log_and_result_files.zip'
 
-    try:
+        try:
 
-        # compression level of 9 to get the smallest file...
-        with zipfile.ZipFile(zipfile_name, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+            # compression level of 9 to get the smallest file...
+            with zipfile.ZipFile(zipfile_name, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
 
-            for dirname, subdirs, files in os.walk(cwd):
+                for dirname, subdirs, files in os.walk(cwd):
 
-                #remove the working directory from the dirname and then check if what is left is in the test_names, if so,
-                # we want to zip up that folder and all of its subfiles
-                if len(dirname) > len(cwd): # we're not the working directory...
-                    dirname_for_comparison = dirname[len(cwd) + 1:] # +1 to remove the slash...
+                    #remove the working directory from the dirname and then check if what is left is in the test_names, if so,
+                    # we want to zip up that folder and all of its subfiles
+                    if len(dirname) > len(cwd): # we're not the working directory...
+                        dirname_for_comparison = dirname[len(cwd) + 1:] # +1 to remove the slash...
 
-                    if dirname_for_comparison in test_names:
+                        if dirname_for_comparison in test_names:
 
-                        zf.write(dirname)
-                        for filename in files:
-                            zf.write(os.path.join(dirname, filename))
+                            zf.write(dirname)
+                            for filename in files:
+                                zf.write(os.path.join(dirname, filename))
 
-    except Exception as e:
-        print(e)
-        print("We failed to zip up the files, will try again without specifying the compression level")
-        print("as this causes issues sometimes.")
+        except Exception as e:
+            print(e)
+            print("We failed to zip up the files, will try again without specifying the compression level")
+            print("as this causes issues sometimes.")
 
-        # compression level of 9 to get the smallest file...
-        with zipfile.ZipFile(zipfile_name, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            # compression level of 9 to get the smallest file...
+            with zipfile.ZipFile(zipfile_name, "w", compression=zipfile.ZIP_DEFLATED) as zf:
 
-            for dirname, subdirs, files in os.walk(cwd):
+                for dirname, subdirs, files in os.walk(cwd):
 
-                # remove the working directory from the dirname and then check if what is left is in the test_names, if so,
-                # we want to zip up that folder and all of its subfiles
-                if len(dirname) > len(cwd):  # we're not the working directory...
-                    dirname_for_comparison = dirname[len(cwd) + 1:]  # +1 to remove the slash...
+                    # remove the working directory from the dirname and then check if what is left is in the test_names, if so,
+                    # we want to zip up that folder and all of its subfiles
+                    if len(dirname) > len(cwd):  # we're not the working directory...
+                        dirname_for_comparison = dirname[len(cwd) + 1:]  # +1 to remove the slash...
 
-                    if dirname_for_comparison in test_names:
+                        if dirname_for_comparison in test_names:
 
-                        zf.write(dirname)
-                        for filename in files:
-                            zf.write(os.path.join(dirname, filename))
+                            zf.write(dirname)
+                            for filename in files:
+                                zf.write(os.path.join(dirname, filename))
 
 
-    #----------------------------------------------------------------------------------------
-    # now to finish off we delete the results folders that we just zipped up...
+        #----------------------------------------------------------------------------------------
+        # now to finish off we delete the results folders that we just zipped up...
 
-    print('-'*60)
-    print("Now removing the individual simulation results to clean up the folder.")
-    print('-'*60)
+        print('-'*60)
+        print("Now removing the individual simulation results to clean up the folder.")
+        print('-'*60)
 
-    remove_condition_builder_folders(mode = 'remove folders', folder_list = test_names, cwd = '.')
+        remove_condition_builder_folders(mode = 'remove folders', folder_list = test_names, cwd = '.')
 
     #----------------------------------------------------------------------------------------
     # And make a summary of the simulation results and print it to the screen and to a file.
@@ -573,6 +632,9 @@ def run_pitot3_condition_builder(config_dict = {}, config_filename = None,
 
             print(summary_line_5, file=output_stream)
 
+            for shock_speed_report_line in shock_speed_report_lines:
+                print(shock_speed_report_line, file=output_stream)
+
             variables_to_not_summarise_list = ['test_number', 'driver_condition','area_ratio',
                                                'secondary_driver_gas_gas_model', 'secondary_driver_gas_name',
                                                'test_gas_gas_model', 'test_gas_name',
@@ -723,6 +785,483 @@ def pitot3_condition_builder_test_run(test_name, changing_input_config_dict, var
 
     return
 
+def pitot3_condition_builder_in_memory_run(test_names, test_config_dicts, changing_input_config_dict,
+                                           variables_we_iterate_through, base_output_filename, no_of_processes,
+                                           warm_start = True):
+    """
+    The function which runs the tests for the 'in_memory' mode of the condition builder.
+
+    The config dictionary of each test is handed out to a pool of worker processes, which keep the facility,
+    driver and gas models they have loaded between tests, and the one line output of each test is added to the
+    output csv as soon as it comes back. Tests which fail are added to a failed tests csv instead.
+
+    If these files are already there from an earlier run which was stopped, any tests in them which have the
+    same input variables as the tests we want to run are kept, and will not be re-ran.
+
+    The tests are handed out one at a time, as workers become free. With warm_start, each one is given the shock
+    speeds of the nearest finished test (by the log of its fill pressures, with the same driver condition) to start
+    its shock speed calculations from. The number of iterations each shock speed calculation took is sent back so we can report
+    how many were saved.
+
+    :param test_names: list of the test names.
+    :param test_config_dicts: dictionary with the config dictionary of each test, by test name.
+    :param changing_input_config_dict: dictionary with the variables which are changed for each test, by test name.
+    :param variables_we_iterate_through: list of the variables which are changed.
+    :param base_output_filename:
+    :param no_of_processes:
+    :param warm_start: set to False to start every shock speed calculation from the normal guesses.
+    :return: a list of lines reporting on the shock speed iterations.
+    """
+
+    condition_builder_output_filename = f'{base_output_filename}_condition_builder_output.csv'
+    failed_tests_filename = f'{base_output_filename}_condition_builder_failed_tests.csv'
+
+    # the input variables which we write to the failed tests file and check when we re-start
+    # (the output_filename is the test name, so it is already there)
+    input_variables = [variable for variable in variables_we_iterate_through if variable != 'output_filename']
+
+    completed_tests, have_added_title_line = pitot3_condition_builder_restart_file_loader(condition_builder_output_filename,
+                                                                                          changing_input_config_dict,
+                                                                                          input_variables,
+                                                                                          header_lines = 2)
+    # (tests which failed because their worker process stopped are dropped from the failed tests file, so they are run again)
+    failed_tests, _ = pitot3_condition_builder_restart_file_loader(failed_tests_filename, changing_input_config_dict,
+                                                                   input_variables, header_lines = 1,
+                                                                   retry_error_message = WORKER_STOPPED_ERROR_MESSAGE)
+
+    if not os.path.exists(condition_builder_output_filename):
+        with open(condition_builder_output_filename, 'w') as condition_builder_output_file:
+            condition_builder_header = f"#Output of PITOT3 condition builder version {CONDITION_BUILDER_VERSION_STRING}"
+            condition_builder_output_file.write(condition_builder_header + '\n')
+
+    if not os.path.exists(failed_tests_filename):
+        with open(failed_tests_filename, 'w') as failed_tests_file:
+            # (the error messages can have commas in them, so this file is written with the csv module)
+            csv.writer(failed_tests_file, lineterminator = '\n').writerow(['test_number', 'test_name'] + input_variables + ['error_message'])
+
+    tests_to_run = [test_name for test_name in test_names if test_name not in completed_tests and test_name not in failed_tests]
+
+    if len(tests_to_run) < len(test_names):
+        print(f"{len(test_names) - len(tests_to_run)} tests have already been ran and will not be re-ran.")
+
+    if not tests_to_run:
+        return []
+
+    # for the warm starts, we keep the log of the fill pressures of every test, which tests have finished,
+    # and the shock speeds of the finished tests (starting with any which were already in the output csv)
+    pressure_variables = [variable for variable in input_variables if variable != 'driver_condition']
+
+    test_log_pressures = np.array([[np.log(float(changing_input_config_dict[test_name][variable])) for variable in pressure_variables]
+                                   for test_name in test_names])
+    test_driver_conditions = np.array([changing_input_config_dict[test_name]['driver_condition'] for test_name in test_names])
+    test_indices = {test_name: i for i, test_name in enumerate(test_names)}
+
+    finished_shock_speeds = pitot3_condition_builder_csv_shock_speed_loader(condition_builder_output_filename)
+    finished_tests = np.array([test_name in finished_shock_speeds for test_name in test_names])
+
+    # and the number of iterations each shock speed calculation took, whether it was warm started,
+    # and how many iterations were taken by a warm start which failed (before the calculation was done cold)
+    shock_speed_iterations = {variable: [] for variable in WARM_START_SHOCK_SPEEDS}
+
+    no_of_processes = min(no_of_processes, len(tests_to_run))
+
+    print(f"Running {len(tests_to_run)} tests using {no_of_processes} process(es).")
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from concurrent.futures.process import BrokenProcessPool
+
+    # the workers each run in their own folder (next to where the test folders would be)
+    # as the CEA calculations make temporary files in the working directory.
+    # They are spawned (rather than forked) so that none of them start with a copy of the gas library state
+    # of this process, and if one of them dies (say with a segfault in the gas library) the pool is 'broken',
+    # which we find out about, instead of the test just never coming back.
+    def new_pool():
+        return ProcessPoolExecutor(max_workers = no_of_processes, mp_context = multiprocessing.get_context('spawn'),
+                                   initializer = pitot3_condition_builder_worker_setup,
+                                   initargs = (os.getcwd(), base_output_filename))
+
+    pool = new_pool()
+
+    # the tests which are running, by their future
+    running_tests = {}
+
+    def start_test(test_name):
+        nonlocal pool
+
+        # we turn off the output files, as the result is sent straight back here instead...
+        config_dict = test_config_dicts[test_name].copy()
+        config_dict['generate_output_files'] = False
+
+        if warm_start and finished_tests.any():
+            test_index = test_indices[test_name]
+
+            candidate_tests = finished_tests & (test_driver_conditions == test_driver_conditions[test_index])
+
+            if candidate_tests.any():
+                distances = np.where(candidate_tests, np.sum((test_log_pressures - test_log_pressures[test_index])**2, axis=1), np.inf)
+
+                nearest_test_name = test_names[int(np.argmin(distances))]
+
+                for variable, shock_speed in finished_shock_speeds[nearest_test_name].items():
+                    config_dict[WARM_START_SHOCK_SPEEDS[variable][1]] = shock_speed
+
+        try:
+            future = pool.submit(pitot3_condition_builder_in_memory_test_run, config_dict)
+        except BrokenProcessPool:
+            # a worker died since we last checked, so we start again with a new pool
+            pool.shutdown(wait = True)
+            pool = new_pool()
+            future = pool.submit(pitot3_condition_builder_in_memory_test_run, config_dict)
+
+        running_tests[future] = test_name
+
+        return
+
+    try:
+        with open(condition_builder_output_filename, 'a') as condition_builder_output_file, \
+                open(failed_tests_filename, 'a') as failed_tests_file:
+
+            failed_tests_writer = csv.writer(failed_tests_file, lineterminator = '\n')
+
+            # we only hand out as many tests as there are workers, and start a new one as each one finishes,
+            # so that each test can be warm started from the tests which finished before it,
+            # and so that if a worker dies, only the tests which were running are lost
+            # (as a broken pool fails all of the tests which are waiting in it as well).
+            tests_to_start = no_of_processes
+
+            for test_name in tests_to_run[:tests_to_start]:
+                start_test(test_name)
+
+            i = 0
+
+            while running_tests:
+
+                finished_futures, _ = wait(list(running_tests), return_when = FIRST_COMPLETED)
+
+                for future in finished_futures:
+                    test_name = running_tests.pop(future)
+
+                    try:
+                        test_name, title_line, result_line, error_message, shock_speed_dict = future.result()
+                    except BrokenProcessPool:
+                        # we can't tell which of the tests which were running killed the worker, so they all fail
+                        error_message = f'{WORKER_STOPPED_ERROR_MESSAGE} the worker process stopped unexpectedly ' \
+                                        'while this test was running (it may have crashed in the gas library). ' \
+                                        'The test will be run again if the condition builder is re-started.'
+                        title_line, result_line, shock_speed_dict = None, None, {}
+                    except Exception as e:
+                        error_message = f'{e}'
+                        title_line, result_line, shock_speed_dict = None, None, {}
+
+                    if tests_to_start < len(tests_to_run):
+                        # we record this test's shock speeds before starting the next one so it can use them
+                        if error_message is None:
+                            finished_tests[test_indices[test_name]] = True
+                            finished_shock_speeds[test_name] = {variable: shock_speed_dict[variable]['vs'] for variable in shock_speed_dict}
+
+                        start_test(tests_to_run[tests_to_start])
+                        tests_to_start += 1
+
+                    test_number = test_config_dicts[test_name]['test_number']
+                    i += 1
+
+                    if error_message is None:
+                        if not have_added_title_line:
+                            condition_builder_output_file.write('test_number,test_name,' + title_line + '\n')
+                            have_added_title_line = True
+
+                        condition_builder_output_file.write(f'{test_number},{test_name},' + result_line + '\n')
+                        condition_builder_output_file.flush()
+
+                        for variable in shock_speed_dict:
+                            shock_speed_iterations[variable].append((shock_speed_dict[variable]['iterations'],
+                                                                     shock_speed_dict[variable]['warm_started'],
+                                                                     shock_speed_dict[variable]['wasted_iterations']))
+
+                        print(f"Test {test_name} finished ({i}/{len(tests_to_run)}).")
+                    else:
+                        failed_test_line = [f'{test_number}', test_name]
+                        failed_test_line += [f'{changing_input_config_dict[test_name][variable]}' for variable in input_variables]
+                        # (one line per test, so the file can be re-loaded a line at a time when we re-start)
+                        failed_test_line += [error_message.replace('\n', ' ')]
+
+                        failed_tests_writer.writerow(failed_test_line)
+                        failed_tests_file.flush()
+
+                        print(f"Test {test_name} failed ({i}/{len(tests_to_run)}). The error message was: {error_message}")
+
+    finally:
+        pool.shutdown(wait = True)
+
+        for worker_folder in glob.glob(f'{base_output_filename}_worker_*'):
+            shutil.rmtree(worker_folder)
+
+    # now the report of the shock speed iterations...
+
+    shock_speed_report_lines = []
+
+    for variable in shock_speed_iterations:
+        if not shock_speed_iterations[variable]:
+            continue
+
+        warm_iterations = [iterations for iterations, warm_started, _ in shock_speed_iterations[variable] if warm_started]
+        cold_iterations = [iterations for iterations, warm_started, _ in shock_speed_iterations[variable] if not warm_started]
+        wasted_iterations = [wasted for _, _, wasted in shock_speed_iterations[variable] if wasted]
+
+        if warm_iterations and cold_iterations:
+            # the iterations of any failed warm starts count against what was saved
+            iterations_saved = (np.mean(cold_iterations) - np.mean(warm_iterations))*len(warm_iterations) - sum(wasted_iterations)
+            if iterations_saved >= 0:
+                iterations_saved_string = f"so about {iterations_saved:.0f} iterations were saved"
+            else:
+                iterations_saved_string = f"so about {-iterations_saved:.0f} more iterations were needed"
+            shock_speed_report_line = f"{len(warm_iterations)} {variable} calculations were warm started and took {np.mean(warm_iterations):.1f} iterations on average, " \
+                                      f"compared to {np.mean(cold_iterations):.1f} for the other {len(cold_iterations)} ({iterations_saved_string})."
+        elif warm_iterations:
+            shock_speed_report_line = f"All {len(warm_iterations)} {variable} calculations were warm started and took {np.mean(warm_iterations):.1f} iterations on average."
+        else:
+            shock_speed_report_line = f"No {variable} calculations were warm started. They took {np.mean(cold_iterations):.1f} iterations on average."
+
+        if wasted_iterations:
+            shock_speed_report_line += f" {len(wasted_iterations)} warm starts failed, wasting {sum(wasted_iterations)} iterations " \
+                                       f"before those calculations were done from the normal guesses."
+
+        print(shock_speed_report_line)
+        shock_speed_report_lines.append(shock_speed_report_line)
+
+    return shock_speed_report_lines
+
+def pitot3_condition_builder_worker_setup(starting_working_directory, base_output_filename):
+    """
+    Sets up a worker process for the 'in_memory' mode of the condition builder.
+
+    The worker gets its own folder to run in and keeps the yaml files and gas models it loads in memory.
+
+    :param starting_working_directory:
+    :param base_output_filename:
+    :return:
+    """
+
+    worker_folder = f'{starting_working_directory}/{base_output_filename}_worker_{os.getpid()}'
+
+    if not os.path.exists(worker_folder):
+        os.mkdir(worker_folder)
+
+    os.chdir(worker_folder)
+
+    pitot3_file_cache_setup()
+
+    return
+
+def pitot3_condition_builder_in_memory_test_run(config_dict):
+    """
+    Runs a single test for the 'in_memory' mode of the condition builder and returns its one line output.
+
+    :param config_dict: the config dictionary of the test.
+    :return: test_name, title_line, result_line, error_message (None if the test was successful),
+        and a dictionary with the shock speed, the number of iterations it took, whether it was warm started,
+        and the iterations wasted by a failed warm start, for each shock speed which was calculated.
+    """
+
+    test_name = config_dict['output_filename']
+
+    with open(os.devnull, 'w') as devnull:
+        with redirect_stdout(devnull):
+            with redirect_stderr(devnull):
+                try:
+                    config_data, gas_path, object_dict, states_dict = run_pitot3(config_dict = config_dict, verbose = False)
+
+                    title_line, result_line = pitot3_single_line_output_file_creator(config_data, object_dict, states_dict,
+                                                                                     output_to_file = False)
+                except Exception as e:
+                    # the run files are normally cleaned up at the end of each simulation...
+                    cleanup_function()
+
+                    return test_name, None, None, f'{e}', {}
+
+    shock_speed_dict = {}
+
+    for variable, (tube_name, warm_start_variable) in WARM_START_SHOCK_SPEEDS.items():
+        # (the shock speed may have been set by the user, instead of calculated)
+        if tube_name in object_dict and object_dict[tube_name].get_shock_speed_iterations() is not None:
+            tube = object_dict[tube_name]
+            shock_speed_dict[variable] = {'vs':tube.get_shock_speed(), 'iterations':tube.get_shock_speed_iterations(),
+                                          'warm_started':tube.get_shock_speed_warm_started(),
+                                          'wasted_iterations':tube.get_shock_speed_wasted_warm_start_iterations()}
+
+    return test_name, title_line, result_line, None, shock_speed_dict
+
+def pitot3_condition_builder_restart_file_loader(filename, changing_input_config_dict, input_variables, header_lines,
+                                                 retry_error_message = None):
+    """
+    Loads a condition builder csv output file (or failed tests file) from an earlier run, so it can be re-started.
+
+    Only the lines of tests which are in the current run and have the same input variables are kept,
+    and the file is re-written with just those lines (and its header lines).
+
+    :param filename:
+    :param changing_input_config_dict: dictionary with the variables which are changed for each test, by test name.
+    :param input_variables: the input variables to check.
+    :param header_lines: the number of lines at the top of the file which are not results.
+    :param retry_error_message: for the failed tests file, lines with an error_message which starts with this
+        are dropped, so that those tests are run again.
+    :return: set of test names in the file, and whether the file has been kept (with all of its header lines).
+    """
+
+    if not os.path.exists(filename):
+        return set(), False
+
+    with open(filename, 'r') as restart_file:
+        lines = restart_file.readlines()
+
+    # the last line may not have been finished if the run was stopped...
+    if lines and not lines[-1].endswith('\n'):
+        lines = lines[:-1]
+
+    if len(lines) < header_lines:
+        # we just start the file again if it doesn't even have its header lines...
+        os.remove(filename)
+        return set(), False
+
+    # (the failed tests file is written with the csv module, as its error messages can have commas in them)
+    title_list = next(csv.reader([lines[header_lines - 1].strip()]))
+
+    test_names = set()
+    lines_to_keep = lines[:header_lines]
+
+    for line in lines[header_lines:]:
+        values = next(csv.reader([line.strip()]), [])
+
+        if len(values) < len(title_list):
+            continue
+
+        line_dict = dict(zip(title_list, values))
+
+        test_name = line_dict['test_name']
+
+        if test_name not in changing_input_config_dict or test_name in test_names:
+            continue
+
+        if retry_error_message and line_dict.get('error_message', '').startswith(retry_error_message):
+            continue
+
+        for variable in input_variables:
+            if f'{changing_input_config_dict[test_name][variable]}' != line_dict.get(variable):
+                break
+        else:
+            test_names.add(test_name)
+            lines_to_keep.append(line)
+
+    with open(filename, 'w') as restart_file:
+        restart_file.writelines(lines_to_keep)
+
+    return test_names, True
+
+def pitot3_condition_builder_csv_shock_speed_loader(filename):
+    """
+    Loads the shock speeds of the tests in a condition builder output csv, so they can be used for warm starts.
+
+    :param filename:
+    :return: dictionary with a dictionary of the shock speeds of each test, by test name.
+    """
+
+    shock_speeds = {}
+
+    if not os.path.exists(filename):
+        return shock_speeds
+
+    with open(filename, 'r') as condition_builder_output_file:
+        lines = condition_builder_output_file.readlines()
+
+    if len(lines) < 2:
+        return shock_speeds
+
+    title_list = lines[1].strip().split(',')
+
+    for line in lines[2:]:
+        line_dict = dict(zip(title_list, line.strip().split(',')))
+
+        shock_speeds[line_dict['test_name']] = {}
+
+        for variable in WARM_START_SHOCK_SPEEDS:
+            if variable in line_dict:
+                try:
+                    shock_speeds[line_dict['test_name']][variable] = float(line_dict[variable])
+                except ValueError:
+                    pass
+
+    return shock_speeds
+
+def pitot3_condition_builder_csv_results_loader(test_names, base_output_filename):
+    """
+    Puts the output csv from the 'in_memory' mode of the condition builder in test order
+    and loads the results into a dictionary with a list for each variable.
+
+    :param test_names:
+    :param base_output_filename:
+    :return: results_dict, unsuccessful_simulations (a list of the test numbers which failed)
+    """
+
+    condition_builder_output_filename = f'{base_output_filename}_condition_builder_output.csv'
+
+    with open(condition_builder_output_filename, 'r') as condition_builder_output_file:
+        lines = condition_builder_output_file.readlines()
+
+    header_lines = lines[:2]
+    result_lines = {line.split(',', 2)[1]: line for line in lines[2:]}
+
+    results_dict = {}
+    unsuccessful_simulations = []
+
+    with open(condition_builder_output_filename, 'w') as condition_builder_output_file:
+        condition_builder_output_file.writelines(header_lines)
+
+        if len(header_lines) > 1:
+            title_list = header_lines[1].strip().split(',')
+        else:
+            title_list = []
+
+        for test_name in test_names:
+            test_number = test_name[len(base_output_filename)+1:]
+
+            if test_name not in result_lines:
+                unsuccessful_simulations.append(test_number)
+                continue
+
+            condition_builder_output_file.write(result_lines[test_name])
+
+            result_list = result_lines[test_name].strip().split(',')
+
+            for title, result in zip(title_list, result_list):
+                # the test number and test name are kept as strings, like in the 'folders' mode
+                if title not in ['test_number', 'test_name']:
+                    result = condition_builder_csv_value_converter(result)
+                if title not in results_dict:
+                    results_dict[title] = []
+                results_dict[title].append(result)
+
+    if unsuccessful_simulations:
+        print(f"{len(unsuccessful_simulations)} tests do not have a result in the output csv so they must have failed.")
+
+    return results_dict, unsuccessful_simulations
+
+def condition_builder_csv_value_converter(value):
+    """
+    Turns a value from the output csv back into a number (or None or a bool) if it was one.
+    """
+
+    if value in ['None', 'True', 'False']:
+        return {'None': None, 'True': True, 'False': False}[value]
+
+    for value_type in [int, float]:
+        try:
+            return value_type(value)
+        except ValueError:
+            pass
+
+    return value
+
 def remove_condition_builder_folders(mode = 'remove all folders', base_output_filename = None, folder_list = None, cwd = '.'):
     """
     This is a function to remove condition builder folders.
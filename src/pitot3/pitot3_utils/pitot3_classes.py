@@ -13,7 +13,7 @@ import yaml
 
 from datetime import datetime
 
-from gdtk.gas import GasModel, GasState, GasFlow
+from gdtk.gas import GasModel, GasState, GasFlow, StateCache
 from gdtk.ideal_gas_flow import p0_p
 from gdtk.numeric.zero_solvers import secant
 
@@ -389,6 +389,89 @@ IdealGas = {{
 
     return ideal_gas_gmodel_filename
 
+# PITOT3 normally loads its yaml files and gas models from scratch for every run.
+# A process which does a lot of runs (such as a condition builder worker) can call
+# pitot3_file_cache_setup() to keep everything it has loaded in memory between runs instead.
+# Files are stored by name and contents, so a file which has been changed (or re-generated differently)
+# is just loaded again.
+# The CEAGas models loaded then also share a StateCache, so that the states which PITOT3 updates itself
+# (such as the fill states, which are often the same from run to run) are not sent to CEA again.
+# (the states updated inside the GasFlow functions do not go through the StateCache)
+pitot3_file_cache = None
+pitot3_state_cache = None
+
+def pitot3_file_cache_setup(use_cache = True):
+    """
+    Function to turn the caching of loaded yaml files and gas models on (or off) for this process.
+
+    :param use_cache: True to keep loaded files in memory between runs, False to go back to loading them every time.
+    :return:
+    """
+
+    global pitot3_file_cache, pitot3_state_cache
+
+    if use_cache:
+        pitot3_file_cache = {}
+        pitot3_state_cache = StateCache()
+    else:
+        pitot3_file_cache = None
+        pitot3_state_cache = None
+
+    return
+
+def pitot3_file_cache_key(filename):
+    """
+    Returns the key which a file is stored by in the cache (its name and contents).
+    """
+
+    with open(os.path.expandvars(filename), 'rb') as cached_file:
+        return (filename, cached_file.read())
+
+def pitot3_yaml_file_loader(yaml_filename, Loader = yaml.FullLoader):
+    """
+    Function to load a yaml file, from the cache if it has been set up and the file has already been loaded.
+
+    We give back a copy of any cached data, as the classes which use it are free to change it.
+
+    :param yaml_filename:
+    :param Loader: the yaml Loader to use.
+    :return:
+    """
+
+    import copy
+
+    if pitot3_file_cache is not None:
+        key = ('yaml',) + pitot3_file_cache_key(yaml_filename)
+        if key not in pitot3_file_cache:
+            with open(os.path.expandvars(yaml_filename)) as yaml_file:
+                pitot3_file_cache[key] = yaml.load(yaml_file, Loader=Loader)
+        return copy.deepcopy(pitot3_file_cache[key])
+
+    with open(os.path.expandvars(yaml_filename)) as yaml_file:
+        yaml_data = yaml.load(yaml_file, Loader=Loader)
+
+    return yaml_data
+
+def pitot3_gas_model_loader(gmodel_filename):
+    """
+    Function to make a GasModel object, using a cached one if the cache has been set up and this gas model
+    file has already been loaded. When the cache has been set up, a CEAGas model also uses the shared StateCache.
+
+    :param gmodel_filename:
+    :return:
+    """
+
+    if pitot3_file_cache is not None:
+        key = ('gmodel',) + pitot3_file_cache_key(gmodel_filename)
+        if key not in pitot3_file_cache:
+            gmodel = GasModel(os.path.expandvars(gmodel_filename))
+            if gmodel.type_str == 'CEAGas':
+                gmodel.use_state_cache(pitot3_state_cache)
+            pitot3_file_cache[key] = gmodel
+        return pitot3_file_cache[key]
+
+    return GasModel(os.path.expandvars(gmodel_filename))
+
 def pitot3_species_MW_dict_loader(species_molecular_weights_filename):
 
     import yaml
@@ -424,8 +507,7 @@ def pitot3_species_MW_dict_loader(species_molecular_weights_filename):
             SafeConstructor.__init__(self)
             StrictBoolSafeResolver.__init__(self)
 
-    species_molecular_weights_file = open(os.path.expandvars(species_molecular_weights_filename))
-    species_MW_dict = yaml.load(species_molecular_weights_file, Loader=StrictBoolSafeLoader)
+    species_MW_dict = pitot3_yaml_file_loader(species_molecular_weights_filename, Loader=StrictBoolSafeLoader)
 
     return species_MW_dict
 
@@ -1409,7 +1491,7 @@ class Driver(object):
                 # we need the molecular masses to get from mole fractions to mass fractions
                 # we will need to make a gas model to do that...
 
-                gmodel = GasModel(os.path.expandvars(driver_gmodel_location))
+                gmodel = pitot3_gas_model_loader(driver_gmodel_location)
 
                 self.driver_speciesList = gmodel.species_names
 
@@ -1441,7 +1523,7 @@ class Driver(object):
 
             driver_gmodel_location = self.driver_fill_gas_filename
 
-        self.gmodel = GasModel(os.path.expandvars(driver_gmodel_location))
+        self.gmodel = pitot3_gas_model_loader(driver_gmodel_location)
 
         # now what we have to do now depends on the type of driver condition
         # we just have empirical for now, which is easy, as they just specify p4 and T4...
@@ -2978,7 +3060,7 @@ class Tube(object):
                  fill_state_name, shocked_fill_state_name, entrance_state_name, entrance_state, unsteadily_expanded_entrance_state_name,
                  expand_to, expansion_factor,
                  preset_gas_models_folder, unsteady_expansion_steps, vs_guess_1, vs_guess_2, vs_limits, vs_tolerance, vs_max_iterations,
-                 outputUnits = 'massf', species_MW_dict = None):
+                 outputUnits = 'massf', species_MW_dict = None, vs_warm_start = None):
 
         self.tube_name = tube_name
 
@@ -3010,7 +3092,7 @@ class Tube(object):
             fill_gmodel_location = self.fill_gas_filename
 
         if os.path.isfile(os.path.expandvars(fill_gmodel_location)):
-            fill_gmodel = GasModel(os.path.expandvars(fill_gmodel_location))
+            fill_gmodel = pitot3_gas_model_loader(fill_gmodel_location)
         elif not os.path.isfile(os.path.expandvars(fill_gmodel_location)) and self.fill_gas_model == 'CEAGas' and self.fill_gas_name:
             print(f"The PITOT3 pre-set gas models folder is {preset_gas_models_folder}")
             print(f"Your selected pre-set CEAGas gas model of '{self.fill_gas_name}' does not appear to exist in that folder.")
@@ -3110,30 +3192,68 @@ class Tube(object):
         self.vs_tolerance = vs_tolerance
         self.vs_max_iterations = vs_max_iterations
 
+        # a shock speed from a similar calculation (say, a neighbouring condition in the condition builder)
+        # which, if it is given, the shock speed solve is started from instead of the guesses above.
+        self.vs_warm_start = vs_warm_start
+
+        # these keep track of how the shock speed solve went, for if the user is interested in that...
+        self.vs_iterations = None
+        self.vs_warm_started = False
+        self.vs_warm_start_wasted_iterations = 0
+
         return
 
     def calculate_shock_speed(self):
         """
         Function to do the shock speed calculation for a given fill state and unsteadily expanding driver state.
 
+        If a warm start shock speed has been given, the secant solve is started from it (and a point 1% above it),
+        with the normal guesses only used if that solve fails. The number of iterations (i.e. shock speeds tried)
+        is stored so we can see how much the warm start saved.
+
         """
 
+        # the state and gas flow objects are made once here and re-used for each shock speed that we try...
+
+        # the shocked state has the same gmodel as the fill_state
+        # which we can use to get the shocked state and its gas flow object...
+        fill_state_gmodel = self.fill_state.get_gas_state().gmodel
+
+        shocked_gas_state = GasState(fill_state_gmodel)
+        fill_state_gas_flow = GasFlow(fill_state_gmodel)
+
+        unsteadily_expanding_state_gmodel = self.unsteadily_expanding_state.get_gas_state().gmodel
+
+        unsteadily_expanded_gas_state = GasState(unsteadily_expanding_state_gmodel)
+        unsteadily_expanding_state_gas_flow = GasFlow(unsteadily_expanding_state_gmodel)
+
+        # shocked state label number will be the fill state label + 1, the unsteadily expanded state will be that number + 2
+        # this is easy for shock tube and acceleration tube as we have s1 or s5, but harder for secondary driver where it is sd1
+        # so we'll do something different based on the length...
+        fill_state_name = self.fill_state.get_state_name()
+
+        if len(fill_state_name) == 2:
+            shocked_state_label_number = int(fill_state_name[1]) + 1
+            unsteadily_expanded_state_label_number = int(fill_state_name[1]) + 2
+        elif len(fill_state_name) == 3:
+            shocked_state_label_number = 'sd' + str(int(fill_state_name[2]) + 1)
+            unsteadily_expanded_state_label_number = 'sd' + str(int(fill_state_name[2]) + 2)
+
+        self.vs_iterations = 0
+        self.vs_warm_started = False
+        self.vs_warm_start_wasted_iterations = 0
+
         # the function below sets it up, code is below...
 
         def error_in_velocity_function(vs, fill_state = self.fill_state, unsteadily_expanding_state = self.unsteadily_expanding_state,
                                        steps=self.unsteady_expansion_steps, shock_name = self.shock_name):
             """Compute the velocity mismatch for a given shock speed."""
 
+            self.vs_iterations += 1
+
             print ('-' * 60)
             print (f"Current guess for {shock_name} = {vs:.2f} m/s")
 
-            # the shocked state has the same gmodel as the fill_state
-            # which we can use to get the shocked state and its gas flow object...
-            fill_state_gmodel = fill_state.get_gas_state().gmodel
-
-            shocked_gas_state = GasState(fill_state_gmodel)
-            fill_state_gas_flow = GasFlow(fill_state_gmodel)
-
             # do the shock
 
             v2, v2g = fill_state_gas_flow.normal_shock(fill_state.get_gas_state(), vs, shocked_gas_state)
@@ -3143,27 +3263,10 @@ class Tube(object):
             # Across the contact surface, p3 == p2 (i.e. the post-shock pressure is teh same as the unsteadily expanded pressure)
             p3 = shocked_gas_state.p
 
-            unsteadily_expanding_state_gmodel = unsteadily_expanding_state.get_gas_state().gmodel
-
-            unsteadily_expanded_gas_state = GasState(unsteadily_expanding_state_gmodel)
-            unsteadily_expanding_state_gas_flow = GasFlow(unsteadily_expanding_state_gmodel)
-
             v3g = finite_wave_dp_wrapper(unsteadily_expanding_state.get_gas_state(), unsteadily_expanding_state.get_v(),
                                          'cplus', p3, unsteadily_expanded_gas_state, unsteadily_expanding_state_gas_flow,
                                          steps = steps, gmodel_without_ions=unsteadily_expanding_state.get_gas_state_gmodel_without_ions())
 
-            # shocked state label number will be the fill state label + 1, the unsteadily expanded state will be that number + 2
-            # this is easy for shock tube and acceleration tube as we have s1 or s5, but harder for secondary driver where it is sd1
-            # so we'll do something different based on the length...
-            fill_state_name = fill_state.get_state_name()
-
-            if len(fill_state_name) == 2:
-                shocked_state_label_number = int(fill_state_name[1]) + 1
-                unsteadily_expanded_state_label_number = int(fill_state_name[1]) + 2
-            elif len(fill_state_name) == 3:
-                shocked_state_label_number = 'sd' + str(int(fill_state_name[2]) + 1)
-                unsteadily_expanded_state_label_number = 'sd' + str(int(fill_state_name[2]) + 2)
-
             print(f"Current p{shocked_state_label_number} = {shocked_gas_state.p:.2f} Pa, current p{unsteadily_expanded_state_label_number} = {unsteadily_expanded_gas_state.p:.2f} Pa.")
             print(f"Current v{shocked_state_label_number}g = {v2g:.2f} m/s, current v{unsteadily_expanded_state_label_number}g = {v3g:.2f} m/s.")
             if abs((v2g - v3g) / v2g) > 0.001:
@@ -3180,27 +3283,54 @@ class Tube(object):
         print("Unsteadily expanding entry state is:")
         print(self.unsteadily_expanding_state)
 
-        # calculate the shock speed using a secant solver
-        try:
-            self.vs = secant(error_in_velocity_function, self.vs_guess_1, self.vs_guess_2, limits = self.vs_limits,
-                             tol=self.vs_tolerance, max_iterations = self.vs_max_iterations)
-        except Exception as e:
-            print(e)
-            if 'Did not converge after ' in e.args:
-                print("Shock speed calculation did not converge")
-                print("This happens sometimes so we'll give it a go one more time with a slightly lower tolerance.")
+        if self.vs_warm_start:
+            # we start from the warm start shock speed and a point 1% above it (or below it if that is past the limits)
+            vs_guess_1 = self.vs_warm_start
+            if self.vs_limits:
+                vs_guess_1 = min(max(vs_guess_1, self.vs_limits[0]), self.vs_limits[1])
 
-                new_vs_tolerance = self.vs_tolerance*10.0
+            if not self.vs_limits or vs_guess_1*1.01 <= self.vs_limits[1]:
+                vs_guess_2 = vs_guess_1*1.01
+            else:
+                vs_guess_2 = vs_guess_1*0.99
 
-                print(f"The old tolerance was {self.vs_tolerance}, the new tolerance is {new_vs_tolerance}.")
+            print('-' * 60)
+            print(f"Starting the shock speed calculation from the warm start value of {self.shock_name} = {vs_guess_1:.2f} m/s.")
 
-                self.vs = secant(error_in_velocity_function, self.vs_guess_1, self.vs_guess_2, limits=self.vs_limits,
-                                 tol=new_vs_tolerance, max_iterations=self.vs_max_iterations)
+            try:
+                self.vs = secant(error_in_velocity_function, vs_guess_1, vs_guess_2, limits = self.vs_limits,
+                                 tol=self.vs_tolerance, max_iterations = self.vs_max_iterations)
+                self.vs_warm_started = True
+            except Exception as e:
+                print(e)
+                print("Shock speed calculation from the warm start failed, so we'll try again from the normal guesses.")
+                # the iterations the failed warm start took are kept separately,
+                # so the iteration count below is just that of the normal (cold) solve.
+                self.vs_warm_start_wasted_iterations = self.vs_iterations
+                self.vs_iterations = 0
+
+        if not self.vs_warm_started:
+            # calculate the shock speed using a secant solver
+            try:
+                self.vs = secant(error_in_velocity_function, self.vs_guess_1, self.vs_guess_2, limits = self.vs_limits,
+                                 tol=self.vs_tolerance, max_iterations = self.vs_max_iterations)
+            except Exception as e:
+                print(e)
+                if 'Did not converge after ' in e.args:
+                    print("Shock speed calculation did not converge")
+                    print("This happens sometimes so we'll give it a go one more time with a slightly lower tolerance.")
+
+                    new_vs_tolerance = self.vs_tolerance*10.0
+
+                    print(f"The old tolerance was {self.vs_tolerance}, the new tolerance is {new_vs_tolerance}.")
+
+                    self.vs = secant(error_in_velocity_function, self.vs_guess_1, self.vs_guess_2, limits=self.vs_limits,
+                                     tol=new_vs_tolerance, max_iterations=self.vs_max_iterations)
 
         self.Ms = self.vs / self.fill_state.get_gas_state().a
 
         print ('-' * 60)
-        print (f"From secant solve: {self.shock_name} = {self.vs:.2f} m/s")
+        print (f"From secant solve: {self.shock_name} = {self.vs:.2f} m/s ({self.vs_iterations} iterations)")
 
         return
 
@@ -3455,6 +3585,29 @@ class Tube(object):
 
         return self.tube_name
 
+    def get_shock_speed_iterations(self):
+        """
+        Return the number of iterations (shock speeds tried) the shock speed calculation took,
+        or None if the shock speed was not calculated.
+        """
+
+        return self.vs_iterations
+
+    def get_shock_speed_wasted_warm_start_iterations(self):
+        """
+        Return the number of iterations taken by a warm start which failed
+        (before the shock speed was calculated from the normal guesses instead), or 0.
+        """
+
+        return self.vs_warm_start_wasted_iterations
+
+    def get_shock_speed_warm_started(self):
+        """
+        Return True if the shock speed was calculated from a warm start.
+        """
+
+        return self.vs_warm_started
+
     def get_shock_speed(self):
         """
         Return the shock speed
@@ -10,6 +10,8 @@ Author:
 
 Versions:
   2022-12-11  Adapted from chkn_post.py
+  2026-10-18  Binary VTK data arrays.
+              KD-tree index for nearest-cell queries.
 """
 
 # ----------------------------------------------------------------------
@@ -27,10 +29,13 @@ from collections import namedtuple
 
 from gdtk.geom.vector3 import Vector3, quad_properties
 from gdtk.geom.sgrid import StructuredGrid
+from gdtk.flow.vtk_writer import write_vts_piece, vtk_points, VTK_FORMATS
+from gdtk.flow.cell_index import CellIndex
 
 
-shortOptions = "hf:t:vp:s:o:"
-longOptions = ["help", "job=", "tindx=", "vtk-xml", "probe=", "slice=", "output-file="]
+shortOptions = "hf:t:vp:s:o:e:z"
+longOptions = ["help", "job=", "tindx=", "vtk-xml", "probe=", "slice=", "output-file=",
+               "vtk-encoding=", "zlib"]
 
 def printUsage():
     print("Post-process a lorikeet simulation to produce VTK format files.")
@@ -39,11 +44,15 @@ def printUsage():
           " [--job=<jobName> | -f <jobName>]" +
           " [--tindx=<tindxSpec> | -t <tindxSpec>]" +
           " [--vtk-xml | -v]" +
+          " [--vtk-encoding=<ascii|base64|raw> | -e <encoding>]" +
+          " [--zlib | -z]" +
           " [--slice=<sliceSpec> | -s <sliceSpec>]" +
           " [--output-file=<name> | -o <name>]" +
           " [--probe=<x,y,z> | -p <x,y,z>]"
     )
     print("  Default is to write VTK files. --vtk-xml")
+    print("  The VTK data arrays are appended as raw binary data unless")
+    print("  another encoding is given, and --zlib compresses the binary data.")
     print("  You may elect to select slices of data, instead, to be written to a GNUPlot file.")
     print("  Or you may probe the data close to a specific point in space.")
     print("")
@@ -57,6 +66,7 @@ def printUsage():
     print("  If the output file is not specified, it defaults to slice-tnnnn.data")
     print("")
     print("  For --probe, <x,y> represents 2 float numbers separated by commas.")
+    print("  Several points may be given, separated by semicolons.")
     print("  Output is just to the console.")
     print("")
     return
@@ -67,6 +77,7 @@ config = {}
 times = {}
 grids = {}
 flows = {}
+cellIndex = None
 
 def read_config(jobDir):
     """
@@ -95,9 +106,13 @@ def read_grids(jobDir):
         raise RuntimeError('Cannot find grid directory: ' + gridDir)
     for j in range(config['njb']):
         for i in range(config['nib']):
-            fileName = gridDir + ('/grid-%04d-%04d.gz' % (i, j))
-            if os.path.exists(fileName):
-                grids['%d,%d'%(i,j)] = StructuredGrid(gzfile=fileName)
+            fileName = gridDir + ('/grid-%04d-%04d' % (i, j))
+            if os.path.exists(fileName+'.bin'):
+                # The vertex arrays are views into a memory-mapped file.
+                grids['%d,%d'%(i,j)] = StructuredGrid(binaryfile=fileName+'.bin', memmap=True)
+            elif os.path.exists(fileName+'.gz'):
+                # Grids from older preparations.
+                grids['%d,%d'%(i,j)] = StructuredGrid(gzfile=fileName+'.gz')
     return
 
 def read_flow_blocks(jobDir, tindx):
@@ -153,31 +168,58 @@ def reshape_flow_data_arrays():
                 flows['%d,%d'%(ib,jb)] = flowData
     return
 
+def get_cell_index():
+    """
+    The spatial index over the cell centres of all blocks.
+
+    It is built from the (reshaped) flow data on first use and then kept
+    because the cells do not move from one snapshot to the next.
+    """
+    global cellIndex
+    if cellIndex is None:
+        cellIndex = CellIndex(flows, ('posx', 'posy'))
+    return cellIndex
+
+def cell_list(distances, blocks, cells):
+    """
+    Arrange the result of CellIndex.nearest_cells as a list of lists of dictionaries.
+    """
+    result = []
+    for n in range(len(distances)):
+        row = []
+        for m in range(len(distances[n])):
+            ib, jb = [int(item) for item in blocks[n][m].split(',')]
+            ic, jc = [int(item) for item in cells[n,m]]
+            row.append({'ib':ib, 'jb':jb, 'ic':ic, 'jc':jc, 'distance':float(distances[n,m])})
+        result.append(row)
+    return result
+
+def nearest_cells(points, k=1):
+    """
+    Locate the k nearest cells to each of the (x,y) points, in any block.
+
+    Returns a list, one entry per point, of lists of k dictionaries
+    holding the block and cell indices and the distance.
+    """
+    return cell_list(*get_cell_index().nearest_cells(points, k))
+
+def probe(points, variables=None, k=4):
+    """
+    Flow data at the (x,y) points, interpolated from the k nearest cells.
+
+    Returns a dictionary of arrays of values, one array per variable,
+    and the list of nearest cells, as from nearest_cells(points, 1).
+    """
+    values, nearest = get_cell_index().probe(points, flows, variables, k)
+    return values, cell_list(*nearest)
+
 def find_nearest_cell(x, y):
     """
     Locate the nearest cell to the location (x,y), in any block.
 
     Returns the block and cell indices of the closest cell centre in a dictionary.
     """
-    global config, flows
-    closest = {'ib':-1, 'jb':-1, 'ic':-1, 'jc':-1, 'distance':sys.float_info.max}
-    nics = config['nics']; njcs = config['njcs']
-    blk_ids = config['blk_ids']
-    for ib in range(config['nib']):
-        for jb in range(config['njb']):
-            if blk_ids[ib][jb][kb] >= 0:
-                # Block data should exist.
-                flowData = flows['%d,%d'%(ib,jb)]
-                for ic in range(nics[ib]):
-                    for jc in range(njcs[jb]):
-                        xc = flowData['posx'][ic][jc]
-                        yc = flowData['posy'][ic][jc]
-                        distance = math.sqrt((x-xc)**2 + (y-yc)**2)
-                        if (distance < closest['distance']):
-                            closest['ib'] = ib; closest['jb'] = jb
-                            closest['ic'] = ic; closest['jc'] = jc
-                            closest['distance'] = distance
-    return closest
+    return nearest_cells([[x, y]], 1)[0][0]
 
 # --------------------------------------------------------------------
 
@@ -229,10 +271,12 @@ def write_pvd_file(jobDir, tindxList, timesList):
     fp.close()
     return
 
-def write_vtk_files(jobDir, tindx):
+def write_vtk_files(jobDir, tindx, encoding="raw", compress=False):
     """
     Write snapshot of the flow data as a collection of VTK files for a single tindx.
     This collection of files will describe the pieces of an overall StructuredGrid.
+
+    encoding and compress are as for gdtk.flow.vtk_writer.write_vts_piece().
     """
     global config, grids, flows
     plotDir = jobDir + '/plot'
@@ -245,15 +289,16 @@ def write_vtk_files(jobDir, tindx):
     fp.write('<VTKFile type="PStructuredGrid" version="0.1" byte_order="BigEndian">\n')
     fp.write('<PStructuredGrid WholeExtent="%d %d %d %d 0 0" GhostLevel="0">\n' % (0, whole_niv-1, 0, whole_njv-1))
     fp.write('<PCellData>\n')
+    fmt = VTK_FORMATS[encoding]
     for var in config["iovar_names"]:
-        fp.write('<PDataArray Name="%s" type="Float64" NumberOfComponents="1" format="ascii" />\n' % (var,))
+        fp.write('<PDataArray Name="%s" type="Float64" NumberOfComponents="1" format="%s" />\n' % (var, fmt))
     if "velx" in config["iovar_names"] and "a" in config["iovar_names"]:
-        fp.write('<PDataArray Name="Mach" type="Float64" NumberOfComponents="1" format="ascii" />\n');
+        fp.write('<PDataArray Name="Mach" type="Float64" NumberOfComponents="1" format="%s" />\n' % fmt);
     if "velx" in config["iovar_names"]:
-        fp.write('<PDataArray Name="vel.vector" type="Float64" NumberOfComponents="3" format="ascii" />\n');
+        fp.write('<PDataArray Name="vel.vector" type="Float64" NumberOfComponents="3" format="%s" />\n' % fmt);
     fp.write('</PCellData>\n')
     fp.write('<PPoints>\n')
-    fp.write('<PDataArray type="Float64" NumberOfComponents="3" format="ascii" />\n')
+    fp.write('<PDataArray type="Float64" NumberOfComponents="3" format="%s" />\n' % fmt)
     fp.write('</PPoints>\n')
     start_njv = 0
     for j in range(config['njb']):
@@ -267,7 +312,8 @@ def write_vtk_files(jobDir, tindx):
                 fp.write('<Piece Extent="%d %d %d %d 0 0" Source="%s" />\n' %
                          (start_niv, start_niv+grid.niv-1, start_njv, start_njv+grid.njv-1, fileName))
                 write_vtk_structured_grid_file(plotDir+'/'+fileName, grid, flows[key],
-                                               whole_niv, whole_njv, start_niv, start_njv)
+                                               whole_niv, whole_njv, start_niv, start_njv,
+                                               encoding, compress)
             start_niv += config['nics'][i]
         start_njv += config['njcs'][j]
     fp.write('</PStructuredGrid>\n')
@@ -275,44 +321,25 @@ def write_vtk_files(jobDir, tindx):
     fp.close()
     return
 
-def write_vtk_structured_grid_file(fileName, grid, flowData, whole_niv, whole_njv, start_niv, start_njv):
+def write_vtk_structured_grid_file(fileName, grid, flowData, whole_niv, whole_njv, start_niv, start_njv,
+                                   encoding="raw", compress=False):
     """
     Combine the grid and flow data for one block into a VTK StructuredGrid file
 
     for one piece of the overall grid..
     """
-    with open(fileName, mode='w') as fp:
-        fp.write('<VTKFile type="StructuredGrid" version="0.1" byte_order="BigEndian">\n')
-        fp.write('<StructuredGrid WholeExtent="%d %d %d %d 0 0">\n' % (0, whole_niv-1, 0, whole_njv-1))
-        fp.write('<Piece Extent="%d %d %d %d 0 0">\n' %
-                 (start_niv, start_niv+grid.niv-1, start_njv, start_njv+grid.njv-1))
-        fp.write('<CellData>\n')
-        for var in config["iovar_names"]:
-            fp.write('<DataArray Name="%s" type="Float64" NumberOfComponents="1" format="ascii">\n' % (var,))
-            for item in flowData[var]: fp.write('%g\n' % (item,))
-            fp.write('</DataArray>\n')
-        if "velx" in config["iovar_names"] and  "a" in config["iovar_names"]:
-            fp.write('<DataArray Name="Mach" type="Float64" NumberOfComponents="1" format="ascii">\n');
-            for a,vx,vy in zip(flowData["a"],flowData["velx"],flowData["vely"]):
-                fp.write('%g\n' % (math.sqrt(vx*vx+vy*vy)/a))
-            fp.write('</DataArray>\n')
-        if "velx" in config["iovar_names"]:
-            fp.write('<DataArray Name="vel.vector" type="Float64" NumberOfComponents="3" format="ascii">\n');
-            for velxy in zip(flowData["velx"],flowData["vely"]): fp.write('%g %g 0.0\n' % velxy)
-            fp.write('</DataArray>\n')
-        fp.write('</CellData>\n')
-        fp.write('<Points>\n')
-        fp.write('<DataArray type="Float64" NumberOfComponents="3" format="ascii">\n')
-        for j in range(grid.njv):
-            for i in range(grid.niv):
-                x = grid.vertices.x[i][j]
-                y = grid.vertices.y[i][j]
-                fp.write('%g %g 0.0\n'%(x, y))
-        fp.write('</DataArray>\n')
-        fp.write('</Points>\n')
-        fp.write('</Piece>\n')
-        fp.write('</StructuredGrid>\n')
-        fp.write('</VTKFile>\n')
+    varNames = config["iovar_names"]
+    cellData = [(var, flowData[var]) for var in varNames]
+    if "velx" in varNames:
+        vel = np.column_stack([flowData["velx"], flowData["vely"], np.zeros_like(flowData["velx"])])
+        if "a" in varNames:
+            cellData.append(("Mach", np.sqrt(np.sum(vel**2, axis=1))/flowData["a"]))
+        cellData.append(("vel.vector", vel))
+    points = vtk_points(grid)
+    points[:,2] = 0.0
+    write_vts_piece(fileName, (0, whole_niv-1, 0, whole_njv-1, 0, 0),
+                    (start_niv, start_niv+grid.niv-1, start_njv, start_njv+grid.njv-1, 0, 0),
+                    cellData, points, encoding, compress)
     return
 
 # --------------------------------------------------------------------
@@ -397,11 +424,19 @@ if __name__ == '__main__':
         action = "slice"
     #
     if action == "vtk-xml":
+        encoding = "raw"
+        if "--vtk-encoding" in uoDict:
+            encoding = uoDict.get("--vtk-encoding", encoding)
+        elif "-e" in uoDict:
+            encoding = uoDict.get("-e", encoding)
+        if encoding not in VTK_FORMATS:
+            raise Exception("Unknown VTK encoding: " + encoding)
+        compress = ("--zlib" in uoDict) or ("-z" in uoDict)
         print("Write out flow data snapshots as VTK files.")
         for tindx in tindxList:
             print("Writing tindx={}".format(tindx))
             read_flow_blocks(jobDir, tindx)
-            write_vtk_files(jobDir, tindx)
+            write_vtk_files(jobDir, tindx, encoding, compress)
         #
         timesList = [times[tindx] for tindx in tindxList]
         write_pvd_file(jobDir, tindxList, timesList)
@@ -411,18 +446,20 @@ if __name__ == '__main__':
             xySpec = uoDict.get("--probe", "")
         elif "-p" in uoDict:
             xySpec = uoDict.get("-p", "")
-        x, y = xySpec.strip().split(',')
-        x = float(x); y = float(y)
-        print("Probe the flow data close to ({}, {}).".format(x,y))
+        # Accept multiple points, separated by semicolons.
+        points = [[float(item) for item in pSpec.split(',')] for pSpec in xySpec.strip().split(';')]
+        for x, y in points:
+            print("Probe the flow data close to ({}, {}).".format(x,y))
         for tindx in tindxList:
             print("Probing flow data at tindx={}".format(tindx))
             read_flow_blocks(jobDir, tindx)
             reshape_flow_data_arrays()
-            closest = find_nearest_cell(x, y)
-            print("closest cell at", closest)
-            flowData = flows['%d,%d'%(closest['ib'],closest['jb'])]
-            for var in config['iovar_names']:
-                print('  {}: {}'.format(var, flowData[var][closest['ic'],closest['jc']]))
+            for row in nearest_cells(points, 1):
+                closest = row[0]
+                print("closest cell at", closest)
+                flowData = flows['%d,%d'%(closest['ib'],closest['jb'])]
+                for var in config['iovar_names']:
+                    print('  {}: {}'.format(var, flowData[var][closest['ic'],closest['jc']]))
     #
     if action == "slice":
         print("Select just a 1D of flow data.")
@@ -276,7 +276,7 @@ class FlowState():
         return "FlowState(gas={}, vel={})".format(self.gas, self.vel)
 
     def to_json(self):
-        gas_dict = {'p': self.gas.p, 'T': self.gas.T, 'massf': self.gas.massf}
+        gas_dict = {'p': self.gas.p, 'T': self.gas.T, 'massf': self.gas.massf.tolist()}
         result = '{"gas": %s, "vel": [%g, %g]}' % (json.dumps(gas_dict), self.vel.x, self.vel.y)
         return result
 
@@ -613,8 +613,8 @@ def write_initial_files():
     if not os.path.exists(gridDir):
         os.mkdir(gridDir)
     for fb in fluidBlocksList:
-        fileName = gridDir + ('/grid-%04d-%04d.gz' % (fb.i, fb.j))
-        fb.grid.write_to_gzip_file(fileName)
+        fileName = gridDir + ('/grid-%04d-%04d.bin' % (fb.i, fb.j))
+        fb.grid.write_to_binary_file(fileName)
     #
     print('Write the initial flow-field files.')
     #
@@ -147,7 +147,7 @@ class GlobalConfig(object):
         fp.write('  "n_streams": %d,\n' % len(streamTubeList))
         for st in streamTubeList:
             # Assemble a dictionary defining the flowstate.
-            fs = {'p':st.gas.p, 'T':st.gas.T, 'massf':st.gas.massf,
+            fs = {'p':st.gas.p, 'T':st.gas.T, 'massf':st.gas.massf.tolist(),
                   'velx':st.velx, 'vely':st.vely}
             fp.write('  "inflow_%d": %s,\n' % (st.indx, json.dumps(fs)))
             fp.write('  "ncells_%d": %d,\n' % (st.indx, st.ncells))